@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Measure the client's scroll, download and upload throughput against the
+local API emulator, optionally with injected latency, throttling and a
+bandwidth limit.
+
+Usage:
+    python benchmarks/emulator.py [--assets 5000] [--latency 0.005] [--throttle 0.0]
+        [--bandwidth 0] [--threads 8]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'pylib'))
+
+from zmlp import ZmlpApp  # noqa: E402
+from zmlp.emulator import Corpus, Emulator  # noqa: E402
+from zmlp.entity import FileUpload  # noqa: E402
+
+APIKEY = {
+    'projectId': 'A5BAFAAA-42FD-45BE-9FA2-92670AB4DA80',
+    'accessKey': 'benchmark',
+    'secretKey': 'benchmark'
+}
+
+
+def timed(name, count, unit, func):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print('{:10s} {:10.0f} {}/s  {:7.3f} s'.format(name, count / elapsed, unit, elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--assets', type=int, default=5000, help='Assets in the corpus')
+    parser.add_argument('--file-size', type=int, default=256 * 1024, help='Proxy file size')
+    parser.add_argument('--latency', type=float, default=0.005, help='Seconds per request')
+    parser.add_argument('--throttle', type=float, default=0.0, help='Fraction of 429s')
+    parser.add_argument('--bandwidth', type=int, default=0, help='Bytes/s per request')
+    parser.add_argument('--threads', type=int, default=8, help='Concurrent transfers')
+    args = parser.parse_args()
+
+    corpus = Corpus(args.assets, file_size=args.file_size)
+    with Emulator(corpus, latency=args.latency, throttle_rate=args.throttle, retry_after=0,
+                  bandwidth=args.bandwidth or None) as emulator:
+        app = ZmlpApp(APIKEY, emulator.url)
+        timed('scroll', args.assets, 'assets',
+              lambda: sum(1 for _ in app.assets.scroll_search({'size': 500})))
+        timed('stream', args.assets, 'assets',
+              lambda: sum(1 for _ in app.assets.scroll_search({'size': 500}, stream=True)))
+
+        file_ids = list(corpus.files)[:args.threads * 16]
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            timed('download', len(file_ids) * args.file_size / 2 ** 20, 'MiB',
+                  lambda: list(pool.map(app.assets.download_file, file_ids)))
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = []
+            for num in range(50):
+                paths.append(os.path.join(tmpdir, '{}.jpg'.format(num)))
+                with open(paths[-1], 'wb') as fp:
+                    fp.write(os.urandom(args.file_size))
+            timed('upload', len(paths) * args.file_size / 2 ** 20, 'MiB',
+                  lambda: app.assets.batch_upload_files([FileUpload(p) for p in paths]))
+
+        stats = emulator.stats
+        print('requests {}  429s {}  peak concurrency {}'.format(
+            sum(stats.requests.values()), stats.statuses[429], stats.max_in_flight))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Compare the available JSON codecs encoding and decoding asset documents
+shaped like the ones returned by a scroll search.
+
+Usage:
+    python benchmarks/json_codec.py [--assets 500] [--rounds 20]
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'pylib'))
+
+from zmlp import Asset  # noqa: E402
+from zmlp.codec import CODECS  # noqa: E402
+
+
+def make_asset(num):
+    """
+    Build an asset document with a realistic set of namespaces.
+    """
+    labels = ['dog', 'cat', 'car', 'tree', 'house', 'person', 'boat', 'sky']
+    return Asset({
+        'id': 'asset-{:08d}'.format(num),
+        'document': {
+            'source': {
+                'path': 'gs://zorroa-dev-data/image/{}.jpg'.format(num),
+                'filename': '{}.jpg'.format(num),
+                'extension': 'jpg',
+                'mimetype': 'image/jpeg',
+                'filesize': random.randint(10000, 10000000),
+                'checksum': random.getrandbits(32)
+            },
+            'system': {
+                'state': 'Analyzed',
+                'projectId': 'A5BAFAAA-42FD-45BE-9FA2-92670AB4DA80',
+                'timeCreated': '2020-04-01T12:00:00.000Z',
+                'timeModified': '2020-04-01T12:01:00.000Z'
+            },
+            'media': {
+                'width': 1920,
+                'height': 1080,
+                'aspect': 1.77,
+                'orientation': 'landscape',
+                'type': 'image'
+            },
+            'files': [
+                {
+                    'id': 'assets/asset-{:08d}/proxy/image_{}x{}.jpg'.format(num, w, h),
+                    'category': 'proxy',
+                    'name': 'image_{}x{}.jpg'.format(w, h),
+                    'mimetype': 'image/jpeg',
+                    'size': random.randint(1000, 100000),
+                    'attrs': {'width': w, 'height': h}
+                } for w, h in ((1920, 1080), (1024, 576), (512, 288))
+            ],
+            'analysis': {
+                'zvi-label-detection': {
+                    'type': 'labels',
+                    'count': 5,
+                    'predictions': [
+                        {'label': random.choice(labels), 'score': random.random()}
+                        for _ in range(5)
+                    ]
+                },
+                'zvi-object-detection': {
+                    'type': 'labels',
+                    'predictions': [
+                        {'label': random.choice(labels), 'score': random.random(),
+                         'bbox': [random.random() for _ in range(4)]}
+                        for _ in range(8)
+                    ]
+                },
+                'zvi-image-similarity': {
+                    'type': 'similarity',
+                    'simhash': ''.join(random.choice('ABCDEFGHIJKLMNOP') for _ in range(2048))
+                }
+            },
+            'labels': [
+                {'dataSetId': 'ds-1', 'label': random.choice(labels), 'bbox': None}
+            ]
+        }
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--assets', type=int, default=500, help='Assets per page')
+    parser.add_argument('--rounds', type=int, default=20, help='Timing rounds')
+    args = parser.parse_args()
+
+    random.seed(0)
+    assets = [make_asset(i) for i in range(args.assets)]
+
+    for name, cls in sorted(CODECS.items()):
+        try:
+            codec = cls()
+        except ImportError:
+            print('{:8s} not installed'.format(name))
+            continue
+        encoded = codec.dumpb({'assets': assets})
+        page = {'hits': {'hits': [
+            {'_id': a.id, '_score': 1.0, '_source': a.document} for a in assets]}}
+        page = codec.dumpb(page)
+
+        encode = min(timeit.repeat(lambda: codec.dumpb({'assets': assets}),
+                                   number=1, repeat=args.rounds))
+        decode = min(timeit.repeat(lambda: codec.loads(page),
+                                   number=1, repeat=args.rounds))
+        print('{:8s} encode {:8.2f} ms  decode {:8.2f} ms  ({:.1f} KiB page)'.format(
+            name, encode * 1000, decode * 1000, len(encoded) / 1024.0))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Compare the latency of small API requests made over TCP, through a plain
+HTTP sidecar and over a Unix domain socket, against a local stand-in server.
+
+Usage:
+    python benchmarks/transport.py [--requests 2000] [--threads 1] [--size 512]
+"""
+import argparse
+import json
+import os
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'pylib'))
+
+from zmlp.client import ZmlpClient  # noqa: E402
+from zmlp.transport import SidecarTransport, unix_url  # noqa: E402
+
+APIKEY = {
+    'projectId': 'A5BAFAAA-42FD-45BE-9FA2-92670AB4DA80',
+    'accessKey': 'benchmark',
+    'secretKey': 'benchmark'
+}
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Replies to every GET with a JSON body of the configured size."""
+
+    protocol_version = 'HTTP/1.1'
+    # Send the headers and body in one write, otherwise TCP waits for a
+    # delayed ACK between them, which isn't a cost of the client.
+    wbufsize = 64 * 1024
+    body = b'{}'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+
+class UnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super(UnixHTTPServer, self).get_request()
+        return request, ('local', 0)
+
+
+def serve(httpd):
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+
+def run(client, count, threads):
+    """
+    Make count requests and return the latency of each in seconds.
+    """
+    client.get('/api/v3/projects/_me')
+
+    def timed(_):
+        start = time.perf_counter()
+        client.get('/api/v3/projects/_me')
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return sorted(pool.map(timed, range(count)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=2000, help='Requests per transport')
+    parser.add_argument('--threads', type=int, default=1, help='Concurrent requests')
+    parser.add_argument('--size', type=int, default=512, help='Response body size in bytes')
+    args = parser.parse_args()
+
+    StandInHandler.body = json.dumps({'pad': 'x' * max(0, args.size - 11)}).encode()
+    tcp = serve(ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler))
+    tcp.daemon_threads = True
+    tcp_url = 'http://127.0.0.1:{}'.format(tcp.server_address[1])
+    socket_path = os.path.join(tempfile.mkdtemp(), 'zmlp.sock')
+    serve(UnixHTTPServer(socket_path, StandInHandler))
+
+    clients = [
+        ('tcp', ZmlpClient(APIKEY, tcp_url, limiter=False)),
+        ('sidecar', ZmlpClient(APIKEY, 'https://api.zmlp.zorroa.com', limiter=False,
+                               transport=SidecarTransport(tcp_url))),
+        ('unix', ZmlpClient(APIKEY, unix_url(socket_path), limiter=False)),
+        ('sidecar-unix', ZmlpClient(APIKEY, 'https://api.zmlp.zorroa.com', limiter=False,
+                                    transport=SidecarTransport(socket_path)))
+    ]
+    try:
+        for name, client in clients:
+            start = time.perf_counter()
+            latencies = run(client, args.requests, args.threads)
+            elapsed = time.perf_counter() - start
+            print('{:12s} {:8.0f} req/s  p50 {:7.3f} ms  p99 {:7.3f} ms'.format(
+                name, args.requests / elapsed,
+                latencies[len(latencies) // 2] * 1000,
+                latencies[int(len(latencies) * 0.99)] * 1000))
+    finally:
+        os.unlink(socket_path)
+        os.rmdir(os.path.dirname(socket_path))
+
+
+if __name__ == '__main__':
+    main()
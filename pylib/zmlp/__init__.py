@@ -1,5 +1,29 @@
 # flake8: noqa
-from .entity import *
-from .search import *
-from .app.zmlp_app import ZmlpApp, app_from_env
-from .client import ZmlpClient, to_json
+# Nothing is imported until it's used, which keeps 'import zmlp' fast for
+# short lived processes, see zmlp.lazy.
+from .lazy import lazy_attrs
+from .entity import _ATTRS as _ENTITY_ATTRS
+
+_ATTRS = dict.fromkeys(_ENTITY_ATTRS, '.entity')
+_ATTRS.update(dict.fromkeys([
+    'AssetSearchScroller',
+    'AssetSearchResult',
+    'AsyncAssetSearchScroller',
+    'AsyncAssetSearchResult',
+    'LabelConfidenceQuery',
+    'SimilarityQuery'
+], '.search'))
+_ATTRS.update({
+    'ZmlpApp': '.app.zmlp_app',
+    'AsyncZmlpApp': '.app.zmlp_app',
+    'app_from_env': '.app.zmlp_app',
+    'async_app_from_env': '.app.zmlp_app',
+    'ZmlpClient': '.client',
+    'to_json': '.client',
+    'AsyncZmlpClient': '.aio'
+})
+
+__all__ = list(_ATTRS)
+
+__getattr__, __dir__ = lazy_attrs(__name__, _ATTRS)
+del lazy_attrs
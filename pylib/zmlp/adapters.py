@@ -0,0 +1,149 @@
+"""requests transport adapters for Unix domain sockets and local sidecars."""
+import socket
+import threading
+from urllib.parse import urlsplit
+
+import requests
+import urllib3
+
+from .transport import UNIX_SCHEME, socket_path_of
+
+__all__ = [
+    'UnixSocketAdapter',
+    'SidecarAdapter'
+]
+
+
+class _UnixConnection(urllib3.connection.HTTPConnection):
+    """An HTTPConnection to a Unix domain socket."""
+
+    def __init__(self, socket_path, *args, **kwargs):
+        super(_UnixConnection, self).__init__(*args, **kwargs)
+        self.socket_path = socket_path
+
+    def _new_conn(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if isinstance(self.timeout, (int, float)):
+            sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError as e:
+            sock.close()
+            raise urllib3.exceptions.NewConnectionError(
+                self, "Failed to connect to {}: {}".format(self.socket_path, e))
+        return sock
+
+
+class _UnixConnectionPool(urllib3.HTTPConnectionPool):
+    """A pool of keep-alive connections to a Unix domain socket."""
+
+    def __init__(self, socket_path, **kwargs):
+        super(_UnixConnectionPool, self).__init__('localhost', **kwargs)
+        self.socket_path = socket_path
+
+    def _new_conn(self):
+        self.num_connections += 1
+        return _UnixConnection(self.socket_path, host=self.host, port=self.port,
+                               timeout=self.timeout.connect_timeout, **self.conn_kw)
+
+
+class _ForwardingAdapter(requests.adapters.HTTPAdapter):
+    """
+    An HTTPAdapter which sends requests for the origin form of their URL and
+    passes the original host in the Host header.  Subclasses override
+    _connection() to send every request to one destination, whatever the host
+    of its URL.
+    """
+
+    def request_url(self, request, proxies):
+        return request.path_url
+
+    def add_headers(self, request, **kwargs):
+        host = urlsplit(request.url).netloc
+        if host and not request.url.startswith(UNIX_SCHEME + '://'):
+            request.headers.setdefault('Host', host)
+
+    def get_connection_with_tls_context(self, request, verify, proxies=None, cert=None):
+        return self._connection(request.url)
+
+    def get_connection(self, url, proxies=None):
+        # Used by requests < 2.32.
+        return self._connection(url)
+
+    def _connection(self, url):
+        """
+        Return the connection pool a request for the URL is sent through.
+
+        Args:
+            url (str): The request URL.
+
+        Returns:
+            urllib3.HTTPConnectionPool: The pool, by default for the host of the URL.
+        """
+        return self.poolmanager.connection_from_url(url)
+
+
+class UnixSocketAdapter(_ForwardingAdapter):
+    """
+    A requests transport adapter which connects to a Unix domain socket, either
+    the socket named by each http+unix:// URL, or one fixed socket.
+    """
+
+    def __init__(self, socket_path=None, pool_connections=10, pool_maxsize=10,
+                 pool_block=False, **kwargs):
+        """
+        Create a new UnixSocketAdapter.
+
+        Args:
+            socket_path (str): Send every request to this socket, otherwise the
+                socket is taken from the http+unix:// URL.
+            pool_connections (int): The number of sockets to keep pools for.
+            pool_maxsize (int): The maximum number of keep-alive connections per socket.
+            pool_block (bool): Block when a pool is exhausted.
+        """
+        self.socket_path = socket_path
+        self._pools = {}
+        self._pools_lock = threading.Lock()
+        super(UnixSocketAdapter, self).__init__(pool_connections=pool_connections,
+                                                pool_maxsize=pool_maxsize,
+                                                pool_block=pool_block, **kwargs)
+
+    def _connection(self, url):
+        path = self.socket_path or socket_path_of(url)
+        if not path:
+            raise requests.exceptions.InvalidURL("No socket path in URL {}".format(url))
+        with self._pools_lock:
+            pool = self._pools.get(path)
+            if pool is None:
+                pool = self._pools[path] = _UnixConnectionPool(
+                    path, maxsize=self._pool_maxsize, block=self._pool_block)
+        return pool
+
+    def close(self):
+        super(UnixSocketAdapter, self).close()
+        with self._pools_lock:
+            pools = list(self._pools.values())
+            self._pools = {}
+        for pool in pools:
+            pool.close()
+
+
+class SidecarAdapter(_ForwardingAdapter):
+    """
+    A requests transport adapter which sends every request, over plain HTTP,
+    to a local sidecar which forwards it to the API server.
+    """
+
+    def __init__(self, url, **kwargs):
+        """
+        Create a new SidecarAdapter.
+
+        Args:
+            url (str): The URL of the sidecar, for example http://127.0.0.1:8181
+            **kwargs: The HTTPAdapter pool options.
+        """
+        self.url = url
+        super(SidecarAdapter, self).__init__(**kwargs)
+
+    def _connection(self, url):
+        return self.poolmanager.connection_from_url(self.url)
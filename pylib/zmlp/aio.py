@@ -0,0 +1,598 @@
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from contextlib import ExitStack
+from io import IOBase
+
+from .codec import get_json_codec
+from .client import ZmlpClient, ZmlpConnectionException, \
+    ZmlpDeadlineExceededException, translate_exception, to_json, _failover, _within_deadline
+from .instrument import RequestEvent
+from .lanes import BULK, DEFAULT_BULK_CONCURRENCY, Lane, resolve_lane
+from .limiter import AdaptiveLimiter, ConcurrencyWindow
+from .lazy import lazy_import
+from .servers import FAILURE_STATUSES
+from .timeouts import Deadline, current_deadline
+
+# Optional, and imported on first use.
+aiohttp = lazy_import('aiohttp', optional=True)
+
+logger = logging.getLogger(__name__)
+
+__all__ = [
+    'AsyncZmlpClient'
+]
+
+DEFAULT_ASYNC_POOL_MAXSIZE = 100
+"""The default maximum number of concurrent connections held by an AsyncZmlpClient."""
+
+
+class AsyncZmlpClient(object):
+    """
+    AsyncZmlpClient is an asyncio based client for communicating with a ZMLP
+    API server.  It mirrors the ZmlpClient interface, however every request
+    method is a coroutine.  Requires the aiohttp library.
+    """
+
+    def __init__(self, apikey, server, **kwargs):
+        """
+        Create a new AsyncZmlpClient instance.
+
+        Args:
+            apikey: An API key in any supported form. (dict, base64 string, or open file handle)
+            server: The url of the server to connect to.
+            project_id: An optional project UUID for API keys with access to multiple projects.
+            max_retries: Maximum number of retries to make if the API server
+                is down, 0 for unlimited.
+            pool_maxsize (int): The maximum number of concurrent connections,
+                which also sizes the default concurrency windows: up to
+                pool_maxsize requests and half as many bulk requests in flight.
+            lanes (list): A list of Lanes, see ZmlpClient.  Each lane has its own
+                limiter, however all lanes share the aiohttp connection pool.
+            transport (Transport): The Transport which carries requests, see ZmlpClient.
+        """
+        if aiohttp is None:
+            raise ImportError("The aiohttp library is required to use the AsyncZmlpClient, "
+                              "install with: pip install zvi-client[async]")
+        self.pool_maxsize = kwargs.get('pool_maxsize', DEFAULT_ASYNC_POOL_MAXSIZE)
+        # Coroutines are cheap, so size the default limiters from the aiohttp
+        # pool rather than the synchronous client's thread sized defaults.
+        kwargs['pool_maxsize'] = self.pool_maxsize
+        if kwargs.get('limiter') is None:
+            kwargs['limiter'] = AdaptiveLimiter(kwargs.get('rate_limits'), ConcurrencyWindow(
+                initial=self.pool_maxsize, max_limit=self.pool_maxsize))
+        bulk = max(DEFAULT_BULK_CONCURRENCY, self.pool_maxsize // 2)
+        kwargs['lanes'] = [Lane(BULK, bulk, rate_limits=kwargs.get('rate_limits'),
+                                limiter=None if kwargs['limiter'] else False)] + \
+            list(kwargs.get('lanes') or [])
+        # The synchronous client handles key loading, request signing and URLs.
+        self.client = ZmlpClient(apikey, server, **kwargs)
+        self._session = None
+
+    @property
+    def server(self):
+        """The URL of the ZMLP API server."""
+        return self.client.server
+
+    @property
+    def apikey(self):
+        """The API key dictionary."""
+        return self.client.apikey
+
+    @property
+    def retry_policy(self):
+        """The RetryPolicy shared with the synchronous client."""
+        return self.client.retry_policy
+
+    @property
+    def tracer(self):
+        """The Tracer shared with the synchronous client, if any."""
+        return self.client.tracer
+
+    @property
+    def session(self):
+        """
+        The aiohttp.ClientSession shared by all requests made with this client.
+        The session is created on first use and must be created from within
+        a running event loop.
+
+        Returns:
+            aiohttp.ClientSession: The shared ClientSession.
+        """
+        if self._session is None or self._session.closed:
+            connector = self.client.transport.connector(self.server, self.pool_maxsize)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def close(self):
+        """
+        Close all pooled connections.
+        """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def lane(self, name):
+        """
+        Return a context manager which sends the requests made within it, by
+        the current asyncio task, through the given lane.  See ZmlpClient.lane().
+
+        Args:
+            name (str): The lane name, None to leave the current lane unchanged.
+
+        Returns:
+            contextmanager: The context manager.
+        """
+        return self.client.lane(name)
+
+    def deadline(self, seconds):
+        """
+        Return a context manager which gives the requests made within it, by
+        the current asyncio task, an overall deadline.  See ZmlpClient.deadline().
+
+        Args:
+            seconds (mixed): The number of seconds or a Deadline.
+
+        Returns:
+            contextmanager: The context manager, which yields the Deadline.
+        """
+        return self.client.deadline(seconds)
+
+    def timeouts(self, connect=None, read=None):
+        """
+        Return a context manager which overrides the connect and read timeouts
+        of the requests made within it.  See ZmlpClient.timeouts().
+
+        Args:
+            connect (float): The seconds to wait for a connection.
+            read (float): The seconds to wait for the server to send data.
+
+        Returns:
+            contextmanager: The context manager.
+        """
+        return self.client.timeouts(connect, read)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def stream(self, url, dst, lane=None):
+        """
+        Stream the given URL path to local dst file path.
+
+        Args:
+            url (str): The URL to stream
+            dst (str): The destination file path
+            lane (str): The lane to download through, defaults to 'bulk'.
+
+        Returns:
+            str: The destination file path.
+        """
+        await self.download(url, dst, lane=lane)
+        return dst
+
+    async def download(self, url, dst, block_size=None, lane=None):
+        """
+        Download the given URL path to a local file path or writable file
+        object, writing each block as it arrives.  See ZmlpClient.download().
+
+        Args:
+            url (str): The URL to download.
+            dst (mixed): The destination file path or a writable file object.
+            block_size (int): The size of the blocks read, defaults to the
+                client's block_size.
+            lane (str): The lane to download through, defaults to 'bulk'.
+
+        Returns:
+            int: The number of bytes written.
+        """
+        try:
+            with self.lane(resolve_lane(lane, BULK)):
+                response = await self._send('get', self.client.get_url(url))
+            async with response:
+                if response.status != 200:
+                    self._raise_exception(response.status, await response.read())
+                if hasattr(dst, 'write'):
+                    return await self._read_into(response, dst, block_size)
+                with open(dst, 'wb') as handle:
+                    return await self._read_into(response, handle, block_size)
+        except aiohttp.ClientConnectionError as e:
+            raise ZmlpConnectionException(e)
+
+    async def _read_into(self, response, dst, block_size):
+        size = 0
+        async for block in response.content.iter_chunked(block_size or self.client.block_size):
+            dst.write(block)
+            size += len(block)
+        self.client.transfer_stats.add_response(size, response.content_length or size)
+        return size
+
+    async def stream_text(self, url):
+        """
+        Stream the given URL.
+
+        Args:
+            url (str): The URL to stream
+
+        Yields:
+            generator (bytes): An async generator of the lines making up the textual
+                URL.
+        """
+        try:
+            async with await self._send('get', self.client.get_url(url)) as response:
+                if response.status != 200:
+                    self._raise_exception(response.status, await response.read())
+                async for line in response.content:
+                    line = line.rstrip(b'\r\n')
+                    if line:
+                        yield line
+        except aiohttp.ClientConnectionError as e:
+            raise ZmlpConnectionException(e)
+
+    async def upload_file(self, path, file, body={}, json_rsp=True, lane=None):
+        """
+        Upload a single file and a request to the given endpoint path.
+
+        Args:
+            path (str): The URL to upload to.
+            file (str): The file path to upload.
+            body (dict): A request body
+            json_rsp (bool): Set to true if the result returned is JSON
+            lane (str): The lane to upload through, defaults to 'bulk'.
+
+        Returns:
+            dict: The response body of the request.
+        """
+        return await self.upload_files(path, [file], body, json_rsp, field='file', lane=lane)
+
+    async def upload_files(self, path, files, body, json_rsp=True, field='files', lane=None):
+        """
+        Upload an array of files and a request to the given endpoint path.
+
+        Args:
+            path (str): The URL to upload to
+            files (list of str): The file paths or file handles to upload
+            body (dict): A request body
+            json_rsp (bool): Set to true if the result returned is JSON
+            field (str): The multipart field name for the files.
+            lane (str): The lane to upload through, defaults to 'bulk'.
+
+        Returns:
+            dict: The response body of the request.
+        """
+        # Files opened here are owned by the stack, which closes them
+        # before the next attempt and when the upload finishes or fails.
+        stack = ExitStack()
+
+        def build_form():
+            # FormData can only be sent once, so the form is rebuilt for every attempt.
+            stack.close()
+            form = aiohttp.FormData()
+            for f in files:
+                if isinstance(f, IOBase):
+                    form.add_field(field, f, filename=os.path.basename(f.name))
+                else:
+                    form.add_field(field, stack.enter_context(open(f, 'rb')),
+                                   filename=os.path.basename(f))
+            if body is not None:
+                form.add_field('body', to_json(body), content_type='application/json')
+            return form
+
+        try:
+            with self.lane(resolve_lane(lane, BULK)):
+                rsp = await self._send('post', self.client.get_url(path),
+                                       content_type="", data=build_form)
+            async with rsp:
+                return await self._handle_rsp(rsp, json_rsp)
+        except aiohttp.ClientConnectionError as e:
+            raise ZmlpConnectionException(e)
+        finally:
+            stack.close()
+
+    async def get(self, path, body=None, is_json=True, lane=None):
+        """
+        Performs a get request.
+
+        Args:
+            path (str): An archivist URI path.
+            body (dict): The request body which will be serialized to json.
+            is_json (bool): Set to true to specify a JSON return value
+            lane (str): The lane to send the request through.
+
+        Returns:
+            object: The raw response bytes or an object deserialized from the
+                response json if the ``json`` argument is true.
+        """
+        with self.lane(lane):
+            return await self._make_request('get', path, body, is_json)
+
+    async def post(self, path, body=None, is_json=True, lane=None):
+        """
+        Performs a post request.
+
+        Args:
+            path (str): An archivist URI path.
+            body (object): The request body which will be serialized to json.
+            is_json (bool): Set to true to specify a JSON return value
+            lane (str): The lane to send the request through.
+
+        Returns:
+            object: The raw response bytes or an object deserialized from the
+                response json if the ``json`` argument is true.
+        """
+        with self.lane(lane):
+            return await self._make_request('post', path, body, is_json)
+
+    async def put(self, path, body=None, is_json=True, lane=None):
+        """
+        Performs a put request.
+
+        Args:
+            path (str): An archivist URI path.
+            body (object): The request body which will be serialized to json.
+            is_json (bool): Set to true to specify a JSON return value
+            lane (str): The lane to send the request through.
+
+        Returns:
+            object: The raw response bytes or an object deserialized from the
+                response json if the ``json`` argument is true.
+        """
+        with self.lane(lane):
+            return await self._make_request('put', path, body, is_json)
+
+    async def delete(self, path, body=None, is_json=True, lane=None):
+        """
+        Performs a delete request.
+
+        Args:
+            path (str): An archivist URI path.
+            body (object): The request body which will be serialized to json.
+            is_json (bool): Set to true to specify a JSON return value
+            lane (str): The lane to send the request through.
+
+        Returns:
+            object: The raw response bytes or an object deserialized from the
+                response json if the ``json`` argument is true.
+        """
+        with self.lane(lane):
+            return await self._make_request('delete', path, body, is_json)
+
+    async def iter_paged_results(self, url, req, limit, cls):
+        """
+        Handles paging through the results of the standard _search
+        endpoints on the backend.
+
+        Args:
+            url (str): the URL to POST a search to
+            req (object): the search request body
+            limit (int): the maximum items to return, None for no limit.
+            cls (type): the class to wrap each result in
+
+        Yields:
+            AsyncGenerator
+
+        """
+        left_to_return = limit or sys.maxsize
+        page = 0
+        req["page"] = {}
+        while True:
+            if left_to_return < 1:
+                break
+            page += 1
+            req["page"]["size"] = min(100, left_to_return)
+            req["page"]["from"] = (page - 1) * req["page"]["size"]
+            rsp = await self.post(url, req)
+            if not rsp.get("list"):
+                break
+            for f in rsp["list"]:
+                yield cls(f)
+                left_to_return -= 1
+            # Used to break before pulling new batch
+            if rsp.get("break"):
+                break
+
+    async def _make_request(self, method, path, body=None, is_json=True):
+        instrumentation = self.client.instrumentation
+        if not instrumentation.enabled:
+            data, headers = self.client._encode_body(body)
+            url = self.client.get_url(path, body)
+            try:
+                async with await self._send(method, url, data=data, headers=headers) as rsp:
+                    return await self._handle_rsp(rsp, is_json)
+            except aiohttp.ClientConnectionError as e:
+                raise ZmlpConnectionException(e)
+
+        url = self.client.get_url(path, body)
+        event = instrumentation.start(method, url)
+        try:
+            start = time.perf_counter()
+            data, headers = self.client._encode_body(body)
+            event.serialize_time = time.perf_counter() - start
+            async with await self._send(method, url, data=data, headers=headers,
+                                        event=event) as rsp:
+                return await self._handle_rsp(rsp, is_json, event)
+        except aiohttp.ClientConnectionError as e:
+            event.error = e
+            raise ZmlpConnectionException(e)
+        except BaseException as e:
+            event.error = e
+            raise
+        finally:
+            instrumentation.end(event)
+
+    async def _send(self, method, url, idempotent=None, content_type="application/json",
+                    data=None, headers=None, event=None, **kwargs):
+        """
+        Send a request using the shared session.  Failed requests are retried
+        according to the retry_policy.  The caller must release the response.
+
+        Args:
+            method (str): The HTTP method.
+            url (str): The full URL.
+            idempotent (bool): Override the idempotency of the request.
+            content_type (str): The request content type.
+            data (mixed): The request body, or a callable which returns the body.
+            headers (dict): Additional request headers.
+            event (RequestEvent): The instrumentation event for the request, if
+                it is being recorded.
+            **kwargs: Additional arguments for aiohttp.ClientSession.request
+
+        Returns:
+            aiohttp.ClientResponse: The response.
+        """
+        instrumentation = self.client.instrumentation
+        tracer = self.client.tracer
+        if tracer is None and (event is not None or not instrumentation.enabled):
+            return await self._send_attempts(method, url, idempotent, content_type,
+                                             data, headers, event, kwargs)
+
+        hooks = event is None and instrumentation.enabled
+        if event is None:
+            event = instrumentation.start(method, url) if hooks else RequestEvent(method, url)
+        span = None
+        if tracer is not None:
+            span = tracer.start_request_span(event)
+            headers = dict(headers or {}, traceparent=span.traceparent)
+        try:
+            rsp = await self._send_attempts(method, url, idempotent, content_type,
+                                            data, headers, event, kwargs)
+            if not event.response_bytes:
+                event.response_bytes = rsp.content_length or 0
+            return rsp
+        except BaseException as e:
+            event.error = e
+            raise
+        finally:
+            if span is not None:
+                tracer.end_request_span(span, event)
+            if hooks:
+                instrumentation.end(event)
+
+    async def _send_attempts(self, method, url, idempotent, content_type, data, headers,
+                             event, kwargs):
+        limiter = self.client.get_lane().limiter
+        pool = self.client.server_pool
+        transport = self.client.transport
+        server, target = None, url
+        deadline = current_deadline()
+        if deadline is None and self.client.operation_deadline:
+            deadline = Deadline(self.client.operation_deadline)
+        timeout = kwargs.pop('timeout', None)
+        state = self.retry_policy.begin(method, idempotent, url)
+        if event is not None and isinstance(data, (bytes, bytearray)):
+            event.request_bytes = len(data)
+        while True:
+            if timeout is None:
+                connect, read = self.client._request_timeout(deadline, method, url)
+                kwargs['timeout'] = aiohttp.ClientTimeout(
+                    total=deadline.remaining() if deadline is not None else None,
+                    sock_connect=connect, sock_read=read)
+            else:
+                kwargs['timeout'] = timeout
+            state.attempt()
+            if pool is not None:
+                server, target = pool.route(url, self.client.server)
+            req_headers = self.client.headers(content_type=content_type, server=server)
+            if headers:
+                req_headers.update(headers)
+            sent_url, route_headers = transport.route(target)
+            if route_headers:
+                req_headers.update(route_headers)
+            permit = await limiter.acquire_async(method, url, deadline) if limiter else None
+            if event is not None:
+                event.retries = state.attempts - 1
+                start = time.perf_counter()
+            sent = time.monotonic()
+            try:
+                rsp = await self.session.request(
+                    method, sent_url, headers=req_headers,
+                    data=data() if callable(data) else data, **kwargs)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if event is not None:
+                    event.network_time += time.perf_counter() - start
+                if permit:
+                    permit.feedback(error=e)
+                    permit.release()
+                delay = state.retry_delay(error=e)
+                if pool is not None:
+                    delay = _failover(pool, server, delay, failed=True)
+                delay = _within_deadline(deadline, delay)
+                if delay is None:
+                    if deadline is not None and deadline.expired:
+                        raise ZmlpDeadlineExceededException(deadline, method, url) from e
+                    raise
+                error = e
+            except BaseException:
+                if permit:
+                    permit.release()
+                if pool is not None:
+                    pool.abandon(server)
+                raise
+            else:
+                if event is not None:
+                    event.network_time += time.perf_counter() - start
+                    event.status = rsp.status
+                if permit:
+                    permit.feedback(status=rsp.status)
+                delay = state.retry_delay(status=rsp.status, headers=rsp.headers)
+                if pool is not None:
+                    delay = _failover(pool, server, delay, rsp.status in FAILURE_STATUSES,
+                                      time.monotonic() - sent)
+                delay = _within_deadline(deadline, delay)
+                if delay is None:
+                    if permit:
+                        # The slot is freed once the headers arrive, the
+                        # caller may make other requests as it reads the body.
+                        permit.release()
+                    return rsp
+                rsp.release()
+                if permit:
+                    permit.release()
+                error = rsp.status
+
+            msg = "Communicating to ZMLP (%s) failed %d times, " \
+                  "waiting ... %0.2f seconds, error=%s\n"
+            sys.stderr.write(msg % (target, state.attempts, delay, error))
+            await asyncio.sleep(delay)
+
+    async def _handle_rsp(self, rsp, is_json, event=None):
+        if event is not None:
+            start = time.perf_counter()
+        content = await rsp.read()
+        size = len(content)
+        self.client.transfer_stats.add_response(size, rsp.content_length or size)
+        if event is not None:
+            # Reading the body is network time.
+            now = time.perf_counter()
+            event.network_time += now - start
+            event.response_bytes = size
+            start = now
+        if rsp.status != 200:
+            self._raise_exception(rsp.status, content)
+        if is_json and len(content):
+            rsp_val = get_json_codec().loads(content)
+            if event is not None:
+                event.parse_time = time.perf_counter() - start
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    "rsp: status: %d  body: '%s'" % (rsp.status, rsp_val))
+            return rsp_val
+        return content
+
+    def _raise_exception(self, status, content):
+        data = {}
+        try:
+            data.update(json.loads(content))
+        except Exception as e:
+            # The result is not json.
+            data["message"] = "Your HTTP request was invalid '%s', response not " \
+                              "JSON formatted. %s" % (status, e)
+            data["status"] = status
+
+        ex_class = translate_exception(status)
+        raise ex_class(data)
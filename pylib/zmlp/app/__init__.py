@@ -1,8 +1,20 @@
 # flake8: noqa
-from .asset_app import AssetApp
-from .datasource_app import DataSourceApp
-from .project_app import ProjectApp
-from .dataset_app import DataSetApp
-from .job_app import JobApp
-from .model_app import ModelApp
-from .pmod_app import PipelineModApp
\ No newline at end of file
+# The apps are imported from their modules on first use, see zmlp.lazy.
+from ..lazy import lazy_attrs
+
+_ATTRS = {
+    'AssetApp': '.asset_app',
+    'DataSourceApp': '.datasource_app',
+    'ProjectApp': '.project_app',
+    'DataSetApp': '.dataset_app',
+    'JobApp': '.job_app',
+    'ModelApp': '.model_app',
+    'PipelineModApp': '.pmod_app',
+    'AsyncAssetApp': '.async_asset_app',
+    'AsyncJobApp': '.async_job_app'
+}
+
+__all__ = list(_ATTRS)
+
+__getattr__, __dir__ = lazy_attrs(__name__, _ATTRS)
+del lazy_attrs
@@ -1,9 +1,14 @@
+import contextvars
 import io
+import itertools
 import os
-from collections import namedtuple
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
 from ..entity import Asset, StoredFile, FileUpload, FileTypes, Job
 from ..search import AssetSearchResult, AssetSearchScroller, SimilarityQuery
+from ..tracing import operation_span, traced_generator
+from ..upload import ChunkedUpload
 from ..util import as_collection, as_id_collection, as_id
 
 
@@ -11,6 +16,12 @@ class AssetApp(object):
 
     def __init__(self, app):
         self.app = app
+        self.loader = None
+        """An optional loader which batches get_asset() calls, see ZmlpApp."""
+
+    def __reduce__(self):
+        # Pickled as a reference to the app, see ZmlpApp.
+        return getattr, (self.app, 'assets')
 
     def batch_import_files(self, files, modules=None):
         """
@@ -61,15 +72,23 @@ class AssetApp(object):
         }
         return self.app.client.post("/api/v3/assets/_batch_create", body)
 
-    def batch_upload_files(self, files, modules=None):
+    def batch_upload_files(self, files, modules=None, progress=None, lane=None,
+                           deadline=None):
         """
         Batch upload a list of files and return a structure which contains
         an ES bulk response object, a list of failed file paths, a list of created
         asset Ids, and a processing jobId.
 
+        The request is streamed, so only one file is open and a small
+        chunk of it in memory at any time.
+
         Args:
             files (list of FileUpload):
             modules (list): A list of Pipeline Modules to apply to the data.
+            progress (func): An optional function called with the number of bytes
+                sent and the total size of the request as the upload progresses.
+            lane (str): The client lane to upload through, defaults to 'bulk'.
+            deadline (float): The number of seconds the upload may take.
 
         Notes:
             Example return value:
@@ -111,11 +130,40 @@ class AssetApp(object):
             "assets": files,
             "modules": modules
         }
-        return self.app.client.upload_files("/api/v3/assets/_batch_upload",
-                                            file_paths, body)
+        with self.app.client.lane(lane), self.app.client.deadline(deadline):
+            return self.app.client.upload_files("/api/v3/assets/_batch_upload",
+                                                file_paths, body, progress=progress)
+
+    def chunked_upload_file(self, file, modules=None, part_size=None,
+                            journal_dir=None, progress=None):
+        """
+        Upload a single, very large file in fixed size parts followed by a
+        commit.  Each part is retried on its own if it fails, and the parts
+        the server has acknowledged are journaled locally so calling this
+        method again after a failure or restart continues the upload from
+        the last acknowledged part.
+
+        Args:
+            file (mixed): A FileUpload or a path to a file.
+            modules (list): A list of Pipeline Modules to apply to the data.
+            part_size (int): The size in bytes of each part, defaults to 16MiB.
+            journal_dir (str): The directory to store upload journals in,
+                defaults to ~/.zmlp/uploads.
+            progress (func): An optional function called with the number of bytes
+                acknowledged and the total size after each part is sent.
+
+        Returns:
+            dict: A dictionary containing an ES bulk response, failed files,
+            and created asset ids.
+        """
+        if not isinstance(file, FileUpload):
+            file = FileUpload(file)
+        return ChunkedUpload(self.app.client, file, modules, part_size=part_size,
+                             journal_dir=journal_dir, progress=progress).run()
 
     def batch_upload_directory(self, path, file_types=None,
-                               batch_size=50, modules=None, callback=None):
+                               batch_size=50, modules=None, callback=None, lane=None,
+                               deadline=None):
         """
         Recursively upload all files in the given directory path.
 
@@ -142,6 +190,9 @@ class AssetApp(object):
             batch_size (int) The number of files to upload per batch.
             modules (list): An array of modules to apply to the files.
             callback (func): A function to call for every batch
+            lane (str): The client lane to upload through, defaults to 'bulk'.
+            deadline (float): The number of seconds the whole upload may take,
+                which is shared by every batch.
 
         Returns:
             dict: A dictionary containing batch operation counters.
@@ -159,28 +210,33 @@ class AssetApp(object):
             totals['file_size'] += sum([os.path.getsize(f) for f in batch])
 
             rsp = self.batch_upload_files(
-                [FileUpload(f) for f in batch], modules)
+                [FileUpload(f) for f in batch], modules, lane=lane)
             if callback:
                 callback(batch.copy(), rsp)
             batch.clear()
 
         file_types = FileTypes.resolve(file_types)
-        for root, dirs, files in os.walk(path):
-            for fname in files:
-                if fname.startswith("."):
-                    continue
-                _, ext = os.path.splitext(fname)
-                if not ext:
-                    continue
-                if ext[1:].lower() not in file_types:
-                    continue
-                batch.append(os.path.abspath(os.path.join(root, fname)))
-                if len(batch) >= batch_size:
-                    process_batch()
-
-        if batch:
-            process_batch()
-
+        with operation_span(self.app.client, 'AssetApp.batch_upload_directory',
+                            **{'zmlp.path': path, 'zmlp.batch_size': batch_size}) as span, \
+                self.app.client.deadline(deadline):
+            for root, dirs, files in os.walk(path):
+                for fname in files:
+                    if fname.startswith("."):
+                        continue
+                    _, ext = os.path.splitext(fname)
+                    if not ext:
+                        continue
+                    if ext[1:].lower() not in file_types:
+                        continue
+                    batch.append(os.path.abspath(os.path.join(root, fname)))
+                    if len(batch) >= batch_size:
+                        process_batch()
+
+            if batch:
+                process_batch()
+
+            for key, value in totals.items():
+                span.set_attribute('zmlp.' + key, value)
         return totals
 
     def delete_asset(self, asset):
@@ -212,7 +268,7 @@ class AssetApp(object):
         }
         return self.app.client.delete("/api/v3/assets/_batch_delete", body)
 
-    def search(self, search=None):
+    def search(self, search=None, stream=False):
         """
         Perform an asset search using the ElasticSearch query DSL.
 
@@ -222,12 +278,14 @@ class AssetApp(object):
 
         Args:
             search (dict): The ElasticSearch search to execute.
+            stream (bool): Decode the response incrementally, so iterating the result
+                yields assets as they are received.
         Returns:
             AssetSearchResult - an AssetSearchResult instance.
         """
-        return AssetSearchResult(self.app, search)
+        return AssetSearchResult(self.app, search, stream=stream)
 
-    def scroll_search(self, search=None, timeout="1m"):
+    def scroll_search(self, search=None, timeout="1m", stream=False, lane=None, deadline=None):
         """
         Perform an asset scrolled search using the ElasticSearch query DSL.
 
@@ -238,12 +296,17 @@ class AssetApp(object):
         Args:
             search (dict): The ElasticSearch search to execute
             timeout (str): The scroll timeout.  Defaults to 1 minute.
+            stream (bool): Decode each page incrementally, which lowers memory use
+                for large pages and yields the first asset sooner.
+            lane (str): The client lane to scroll through, defaults to 'bulk'.
+            deadline (float): The number of seconds the whole scroll may take.
         Returns:
             AssetSearchScroll - an AssetSearchScroller instance which is a generator
                 by nature.
 
         """
-        return AssetSearchScroller(self.app, search, timeout)
+        return AssetSearchScroller(self.app, search, timeout, stream=stream, lane=lane,
+                                   deadline=deadline)
 
     def reprocess_search(self, search, modules):
         """
@@ -297,8 +360,88 @@ class AssetApp(object):
         Returns:
             Asset: The Asset
         """
+        if self.loader is not None:
+            return self.loader.load(id)
         return Asset(self.app.client.get("/api/v3/assets/{}".format(id)))
 
+    def get_assets(self, ids, fields=None, chunk_size=500, concurrency=4, on_missing=None):
+        """
+        Fetch many assets by their unique Id.  The ids are fetched in chunks with
+        an _id terms query, several chunks at a time, and the assets are yielded
+        in the same order as the ids.  Only 'concurrency' chunks are held in memory,
+        so 'ids' can be a generator over any number of ids.
+
+        Examples:
+            missing = []
+            for asset in app.assets.get_assets(ids, fields=['source'],
+                                               on_missing=missing.append):
+                do_something(asset)
+
+        Args:
+            ids (iterable): The asset ids or Assets.
+            fields (list): The document fields to return, for example ['source', 'media'].
+                Defaults to the whole document.
+            chunk_size (int): The number of ids fetched by each search, at most 10000.
+            concurrency (int): The number of chunks fetched at the same time.
+            on_missing (func): A function called with each id which doesn't exist.
+                Missing ids are skipped.
+
+        Returns:
+            generator: A generator of Assets.
+        """
+        if not 0 < chunk_size <= 10000:
+            raise ValueError("The chunk_size must be between 1 and 10000")
+        span = operation_span(self.app.client, 'AssetApp.get_assets',
+                              **{'zmlp.chunk_size': chunk_size})
+        return traced_generator(span, self.__get_assets(ids, fields, chunk_size,
+                                                        max(1, concurrency), on_missing))
+
+    def __get_assets(self, ids, fields, chunk_size, concurrency, on_missing):
+        ids = (as_id(asset_id) for asset_id in ids)
+        chunks = iter(lambda: list(itertools.islice(ids, chunk_size)), [])
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+
+            def submit(chunk):
+                # Run in a copy of the caller's context so requests join its trace.
+                pending.append((chunk, pool.submit(contextvars.copy_context().run,
+                                                   self.__get_chunk, chunk, fields)))
+
+            try:
+                for chunk in itertools.islice(chunks, concurrency):
+                    submit(chunk)
+                while pending:
+                    chunk, future = pending.popleft()
+                    found = future.result()
+                    # Keep the next chunk in flight while this one is consumed.
+                    for next_chunk in itertools.islice(chunks, 1):
+                        submit(next_chunk)
+                    for asset_id in chunk:
+                        asset = found.get(asset_id)
+                        if asset is not None:
+                            yield asset
+                        elif on_missing:
+                            on_missing(asset_id)
+            finally:
+                for _, future in pending:
+                    future.cancel()
+
+    def __get_chunk(self, chunk, fields):
+        unique_ids = list(dict.fromkeys(chunk))
+        body = {
+            'size': len(unique_ids),
+            'query': {
+                'terms': {
+                    '_id': unique_ids
+                }
+            }
+        }
+        if fields is not None:
+            body['_source'] = fields
+        rsp = self.app.client.post('api/v3/assets/_search', body)
+        return {hit['_id']: Asset({'id': hit['_id'], 'document': hit.get('_source', {})})
+                for hit in rsp['hits']['hits']}
+
     def update_labels(self, assets, add_labels=None, remove_labels=None):
         """
         Update the DataSet labels on the given array of assets.
@@ -321,20 +464,29 @@ class AssetApp(object):
             raise ValueError("Must pass at least and add_labels or remove_labels argument")
         return self.app.client.put("/api/v3/assets/_batch_update_labels", body)
 
-    def download_file(self, stored_file, dst_file=None):
+    def download_file(self, stored_file, dst_file=None, block_size=None, checksum=None,
+                      lane=None, deadline=None):
         """
         Download given file and store results in memory, or optionally
         a destination file.  The stored_file ID can be specified as
         either a string like "assets/<id>/proxy/image_450x360.jpg"
         or a StoredFile instance can be used.
 
+        The file is streamed in blocks, so only the BytesIO result, if
+        no destination is provided, is held in memory.
+
         Args:
             stored_file (mixed): The StoredFile instance or its ID.
-            dst_file (str): An optional destination file path.
+            dst_file (mixed): An optional destination file path or writable file object.
+            block_size (int): The size of the read buffer in bytes.
+            checksum (hashlib.Hash): An optional hashlib object, for example
+                hashlib.md5(), which is updated with the file content.
+            lane (str): The client lane to download through, defaults to 'bulk'.
+            deadline (float): The number of seconds the download may take.
 
         Returns:
             io.BytesIO instance containing the binary data or if
-                a destination path was provided the size of the
+                a destination was provided the size of the
                 file is returned.
 
         """
@@ -345,27 +497,29 @@ class AssetApp(object):
         else:
             raise ValueError("stored_file must be a string or StoredFile instance")
 
-        rsp = self.app.client.get("/api/v3/files/_stream/{}".format(path), is_json=False)
-        if dst_file:
-            with open(dst_file, 'wb') as fp:
-                fp.write(rsp.content)
-            return os.path.getsize(dst_file)
-        else:
-            return io.BytesIO(rsp.content)
+        url = "/api/v3/files/_stream/{}".format(path)
+        with self.app.client.lane(lane), self.app.client.deadline(deadline):
+            if dst_file:
+                return self.app.client.download(url, dst_file, block_size, checksum)
+            return io.BytesIO(self.app.client.download_bytes(url, block_size,
+                                                             checksum=checksum))
 
-    def get_sim_hashes(self, images):
+    def get_sim_hashes(self, images, progress=None):
         """
         Return a similarity hash for the given array of images.
 
         Args:
             images (mixed): Can be an file handle (opened with 'rb'), or
                 path to a file.
+            progress (func): An optional function called with the number of bytes
+                sent and the total size of the request as the upload progresses.
         Returns:
             list of str: A list of similarity hashes.
 
         """
         return self.app.client.upload_files("/ml/v1/sim-hash",
-                                            as_collection(images), body=None)
+                                            as_collection(images), body=None,
+                                            progress=progress)
 
     def get_sim_query(self, images, min_score=0.75):
         """
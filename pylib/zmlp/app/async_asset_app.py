@@ -0,0 +1,187 @@
+import io
+
+from ..entity import Asset, StoredFile
+from ..lanes import BULK, resolve_lane
+from ..search import AsyncAssetSearchResult, AsyncAssetSearchScroller
+from ..util import as_collection, as_id_collection, as_id
+
+__all__ = [
+    'AsyncAssetApp'
+]
+
+
+class AsyncAssetApp(object):
+    """
+    An asyncio version of the AssetApp which exposes the most commonly
+    used asset operations as coroutines.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.loader = None
+        """An optional loader which batches get_asset() calls, see ZmlpApp."""
+
+    async def batch_import_files(self, files, modules=None):
+        """
+        Import a list of FileImport instances.
+
+        Args:
+            files (list of FileImport): The list of files to import as Assets.
+            modules (list): A list of Pipeline Modules to apply to the data.
+
+        Returns:
+            dict: A dictionary containing an ES bulk response, failed files,
+            and created asset ids.
+
+        """
+        body = {
+            "assets": files,
+            "modules": modules
+        }
+        return await self.app.client.post("/api/v3/assets/_batch_create", body)
+
+    async def batch_upload_files(self, files, modules=None, lane=None, deadline=None):
+        """
+        Batch upload a list of files.
+
+        Args:
+            files (list of FileUpload):
+            modules (list): A list of Pipeline Modules to apply to the data.
+            lane (str): The client lane to upload through, defaults to 'bulk'.
+            deadline (float): The number of seconds the upload may take.
+
+        Returns:
+            dict: A dictionary containing an ES bulk response, failed files,
+            and created asset ids.
+        """
+        files = as_collection(files)
+        file_paths = [f.uri for f in files]
+        body = {
+            "assets": files,
+            "modules": modules
+        }
+        with self.app.client.lane(lane), self.app.client.deadline(deadline):
+            return await self.app.client.upload_files("/api/v3/assets/_batch_upload",
+                                                      file_paths, body)
+
+    async def delete_asset(self, asset):
+        """
+        Delete the given asset.
+
+        Args:
+            asset (mixed): unique Id or Asset instance.
+
+        Returns:
+            bool: True if the asset was deleted.
+
+        """
+        rsp = await self.app.client.delete("/api/v3/assets/{}".format(as_id(asset)))
+        return rsp['success']
+
+    async def batch_delete_assets(self, assets):
+        """
+        Batch delete the given list of Assets or asset ids.
+
+        Args:
+            assets (list): A list of Assets or unique asset ids.
+
+        Returns:
+            dict: A dictionary containing deleted and errored asset Ids.
+        """
+        body = {
+            "assetIds": as_id_collection(assets)
+        }
+        return await self.app.client.delete("/api/v3/assets/_batch_delete", body)
+
+    async def search(self, search=None):
+        """
+        Perform an asset search using the ElasticSearch query DSL.
+
+        Args:
+            search (dict): The ElasticSearch search to execute.
+        Returns:
+            AsyncAssetSearchResult - an AsyncAssetSearchResult instance.
+        """
+        return await AsyncAssetSearchResult.execute(self.app, search)
+
+    def scroll_search(self, search=None, timeout="1m", lane=None, deadline=None):
+        """
+        Perform an asset scrolled search using the ElasticSearch query DSL.
+        The result must be iterated with 'async for'.
+
+        Args:
+            search (dict): The ElasticSearch search to execute
+            timeout (str): The scroll timeout.  Defaults to 1 minute.
+            lane (str): The client lane to scroll through, defaults to 'bulk'.
+            deadline (float): The number of seconds the whole scroll may take.
+        Returns:
+            AsyncAssetSearchScroller - an AsyncAssetSearchScroller instance.
+
+        """
+        return AsyncAssetSearchScroller(self.app, search, timeout, lane=lane, deadline=deadline)
+
+    async def get_asset(self, id):
+        """
+        Return the asset with the given unique Id.
+
+        Args:
+            id (str): The unique ID of the asset.
+
+        Returns:
+            Asset: The Asset
+        """
+        if self.loader is not None:
+            return await self.loader.load(id)
+        return Asset(await self.app.client.get("/api/v3/assets/{}".format(id)))
+
+    async def update_labels(self, assets, add_labels=None, remove_labels=None):
+        """
+        Update the DataSet labels on the given array of assets.
+
+        Args:
+            assets (mixed): An Asset, asset ID, or a list of either type.
+            add_labels (list[DataSetLabel]): A DataSetLabel or list of DataSetLabels to add.
+            remove_labels (list[DataSetLabel]): A DataSetLabels or list of DataSetLabels to remove.
+        Returns:
+            dict: An request status dict
+
+        """
+        ids = as_id_collection(assets)
+        body = {}
+        if add_labels:
+            body['add'] = dict([(a, as_collection(add_labels)) for a in ids])
+        if remove_labels:
+            body['remove'] = dict([(a, as_collection(remove_labels)) for a in ids])
+        if not body:
+            raise ValueError("Must pass at least and add_labels or remove_labels argument")
+        return await self.app.client.put("/api/v3/assets/_batch_update_labels", body)
+
+    async def download_file(self, stored_file, dst_file=None, lane=None, deadline=None):
+        """
+        Download given file and store results in memory, or optionally
+        a destination file.
+
+        Args:
+            stored_file (mixed): The StoredFile instance or its ID.
+            dst_file (mixed): An optional destination file path or writable file object.
+            lane (str): The client lane to download through, defaults to 'bulk'.
+            deadline (float): The number of seconds the download may take.
+
+        Returns:
+            io.BytesIO instance containing the binary data or if
+                a destination was provided the size of the
+                file is returned.
+
+        """
+        if isinstance(stored_file, str):
+            path = stored_file
+        elif isinstance(stored_file, StoredFile):
+            path = stored_file.id
+        else:
+            raise ValueError("stored_file must be a string or StoredFile instance")
+
+        url = "/api/v3/files/_stream/{}".format(path)
+        with self.app.client.lane(resolve_lane(lane, BULK)), self.app.client.deadline(deadline):
+            if dst_file:
+                return await self.app.client.download(url, dst_file)
+            return io.BytesIO(await self.app.client.get(url, is_json=False))
@@ -0,0 +1,156 @@
+from ..entity import Job, Task, TaskError
+from ..util import as_collection, as_id_collection, as_id
+
+__all__ = [
+    'AsyncJobApp'
+]
+
+
+class AsyncJobApp(object):
+    """
+    An asyncio version of the JobApp which exposes the most commonly used
+    Job and Task operations as coroutines.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def get_job(self, id):
+        """
+        Get a Job by its unique Id.
+        Args:
+            id (str): The Job id or Job object.
+
+        Returns:
+            Job: The Job
+        """
+        return Job(await self.app.client.get('/api/v1/jobs/{}'.format(as_id(id))))
+
+    async def refresh_job(self, job):
+        """
+        Refreshes the internals of the given job.
+
+        Args:
+            job (Job): The job to refresh.
+
+        """
+        job._data = await self.app.client.get('/api/v1/jobs/{}'.format(job.id))
+
+    def find_jobs(self, id=None, state=None, name=None, limit=None, sort=None):
+        """
+        Find jobs matching the given criteria.
+
+        Args:
+            id (mixed): A job ID or IDs to filter on.
+            state (mixed): A Job state or list of states to filter on.
+            name (mixed): A Job name or list of names to filter on.
+            limit (int): The maximum number of jobs to return, None  is no limit.
+            sort (list): A list of sort ordering phrases, like ["name:d", "time_created:a"]
+
+        Returns:
+            AsyncGenerator: An async generator which will return matching jobs.
+
+        """
+        body = {
+            'ids': as_collection(id),
+            'states': as_collection(state),
+            'names': as_collection(name),
+            'sort': sort
+        }
+        return self.app.client.iter_paged_results('/api/v1/jobs/_search', body, limit, Job)
+
+    async def find_one_job(self, id=None, state=None, name=None):
+        """
+        Find single Job matching the given criteria.  Raises exception if more
+        than one result is found.
+
+        Args:
+            id (mixed): A job ID or IDs to filter on.
+            state (mixed): A Job state or list of states to filter on.
+            name (mixed): A Job name or list of names to filter on.
+
+        Returns:
+            Job: The job.
+        """
+        body = {
+            'ids': as_collection(id),
+            'states': as_collection(state),
+            'names': as_collection(name)
+        }
+        return Job(await self.app.client.post('/api/v1/jobs/_findOne', body))
+
+    def find_task_errors(self, query=None, job=None, task=None,
+                         asset=None, path=None, processor=None, limit=None, sort=None):
+        """
+        Find TaskErrors based on the supplied criterion.
+
+        Args:
+            query (str): keyword query to match various error properties.
+            job (mixed): A single Job, job id or list of either type.
+            task (mixed): A single Task, task id or list of either type.
+            asset (mixed): A single Asset, asset id or list of either type.
+            path (mixed): A file path or list of file path.
+            processor (mixed): A processor name or list of processors.
+            limit (int): Limit the number of results or None for all results.
+            sort (list): A list of sort ordering phrases, like ["name:d", "time_created:a"]
+
+        Returns:
+            AsyncGenerator: An async generator which returns matching TaskErrors.
+
+        """
+        body = {
+            'keywords': query,
+            'jobIds': as_id_collection(job),
+            'taskIds': as_id_collection(task),
+            'assetIds': as_id_collection(asset),
+            'paths': as_collection(path),
+            'processor': as_collection(processor),
+            'sort': sort
+        }
+        return self.app.client.iter_paged_results(
+            '/api/v1/taskerrors/_search', body, limit, TaskError)
+
+    def find_tasks(self, job=None, id=None, name=None, state=None, limit=None, sort=None):
+        """
+        Find Tasks matching the given criteria.
+
+        Args:
+            job: (mixed): A single Job, job id or list of either type.
+            id (mixed): A single Task, task id or list of either type.
+            name (mixed): A task name or list of tasks names.
+            state (mixed): A take state or list of task states.
+            limit (int): Limit the number of results, None for no limit.
+            sort (list): A list of sort phrases, like ["name:d", "time_created:a"]
+
+        Returns:
+            AsyncGenerator: An async generator which returns matching Tasks.
+        """
+        body = {
+            'ids': as_collection(id),
+            'states': as_collection(state),
+            'names': as_collection(name),
+            'jobIds': as_id_collection(job),
+            'sort': sort
+        }
+        return self.app.client.iter_paged_results('/api/v1/tasks/_search', body, limit, Task)
+
+    async def get_task(self, task):
+        """
+        Get a Task by its unique id.
+
+        Args:
+            task (str): The Task or task id.
+
+        Returns:
+            Task: The Task
+        """
+        return Task(await self.app.client.get('/api/v1/tasks/{}'.format(as_id(task))))
+
+    async def refresh_task(self, task):
+        """
+        Refreshes the internals of the given task.
+
+        Args:
+            task (Task): The Task
+        """
+        task._data = await self.app.client.get('/api/v1/tasks/{}'.format(task.id))
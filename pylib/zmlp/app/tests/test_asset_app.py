@@ -1,14 +1,15 @@
 import copy
+import hashlib
 import os
 import tempfile
 import unittest
-import unittest.mock as mock
 from unittest.mock import patch
 
 import pytest
 
 from zmlp import Asset, ZmlpClient, app_from_env, \
     FileImport, FileUpload, StoredFile, ZmlpException, DataSet
+from zmlp.upload import ChunkedUpload
 from .util import get_test_file
 
 
@@ -102,6 +103,42 @@ class AssetAppTests(unittest.TestCase):
         assert asset.id is not None
         assert asset.document is not None
 
+    @patch.object(ZmlpClient, 'post')
+    def test_get_assets(self, post_patch):
+        def search(path, body):
+            ids = body['query']['terms']['_id']
+            return {'hits': {'hits': [
+                {'_id': i, '_source': {'source': {'filename': i}}}
+                for i in reversed(ids) if not i.startswith('missing')]}}
+
+        post_patch.side_effect = search
+        missing = []
+        ids = ['a', 'b', 'missing1', 'c', 'a', 'd', 'e']
+        assets = list(self.app.assets.get_assets(iter(ids), fields=['source'], chunk_size=2,
+                                                 concurrency=2, on_missing=missing.append))
+        assert ['a', 'b', 'c', 'a', 'd', 'e'] == [asset.id for asset in assets]
+        assert 'd' == assets[4].get_attr('source.filename')
+        assert ['missing1'] == missing
+        assert 4 == post_patch.call_count
+        body = post_patch.call_args_list[0][0][1]
+        assert ['source'] == body['_source']
+        assert 2 == body['size']
+
+    @patch.object(ZmlpClient, 'post')
+    def test_get_assets_bounded(self, post_patch):
+        post_patch.side_effect = lambda path, body: {'hits': {'hits': [
+            {'_id': i, '_source': {}} for i in body['query']['terms']['_id']]}}
+
+        ids = ('asset-{}'.format(i) for i in range(1000000))
+        assets = self.app.assets.get_assets(ids, chunk_size=10, concurrency=2)
+        assert 'asset-0' == next(assets).id
+        assets.close()
+        assert post_patch.call_count <= 3
+
+    def test_get_assets_bad_chunk_size(self):
+        with pytest.raises(ValueError):
+            self.app.assets.get_assets(['a'], chunk_size=20000)
+
     @patch.object(ZmlpClient, 'upload_files')
     def test_batch_upload_directory(self, post_patch):
         post_patch.return_value = self.mock_import_result
@@ -274,51 +311,77 @@ class AssetAppTests(unittest.TestCase):
         assert '12345' in args[0][0][1]['assetIds']
         assert '6789' in args[0][0][1]['assetIds']
 
-    @patch.object(ZmlpClient, 'get')
-    def test_download_file(self, get_patch):
+    @staticmethod
+    def mock_download(url, dst, block_size=None, checksum=None):
         data = b'some_data'
-        mockresponse = mock.Mock()
-        mockresponse.content = data
-        get_patch.return_value = mockresponse
+        if checksum is not None:
+            checksum.update(data)
+        if hasattr(dst, 'write'):
+            dst.write(data)
+        else:
+            with open(dst, 'wb') as fp:
+                fp.write(data)
+        return len(data)
+
+    @patch.object(ZmlpClient, 'download')
+    def test_download_file(self, dl_patch):
+        dl_patch.side_effect = self.mock_download
 
         b = self.app.assets.download_file('assets/123/proxy/proxy123.jpg')
         assert 'some_data' == b.read().decode()
+        assert '/api/v3/files/_stream/assets/123/proxy/proxy123.jpg' == dl_patch.call_args[0][0]
 
-    @patch.object(ZmlpClient, 'get')
-    def test_download_file_using_stored_file(self, get_patch):
-        data = b'some_data'
-        mockresponse = mock.Mock()
-        mockresponse.content = data
-        get_patch.return_value = mockresponse
+    @patch.object(ZmlpClient, 'download')
+    def test_download_file_using_stored_file(self, dl_patch):
+        dl_patch.side_effect = self.mock_download
 
         sf = StoredFile({"id": "assets/123/proxy/foo.jpg"})
         b = self.app.assets.download_file(sf)
         assert 'some_data' == b.read().decode()
 
-    @patch.object(ZmlpClient, 'get')
-    def test_download_file_to_file(self, get_patch):
-        data = b'some_data'
-        mockresponse = mock.Mock()
-        mockresponse.content = data
-        get_patch.return_value = mockresponse
+    @patch.object(ZmlpClient, 'download')
+    def test_download_file_to_file(self, dl_patch):
+        dl_patch.side_effect = self.mock_download
 
         fd, path = tempfile.mkstemp(".jpg")
         size = self.app.assets.download_file(
             'assets/123/proxy/proxy123.jpg', dst_file=path)
         assert 9 == size
 
-    @patch.object(ZmlpClient, 'get')
-    def test_download_file_to_file_using_stored_file(self, get_patch):
-        data = b'some_data'
-        mockresponse = mock.Mock()
-        mockresponse.content = data
-        get_patch.return_value = mockresponse
+    @patch.object(ZmlpClient, 'download')
+    def test_download_file_to_file_using_stored_file(self, dl_patch):
+        dl_patch.side_effect = self.mock_download
 
         fd, path = tempfile.mkstemp(".jpg")
         sf = StoredFile({"id": "assets/123/proxy/foo.jpg"})
         size = self.app.assets.download_file(sf, path)
         assert 9 == size
 
+    @patch.object(ZmlpClient, 'download')
+    def test_download_file_to_file_object_with_checksum(self, dl_patch):
+        dl_patch.side_effect = self.mock_download
+
+        checksum = hashlib.md5()
+        with tempfile.TemporaryFile() as fp:
+            size = self.app.assets.download_file('assets/123/proxy/foo.jpg', fp,
+                                                 block_size=4096, checksum=checksum)
+            fp.seek(0)
+            assert b'some_data' == fp.read()
+        assert 9 == size
+        assert hashlib.md5(b'some_data').hexdigest() == checksum.hexdigest()
+        assert 4096 == dl_patch.call_args[0][2]
+
+    @patch.object(ZmlpClient, 'download')
+    def test_download_file_to_memory_with_checksum(self, dl_patch):
+        dl_patch.side_effect = self.mock_download
+
+        checksum = hashlib.md5()
+        b = self.app.assets.download_file('assets/123/proxy/foo.jpg', checksum=checksum)
+        assert b'some_data' == b.read()
+        assert hashlib.md5(b'some_data').hexdigest() == checksum.hexdigest()
+        # The checksum is updated as the body is read.
+        assert checksum is dl_patch.call_args[0][3]
+
     @patch.object(ZmlpClient, 'upload_files')
     def test_et_sim_hashes(self, upload_patch):
         upload_patch.return_value = ['ABC']
@@ -333,6 +396,24 @@ class AssetAppTests(unittest.TestCase):
         b = self.app.assets.get_sim_hashes(path)
         assert b == ['ABC']
 
+    @patch.object(ZmlpClient, 'upload_files')
+    def test_batch_upload_files_progress(self, upload_patch):
+        upload_patch.return_value = self.mock_import_result
+        progress = []
+        fd, path = tempfile.mkstemp(".jpg")
+        rsp = self.app.assets.batch_upload_files([FileUpload(path)],
+                                                 progress=progress.append)
+        assert rsp['created'][0] == 'dd0KZtqyec48n1q1fniqVMV5yllhRRGx'
+        assert [path] == upload_patch.call_args[0][1]
+        assert progress.append == upload_patch.call_args[1]['progress']
+
+    @patch.object(ChunkedUpload, 'run')
+    def test_chunked_upload_file(self, run_patch):
+        run_patch.return_value = self.mock_import_result
+        fd, path = tempfile.mkstemp(".mov")
+        rsp = self.app.assets.chunked_upload_file(path, part_size=1024)
+        assert rsp['created'][0] == 'dd0KZtqyec48n1q1fniqVMV5yllhRRGx'
+
     @patch.object(ZmlpClient, 'upload_files')
     def test_get_sim_query(self, upload_patch):
         upload_patch.return_value = ['ABC']
@@ -0,0 +1,122 @@
+import asyncio
+import copy
+import io
+import os
+import tempfile
+import unittest
+from unittest.mock import patch, AsyncMock
+
+from zmlp import AsyncZmlpApp, AsyncZmlpClient, Asset, Job
+from zmlp.aio import aiohttp
+from zmlp.emulator import Corpus, Emulator
+
+key_dict = {
+    'accessKey': 'A5BAFAAA-42FD-45BE-9FA2-92670AB4DA80',
+    'secretKey': 'test123test135'
+}
+
+mock_search_result = {
+    'took': 4,
+    'timed_out': False,
+    '_scroll_id': 'abc123',
+    'hits': {
+        'total': {'value': 2},
+        'max_score': 0.2876821,
+        'hits': [
+            {
+                '_id': 'dd0KZtqyec48n1q1ffogVMV5yzthRRGx2WKzKLjDphg',
+                '_score': 0.2876821,
+                '_source': {'source': {'path': 'https://i.imgur.com/SSN26nN.jpg'}}
+            },
+            {
+                '_id': 'aabbccddec48n1q1fginVMV5yllhRRGx2WKyKLjDphg',
+                '_score': 0.2876821,
+                '_source': {'source': {'path': 'https://i.imgur.com/foo.jpg'}}
+            }
+        ]
+    }
+}
+
+
+@unittest.skipIf(aiohttp is None, 'aiohttp is not installed')
+class AsyncAssetAppTests(unittest.TestCase):
+
+    def setUp(self):
+        self.app = AsyncZmlpApp(key_dict)
+
+    @patch.object(AsyncZmlpClient, 'get', new_callable=AsyncMock)
+    def test_get_asset(self, get_patch):
+        get_patch.return_value = {'id': 'abc123', 'document': {'source': {'path': '/foo.jpg'}}}
+        asset = asyncio.run(self.app.assets.get_asset('abc123'))
+        assert isinstance(asset, Asset)
+        assert 'abc123' == asset.id
+        get_patch.assert_called_with('/api/v3/assets/abc123')
+
+    @patch.object(AsyncZmlpClient, 'post', new_callable=AsyncMock)
+    def test_search(self, post_patch):
+        post_patch.return_value = mock_search_result
+        result = asyncio.run(self.app.assets.search({'query': {'match_all': {}}}))
+        assert 2 == result.size
+        assert 'https://i.imgur.com/foo.jpg' == result.assets[1].get_attr('source.path')
+
+    @patch.object(AsyncZmlpClient, 'delete', new_callable=AsyncMock)
+    @patch.object(AsyncZmlpClient, 'post', new_callable=AsyncMock)
+    def test_scroll_search(self, post_patch, del_patch):
+        post_patch.side_effect = [copy.deepcopy(mock_search_result), {'hits': {'hits': []}}]
+        del_patch.return_value = {}
+
+        async def scroll():
+            return [asset async for asset in self.app.assets.scroll_search()]
+
+        assets = asyncio.run(scroll())
+        assert 2 == len(assets)
+        del_patch.assert_called_once()
+
+    def test_download_file(self):
+        with Emulator(Corpus(size=1, file_size=100 * 1024)) as emulator, \
+                tempfile.TemporaryDirectory() as tmpdir:
+            file_id = next(iter(emulator.corpus.files))
+            dst = os.path.join(tmpdir, 'file.jpg')
+            buf = io.BytesIO()
+
+            async def run():
+                async with AsyncZmlpApp(key_dict, emulator.url) as app:
+                    return (await app.assets.download_file(file_id, dst),
+                            await app.assets.download_file(file_id, buf),
+                            await app.assets.download_file(file_id))
+
+            # The same as the AssetApp, the size unless downloading to memory.
+            to_path, to_file, to_memory = asyncio.run(run())
+            content = emulator.corpus.file_content(file_id)
+            assert len(content) == to_path == to_file
+            assert content == buf.getvalue() == to_memory.getvalue()
+            with open(dst, 'rb') as fp:
+                assert content == fp.read()
+
+    def test_scroll_search_requires_async_for(self):
+        with self.assertRaises(TypeError):
+            iter(self.app.assets.scroll_search())
+
+
+@unittest.skipIf(aiohttp is None, 'aiohttp is not installed')
+class AsyncJobAppTests(unittest.TestCase):
+
+    def setUp(self):
+        self.app = AsyncZmlpApp(key_dict)
+
+    @patch.object(AsyncZmlpClient, 'get', new_callable=AsyncMock)
+    def test_get_job(self, get_patch):
+        get_patch.return_value = {'id': '12345', 'name': 'test'}
+        job = asyncio.run(self.app.jobs.get_job('12345'))
+        assert isinstance(job, Job)
+        assert 'test' == job.name
+
+    @patch.object(AsyncZmlpClient, 'post', new_callable=AsyncMock)
+    def test_find_jobs(self, post_patch):
+        post_patch.side_effect = [{'list': [{'id': '1'}, {'id': '2'}]}, {'list': []}]
+
+        async def find():
+            return [job async for job in self.app.jobs.find_jobs(state='Active')]
+
+        jobs = asyncio.run(find())
+        assert ['1', '2'] == [job.id for job in jobs]
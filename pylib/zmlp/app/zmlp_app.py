@@ -2,40 +2,180 @@ import base64
 import logging
 import os
 
-from . import AssetApp, DataSourceApp, ProjectApp, DataSetApp, JobApp, ModelApp, PipelineModApp
 from ..client import ZmlpClient
+from ..lazy import import_module
+from ..loader import DEFAULT_MAX_BATCH_SIZE
 
 logger = logging.getLogger(__name__)
 
 DEFAULT_SERVER = 'https://api.zmlp.zorroa.com'
 
+_restored = {}
+"""The ZmlpApps created by unpickling, by client instance id."""
+
+
+class _SubApp(object):
+    """
+    A sub-app, such as ZmlpApp.assets, which is imported and created the first
+    time it's used.  Once created it's stored on the app, so it can also be
+    replaced by assigning to it.
+    """
+
+    def __init__(self, module, name, loader=None):
+        """
+        Create a new _SubApp.
+
+        Args:
+            module (str): The module the sub-app class is in, relative to zmlp.app.
+            name (str): The name of the sub-app class.
+            loader (str): The name of the zmlp.loader class which batches the
+                sub-app's lookups, if the app has an asset_batch_window.
+        """
+        self.module = module
+        self.name = name
+        self.loader = loader
+        self.attr = None
+
+    def __set_name__(self, owner, attr):
+        self.attr = attr
+
+    def __get__(self, app, owner=None):
+        if app is None:
+            return self
+        cls = getattr(import_module(self.module, __package__), self.name)
+        sub_app = cls(app)
+        if self.loader and app.asset_batch_window is not None:
+            loader = getattr(import_module('..loader', __package__), self.loader)
+            sub_app.loader = loader(app, app.asset_batch_window, app.asset_batch_size)
+        # Another thread may have got there first, everyone gets the same one.
+        return app.__dict__.setdefault(self.attr, sub_app)
+
 
 class ZmlpApp(object):
     """
     Exposes the main ZMLP API.
 
+    A ZmlpApp is thread safe and cheap to pickle, it can be passed to, or its
+    methods used as tasks by, a multiprocessing.Pool.  See ZmlpClient.
+
+    The sub-apps, such as assets and jobs, are created the first time
+    they're used.
+
     """
-    def __init__(self, apikey, server=None):
+    assets = _SubApp('.asset_app', 'AssetApp', loader='AssetLoader')
+    datasource = _SubApp('.datasource_app', 'DataSourceApp')
+    projects = _SubApp('.project_app', 'ProjectApp')
+    datasets = _SubApp('.dataset_app', 'DataSetApp')
+    jobs = _SubApp('.job_app', 'JobApp')
+    models = _SubApp('.model_app', 'ModelApp')
+    pmods = _SubApp('.pmod_app', 'PipelineModApp')
+
+    def __init__(self, apikey, server=None, **kwargs):
         """
         Initialize a ZMLP Application instance.
 
         Args:
             apikey (mixed): An API key, can be either a key or file handle.
-            server (str): The URL to the ZMLP API server, defaults cloud api.
+            server (str): The URL to the ZMLP API server, defaults cloud api.  A list
+                of equivalent servers fails over between them, see ServerPool.
+            asset_batch_window (float): Merge get_asset() calls made by concurrent
+                threads within this many seconds into one search.  Disabled by default.
+            asset_batch_size (int): The maximum number of assets fetched by one
+                merged search.
+            **kwargs: Additional ZmlpClient options, for example pool_maxsize.
         """
         logger.debug("Initializing ZMLP to {}".format(server))
+        batch_window = kwargs.pop('asset_batch_window', None)
+        batch_size = kwargs.pop('asset_batch_size', DEFAULT_MAX_BATCH_SIZE)
         self.client = ZmlpClient(apikey, server or
-                                 os.environ.get("ZMLP_SERVER", DEFAULT_SERVER))
-        self.assets = AssetApp(self)
-        self.datasource = DataSourceApp(self)
-        self.projects = ProjectApp(self)
-        self.datasets = DataSetApp(self)
-        self.jobs = JobApp(self)
-        self.models = ModelApp(self)
-        self.pmods = PipelineModApp(self)
+                                 os.environ.get("ZMLP_SERVER", DEFAULT_SERVER), **kwargs)
+        self.asset_batch_window = batch_window
+        self.asset_batch_size = batch_size
+
+    def close(self):
+        """
+        Close any pooled connections held by the underlying ZmlpClient.
+        """
+        self.client.close()
+
+    def __reduce__(self):
+        return _restore_app, (self.client, self.asset_batch_window, self.asset_batch_size,
+                              os.getpid())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
 
 
-def app_from_env():
+def _restore_app(client, batch_window, batch_size, pid):
+    """
+    Unpickle a ZmlpApp.  In another process one ZmlpApp is created for each
+    unpickled client, in the same process the client and app are new.
+    """
+    app = _restored.get(client._instance_id)
+    if app is None or app.client is not client:
+        app = ZmlpApp.__new__(ZmlpApp)
+        app.client = client
+        app.asset_batch_window = batch_window
+        app.asset_batch_size = batch_size
+        if pid != os.getpid():
+            _restored[client._instance_id] = app
+    return app
+
+
+class AsyncZmlpApp(object):
+    """
+    Exposes the most commonly used parts of the ZMLP API as coroutines
+    for use with asyncio.  Requires the aiohttp library.
+
+    Examples:
+        async with AsyncZmlpApp(apikey) as app:
+            async for asset in app.assets.scroll_search(search):
+                do_something(asset)
+
+    """
+    assets = _SubApp('.async_asset_app', 'AsyncAssetApp', loader='AsyncAssetLoader')
+    jobs = _SubApp('.async_job_app', 'AsyncJobApp')
+
+    def __init__(self, apikey, server=None, **kwargs):
+        """
+        Initialize an async ZMLP Application instance.
+
+        Args:
+            apikey (mixed): An API key, can be either a key or file handle.
+            server (str): The URL to the ZMLP API server, defaults cloud api.  A list
+                of equivalent servers fails over between them, see ServerPool.
+            asset_batch_window (float): Merge get_asset() calls made by concurrent
+                tasks within this many seconds into one search.  Disabled by default.
+            asset_batch_size (int): The maximum number of assets fetched by one
+                merged search.
+            **kwargs: Additional AsyncZmlpClient options, for example pool_maxsize.
+        """
+        from ..aio import AsyncZmlpClient
+        logger.debug("Initializing async ZMLP to {}".format(server))
+        batch_window = kwargs.pop('asset_batch_window', None)
+        batch_size = kwargs.pop('asset_batch_size', DEFAULT_MAX_BATCH_SIZE)
+        self.client = AsyncZmlpClient(apikey, server or
+                                      os.environ.get("ZMLP_SERVER", DEFAULT_SERVER), **kwargs)
+        self.asset_batch_window = batch_window
+        self.asset_batch_size = batch_size
+
+    async def close(self):
+        """
+        Close any pooled connections held by the underlying AsyncZmlpClient.
+        """
+        await self.client.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+
+def app_from_env(**kwargs):
     """
     Create a ZmlpApp configured via environment variables. This method
     will not throw if the environment is configured improperly, however
@@ -44,16 +184,39 @@ def app_from_env():
 
     - ZMLP_APIKEY : A base64 encoded API key.
     - ZMLPL_APIKEY_FILE : A path to a JSON formatted API key.
-    - ZMLP_SERVER : The URL to the ZMLP API server.
+    - ZMLP_SERVER : The URL to the ZMLP API server, or a comma separated list of
+        equivalent servers.
+
+    Args:
+        **kwargs: Additional ZmlpClient options, for example pool_maxsize.
 
     Returns:
         ZmlpClient : A configured ZmlpClient
 
     """
+    return ZmlpApp(_apikey_from_env(), os.environ.get('ZMLP_SERVER'), **kwargs)
+
+
+def async_app_from_env(**kwargs):
+    """
+    Create an AsyncZmlpApp configured via environment variables.  See
+    app_from_env() for the supported environment variables.
+
+    Args:
+        **kwargs: Additional AsyncZmlpClient options, for example pool_maxsize.
+
+    Returns:
+        AsyncZmlpApp : A configured AsyncZmlpApp
+
+    """
+    return AsyncZmlpApp(_apikey_from_env(), os.environ.get('ZMLP_SERVER'), **kwargs)
+
+
+def _apikey_from_env():
     apikey = None
     if 'ZMLP_APIKEY' in os.environ:
         apikey = os.environ['ZMLP_APIKEY']
     elif 'ZMLP_APIKEY_FILE' in os.environ:
         with open(os.environ['ZMLP_APIKEY_FILE'], 'rb') as fp:
             apikey = base64.b64encode(fp.read())
-    return ZmlpApp(apikey, os.environ.get('ZMLP_SERVER'))
+    return apikey
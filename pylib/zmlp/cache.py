@@ -0,0 +1,241 @@
+"""An LRU cache of responses from slow changing endpoints."""
+import collections
+import threading
+import time
+
+from . import forksafe
+from .instrument import normalize_endpoint
+
+__all__ = [
+    'ResponseCache'
+]
+
+DEFAULT_TTLS = {
+    ('GET', '/api/v1/pipeline-mods/{id}'): 300,
+    ('POST', '/api/v1/pipeline-mods/_search'): 300,
+    ('POST', '/api/v1/pipeline-mods/_find_one'): 300,
+    ('GET', '/api/v1/data-sets/{id}'): 60,
+    ('GET', '/api/v1/project/_settings'): 60,
+    ('GET', '/api/v3/models/{id}'): 60
+}
+"""The default seconds a response is fresh for, by method and endpoint template."""
+
+_READ_ONLY_ACTIONS = frozenset(['_search', '_find', '_find_one'])
+
+DEFAULT_MAX_ENTRIES = 1024
+"""The default maximum number of cached responses."""
+
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+"""The default maximum total size of the cached responses."""
+
+
+class CacheEntry(object):
+    """
+    A cached response body and the validators needed to revalidate it.
+    """
+
+    __slots__ = ('content', 'etag', 'last_modified', 'expires', 'resource')
+
+    def __init__(self, content, etag, last_modified, expires, resource):
+        self.content = content
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires = expires
+        self.resource = resource
+
+    @property
+    def fresh(self):
+        """True if the entry can be used without asking the server."""
+        return time.monotonic() < self.expires
+
+    @property
+    def size(self):
+        """The size of the cached body in bytes."""
+        return len(self.content)
+
+
+class ResponseCache(object):
+    """
+    A thread safe LRU cache of response bodies from endpoints which rarely
+    change, for example PipelineMods, DataSets, project settings and Models.
+
+    A response is fresh for the TTL of its endpoint.  A stale GET response
+    with an ETag or Last-Modified header is revalidated with a conditional
+    request, and reused if the server replies 304 Not Modified.  Any other
+    request which changes a resource, for example a PUT to the project
+    settings or a POST to /api/v3/models/<id>/_publish, evicts the cached
+    responses for that resource and the searches of its collection.
+
+    Enable the cache with the ZmlpClient response_cache option.
+
+    Examples:
+        app = ZmlpApp(apikey, response_cache=ResponseCache(max_entries=500))
+        ...
+        print(app.client.response_cache.stats()['hit_rate'])
+    """
+
+    def __init__(self, ttls=None, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        Create a new ResponseCache.
+
+        Args:
+            ttls (dict): A dictionary of (method, endpoint template) to the seconds
+                a response is fresh for, merged with DEFAULT_TTLS.  An endpoint
+                template has ids replaced with {id}, see normalize_endpoint().
+                A TTL of None disables caching for an endpoint.
+            max_entries (int): The maximum number of cached responses.
+            max_bytes (int): The maximum total size of the cached response bodies.
+        """
+        self.ttls = dict(DEFAULT_TTLS)
+        self.ttls.update(ttls or {})
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = collections.OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = collections.Counter()
+        forksafe.register(self)
+
+    def __reduce__(self):
+        # The cached responses aren't sent to other processes.
+        return ResponseCache, (self.ttls, self.max_entries, self.max_bytes)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+
+    def ttl(self, method, url):
+        """
+        Return the TTL of the endpoint a request is for.
+
+        Args:
+            method (str): The HTTP method.
+            url (str): The request URL.
+
+        Returns:
+            int: The TTL in seconds, or None if the endpoint isn't cached.
+        """
+        return self.ttls.get((method.upper(), normalize_endpoint(url)))
+
+    def get(self, key):
+        """
+        Return the entry for a request, fresh or stale, and count a hit or miss.
+        The caller must revalidate a stale entry.
+
+        Args:
+            key (tuple): The request key.
+
+        Returns:
+            CacheEntry: The entry or None.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            if entry.fresh:
+                self._stats['hits'] += 1
+            else:
+                self._stats['stale'] += 1
+            return entry
+
+    def put(self, key, url, content, headers, ttl):
+        """
+        Cache a response body.  Bodies larger than a quarter of max_bytes and
+        responses marked Cache-Control: no-store are not cached.
+
+        Args:
+            key (tuple): The request key.
+            url (str): The request URL.
+            content (bytes): The response body.
+            headers (dict): The response headers.
+            ttl (int): The seconds the response is fresh for.
+        """
+        if len(content) > self.max_bytes // 4 or 'no-store' in headers.get('Cache-Control', ''):
+            return
+        entry = CacheEntry(content, headers.get('ETag'), headers.get('Last-Modified'),
+                           time.monotonic() + ttl, _resource(url))
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = entry
+            self._bytes += entry.size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._stats['evictions'] += 1
+
+    def revalidated(self, entry, ttl):
+        """
+        Mark a stale entry fresh again after the server replied 304 Not Modified.
+
+        Args:
+            entry (CacheEntry): The entry.
+            ttl (int): The seconds the response is fresh for.
+        """
+        entry.expires = time.monotonic() + ttl
+        with self._lock:
+            self._stats['revalidations'] += 1
+
+    def invalidate(self, url):
+        """
+        Remove the responses for the resource a request changes, and any
+        searches of its collection.
+
+        Args:
+            url (str): The URL of the request which changes the resource.
+        """
+        if not self._entries:
+            return
+        if _READ_ONLY_ACTIONS.intersection(url.split('?', 1)[0].split('/')):
+            return
+        resource = _resource(url)
+        with self._lock:
+            stale = [key for key, entry in self._entries.items()
+                     if entry.resource.startswith(resource) or
+                     resource.startswith(entry.resource)]
+            for key in stale:
+                self._remove(key)
+            self._stats['invalidations'] += len(stale)
+
+    def clear(self):
+        """
+        Remove all cached responses.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """
+        Return the cache statistics.
+
+        Returns:
+            dict: The hits, misses, stale entries found, revalidations, evictions,
+                invalidations, number of entries, total bytes and the hit rate,
+                which counts revalidated responses as hits.
+        """
+        with self._lock:
+            stats = {name: self._stats[name] for name in (
+                'hits', 'misses', 'stale', 'revalidations', 'evictions', 'invalidations')}
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+        lookups = stats['hits'] + stats['misses'] + stats['stale']
+        stats['hit_rate'] = (stats['hits'] + stats['revalidations']) / lookups if lookups else 0.0
+        return stats
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+
+def _resource(url):
+    """
+    Return the path of the resource a URL refers to, without the query or
+    any trailing '_action' segments, ending in a slash so it can be prefix
+    matched.  For example /api/v3/models/<id>/_publish becomes /api/v3/models/<id>/
+    and /api/v1/pipeline-mods/_search becomes /api/v1/pipeline-mods/
+    """
+    segments = url.split('?', 1)[0].split('://', 1)[-1].split('/')[1:]
+    while segments and (not segments[-1] or segments[-1].startswith('_')):
+        segments.pop()
+    return '/' + '/'.join(segments) + '/'
@@ -1,27 +1,86 @@
 import base64
 import binascii
-import datetime
-import decimal
+import copy
+import gzip
+import io
 import json
 import logging
 import os
-import random
 import sys
+import threading
 import time
-from io import IOBase
-from urllib.parse import urljoin
-
-import jwt
-import requests
-
+import uuid
+import weakref
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from . import forksafe
+from .cache import ResponseCache
+from .codec import get_json_codec, json_default
+from .multipart import MultipartEncoder
+from .download import RangedDownload, DEFAULT_PART_SIZE, DEFAULT_CONCURRENCY, \
+    DEFAULT_PARALLEL_THRESHOLD, read_block
 from .entity.exception import ZmlpException
+from .instrument import Instrumentation, RequestEvent
+from .lazy import lazy_import
+from .lanes import Lane, BULK, DEFAULT_BULK_CONCURRENCY, INTERACTIVE, resolve_lane, use_lane
+from .limiter import AdaptiveLimiter, ConcurrencyWindow
+from .retry import RetryPolicy
+from .servers import FAILURE_STATUSES, ServerPool
+from .singleflight import SingleFlight
+from .streaming import StreamingSearchResponse
+from .transport import default_transport, join_url
+from .timeouts import Deadline, DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT, \
+    current_deadline, current_timeouts, deadline as use_deadline, timeouts as use_timeouts
+
+# Imported on first use, which keeps 'import zmlp' fast.
+jwt = lazy_import('jwt')
+requests = lazy_import('requests')
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_POOL_CONNECTIONS = 4
+"""The default number of per-host connection pools to keep."""
+
+DEFAULT_POOL_MAXSIZE = 16
+"""The default maximum number of keep-alive connections per host."""
+
+STREAM_CHUNK_SIZE = 64 * 1024
+"""The size of the chunks read from streaming responses."""
+
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+"""The default size of the buffer used to download files."""
+
+DEFAULT_COMPRESS_THRESHOLD = 16 * 1024
+"""Request bodies at least this many bytes are compressed when compression is enabled."""
+
+TOKEN_TTL = 60
+"""The number of seconds a signed request token is valid for."""
+
+TOKEN_REFRESH_MARGIN = 10
+"""The number of seconds before expiry that a cached token is re-signed."""
+
+_clients = weakref.WeakValueDictionary()
+"""Every ZmlpClient in the process by instance id, used to unpickle a client."""
+
+_restored = {}
+"""The clients created by unpickling, which live as long as the process."""
+
 
 class ZmlpClient(object):
     """
     ZmlpClient is used to communicate to a ZMLP API server.
+
+    A ZmlpClient is thread safe and should be shared by the threads of a
+    process, the connection pools, limiters and caches are all locked.
+
+    A forked child process, for example a multiprocessing.Pool worker, drops
+    the connections and locks it inherited and opens its own connections on
+    first use.  Pickling a client only sends the API key, the servers and the
+    configuration, a worker which unpickles the same client many times gets
+    back one client with one connection pool.  Unpickling in the process the
+    client was pickled in, or copy.deepcopy(), creates a new client with the
+    same configuration.  The instrumentation, tracer and any cached responses
+    and tokens are not pickled.
     """
 
     def __init__(self, apikey, server, **kwargs):
@@ -31,14 +90,335 @@ class ZmlpClient(object):
         Args:
             apikey: An API key in any supported form. (dict, base64 string, or open file handle)
             server: The url of the server to connect to. Defaults to https://api.zmlp.zorroa.com
+                A list or comma separated string of equivalent servers, or a ServerPool,
+                sends each request to the fastest healthy server and fails over
+                between them, see ServerPool.
             project_id: An optional project UUID for API keys with access to multiple projects.
-            max_retries: Maximum number of retries to make if the API server
-                is down, 0 for unlimited.
+            max_retries: Maximum number of attempts to make if the API server
+                is down, 0 for unlimited.  Ignored if a retry_policy is provided.
+            retry_policy (RetryPolicy): A RetryPolicy which determines how failed
+                requests are retried.
+            pool_connections (int): The number of per-host connection pools to cache.
+            pool_maxsize (int): The maximum number of keep-alive connections
+                held open to a single host.
+            pool_block (bool): Block when the pool for a host is exhausted rather
+                than opening throw away connections.
+            compress_requests (bool): Gzip compress JSON request bodies that are
+                larger than the compress_threshold.  Defaults to False.
+            compress_threshold (int): The minimum size in bytes of a request body
+                that will be compressed.
+            compress_level (int): The gzip compression level, 1-9.
+            block_size (int): The size in bytes of the buffer used to download files.
+            download_part_size (int): The size in bytes of each range fetched
+                by a parallel download.
+            download_concurrency (int): The number of ranges fetched concurrently
+                by a parallel download, 1 to disable parallel downloads.
+            parallel_download_threshold (int): The minimum size in bytes of a
+                file that is downloaded in parallel.
+            limiter (AdaptiveLimiter): The limiter which controls the rate of requests
+                and number in flight, which can be shared between clients.  Set to
+                False to disable limiting.
+            rate_limits (dict): A dictionary of endpoint class to a tuple of the
+                requests per second and burst size for the default limiter, see
+                SUGGESTED_RATE_LIMITS.  Requests are not rate limited by default,
+                only the number in flight is.
+            lanes (list): A list of Lanes, which are classes of traffic with their
+                own connection pool and limiter.  Lanes named 'interactive' or
+                'bulk' replace the default lanes.  Scrolls, uploads and downloads
+                use the 'bulk' lane by default, everything else the 'interactive'
+                lane, which uses the pool_maxsize and limiter options.
+            instrumentation (Instrumentation): The Instrumentation which calls hooks
+                for every request, which can be shared between clients.
+            tracer (Tracer): An optional Tracer, which records a span for each request
+                and sends the W3C traceparent header.
+            single_flight (SingleFlight): Collapses identical GET requests and
+                downloads made by concurrent threads into one request.  Disabled by
+                default, set to True or a SingleFlight to enable.
+            response_cache (ResponseCache): An optional cache of responses from slow
+                changing endpoints, for example PipelineMods and DataSets.  Set to
+                True for a ResponseCache with the default settings.
+            connect_timeout (float): The seconds to wait for a connection to the server.
+            read_timeout (float): The seconds to wait for the server to send data.
+            operation_deadline (float): The default number of seconds a request,
+                including its retries, may take.  None for no deadline.
+            transport (Transport): The Transport which carries requests, for example
+                a SidecarTransport.  Defaults to TCP, or the sidecar named by the
+                ZMLP_SIDECAR environment variable.  A server URL made with
+                unix_url() is reached through a Unix domain socket.
         """
         self.apikey = self.__load_apikey(apikey)
-        self.server = server
+        if isinstance(server, str) and ',' in server:
+            server = [url.strip() for url in server.split(',') if url.strip()]
+        if isinstance(server, (list, tuple)):
+            server = ServerPool(server) if len(server) > 1 else server[0]
+        self.server_pool = server if isinstance(server, ServerPool) else None
+        self.server = self.server_pool.primary if self.server_pool else server
         self.project_id = kwargs.get('project_id')
         self.max_retries = kwargs.get('max_retries', 3)
+        self.pool_connections = kwargs.get('pool_connections', DEFAULT_POOL_CONNECTIONS)
+        self.pool_maxsize = kwargs.get('pool_maxsize', DEFAULT_POOL_MAXSIZE)
+        self.pool_block = kwargs.get('pool_block', False)
+        self.retry_policy = kwargs.get('retry_policy') or \
+            RetryPolicy(max_attempts=self.max_retries)
+        self.compress_requests = kwargs.get('compress_requests', False)
+        self.compress_threshold = kwargs.get('compress_threshold', DEFAULT_COMPRESS_THRESHOLD)
+        self.compress_level = kwargs.get('compress_level', 6)
+        self.block_size = kwargs.get('block_size', DEFAULT_BLOCK_SIZE)
+        self.download_part_size = kwargs.get('download_part_size', DEFAULT_PART_SIZE)
+        self.download_concurrency = kwargs.get('download_concurrency', DEFAULT_CONCURRENCY)
+        self.parallel_download_threshold = kwargs.get('parallel_download_threshold',
+                                                      DEFAULT_PARALLEL_THRESHOLD)
+        self.limiter = kwargs.get('limiter')
+        if self.limiter is None:
+            self.limiter = AdaptiveLimiter(
+                kwargs.get('rate_limits'), ConcurrencyWindow(initial=self.pool_maxsize))
+        self.lanes = {
+            INTERACTIVE: Lane(INTERACTIVE, pool_maxsize=self.pool_maxsize, limiter=self.limiter),
+            BULK: Lane(BULK, DEFAULT_BULK_CONCURRENCY, rate_limits=kwargs.get('rate_limits'),
+                       limiter=None if self.limiter else False)
+        }
+        for lane in kwargs.get('lanes') or []:
+            self.lanes[lane.name] = lane
+        self.limiter = self.lanes[INTERACTIVE].limiter
+        self.instrumentation = kwargs.get('instrumentation') or Instrumentation()
+        self.tracer = kwargs.get('tracer')
+        self.single_flight = kwargs.get('single_flight', False)
+        if self.single_flight is True:
+            self.single_flight = SingleFlight()
+        elif not self.single_flight:
+            self.single_flight = None
+        self.response_cache = kwargs.get('response_cache')
+        if self.response_cache is True:
+            self.response_cache = ResponseCache()
+        self.connect_timeout = kwargs.get('connect_timeout', DEFAULT_CONNECT_TIMEOUT)
+        self.read_timeout = kwargs.get('read_timeout', DEFAULT_READ_TIMEOUT)
+        self.operation_deadline = kwargs.get('operation_deadline')
+        self.transport = kwargs.get('transport') or default_transport()
+        self.token_cache = TokenCache()
+        self.transfer_stats = TransferStats()
+        self._session = None
+        self._lane_sessions = {}
+        self._session_lock = threading.Lock()
+        self._instance_id = uuid.uuid4().hex
+        _clients[self._instance_id] = self
+        forksafe.register(self)
+
+    @property
+    def session(self):
+        """
+        The requests.Session shared by all requests made with this client in
+        the interactive lane.  The Session holds a pool of keep-alive connections
+        per host, which allows TCP connections and TLS sessions to be reused
+        across requests.  The Session is created on first use.
+
+        Returns:
+            requests.Session: The shared Session.
+        """
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    self._session = self._create_session()
+        return self._session
+
+    def _create_session(self, pool_maxsize=None):
+        session = requests.Session()
+        session.verify = False
+        session.headers['Accept-Encoding'] = 'gzip, deflate'
+        self.transport.mount(session, self.pool_connections,
+                             pool_maxsize or self.pool_maxsize, self.pool_block)
+        return session
+
+    def close(self):
+        """
+        Close all pooled connections.  The client remains usable, a new
+        connection pool is created on the next request.
+        """
+        with self._session_lock:
+            sessions = list(self._lane_sessions.values())
+            if self._session is not None:
+                sessions.append(self._session)
+            self._session = None
+            self._lane_sessions = {}
+        for session in sessions:
+            session.close()
+
+    def _after_fork(self):
+        # The sockets are shared with the parent, so they are dropped rather
+        # than closed, closing a TLS connection would write to it.
+        self._session = None
+        self._lane_sessions = {}
+        self._session_lock = threading.Lock()
+
+    def __reduce__(self):
+        return _restore_client, (self._instance_id, os.getpid(), type(self), self.apikey,
+                                 self.server_pool or self.server, self._options())
+
+    def __deepcopy__(self, memo):
+        return type(self)(copy.deepcopy(self.apikey, memo),
+                          copy.deepcopy(self.server_pool or self.server, memo),
+                          **copy.deepcopy(self._options(), memo))
+
+    def _options(self):
+        """
+        Return the configuration a copy of this client is created with.
+
+        Returns:
+            dict: The keyword arguments for a new client.
+        """
+        return {
+            'project_id': self.project_id,
+            'max_retries': self.max_retries,
+            'retry_policy': self.retry_policy,
+            'pool_connections': self.pool_connections,
+            'pool_maxsize': self.pool_maxsize,
+            'pool_block': self.pool_block,
+            'compress_requests': self.compress_requests,
+            'compress_threshold': self.compress_threshold,
+            'compress_level': self.compress_level,
+            'block_size': self.block_size,
+            'download_part_size': self.download_part_size,
+            'download_concurrency': self.download_concurrency,
+            'parallel_download_threshold': self.parallel_download_threshold,
+            'limiter': self.limiter,
+            'lanes': list(self.lanes.values()),
+            'single_flight': self.single_flight is not None,
+            'response_cache': self.response_cache,
+            'connect_timeout': self.connect_timeout,
+            'read_timeout': self.read_timeout,
+            'operation_deadline': self.operation_deadline,
+            'transport': self.transport
+        }
+
+    def lane(self, name):
+        """
+        Return a context manager which sends the requests made within it, by
+        the current thread or asyncio task, through the given lane.  The lane
+        overrides the default lane of scroll, upload and download helpers.
+
+        Examples:
+            with app.client.lane('bulk'):
+                for asset in app.assets.search(search):
+                    ...
+
+        Args:
+            name (str): The lane name, None to leave the current lane unchanged.
+
+        Returns:
+            contextmanager: The context manager.
+        """
+        if name is not None and name not in self.lanes:
+            raise ValueError("Unknown lane '{}'".format(name))
+        return use_lane(name)
+
+    def get_lane(self, name=None):
+        """
+        Return a Lane by name, or the lane requests are currently sent through.
+
+        Args:
+            name (str): The lane name.
+
+        Returns:
+            Lane: The Lane.
+        """
+        name = resolve_lane(name, INTERACTIVE)
+        try:
+            return self.lanes[name]
+        except KeyError:
+            raise ValueError("Unknown lane '{}'".format(name))
+
+    def deadline(self, seconds):
+        """
+        Return a context manager which gives the requests made within it, by the
+        current thread or asyncio task, an overall deadline.  The remaining time
+        is shared by every request and retry in the block, and nested deadlines
+        can only shorten it.  A request which can't be finished in time raises
+        a ZmlpDeadlineExceededException.
+
+        Examples:
+            with app.client.deadline(30):
+                for asset in app.assets.scroll_search(search):
+                    ...
+
+        Args:
+            seconds (mixed): The number of seconds or a Deadline, None to leave
+                the current deadline unchanged.
+
+        Returns:
+            contextmanager: The context manager, which yields the Deadline.
+        """
+        return use_deadline(seconds)
+
+    def timeouts(self, connect=None, read=None):
+        """
+        Return a context manager which overrides the connect and read timeouts
+        of the requests made within it.
+
+        Args:
+            connect (float): The seconds to wait for a connection.
+            read (float): The seconds to wait for the server to send data.
+
+        Returns:
+            contextmanager: The context manager.
+        """
+        return use_timeouts(connect, read)
+
+    def _deadline(self):
+        """
+        Return the deadline of the current operation, which is the current
+        deadline or a new one of operation_deadline seconds.
+
+        Returns:
+            Deadline: The deadline, or None.
+        """
+        deadline = current_deadline()
+        if deadline is None and self.operation_deadline:
+            deadline = Deadline(self.operation_deadline)
+        return deadline
+
+    def _request_timeout(self, deadline, method, url):
+        """
+        Return the connect and read timeouts for a request, which are capped by
+        the time left before its deadline.
+
+        Args:
+            deadline (Deadline): The deadline of the request, if it has one.
+            method (str): The HTTP method.
+            url (str): The request URL.
+
+        Returns:
+            tuple: The connect and read timeouts in seconds.
+
+        Raises:
+            ZmlpDeadlineExceededException: If the deadline has passed.
+        """
+        connect, read = current_timeouts()
+        connect = connect or self.connect_timeout
+        read = read or self.read_timeout
+        if deadline is not None:
+            remaining = deadline.remaining()
+            if remaining <= 0:
+                raise ZmlpDeadlineExceededException(deadline, method, url)
+            connect = min(connect, remaining) if connect else remaining
+            read = min(read, remaining) if read else remaining
+        return connect, read
+
+    def __lane_session(self, lane):
+        if lane.name == INTERACTIVE:
+            return self.session
+        session = self._lane_sessions.get(lane.name)
+        if session is None:
+            with self._session_lock:
+                session = self._lane_sessions.get(lane.name)
+                if session is None:
+                    session = self._lane_sessions[lane.name] = \
+                        self._create_session(lane.pool_maxsize)
+        return session
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
 
     def stream(self, url, dst):
         """
@@ -48,21 +428,137 @@ class ZmlpClient(object):
             url (str): The URL to stream
             dst (str): The destination file path
         """
-        try:
-            with open(dst, 'wb') as handle:
-                response = requests.get(self.get_url(url), verify=False,
-                                        headers=self.headers(), stream=True)
+        self.download(url, dst)
+        return dst
 
-                if not response.ok:
-                    raise ZmlpClientException(
-                        "Failed to stream asset: %s, %s" % (url, response))
+    def download(self, url, dst, block_size=None, checksum=None,
+                 part_size=None, concurrency=None, lane=None):
+        """
+        Download the given URL path to a local file path or writable file object.
+        The response is never held in memory, it's read in blocks into a
+        single reusable buffer and written out as it arrives.
+
+        Downloads to a file path use HTTP Range requests.  The data is written
+        to a '.part' file first so an interrupted download resumes where it
+        left off, and large files are fetched as concurrent byte ranges.
+        See the download_part_size, download_concurrency and
+        parallel_download_threshold client options.
 
-                for block in response.iter_content(1024):
-                    handle.write(block)
-            return dst
+        Args:
+            url (str): The URL to download.
+            dst (mixed): The destination file path or a writable file object.
+            block_size (int): The size of the read buffer, defaults to the
+                client's block_size.
+            checksum (hashlib.Hash): An optional hashlib object, for example
+                hashlib.md5(), which is updated with the content as it is written.
+            part_size (int): Override the download_part_size.
+            concurrency (int): Override the download_concurrency.
+            lane (str): The lane to download through, defaults to 'bulk'.
+
+        Returns:
+            int: The number of bytes written.
+        """
+        # The deadline covers reading the body as well as each request.
+        with self.lane(resolve_lane(lane, BULK)), use_deadline(self._deadline()):
+            return self.__download(url, dst, block_size, checksum, part_size, concurrency)
+
+    def __download(self, url, dst, block_size, checksum, part_size, concurrency):
+        try:
+            if not hasattr(dst, 'write'):
+                return self.__download_path(url, dst, part_size, concurrency, block_size,
+                                            checksum)
+
+            response = self._send('get', self.get_url(url), stream=True)
+            with response:
+                if response.status_code != 200:
+                    self.__handle_rsp(response, False)
+                response.raw.decode_content = True
+                size = self.__read_into(response.raw, dst, block_size, checksum,
+                                        current_deadline(), url)
+                self.transfer_stats.add_response(size, _wire_size(response, size))
+            return size
         except requests.exceptions.ConnectionError as e:
             raise ZmlpConnectionException(e)
 
+    def __download_path(self, url, dst, part_size, concurrency, block_size, checksum):
+        flights = self.single_flight
+        if flights is None:
+            return RangedDownload(self, url, dst, part_size=part_size, concurrency=concurrency,
+                                  block_size=block_size, checksum=checksum).run()
+
+        dst = os.path.abspath(dst)
+        (size, src), shared = self.__coalesce(
+            ('download', self.get_url(url)), 'get', self.get_url(url), None,
+            lambda: self.__ranged_download(url, dst, part_size, concurrency, block_size,
+                                           checksum))
+        if shared:
+            # Another thread downloaded the same file, copy it, hashing it
+            # with this caller's checksum as it's copied.
+            with open(src, 'rb') as handle:
+                if src != dst:
+                    with open(dst, 'wb') as out:
+                        self.__read_into(handle, out, block_size, checksum)
+                elif checksum is not None:
+                    self.__read_into(handle, None, block_size, checksum)
+        return size
+
+    def __ranged_download(self, url, dst, part_size, concurrency, block_size, checksum):
+        size = RangedDownload(self, url, dst, part_size=part_size, concurrency=concurrency,
+                              block_size=block_size, checksum=checksum).run()
+        return size, dst
+
+    def download_bytes(self, url, block_size=None, lane=None, checksum=None):
+        """
+        Download the given URL path into memory.  If single_flight is enabled,
+        concurrent downloads of the same URL are made once and the content is
+        shared.
+
+        Args:
+            url (str): The URL to download.
+            block_size (int): The size of the read buffer, defaults to the
+                client's block_size.
+            lane (str): The lane to download through, defaults to 'bulk'.
+            checksum (hashlib.Hash): An optional hashlib object, for example
+                hashlib.md5(), which is updated with the content as it is read.
+
+        Returns:
+            bytes: The content.
+        """
+        with self.lane(resolve_lane(lane, BULK)):
+            flights = self.single_flight
+            if flights is None:
+                return self.__download_bytes(url, block_size, checksum)
+            data, shared = self.__coalesce(('download', self.get_url(url), None), 'get',
+                                           self.get_url(url), None,
+                                           lambda: self.__download_bytes(url, block_size,
+                                                                         checksum))
+            if shared and checksum is not None:
+                # Another thread downloaded the content and hashed it with its
+                # own checksum.
+                checksum.update(data)
+            return data
+
+    def __download_bytes(self, url, block_size, checksum):
+        buf = io.BytesIO()
+        self.download(url, buf, block_size, checksum)
+        return buf.getvalue()
+
+    def __read_into(self, src, dst, block_size, checksum, deadline=None, url=None):
+        buf = bytearray(block_size or self.block_size)
+        view = memoryview(buf)
+        size = 0
+        while True:
+            count = read_block(src, view, deadline, url)
+            if not count:
+                break
+            block = view[:count]
+            if dst is not None:
+                dst.write(block)
+            if checksum is not None:
+                checksum.update(block)
+            size += count
+        return size
+
     def stream_text(self, url):
         """
         Stream the given URL.
@@ -75,20 +571,20 @@ class ZmlpClient(object):
                 URL.
         """
         try:
-            response = requests.get(self.get_url(url), verify=False,
-                                    headers=self.headers(), stream=True)
-            if not response.ok:
-                raise ZmlpClientException(
-                    "Failed to stream asset: %s" % response)
+            response = self._send('get', self.get_url(url), stream=True)
+            with response:
+                if not response.ok:
+                    raise ZmlpClientException(
+                        "Failed to stream asset: %s" % response)
 
-            for line in response.iter_lines():
-                if line:
-                    yield line
+                for line in response.iter_lines():
+                    if line:
+                        yield line
 
         except requests.exceptions.ConnectionError as e:
             raise ZmlpConnectionException(e)
 
-    def upload_file(self, path, file, body={}, json_rsp=True):
+    def upload_file(self, path, file, body={}, json_rsp=True, progress=None, lane=None):
         """
         Upload a single file and a request to the given endpoint path.
 
@@ -97,59 +593,55 @@ class ZmlpClient(object):
             file (str): The file path to upload.
             body (dict): A request body
             json_rsp (bool): Set to true if the result returned is JSON
+            progress (func): An optional function called with the number of bytes
+                sent and the total size as the upload progresses.
+            lane (str): The lane to upload through, defaults to 'bulk'.
 
         Returns:
             dict: The response body of the request.
         """
-        try:
-            post_files = [("file", (os.path.basename(file), open(file, 'rb')))]
-            if body is not None:
-                post_files.append(
-                    ["body", (None, to_json(body), 'application/json')])
-
-            return self.__handle_rsp(requests.post(
-                self.get_url(path), headers=self.headers(content_type=""),
-                files=post_files), json_rsp)
-
-        except requests.exceptions.ConnectionError as e:
-            raise ZmlpConnectionException(e)
+        encoder = MultipartEncoder(callback=progress)
+        encoder.add_file("file", file)
+        if body is not None:
+            encoder.add_field("body", to_json(body), content_type='application/json')
+        return self.__upload(path, encoder, json_rsp, lane)
 
-    def upload_files(self, path, files, body, json_rsp=True):
+    def upload_files(self, path, files, body, json_rsp=True, progress=None, lane=None):
         """
-        Upload an array of files and a reques to the given endpoint path.
+        Upload an array of files and a reques to the given endpoint path.  The
+        request body is streamed, each file is only opened while it's being sent.
 
         Args:
             path (str): The URL to upload to
-            files (list of str): The file paths to upload
+            files (list of str): The file paths or file handles to upload
             body (dict): A request body
             json_rsp (bool): Set to true if the result returned is JSON
+            progress (func): An optional function called with the number of bytes
+                sent and the total size as the upload progresses.
+            lane (str): The lane to upload through, defaults to 'bulk'.
 
         Returns:
             dict: The response body of the request.
         """
-        try:
-            post_files = []
-            for f in files:
-                if isinstance(f, IOBase):
-                    post_files.append(
-                        ("files", (os.path.basename(f.name), f)))
-                else:
-                    post_files.append(
-                        ("files", (os.path.basename(f), open(f, 'rb'))))
-
-            if body is not None:
-                post_files.append(
-                    ("body", ("", to_json(body),
-                              'application/json')))
-
-            return self.__handle_rsp(requests.post(
-                self.get_url(path), headers=self.headers(content_type=""),
-                files=post_files), json_rsp)
+        encoder = MultipartEncoder(callback=progress)
+        for f in files:
+            encoder.add_file("files", f)
+        if body is not None:
+            encoder.add_field("body", to_json(body), content_type='application/json',
+                              filename="")
+        return self.__upload(path, encoder, json_rsp, lane)
 
+    def __upload(self, path, encoder, json_rsp, lane):
+        try:
+            with encoder, self.lane(resolve_lane(lane, BULK)):
+                rsp = self._send('post', self.get_url(path),
+                                 content_type=encoder.content_type, data=encoder)
+                self.transfer_stats.add_request(encoder.bytes_read, encoder.bytes_read)
+                return self.__handle_rsp(rsp, json_rsp)
         except requests.exceptions.ConnectionError as e:
             raise ZmlpConnectionException(e)
 
-    def get(self, path, body=None, is_json=True):
+    def get(self, path, body=None, is_json=True, lane=None):
         """
         Performs a get request.
 
@@ -157,6 +649,7 @@ class ZmlpClient(object):
             path (str): An archivist URI path.
             body (dict): The request body which will be serialized to json.
             is_json (bool): Set to true to specify a JSON return value
+            lane (str): The lane to send the request through.
 
         Returns:
             object: The http response object or an object deserialized from the
@@ -166,9 +659,10 @@ class ZmlpClient(object):
             Exception: An error occurred making the request or parsing the
                 JSON response
         """
-        return self._make_request('get', path, body, is_json)
+        with self.lane(lane):
+            return self._make_request('get', path, body, is_json)
 
-    def post(self, path, body=None, is_json=True):
+    def post(self, path, body=None, is_json=True, lane=None):
         """
         Performs a post request.
 
@@ -176,6 +670,7 @@ class ZmlpClient(object):
             path (str): An archivist URI path.
             body (object): The request body which will be serialized to json.
             is_json (bool): Set to true to specify a JSON return value
+            lane (str): The lane to send the request through.
 
         Returns:
             object: The http response object or an object deserialized from the
@@ -185,9 +680,10 @@ class ZmlpClient(object):
             Exception: An error occurred making the request or parsing the
                 JSON response
         """
-        return self._make_request('post', path, body, is_json)
+        with self.lane(lane):
+            return self._make_request('post', path, body, is_json)
 
-    def put(self, path, body=None, is_json=True):
+    def put(self, path, body=None, is_json=True, lane=None):
         """
         Performs a put request.
 
@@ -195,6 +691,7 @@ class ZmlpClient(object):
             path (str): An archivist URI path.
             body (object): The request body which will be serialized to json.
             is_json (bool): Set to true to specify a JSON return value
+            lane (str): The lane to send the request through.
 
         Returns:
             object: The http response object or an object deserialized from the
@@ -204,9 +701,10 @@ class ZmlpClient(object):
             Exception: An error occurred making the request or parsing the
                 JSON response
         """
-        return self._make_request('put', path, body, is_json)
+        with self.lane(lane):
+            return self._make_request('put', path, body, is_json)
 
-    def delete(self, path, body=None, is_json=True):
+    def delete(self, path, body=None, is_json=True, lane=None):
         """
          Performs a delete request.
 
@@ -214,6 +712,7 @@ class ZmlpClient(object):
              path (str): An archivist URI path.
              body (object): The request body which will be serialized to json.
              is_json (bool): Set to true to specify a JSON return value
+             lane (str): The lane to send the request through.
 
          Returns:
              object: The http response object or an object deserialized from
@@ -223,7 +722,71 @@ class ZmlpClient(object):
              Exception: An error occurred making the request or parsing the
                 JSON response
          """
-        return self._make_request('delete', path, body, is_json)
+        with self.lane(lane):
+            return self._make_request('delete', path, body, is_json)
+
+    def put_bytes(self, path, data, headers=None, is_json=True, lane=None):
+        """
+        Performs a put request with a raw binary body, for example one
+        part of a chunked upload.  A PUT is idempotent so the request is
+        retried according to the retry_policy if it fails.
+
+        Args:
+            path (str): An archivist URI path.
+            data (bytes): The request body.
+            headers (dict): Additional request headers.
+            is_json (bool): Set to true to specify a JSON return value
+            lane (str): The lane to send the request through, defaults to 'bulk'.
+
+        Returns:
+            object: The http response object or an object deserialized from the
+                response json if the ``json`` argument is true.
+        """
+        try:
+            with self.lane(resolve_lane(lane, BULK)):
+                rsp = self._send('put', self.get_url(path),
+                                 content_type='application/octet-stream',
+                                 data=data, headers=headers)
+            self.transfer_stats.add_request(len(data), len(data))
+            return self.__handle_rsp(rsp, is_json)
+        except requests.exceptions.ConnectionError as e:
+            raise ZmlpConnectionException(e)
+
+    def post_streaming(self, path, body=None, lane=None):
+        """
+        Performs a search post request and returns a StreamingSearchResponse,
+        which decodes the search hits incrementally as the response body
+        is received.
+
+        Args:
+            path (str): An archivist URI path.
+            body (object): The request body which will be serialized to json.
+            lane (str): The lane to send the request through.
+
+        Returns:
+            StreamingSearchResponse: The streaming response.
+
+        Raises:
+            Exception: An error occurred making the request.
+        """
+        data, headers = self._encode_body(body)
+        with self.lane(lane):
+            rsp = self._send('post', self.get_url(path, body), data=data, headers=headers,
+                             stream=True)
+        if rsp.status_code != 200:
+            with rsp:
+                self.__handle_rsp(rsp, True)
+        return StreamingSearchResponse(self.__iter_content(rsp))
+
+    def __iter_content(self, rsp):
+        size = 0
+        try:
+            for chunk in rsp.iter_content(STREAM_CHUNK_SIZE):
+                size += len(chunk)
+                yield chunk
+        finally:
+            self.transfer_stats.add_response(size, _wire_size(rsp, size))
+            rsp.close()
 
     def iter_paged_results(self, url, req, limit, cls):
         """
@@ -260,52 +823,303 @@ class ZmlpClient(object):
                 break
 
     def _make_request(self, method, path, body=None, is_json=True):
-        request_function = getattr(requests, method)
-        if body is not None:
-            data = to_json(body)
-        else:
-            data = body
-
-        # Making the request is wrapped in its own try/catch so it's easier
-        # to catch any and all socket and http exceptions that can possibly be
-        # thrown.  Once hat happens, handle_rsp is called which may throw
-        # application level exceptions.
-        rsp = None
-        tries = 0
+        cache = self.response_cache
+        if cache is not None and is_json:
+            url = self.get_url(path, body)
+            ttl = cache.ttl(method, url)
+            if ttl is not None:
+                return self.__cached_request(method, url, body, ttl)
+            if method.lower() != 'get':
+                try:
+                    return self.__make_request(method, path, body, is_json)
+                finally:
+                    cache.invalidate(url)
+        return self.__make_request(method, path, body, is_json)
+
+    def __cached_request(self, method, url, body, ttl):
+        cache = self.response_cache
+        codec = get_json_codec()
+        key = (method.upper(), url, None if body is None else codec.dumpb(body))
+        entry = cache.get(key)
+        if entry is not None and entry.fresh:
+            return codec.loads(entry.content)
+
+        data, headers = self._encode_body(body)
+        if entry is not None and method.lower() == 'get':
+            headers = dict(headers or {})
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+        rsp = self.__send_shared(method, url, data, headers)
+        if rsp.status_code == 304 and entry is not None:
+            cache.revalidated(entry, ttl)
+            return codec.loads(entry.content)
+        result = self.__handle_rsp(rsp, True)
+        if rsp.content:
+            cache.put(key, url, rsp.content, rsp.headers, ttl)
+        return result
+
+    def __make_request(self, method, path, body, is_json):
+        instrumentation = self.instrumentation
+        if not instrumentation.enabled:
+            data, headers = self._encode_body(body)
+            url = self.get_url(path, body)
+            rsp = self.__send_shared(method, url, data, headers)
+            return self.__handle_rsp(rsp, is_json)
+
         url = self.get_url(path, body)
+        event = instrumentation.start(method, url)
+        try:
+            start = time.perf_counter()
+            data, headers = self._encode_body(body)
+            event.serialize_time = time.perf_counter() - start
+            rsp = self.__send_shared(method, url, data, headers, event)
+            start = time.perf_counter()
+            result = self.__handle_rsp(rsp, is_json)
+            event.parse_time = time.perf_counter() - start
+            return result
+        except BaseException as e:
+            event.error = e
+            raise
+        finally:
+            instrumentation.end(event)
+
+    def __send_shared(self, method, url, data, headers, event=None):
+        """
+        Send a request, sharing the response of an identical GET which is
+        already in flight if single_flight is enabled.  Each caller parses
+        the shared response itself, so results are never shared.
+        """
+        flights = self.single_flight
+        if flights is None or method.lower() != 'get':
+            return self._send(method, url, data=data, headers=headers, event=event)
+        key = ('GET', url, data, tuple(sorted(headers.items())) if headers else None)
+        rsp, _ = self.__coalesce(key, method, url, event, lambda: self._send(
+            method, url, data=data, headers=headers, event=event))
+        return rsp
+
+    def __coalesce(self, key, method, url, event, func):
+        """
+        Call func() through single_flight.  A caller which shares
+        an identical call already in flight waits no longer than the deadline
+        of the operation, and its request is instrumented as coalesced, either
+        by marking the caller's event or by recording a new one.
+
+        Returns:
+            tuple: The result and True if it was shared with another caller.
+        """
+        instrumentation = self.instrumentation
+        record = event is None and instrumentation.enabled
+        if record:
+            event = RequestEvent(method, url)
+        called = []
+
+        def call():
+            called.append(True)
+            return func()
+
+        deadline = self._deadline()
+        try:
+            result, shared = self.single_flight.do(
+                key, call, timeout=deadline.remaining() if deadline is not None else None)
+        except BaseException as e:
+            if called:
+                raise
+            error = e
+            if isinstance(e, FutureTimeoutError) and deadline is not None and deadline.expired:
+                # Gave up waiting for the caller making the call.
+                error = ZmlpDeadlineExceededException(deadline, method, url)
+            if event is not None:
+                event.error = error
+                self.__end_coalesced(event, record)
+            if error is e:
+                raise
+            raise error from e
+
+        if shared and event is not None:
+            event.status = getattr(result, 'status_code', 200)
+            self.__end_coalesced(event, record)
+        return result, shared
+
+    def __end_coalesced(self, event, record):
+        if record:
+            self.instrumentation.coalesced(event)
+        else:
+            # The caller records its own event.
+            event.coalesced = True
+
+    def _encode_body(self, body):
+        """
+        Serialize the given request body to JSON, compressing it if
+        compression is enabled and the body is large enough.
+
+        Args:
+            body (object): The request body.
+
+        Returns:
+            tuple: The encoded body and any additional request headers.
+        """
+        if body is None:
+            return None, None
+        data = get_json_codec().dumpb(body)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("json: %s" % data)
+        size = len(data)
+        headers = None
+        if self.compress_requests and size >= self.compress_threshold:
+            data = gzip.compress(data, self.compress_level)
+            headers = {'Content-Encoding': 'gzip'}
+        self.transfer_stats.add_request(size, len(data))
+        return data, headers
+
+    def _send(self, method, url, idempotent=None, content_type="application/json",
+              headers=None, event=None, **kwargs):
+        """
+        Send a request using the shared session.  Failed requests are retried
+        according to the retry_policy.  Any socket or http exception which is
+        not retried is raised, application level errors are handled by the caller.
+
+        Args:
+            method (str): The HTTP method.
+            url (str): The full URL.
+            idempotent (bool): Override the idempotency of the request.
+            content_type (str): The request content type.
+            headers (dict): Additional request headers.
+            event (RequestEvent): The instrumentation event for the request if the
+                caller is recording it, otherwise one is recorded if instrumentation
+                is enabled.
+            **kwargs: Additional arguments for requests.Session.request
+
+        Returns:
+            requests.Response: The response.
+        """
+        instrumentation = self.instrumentation
+        tracer = self.tracer
+        if tracer is None and (event is not None or not instrumentation.enabled):
+            return self.__send(method, url, idempotent, content_type, headers, event, kwargs)
+
+        hooks = event is None and instrumentation.enabled
+        if event is None:
+            event = instrumentation.start(method, url) if hooks else RequestEvent(method, url)
+        span = None
+        if tracer is not None:
+            span = tracer.start_request_span(event)
+            headers = dict(headers or {}, traceparent=span.traceparent)
+        try:
+            return self.__send(method, url, idempotent, content_type, headers, event, kwargs)
+        except BaseException as e:
+            event.error = e
+            raise
+        finally:
+            if span is not None:
+                tracer.end_request_span(span, event)
+            if hooks:
+                instrumentation.end(event)
+
+    def __send(self, method, url, idempotent, content_type, headers, event, kwargs):
+        lane = self.get_lane()
+        session = self.__lane_session(lane)
+        limiter = lane.limiter
+        pool = self.server_pool
+        server, target = None, url
+        deadline = self._deadline()
+        timeout = kwargs.pop('timeout', None)
+        state = self.retry_policy.begin(method, idempotent, url)
+        if event is not None:
+            event.request_bytes = _body_size(kwargs.get('data'))
         while True:
+            kwargs['timeout'] = timeout or self._request_timeout(deadline, method, url)
+            state.attempt()
+            if pool is not None:
+                server, target = pool.route(url, self.server)
+            req_headers = self.headers(content_type=content_type, server=server)
+            if headers:
+                req_headers.update(headers)
+            permit = limiter.acquire(method, url, deadline) if limiter else None
+            if event is not None:
+                event.retries = state.attempts - 1
+                start = time.perf_counter()
+            sent = time.monotonic()
             try:
-                rsp = request_function(url, data=data, headers=self.headers(),
-                                       verify=False)
-                break
+                rsp = session.request(method, target, headers=req_headers, **kwargs)
             except Exception as e:
-                # Some form of connection error, wait until archivist comes
-                # back.
-                tries += 1
-                if 0 < self.max_retries <= tries:
-                    raise e
-                wait = random.randint(1, random.randint(1, 60))
-                # Switched to stderr in case no logger is setup, still want
-                # to see messages.
-                msg = "Communicating to ZMLP (%s) timed out %d times, " \
-                      "waiting ... %d seconds, error=%s\n"
-                sys.stderr.write(msg % (url, tries, wait, e))
-                time.sleep(wait)
-
-        return self.__handle_rsp(rsp, is_json)
+                if event is not None:
+                    event.network_time += time.perf_counter() - start
+                if permit:
+                    permit.feedback(error=e)
+                    permit.release()
+                delay = state.retry_delay(error=e)
+                if pool is not None:
+                    delay = _failover(pool, server, delay, failed=True)
+                delay = _within_deadline(deadline, delay)
+                if delay is None:
+                    if deadline is not None and deadline.expired:
+                        raise ZmlpDeadlineExceededException(deadline, method, url) from e
+                    raise
+                self.__log_retry(target, state, delay, e)
+            except BaseException:
+                if permit:
+                    permit.release()
+                if pool is not None:
+                    pool.abandon(server)
+                raise
+            else:
+                if permit:
+                    permit.feedback(status=rsp.status_code)
+                delay = state.retry_delay(status=rsp.status_code, headers=rsp.headers)
+                if pool is not None:
+                    delay = _failover(pool, server, delay, rsp.status_code in FAILURE_STATUSES,
+                                      time.monotonic() - sent)
+                delay = _within_deadline(deadline, delay)
+                if delay is None:
+                    if not kwargs.get('stream'):
+                        try:
+                            size = len(rsp.content)
+                        finally:
+                            if permit:
+                                permit.release()
+                        self.transfer_stats.add_response(size, _wire_size(rsp, size))
+                    else:
+                        size = int(rsp.headers.get('Content-Length') or 0)
+                        if permit:
+                            # The slot is freed once the headers arrive, the
+                            # caller may make other requests as it reads the body.
+                            permit.release()
+                    if event is not None:
+                        event.network_time += time.perf_counter() - start
+                        event.status = rsp.status_code
+                        event.response_bytes = size
+                    return rsp
+                rsp.close()
+                if event is not None:
+                    event.network_time += time.perf_counter() - start
+                if permit:
+                    permit.release()
+                self.__log_retry(target, state, delay, rsp.status_code)
+
+            time.sleep(delay)
+            _rewind_files(kwargs)
+
+    def __log_retry(self, url, state, delay, error):
+        # Switched to stderr in case no logger is setup, still want
+        # to see messages.
+        msg = "Communicating to ZMLP (%s) failed %d times, " \
+              "waiting ... %0.2f seconds, error=%s\n"
+        sys.stderr.write(msg % (url, state.attempts, delay, error))
 
     def __handle_rsp(self, rsp, is_json):
         if rsp.status_code != 200:
-            self.__raise_exception(rsp)
+            self._raise_exception(rsp)
         if is_json and len(rsp.content):
-            rsp_val = rsp.json()
-            if logger.getEffectiveLevel() == logging.DEBUG:
+            rsp_val = get_json_codec().loads(rsp.content)
+            if logger.isEnabledFor(logging.DEBUG):
                 logger.debug(
                     "rsp: status: %d  body: '%s'" % (rsp.status_code, rsp_val))
             return rsp_val
         return rsp
 
-    def __raise_exception(self, rsp):
+    def _raise_exception(self, rsp):
         data = {}
         try:
             data.update(rsp.json())
@@ -323,29 +1137,31 @@ class ZmlpClient(object):
         """
         Returns the full URL including the configured server part.
         """
-        url = urljoin(self.server, path)
-        if logger.getEffectiveLevel() == logging.DEBUG:
+        url = join_url(self.server, path)
+        if logger.isEnabledFor(logging.DEBUG):
             logger.debug("url: '%s' path: '%s' body: '%s'" % (url, path, body))
         return url
 
-    def headers(self, content_type="application/json"):
+    def headers(self, content_type="application/json", server=None):
         """
         Generate the return some request headers.
 
         Args:
             content_type(str):  The content-type for the request. Defaults to
                 'application/json'
+            server (str): The server the request is sent to, which is the audience
+                of the signed token.  Defaults to the client's server.
 
         Returns:
             dict: An http header struct.
 
         """
-        header = {'Authorization': "Bearer {}".format(self.__sign_request())}
+        header = {'Authorization': "Bearer {}".format(self.__sign_request(server))}
 
         if content_type:
             header['Content-Type'] = content_type
 
-        if logger.getEffectiveLevel() == logging.DEBUG:
+        if logger.isEnabledFor(logging.DEBUG):
             logger.debug("headers: %s" % header)
 
         return header
@@ -366,22 +1182,259 @@ class ZmlpClient(object):
 
         return key_data
 
-    def __sign_request(self):
+    def __sign_request(self, server=None):
+        server = server or self.server
         if not self.apikey:
             raise RuntimeError("Unable to make request, no ApiKey has been specified.")
+        task_id = os.environ.get("ZMLP_TASK_ID")
+        job_id = os.environ.get("ZMLP_JOB_ID") if task_id else None
+
+        key = (server, self.project_id, task_id, job_id)
+        token = self.token_cache.get(key)
+        if token:
+            return token
+
+        expires = int(time.time()) + TOKEN_TTL
         claims = {
-            'aud': self.server,
-            'exp': datetime.datetime.utcnow() + datetime.timedelta(seconds=60),
+            'aud': server,
+            'exp': expires,
             'accessKey': self.apikey["accessKey"],
         }
 
-        if os.environ.get("ZMLP_TASK_ID"):
-            claims['taskId'] = os.environ.get("ZMLP_TASK_ID")
-            claims['jobId'] = os.environ.get("ZMLP_JOB_ID")
+        if task_id:
+            claims['taskId'] = task_id
+            claims['jobId'] = job_id
 
         if self.project_id:
             claims["projectId"] = self.project_id
-        return jwt.encode(claims, self.apikey['secretKey'], algorithm='HS512').decode("utf-8")
+
+        token = jwt.encode(claims, self.apikey['secretKey'], algorithm='HS512')
+        # Older versions of PyJWT return bytes.
+        if isinstance(token, bytes):
+            token = token.decode("utf-8")
+        self.token_cache.put(key, token, expires)
+        return token
+
+
+class TokenCache(object):
+    """
+    A thread safe cache of signed request tokens.  A signed token is reused
+    until it is within TOKEN_REFRESH_MARGIN seconds of expiring, which avoids
+    re-signing a token for every single request.  Tokens are keyed on the
+    claims that can change between requests, for example the project and
+    task context.
+    """
+
+    def __init__(self, refresh_margin=TOKEN_REFRESH_MARGIN):
+        """
+        Create a new TokenCache.
+
+        Args:
+            refresh_margin (int): The number of seconds before expiry that
+                a token is considered stale.
+        """
+        self.refresh_margin = refresh_margin
+        self.hits = 0
+        self.misses = 0
+        self._tokens = {}
+        self._lock = threading.Lock()
+        forksafe.register(self)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Return the cached token for the given key or None if there is no
+        token or the token is about to expire.
+
+        Args:
+            key (tuple): The cache key.
+
+        Returns:
+            str: The signed token or None.
+        """
+        with self._lock:
+            entry = self._tokens.get(key)
+            if entry and entry[1] - self.refresh_margin > time.time():
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            return None
+
+    def put(self, key, token, expires):
+        """
+        Add a signed token to the cache.
+
+        Args:
+            key (tuple): The cache key.
+            token (str): The signed token.
+            expires (int): The token expiration time in epoch seconds.
+        """
+        with self._lock:
+            self._tokens[key] = (token, expires)
+
+    def clear(self):
+        """
+        Remove all cached tokens.
+        """
+        with self._lock:
+            self._tokens.clear()
+
+    def stats(self):
+        """
+        Return the cache hit and miss counters.
+
+        Returns:
+            dict: A dictionary of hits, misses and the cache size.
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._tokens)
+            }
+
+
+class TransferStats(object):
+    """
+    Thread safe counters for the number of bytes transferred.  The logical
+    size is the size of the uncompressed data, the wire size is the number
+    of bytes actually sent or received, which may be compressed.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+        self.reset()
+        forksafe.register(self)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+
+    def add_request(self, logical, wire):
+        """
+        Record a request body being sent.
+
+        Args:
+            logical (int): The uncompressed size in bytes.
+            wire (int): The size in bytes actually sent.
+        """
+        with self._lock:
+            self._stats['request_bytes_logical'] += logical
+            self._stats['request_bytes_wire'] += wire
+            if wire != logical:
+                self._stats['compressed_requests'] += 1
+
+    def add_response(self, logical, wire):
+        """
+        Record a response body being received.
+
+        Args:
+            logical (int): The decoded size in bytes.
+            wire (int): The size in bytes actually received.
+        """
+        with self._lock:
+            self._stats['response_bytes_logical'] += logical
+            self._stats['response_bytes_wire'] += wire
+            if wire != logical:
+                self._stats['compressed_responses'] += 1
+
+    def stats(self):
+        """
+        Return a copy of the counters.
+
+        Returns:
+            dict: The transfer counters.
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def reset(self):
+        """
+        Reset all counters to zero.
+        """
+        with self._lock:
+            self._stats = {
+                'request_bytes_logical': 0,
+                'request_bytes_wire': 0,
+                'compressed_requests': 0,
+                'response_bytes_logical': 0,
+                'response_bytes_wire': 0,
+                'compressed_responses': 0
+            }
+
+
+def _restore_client(instance_id, pid, cls, apikey, server, options):
+    """
+    Unpickle a ZmlpClient.  Unpickling in the process it was pickled in makes
+    a new client.  In another process the client it was pickled from is
+    returned if it exists, for example in a forked worker, otherwise a client
+    is created once per instance id and reused.
+    """
+    if pid == os.getpid():
+        return cls(apikey, server, **options)
+    client = _clients.get(instance_id)
+    if client is None:
+        client = cls(apikey, server, **options)
+        client._instance_id = instance_id
+        _clients[instance_id] = client
+        _restored[instance_id] = client
+    return client
+
+
+def _wire_size(rsp, default):
+    """
+    Return the number of raw, possibly compressed, bytes read for the
+    given response, or the default if it's not known.
+    """
+    try:
+        size = rsp.raw.tell()
+    except Exception:
+        return default
+    return size if isinstance(size, int) and size > 0 else default
+
+
+def _body_size(data):
+    """
+    Return the size of a request body, or 0 if it's unknown.
+    """
+    if data is None:
+        return 0
+    if isinstance(data, (bytes, bytearray)):
+        return len(data)
+    return getattr(data, 'len', None) or 0
+
+
+def _within_deadline(deadline, delay):
+    """
+    Return the delay before a request is retried, or None if the retry
+    couldn't start before the deadline.
+    """
+    if delay is None or deadline is None or delay < deadline.remaining():
+        return delay
+    return None
+
+
+def _failover(pool, server, delay, failed, latency=None):
+    """
+    Record the outcome of a request sent to a server in a ServerPool, and
+    return the delay before it's retried.  A failed request is retried
+    immediately if another healthy server is available.
+    """
+    pool.record(server, latency, failed)
+    if failed and delay is not None and pool.has_alternative(server):
+        return 0
+    return delay
+
+
+def _rewind_files(kwargs):
+    """
+    Seek a streamed request body back to the start so the request
+    can be sent again.
+    """
+    if hasattr(kwargs.get('data'), 'seek'):
+        kwargs['data'].seek(0)
 
 
 class SearchResult(object):
@@ -415,8 +1468,8 @@ class SearchResult(object):
 
 def to_json(obj, indent=None):
     """
-    Convert the given object to a JSON string using
-    the ZmlpJsonEncoder.
+    Convert the given object to a JSON string using the
+    configured JsonCodec, see zmlp.codec.
 
     Args:
         obj (mixed): any json serializable python object.
@@ -425,8 +1478,8 @@ def to_json(obj, indent=None):
         str: The serialized object
 
     """
-    val = json.dumps(obj, cls=ZmlpJsonEncoder, indent=indent)
-    if logger.getEffectiveLevel() == logging.DEBUG:
+    val = get_json_codec().dumps(obj, indent)
+    if logger.isEnabledFor(logging.DEBUG):
         logger.debug("json: %s" % val)
     return val
 
@@ -437,21 +1490,11 @@ class ZmlpJsonEncoder(json.JSONEncoder):
     """
 
     def default(self, obj):
-        if hasattr(obj, 'for_json'):
-            return obj.for_json()
-        elif isinstance(obj, (set, frozenset)):
-            return list(obj)
-        elif isinstance(obj, datetime.datetime):
-            return obj.isoformat()
-        elif isinstance(obj, datetime.date):
-            return obj.isoformat()
-        elif isinstance(obj, datetime.time):
-            return obj.isoformat()
-        elif isinstance(obj, decimal.Decimal):
-            return float(obj)
-
-        # Let the base class default method raise the TypeError
-        return json.JSONEncoder.default(self, obj)
+        try:
+            return json_default(obj)
+        except TypeError:
+            # Let the base class default method raise the TypeError
+            return json.JSONEncoder.default(self, obj)
 
 
 class ZmlpClientException(ZmlpException):
@@ -496,6 +1539,17 @@ class ZmlpConnectionException(ZmlpClientException):
     pass
 
 
+class ZmlpDeadlineExceededException(ZmlpClientException):
+    """
+    This exception is thrown if a request can't be finished before the
+    deadline of the operation making it.
+    """
+    def __init__(self, deadline, method, url):
+        super(ZmlpDeadlineExceededException, self).__init__(
+            "Deadline of {}s exceeded, {} {}".format(deadline.seconds, method.upper(), url))
+        self.deadline = deadline
+
+
 class ZmlpWriteException(ZmlpRequestException):
     """
     This exception is thrown the Zmlp fails a write operation.
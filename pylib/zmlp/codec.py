@@ -0,0 +1,189 @@
+"""Pluggable JSON codecs used for serializing requests and parsing responses."""
+import datetime
+import decimal
+import json
+import os
+
+from .lazy import lazy_import
+
+# Optional, and only imported once a codec is needed.
+orjson = lazy_import('orjson', optional=True)
+
+__all__ = [
+    'JsonCodec',
+    'StdlibJsonCodec',
+    'OrjsonCodec',
+    'get_json_codec',
+    'set_json_codec'
+]
+
+
+def json_default(obj):
+    """
+    Convert objects that are not natively JSON serializable into a
+    serializable form.  This implements the ZMLP specific serialization
+    defaults shared by all codecs.
+
+    Args:
+        obj (mixed): The object to convert.
+
+    Returns:
+        mixed: A JSON serializable object.
+
+    Raises:
+        TypeError: If the object cannot be serialized.
+    """
+    if hasattr(obj, 'for_json'):
+        return obj.for_json()
+    elif isinstance(obj, (set, frozenset)):
+        return list(obj)
+    elif isinstance(obj, datetime.datetime):
+        return obj.isoformat()
+    elif isinstance(obj, datetime.date):
+        return obj.isoformat()
+    elif isinstance(obj, datetime.time):
+        return obj.isoformat()
+    elif isinstance(obj, decimal.Decimal):
+        return float(obj)
+    raise TypeError("Object of type {} is not JSON serializable".format(type(obj).__name__))
+
+
+class JsonCodec(object):
+    """
+    The base class for JSON codecs.
+    """
+
+    name = None
+    """The name of the codec"""
+
+    def dumps(self, obj, indent=None):
+        """
+        Serialize the given object to a JSON string.
+
+        Args:
+            obj (mixed): any json serializable python object.
+            indent (int): The indentation level for the json, or None for compact.
+
+        Returns:
+            str: The serialized object.
+        """
+        raise NotImplementedError()
+
+    def dumpb(self, obj):
+        """
+        Serialize the given object to UTF-8 encoded JSON bytes.
+
+        Args:
+            obj (mixed): any json serializable python object.
+
+        Returns:
+            bytes: The serialized object.
+        """
+        return self.dumps(obj).encode('utf-8')
+
+    def loads(self, data):
+        """
+        Deserialize the given JSON document.
+
+        Args:
+            data (mixed): A str or bytes JSON document.
+
+        Returns:
+            mixed: The deserialized object.
+        """
+        raise NotImplementedError()
+
+
+class StdlibJsonCodec(JsonCodec):
+    """
+    A JsonCodec which uses the standard library json module.
+    """
+
+    name = 'stdlib'
+
+    def dumps(self, obj, indent=None):
+        return json.dumps(obj, default=json_default, indent=indent)
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+class OrjsonCodec(JsonCodec):
+    """
+    A JsonCodec which uses the orjson library.  The output is compact
+    rather than using the stdlib separators.  Objects orjson cannot
+    handle, for example integers larger than 64 bits, fall back to
+    the stdlib codec.
+    """
+
+    name = 'orjson'
+
+    def __init__(self):
+        if orjson is None:
+            raise ImportError("The orjson library is not installed")
+        self.fallback = StdlibJsonCodec()
+        self.options = orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, obj, indent=None):
+        if indent is not None:
+            return self.fallback.dumps(obj, indent)
+        return self.dumpb(obj).decode('utf-8')
+
+    def dumpb(self, obj):
+        try:
+            return orjson.dumps(obj, default=json_default, option=self.options)
+        except orjson.JSONEncodeError:
+            return self.fallback.dumpb(obj)
+
+    def loads(self, data):
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # orjson is stricter than the stdlib, for example with NaN.
+            return self.fallback.loads(data)
+
+
+CODECS = {
+    'stdlib': StdlibJsonCodec,
+    'orjson': OrjsonCodec
+}
+"""A map of codec names to codec classes."""
+
+_codec = None
+
+
+def get_json_codec():
+    """
+    Return the JsonCodec in use.  The fastest available codec is chosen by
+    default, which can be overridden with the ZMLP_JSON_CODEC environment
+    variable or set_json_codec().
+
+    Returns:
+        JsonCodec: The JsonCodec.
+    """
+    global _codec
+    if _codec is None:
+        name = os.environ.get('ZMLP_JSON_CODEC')
+        if name:
+            _codec = CODECS[name]()
+        else:
+            _codec = OrjsonCodec() if orjson is not None else StdlibJsonCodec()
+    return _codec
+
+
+def set_json_codec(codec):
+    """
+    Set the JsonCodec to use.
+
+    Args:
+        codec (mixed): A JsonCodec instance or codec name, or None to choose the default.
+
+    Returns:
+        JsonCodec: The previous JsonCodec.
+    """
+    global _codec
+    previous = get_json_codec()
+    if isinstance(codec, str):
+        codec = CODECS[codec]()
+    _codec = codec
+    return previous
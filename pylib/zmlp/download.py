@@ -0,0 +1,489 @@
+"""Resumable and parallel downloads using HTTP Range requests."""
+import contextvars
+import json
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .entity.exception import ZmlpException
+from .lazy import lazy_import
+from .timeouts import current_deadline
+
+logger = logging.getLogger(__name__)
+
+urllib3 = lazy_import('urllib3')
+
+__all__ = [
+    'RangedDownload',
+    'ZmlpDownloadException'
+]
+
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+"""The default size in bytes of each range fetched by a parallel download."""
+
+DEFAULT_CONCURRENCY = 4
+"""The default number of ranges fetched concurrently."""
+
+DEFAULT_PARALLEL_THRESHOLD = 32 * 1024 * 1024
+"""Files at least this many bytes are downloaded in parallel."""
+
+_CONTENT_RANGE_RE = re.compile(r'bytes\s+(?:(\d+)-(\d+)|\*)/(\d+|\*)')
+
+
+def _transfer_errors():
+    """
+    The errors raised while reading a response body which can be resumed.
+    """
+    return urllib3.exceptions.HTTPError, ConnectionError, TimeoutError
+
+
+def check_deadline(deadline, raw, url, error=None):
+    """
+    Raise a ZmlpDeadlineExceededException if the deadline has passed, otherwise
+    limit the wait for the next block of a streamed response to the time left.
+
+    Args:
+        deadline (Deadline): The deadline, or None.
+        raw (urllib3.HTTPResponse): The streamed response, or None.
+        url (str): The URL being downloaded.
+        error (Exception): The error which interrupted the download, if any.
+    """
+    if deadline is None:
+        return
+    remaining = deadline.remaining()
+    if remaining <= 0:
+        from .client import ZmlpDeadlineExceededException
+        raise ZmlpDeadlineExceededException(deadline, 'get', url) from error
+    # The read timeout of a request is set when it's sent, so a slow body
+    # could otherwise outlive the deadline by up to the read timeout.
+    sock = getattr(getattr(raw, 'connection', None), 'sock', None)
+    if sock is not None:
+        timeout = sock.gettimeout()
+        if timeout is None or remaining < timeout:
+            sock.settimeout(remaining)
+
+
+def read_block(raw, view, deadline, url):
+    """
+    Read the next block of a response body into a buffer.  With a deadline,
+    whatever data has arrived is returned rather than waiting for a full
+    block, so the deadline is checked between socket reads.
+
+    Args:
+        raw (urllib3.HTTPResponse): The streamed response, or a file object.
+        view (memoryview): The buffer to read into.
+        deadline (Deadline): The deadline, or None.
+        url (str): The URL being downloaded.
+
+    Returns:
+        int: The number of bytes read, 0 at the end of the body.
+    """
+    read1 = getattr(raw, 'read1', None)
+    if deadline is None or read1 is None:
+        return raw.readinto(view)
+    check_deadline(deadline, raw, url)
+    try:
+        data = read1(len(view))
+    except Exception as e:
+        # The read timed out because the deadline passed.
+        check_deadline(deadline, None, url, e)
+        raise
+    view[:len(data)] = data
+    return len(data)
+
+
+class ZmlpDownloadException(ZmlpException):
+    """
+    Raised when a download cannot be completed.
+    """
+    pass
+
+
+class _FileChanged(ZmlpDownloadException):
+    """
+    Raised when the file changed on the server part way through a download.
+    """
+    pass
+
+
+class RangedDownload(object):
+    """
+    Downloads a URL to a local file using HTTP Range requests.  Data is written
+    to a '<dst>.part' file which is renamed to dst once it is complete, so a
+    download interrupted by a dropped connection resumes from where it left
+    off rather than starting again, as does a download that is run again after
+    the process was killed.
+
+    Files at least parallel_threshold bytes are fetched as concurrent byte ranges
+    of part_size bytes which are written into a preallocated file with os.pwrite.
+    If the server does not support ranges the file is downloaded with a single
+    request.
+
+    A '<dst>.part.json' journal records the URL, size and validator, the ETag
+    or Last-Modified date, of the file being downloaded, and the completed
+    ranges of a parallel download.  The validator is sent in an If-Range header
+    when resuming, so the part file is only resumed if the file hasn't changed
+    on the server, otherwise the download starts again.  A part file without a
+    journal, or from a server which sent no validator, can't be checked and is
+    not resumed.
+    """
+
+    def __init__(self, client, url, dst, part_size=None, concurrency=None,
+                 parallel_threshold=None, block_size=None, checksum=None):
+        """
+        Create a new RangedDownload.
+
+        Args:
+            client (ZmlpClient): The client used to make requests.
+            url (str): The URL path to download.
+            dst (str): The destination file path.
+            part_size (int): The size in bytes of each range fetched in parallel.
+            concurrency (int): The number of ranges to fetch concurrently.
+            parallel_threshold (int): The minimum file size in bytes that is
+                downloaded in parallel.
+            block_size (int): The size of the read buffer used by each request.
+            checksum (hashlib.Hash): An optional hashlib object which is updated
+                with the content of the file.
+        """
+        self.client = client
+        self.url = client.get_url(url)
+        self.dst = dst
+        self.part_path = dst + '.part'
+        self.journal_path = dst + '.part.json'
+        self.part_size = part_size or client.download_part_size
+        self.concurrency = concurrency or client.download_concurrency
+        self.parallel_threshold = client.parallel_download_threshold \
+            if parallel_threshold is None else parallel_threshold
+        self.block_size = block_size or client.block_size
+        self.checksum = checksum
+        self.journal = None
+        self._hashed = 0
+        self._lock = threading.Lock()
+
+    def run(self):
+        """
+        Run the download.
+
+        Returns:
+            int: The size of the file in bytes.
+        """
+        self.journal = self._load_journal()
+        try:
+            if self.journal and 'done' in self.journal:
+                size = self._download_parts(self.journal)
+            else:
+                size = self._download_sequential()
+        except _FileChanged as e:
+            # Start again once, a second change is raised.
+            logger.warning("%s, downloading it again", e)
+            self._discard()
+            size = self._download_sequential()
+        # Ranges fetched in parallel arrive out of order, so they're hashed
+        # from the finished file rather than as they're written.
+        self._hash_part_file(size)
+        os.replace(self.part_path, self.dst)
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        return size
+
+    def _download_sequential(self):
+        """
+        Download the file with a single request at a time, resuming from the
+        end of the part file whenever the connection drops.
+        """
+        state = self.client.retry_policy.begin('get')
+        while True:
+            state.attempt()
+            try:
+                return self._fetch_sequential()
+            except _transfer_errors() as e:
+                check_deadline(current_deadline(), None, self.url, e)
+                delay = state.retry_delay(error=ConnectionError(str(e)))
+                if delay is None:
+                    raise ZmlpDownloadException(
+                        "Failed to download '{}', {}".format(self.url, e))
+                self._log_resume(state, delay, e)
+                time.sleep(delay)
+
+    def _fetch_sequential(self):
+        journal = self.journal
+        # The part file is only resumed if the server can check it's still current.
+        validator = journal['validator'] if journal else None
+        offset = self._part_offset() if validator else 0
+        with self._request(offset, validator=validator) as rsp:
+            if rsp.status_code == 416:
+                _, _, total = _parse_content_range(rsp.headers)
+                if total == offset and (not offset or total == journal['size']):
+                    self._open().close()
+                    return total
+                # The part file does not belong to the current file.
+                raise _FileChanged("The size of '{}' changed".format(self.url))
+
+            # A compressed response can't be resumed, but it's only sent
+            # when the whole file is requested.
+            encoded = rsp.headers.get('Content-Encoding', 'identity') != 'identity'
+            if rsp.status_code == 206 and not encoded:
+                start, _, total = _parse_content_range(rsp.headers)
+                if start != offset:
+                    raise ZmlpDownloadException(
+                        "Unexpected Content-Range '{}'".format(rsp.headers['Content-Range']))
+                if offset and (total != journal['size'] or
+                               _validator(rsp.headers) not in (None, validator)):
+                    raise _FileChanged("'{}' changed on the server".format(self.url))
+            elif rsp.status_code in (200, 206):
+                # The whole file, either ranges aren't supported or it changed.
+                offset, total = 0, None
+            else:
+                self.client._raise_exception(rsp)
+
+            if offset < self._hashed:
+                # The hash can't be rewound to start again.
+                raise ZmlpDownloadException(
+                    "'{}' changed on the server during the download".format(self.url))
+            # A part file from an earlier run is hashed before the new data.
+            self._hash_part_file(offset)
+
+            if not offset:
+                size = total
+                if size is None and not encoded and 'Content-Length' in rsp.headers:
+                    size = int(rsp.headers['Content-Length'])
+                journal = self.journal = {'url': self.url, 'size': size,
+                                          'validator': _validator(rsp.headers)}
+                self._save_journal(journal)
+
+            parallel = total is not None and offset == 0 and self._is_parallel(total)
+            with self._open(truncate=not offset) as fp:
+                # Keep the first range from this response and fetch the rest in parallel.
+                offset = self._write(rsp, fp.fileno(), offset,
+                                     self.part_size if parallel else total, hash=True)
+
+        if parallel:
+            if offset < self.part_size:
+                raise ConnectionError("Connection closed in the first range")
+            journal.update(part_size=self.part_size, done=[0])
+            self._save_journal(journal)
+            return self._download_parts(journal)
+
+        if total is not None and offset < total:
+            raise ConnectionError("Connection closed at byte {} of {}".format(offset, total))
+        return offset
+
+    def _download_parts(self, journal):
+        """
+        Download the ranges of the file which are not marked as done
+        in the journal concurrently.
+        """
+        size = journal['size']
+        part_size = journal['part_size']
+        done = set(journal['done'])
+        parts = [i for i in range((size + part_size - 1) // part_size) if i not in done]
+
+        # Preallocate the file so each range can be written in place.
+        os.truncate(self.part_path, size)
+        fd = os.open(self.part_path, os.O_WRONLY)
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+                # Run each part in a copy of the caller's context so the
+                # requests belong to the caller's trace span.
+                futures = [pool.submit(contextvars.copy_context().run,
+                                       self._fetch_part, fd, journal, i) for i in parts]
+                try:
+                    for future in futures:
+                        future.result()
+                except BaseException:
+                    for future in futures:
+                        future.cancel()
+                    raise
+        finally:
+            os.close(fd)
+        return size
+
+    def _fetch_part(self, fd, journal, index):
+        part_size = journal['part_size']
+        pos = index * part_size
+        end = min(journal['size'], pos + part_size)
+
+        state = self.client.retry_policy.begin('get')
+        while True:
+            state.attempt()
+            try:
+                with self._request(pos, end - 1, validator=journal['validator']) as rsp:
+                    if rsp.status_code != 206:
+                        if rsp.status_code == 200 and journal['validator']:
+                            # The If-Range validator didn't match.
+                            raise _FileChanged("'{}' changed on the server".format(self.url))
+                        if rsp.status_code == 200:
+                            raise ZmlpDownloadException(
+                                "The server ignored the Range request for '{}'".format(self.url))
+                        self.client._raise_exception(rsp)
+                    if _parse_content_range(rsp.headers)[2] != journal['size']:
+                        raise _FileChanged("The size of '{}' changed".format(self.url))
+                    pos = self._write(rsp, fd, pos, end)
+                if pos < end:
+                    raise ConnectionError("Connection closed at byte {} of {}".format(pos, end))
+                break
+            except _transfer_errors() as e:
+                check_deadline(current_deadline(), None, self.url, e)
+                delay = state.retry_delay(error=ConnectionError(str(e)))
+                if delay is None:
+                    raise ZmlpDownloadException(
+                        "Failed to download '{}', {}".format(self.url, e))
+                self._log_resume(state, delay, e)
+                time.sleep(delay)
+
+        with self._lock:
+            journal['done'].append(index)
+            self._save_journal(journal)
+
+    def _request(self, start, end=None, validator=None):
+        headers = {'Range': 'bytes={}-{}'.format(start, '' if end is None else end)}
+        if start or end is not None:
+            # Ranges apply to the encoded content, so ask for the raw bytes.
+            headers['Accept-Encoding'] = 'identity'
+        if validator:
+            # The server sends the whole file instead if it has changed.
+            headers['If-Range'] = validator
+        return self.client._send('get', self.url, headers=headers, stream=True)
+
+    def _write(self, rsp, fd, pos, end=None, hash=False):
+        """
+        Write the response body into the file at the given position, stopping
+        at the end position if there is one.  If hash is True each block is
+        added to the checksum as it's written.
+
+        Returns:
+            int: The position after the last byte written.
+        """
+        buf = bytearray(self.block_size)
+        view = memoryview(buf)
+        raw = rsp.raw
+        raw.decode_content = True
+        checksum = self.checksum if hash else None
+        deadline = current_deadline()
+        start, wire_start = pos, raw.tell()
+        try:
+            while end is None or pos < end:
+                limit = len(buf) if end is None else min(len(buf), end - pos)
+                count = read_block(raw, view[:limit], deadline, self.url)
+                if not count:
+                    break
+                written = 0
+                while written < count:
+                    written += os.pwrite(fd, view[written:count], pos + written)
+                if checksum is not None:
+                    checksum.update(view[:count])
+                    self._hashed = pos + count
+                pos += count
+        finally:
+            self.client.transfer_stats.add_response(pos - start, raw.tell() - wire_start)
+        return pos
+
+    def _hash_part_file(self, end):
+        """
+        Add the part file from the last byte hashed up to end to the checksum.
+        """
+        if self.checksum is None or self._hashed >= end:
+            return
+        with open(self.part_path, 'rb') as fp:
+            fp.seek(self._hashed)
+            while self._hashed < end:
+                data = fp.read(min(self.block_size, end - self._hashed))
+                if not data:
+                    break
+                self.checksum.update(data)
+                self._hashed += len(data)
+
+    def _open(self, truncate=False):
+        # Not opened for appending, os.pwrite ignores the offset with O_APPEND.
+        flags = os.O_WRONLY | os.O_CREAT | (os.O_TRUNC if truncate else 0)
+        return os.fdopen(os.open(self.part_path, flags), 'wb')
+
+    def _is_parallel(self, size):
+        return self.concurrency > 1 and hasattr(os, 'pwrite') \
+            and size >= self.parallel_threshold and size > self.part_size
+
+    def _part_offset(self):
+        try:
+            return os.path.getsize(self.part_path)
+        except OSError:
+            return 0
+
+    def _load_journal(self):
+        """
+        Load the journal of a previously interrupted download.
+
+        Returns:
+            dict: The journal, or None if there is no valid journal.
+        """
+        try:
+            with open(self.journal_path) as fp:
+                journal = json.load(fp)
+            size = journal['size']
+            if journal['url'] == self.url and journal['validator'] and \
+                    os.path.exists(self.part_path) and \
+                    (size is None or self._part_offset() <= size):
+                return journal
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        # A missing, stale or corrupt journal, start again.
+        self._discard()
+        return None
+
+    def _discard(self):
+        """
+        Remove the part file and journal.
+        """
+        self.journal = None
+        for path in (self.part_path, self.journal_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _save_journal(self, journal):
+        tmp_path = self.journal_path + '.tmp'
+        with open(tmp_path, 'w') as fp:
+            json.dump(journal, fp)
+        os.replace(tmp_path, self.journal_path)
+
+    def _log_resume(self, state, delay, error):
+        logger.warning("Downloading %s failed %d times, resuming in %0.2f seconds, error=%s",
+                       self.url, state.attempts, delay, error)
+
+
+def _validator(headers):
+    """
+    Return the validator of a response which can be sent in an If-Range
+    header, a strong ETag or otherwise the Last-Modified date.
+
+    Args:
+        headers (dict): The response headers.
+
+    Returns:
+        str: The validator, or None if there isn't one.
+    """
+    etag = headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return headers.get('Last-Modified')
+
+
+def _parse_content_range(headers):
+    """
+    Parse a Content-Range header.
+
+    Args:
+        headers (dict): The response headers.
+
+    Returns:
+        tuple: The start, end and total size, any of which may be None.
+    """
+    match = _CONTENT_RANGE_RE.match(headers.get('Content-Range', ''))
+    if not match:
+        raise ZmlpDownloadException(
+            "Invalid Content-Range '{}'".format(headers.get('Content-Range')))
+    start, end, total = match.groups()
+    return (int(start) if start else None,
+            int(end) if end else None,
+            int(total) if total != '*' else None)
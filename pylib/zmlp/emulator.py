@@ -0,0 +1,895 @@
+"""
+An in-process stand-in for the ZMLP API, for measuring the client's throughput
+and concurrency against a real HTTP server, and for integration tests.
+"""
+import collections
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from email.parser import BytesHeaderParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+__all__ = [
+    'Emulator',
+    'Corpus'
+]
+
+DEFAULT_FILE_SIZE = 64 * 1024
+"""The default size in bytes of the synthetic files of each asset."""
+
+PROXY_SIZES = ((1920, 1080), (1024, 576), (512, 288))
+"""The dimensions of the proxy files of each synthetic asset."""
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class Corpus(object):
+    """
+    A synthetic set of assets, their files, and the jobs, tasks and task errors
+    which imported them.  The corpus is generated from a seed, so the same seed
+    always produces the same assets.  The content of the synthetic files is a
+    repeating pattern derived from the file ID, so it's never held in memory,
+    uploaded files are kept as they were sent.
+    """
+
+    def __init__(self, size=1000, seed=0, file_size=DEFAULT_FILE_SIZE, jobs=10,
+                 tasks_per_job=5):
+        """
+        Create a new Corpus.
+
+        Args:
+            size (int): The number of assets to generate.
+            seed (int): The random seed.
+            file_size (int): The size in bytes of each synthetic file.
+            jobs (int): The number of import jobs to generate.
+            tasks_per_job (int): The number of tasks in each generated job.
+        """
+        self.file_size = file_size
+        self.assets = collections.OrderedDict()
+        self.files = {}
+        self.jobs = collections.OrderedDict()
+        self.tasks = collections.OrderedDict()
+        self.task_errors = collections.OrderedDict()
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+        for num in range(size):
+            self.add_asset('gs://zorroa-emulator/image/{:08d}.jpg'.format(num))
+        for num in range(jobs):
+            self.add_job('Import job {}'.format(num), tasks_per_job,
+                         failed=1 if num % 3 == 2 else 0)
+
+    def new_id(self):
+        """
+        Return a new random ID.
+
+        Returns:
+            str: A UUID string.
+        """
+        with self._lock:
+            return str(uuid.UUID(int=self._random.getrandbits(128), version=4))
+
+    def now(self):
+        """The current time in epoch milliseconds."""
+        return int(time.time() * 1000)
+
+    def add_asset(self, uri, attrs=None, label=None, content=None):
+        """
+        Add an asset with synthetic metadata and proxy files.
+
+        Args:
+            uri (str): The source URI of the asset.
+            attrs (dict): Optional custom attributes.
+            label (dict): An optional DataSetLabel dictionary.
+            content (bytes): The content of an uploaded source file.
+
+        Returns:
+            str: The asset ID.
+        """
+        with self._lock:
+            asset_id = self.new_id().replace('-', '')
+            filename = os.path.basename(uri)
+            size = len(content) if content is not None else \
+                self._random.randint(10000, 10000000)
+            document = {
+                'source': {
+                    'path': uri,
+                    'filename': filename,
+                    'extension': os.path.splitext(filename)[1].lstrip('.').lower(),
+                    'mimetype': 'image/jpeg',
+                    'filesize': size,
+                    'checksum': self._random.getrandbits(32)
+                },
+                'system': {
+                    'state': 'Analyzed',
+                    'timeCreated': self.now(),
+                    'timeModified': self.now()
+                },
+                'media': {
+                    'width': 1920,
+                    'height': 1080,
+                    'aspect': 1.78,
+                    'orientation': 'landscape',
+                    'type': 'image'
+                },
+                'files': [],
+                'analysis': {
+                    'zvi-label-detection': {
+                        'type': 'labels',
+                        'count': 3,
+                        'predictions': [
+                            {'label': label_name, 'score': round(self._random.random(), 3)}
+                            for label_name in self._random.sample(
+                                ['dog', 'cat', 'car', 'tree', 'house', 'person', 'boat'], 3)
+                        ]
+                    }
+                },
+                'labels': [label] if label else []
+            }
+            if attrs:
+                document['custom'] = dict(attrs)
+            if content is not None:
+                self._add_file(document, 'assets/{}/source/{}'.format(asset_id, filename),
+                               'source', filename, content)
+            for width, height in PROXY_SIZES:
+                name = 'image_{}x{}.jpg'.format(width, height)
+                self._add_file(document, 'assets/{}/proxy/{}'.format(asset_id, name),
+                               'proxy', name, self.file_size,
+                               {'width': width, 'height': height})
+            self.assets[asset_id] = document
+            return asset_id
+
+    def _add_file(self, document, file_id, category, name, content, attrs=None):
+        size = content if isinstance(content, int) else len(content)
+        document['files'].append({
+            'id': file_id,
+            'category': category,
+            'name': name,
+            'mimetype': 'image/jpeg',
+            'size': size,
+            'attrs': attrs or {}
+        })
+        self.files[file_id] = content
+
+    def file_content(self, file_id):
+        """
+        Return the content of a file.
+
+        Args:
+            file_id (str): The file ID.
+
+        Returns:
+            bytes: The content, or None if there's no such file.
+        """
+        content = self.files.get(file_id)
+        if isinstance(content, int):
+            block = hashlib.sha256(file_id.encode('utf-8')).digest()
+            return (block * (content // len(block) + 1))[:content]
+        return content
+
+    def add_job(self, name, tasks=1, failed=0):
+        """
+        Add a finished job with the given number of tasks, of which the
+        failed number have an error.
+
+        Args:
+            name (str): The name of the job.
+            tasks (int): The number of tasks.
+            failed (int): The number of failed tasks.
+
+        Returns:
+            dict: The job.
+        """
+        with self._lock:
+            now = self.now()
+            job_id = self.new_id()
+            job = {
+                'id': job_id,
+                'jobId': job_id,
+                'name': name,
+                'type': 'Import',
+                'state': 'Failure' if failed else 'Success',
+                'paused': False,
+                'priority': 100,
+                'maxRunningTasks': 1024,
+                'assetCounts': {'assetCreatedCount': tasks,
+                                'assetErrorCount': failed,
+                                'assetReplacedCount': 0,
+                                'assetWarningCount': 0},
+                'taskCounts': {'tasksFailure': failed,
+                               'tasksQueued': 0,
+                               'tasksRunning': 0,
+                               'tasksSkipped': 0,
+                               'tasksSuccess': tasks - failed,
+                               'tasksTotal': tasks,
+                               'tasksWaiting': 0},
+                'timeCreated': now,
+                'timePauseExpired': -1,
+                'timeStarted': now,
+                'timeStopped': now,
+                'timeUpdated': now
+            }
+            self.jobs[job_id] = job
+            for num in range(tasks):
+                task_id = self.new_id()
+                self.tasks[task_id] = {
+                    'id': task_id,
+                    'taskId': task_id,
+                    'jobId': job_id,
+                    'name': '{} task {}'.format(name, num),
+                    'state': 'Failure' if num < failed else 'Success',
+                    'assetCounts': {'assetCreatedCount': 1,
+                                    'assetErrorCount': 1 if num < failed else 0,
+                                    'assetReplacedCount': 0,
+                                    'assetTotalCount': 1,
+                                    'assetWarningCount': 0},
+                    'timeCreated': now,
+                    'timePing': now,
+                    'timeStarted': now,
+                    'timeStopped': now
+                }
+                if num < failed:
+                    error_id = self.new_id()
+                    self.task_errors[error_id] = {
+                        'id': error_id,
+                        'taskId': task_id,
+                        'jobId': job_id,
+                        'dataSourceId': None,
+                        'assetId': next(iter(self.assets), None),
+                        'path': '/tmp/{}.jpg'.format(num),
+                        'message': 'Emulated processing error',
+                        'processor': 'zmlp_core.core.FileImportProcessor',
+                        'fatal': True,
+                        'phase': 'execute',
+                        'stackTrace': [],
+                        'timeCreated': now
+                    }
+            return job
+
+    def search_assets(self, query):
+        """
+        Return the IDs of the assets matching an Elasticsearch query.  The
+        match_all, ids, term and terms queries and bool filters are supported,
+        any other query matches every asset.
+
+        Args:
+            query (dict): The query.
+
+        Returns:
+            list: The matching asset IDs, in the order they were added.
+        """
+        with self._lock:
+            return [asset_id for asset_id, doc in self.assets.items()
+                    if _matches(query, asset_id, doc)]
+
+    def search_entities(self, entities, body, filters):
+        """
+        Return the entities matching the filters of a jobs, tasks or task
+        errors search request.
+
+        Args:
+            entities (dict): The entities to search.
+            body (dict): The search request.
+            filters (dict): A dictionary of request property to entity property.
+
+        Returns:
+            list: The matching entities.
+        """
+        with self._lock:
+            result = []
+            for entity in entities.values():
+                for prop, field in filters.items():
+                    values = body.get(prop)
+                    if values and entity.get(field) not in values:
+                        break
+                else:
+                    result.append(entity)
+            return result
+
+
+class Emulator(object):
+    """
+    Emulates the ZMLP API endpoints the client uses on a local HTTP server,
+    backed by a synthetic Corpus.  The server runs in a background thread and
+    handles each connection in its own thread.
+
+    The knobs, which can be changed while the emulator is running, are:
+
+        * latency: Seconds added to every response, plus up to jitter more.
+        * error_rate: The fraction of requests which fail with error_status.
+        * throttle_rate: The fraction of requests which get a 429 with a
+          Retry-After of retry_after seconds.
+        * bandwidth: The bytes per second each request and response is limited to.
+        * ranges: False to ignore Range headers, like some proxies do.
+
+    Errors can also be injected deterministically with fail_next().  Request
+    counts, bytes transferred and the peak number of concurrent requests are
+    kept in stats.
+
+    Examples:
+        with Emulator(assets=5000, latency=0.01, throttle_rate=0.05) as emulator:
+            app = ZmlpApp(apikey, emulator.url)
+            for asset in app.assets.scroll_search():
+                ...
+    """
+
+    def __init__(self, corpus=None, assets=1000, seed=0, latency=0.0, jitter=0.0,
+                 error_rate=0.0, error_status=503, throttle_rate=0.0, retry_after=1,
+                 bandwidth=None, ranges=True, host='127.0.0.1', port=0):
+        """
+        Create a new Emulator.
+
+        Args:
+            corpus (Corpus): The corpus to serve, defaults to a new Corpus.
+            assets (int): The number of assets in the default corpus.
+            seed (int): The random seed of the default corpus and the injected faults.
+            latency (float): Seconds to delay every response by.
+            jitter (float): The most random seconds added to the latency.
+            error_rate (float): The fraction of requests to fail with error_status.
+            error_status (int): The status of injected errors.
+            throttle_rate (float): The fraction of requests to fail with a 429.
+            retry_after (int): The Retry-After seconds sent with 429 responses,
+                or None to send none.
+            bandwidth (int): The bytes per second each request is limited to,
+                None for no limit.
+            ranges (bool): Handle Range requests to the file stream endpoint.
+            host (str): The address to listen on.
+            port (int): The port to listen on, 0 for a random free port.
+        """
+        self.corpus = corpus if corpus is not None else Corpus(assets, seed)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.bandwidth = bandwidth
+        self.ranges = ranges
+        self.stats = EmulatorStats()
+        self.scrolls = {}
+
+        self._random = random.Random(seed)
+        self._failures = collections.deque()
+        self._lock = threading.Lock()
+
+        self._routes = [(method, re.compile(pattern + '$'), name, func)
+                        for method, pattern, name, func in self.routes()]
+        handler = type('EmulatorHandler', (_Handler,), {'emulator': self})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        """The base URL of the emulator."""
+        host, port = self.httpd.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    def start(self):
+        """
+        Start serving requests in a background thread.
+
+        Returns:
+            Emulator: This emulator.
+        """
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True,
+                                       name='zmlp-emulator')
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stop the emulator and close its socket.
+        """
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def fail_next(self, status=503, count=1, path=None, retry_after=None):
+        """
+        Fail the next requests with the given status.
+
+        Args:
+            status (int): The response status.
+            count (int): The number of requests to fail.
+            path (str): Only fail requests whose path contains this string.
+            retry_after (int): The Retry-After header to send, if any.
+        """
+        with self._lock:
+            for _ in range(count):
+                self._failures.append((status, path, retry_after))
+
+    def _fault(self, path):
+        """
+        Return the (status, retry_after) of the fault to inject into a
+        request, or None.
+        """
+        with self._lock:
+            for failure in self._failures:
+                if failure[1] is None or failure[1] in path:
+                    self._failures.remove(failure)
+                    return failure[0], failure[2]
+            roll = self._random.random()
+            if roll < self.throttle_rate:
+                return 429, self.retry_after
+            if roll < self.throttle_rate + self.error_rate:
+                return self.error_status, None
+            return None
+
+    def _delay(self):
+        with self._lock:
+            return self.latency + self._random.random() * self.jitter
+
+    # Endpoints, each takes the path match, query and request body and
+    # returns the status, a JSON serializable object or bytes, and headers.
+
+    def search_assets(self, match, query, body, headers):
+        body = json.loads(body or b'{}')
+        ids = self.corpus.search_assets(body.get('query'))
+        size = body.get('size', 10)
+        scroll = query.get('scroll')
+        if scroll:
+            scroll_id = uuid.uuid4().hex
+            with self._lock:
+                self.scrolls[scroll_id] = {'ids': ids, 'pos': size, 'size': size,
+                                           '_source': body.get('_source')}
+            return 200, self._hits(ids, 0, size, body.get('_source'), scroll_id), None
+        start = body.get('from', 0)
+        return 200, self._hits(ids, start, start + size, body.get('_source')), None
+
+    def scroll_assets(self, match, query, body, headers):
+        scroll_id = json.loads(body or b'{}').get('scroll_id')
+        with self._lock:
+            scroll = self.scrolls.get(scroll_id)
+            if scroll is None:
+                return 404, _error(404, 'No search context found for id [{}]'.format(
+                    scroll_id)), None
+            start = scroll['pos']
+            scroll['pos'] += scroll['size']
+        return 200, self._hits(scroll['ids'], start, start + scroll['size'],
+                               scroll['_source'], scroll_id), None
+
+    def clear_scroll(self, match, query, body, headers):
+        scroll_id = json.loads(body or b'{}').get('scroll_id')
+        with self._lock:
+            freed = self.scrolls.pop(scroll_id, None) is not None
+        return 200, {'succeeded': True, 'num_freed': int(freed)}, None
+
+    def _hits(self, ids, start, end, fields, scroll_id=None):
+        hits = []
+        with self.corpus._lock:
+            for asset_id in ids[start:end]:
+                hits.append({
+                    '_index': 'emulator',
+                    '_type': '_doc',
+                    '_id': asset_id,
+                    '_score': 1.0,
+                    '_source': _select(self.corpus.assets[asset_id], fields)
+                })
+        result = collections.OrderedDict()
+        # Elasticsearch sends the scroll id before the hits.
+        if scroll_id:
+            result['_scroll_id'] = scroll_id
+        result['took'] = 1
+        result['timed_out'] = False
+        result['hits'] = {
+            'total': {'value': len(ids), 'relation': 'eq'},
+            'max_score': 1.0,
+            'hits': hits
+        }
+        return result
+
+    def get_asset(self, match, query, body, headers):
+        asset_id = match.group(1)
+        document = self.corpus.assets.get(asset_id)
+        if document is None:
+            return 404, _error(404, 'Asset {} not found'.format(asset_id)), None
+        return 200, {'id': asset_id, 'document': document}, None
+
+    def batch_create(self, match, query, body, headers):
+        body = json.loads(body or b'{}')
+        return 200, self._create(body.get('assets') or [], []), None
+
+    def batch_upload(self, match, query, body, headers):
+        parts = _parse_multipart(headers.get('Content-Type', ''), body)
+        contents = [part[2] for part in parts if part[0] == 'files']
+        body = next((json.loads(part[2]) for part in parts if part[0] == 'body'), {})
+        assets = body.get('assets') or []
+        if len(assets) != len(contents):
+            return 400, _error(400, 'Expected {} files, got {}'.format(
+                len(assets), len(contents))), None
+        return 200, self._create(assets, contents), None
+
+    def _create(self, assets, contents):
+        created = []
+        items = []
+        for num, spec in enumerate(assets):
+            asset_id = self.corpus.add_asset(
+                spec['uri'], spec.get('attrs'), spec.get('label'),
+                contents[num] if contents else None)
+            created.append(asset_id)
+            items.append({'create': {'_index': 'emulator', '_type': '_doc', '_id': asset_id,
+                                     '_version': 1, 'result': 'created', 'status': 201}})
+        job = self.corpus.add_job('Analyze {} created assets, 0 existing files.'.format(
+            len(created))) if created else None
+        return {
+            'bulkResponse': {'took': 1, 'errors': False, 'items': items},
+            'failed': [],
+            'created': created,
+            'jobId': job['id'] if job else None
+        }
+
+    def update_labels(self, match, query, body, headers):
+        body = json.loads(body or b'{}')
+        with self.corpus._lock:
+            for op in ('remove', 'add'):
+                for asset_id, labels in (body.get(op) or {}).items():
+                    document = self.corpus.assets.get(asset_id)
+                    if document is None:
+                        return 404, _error(404, 'Asset {} not found'.format(asset_id)), None
+                    dataset_ids = set(label['dataSetId'] for label in labels)
+                    document['labels'] = [label for label in document['labels']
+                                          if label['dataSetId'] not in dataset_ids]
+                    if op == 'add':
+                        document['labels'].extend(labels)
+        return 200, {'type': 'asset', 'op': '_batch_update_labels', 'success': True}, None
+
+    def stream_file(self, match, query, body, headers):
+        file_id = unquote(match.group(1))
+        content = self.corpus.file_content(file_id)
+        if content is None:
+            return 404, _error(404, 'File {} not found'.format(file_id)), None
+        size = len(content)
+        etag = '"{}"'.format(hashlib.md5(content).hexdigest())
+        range_match = _RANGE_RE.match(headers.get('Range', '')) if self.ranges else None
+        if_range = headers.get('If-Range')
+        if not range_match or not any(range_match.groups()) or if_range not in (None, etag):
+            return 200, content, {'Accept-Ranges': 'bytes', 'ETag': etag}
+        first, last = range_match.groups()
+        if not first:
+            start, end = max(0, size - int(last)), size - 1
+        else:
+            start, end = int(first), min(int(last), size - 1) if last else size - 1
+        if start >= size or start > end:
+            return 416, b'', {'Content-Range': 'bytes */{}'.format(size)}
+        return 206, content[start:end + 1], {
+            'Accept-Ranges': 'bytes',
+            'ETag': etag,
+            'Content-Range': 'bytes {}-{}/{}'.format(start, end, size)
+        }
+
+    def _entity_search(self, entities, filters):
+        def search(match, query, body, headers):
+            body = json.loads(body or b'{}')
+            found = self.corpus.search_entities(entities, body, filters)
+            page = body.get('page') or {}
+            start = page.get('from', 0)
+            size = page.get('size', 50)
+            return 200, {
+                'list': found[start:start + size],
+                'page': {'from': start, 'size': size, 'totalCount': len(found)}
+            }, None
+        return search
+
+    def _entity_find_one(self, entities, filters, kind):
+        def find_one(match, query, body, headers):
+            found = self.corpus.search_entities(entities, json.loads(body or b'{}'), filters)
+            if len(found) != 1:
+                status = 404 if not found else 400
+                return status, _error(status, 'Expected one {}, found {}'.format(
+                    kind, len(found))), None
+            return 200, found[0], None
+        return find_one
+
+    def _entity_get(self, entities, kind):
+        def get(match, query, body, headers):
+            entity = entities.get(match.group(1))
+            if entity is None:
+                return 404, _error(404, '{} {} not found'.format(kind, match.group(1))), None
+            return 200, entity, None
+        return get
+
+    def routes(self):
+        """
+        Return the emulated endpoints.
+
+        Returns:
+            list: A list of (method, path regex, name, handler) tuples.
+        """
+        corpus = self.corpus
+        jobs = {'ids': 'id', 'states': 'state', 'names': 'name'}
+        tasks = {'ids': 'id', 'states': 'state', 'names': 'name', 'jobIds': 'jobId'}
+        errors = {'jobIds': 'jobId', 'taskIds': 'taskId', 'assetIds': 'assetId',
+                  'paths': 'path', 'processor': 'processor'}
+        return [
+            ('POST', r'/api/v3/assets/_search', 'search', self.search_assets),
+            ('POST', r'/api/v3/assets/_search/scroll', 'scroll', self.scroll_assets),
+            ('DELETE', r'/api/v3/assets/_search/scroll', 'clear_scroll', self.clear_scroll),
+            ('POST', r'/api/v3/assets/_batch_create', 'batch_create', self.batch_create),
+            ('POST', r'/api/v3/assets/_batch_upload', 'batch_upload', self.batch_upload),
+            ('PUT', r'/api/v3/assets/_batch_update_labels', 'update_labels',
+             self.update_labels),
+            ('GET', r'/api/v3/assets/([^/_][^/]*)', 'get_asset', self.get_asset),
+            ('GET', r'/api/v3/files/_stream/(.+)', 'stream', self.stream_file),
+            ('POST', r'/api/v1/jobs/_search', 'jobs_search',
+             self._entity_search(corpus.jobs, jobs)),
+            ('POST', r'/api/v1/jobs/_findOne', 'jobs_find_one',
+             self._entity_find_one(corpus.jobs, jobs, 'job')),
+            ('GET', r'/api/v1/jobs/([^/_][^/]*)', 'get_job',
+             self._entity_get(corpus.jobs, 'Job')),
+            ('POST', r'/api/v1/tasks/_search', 'tasks_search',
+             self._entity_search(corpus.tasks, tasks)),
+            ('POST', r'/api/v1/tasks/_findOne', 'tasks_find_one',
+             self._entity_find_one(corpus.tasks, tasks, 'task')),
+            ('GET', r'/api/v1/tasks/([^/_][^/]*)', 'get_task',
+             self._entity_get(corpus.tasks, 'Task')),
+            ('POST', r'/api/v1/taskerrors/_search', 'task_errors_search',
+             self._entity_search(corpus.task_errors, errors))
+        ]
+
+    def _route(self, method, path):
+        for route_method, pattern, name, func in self._routes:
+            match = pattern.match(path)
+            if match and route_method == method:
+                return name, match, func
+        return None, None, None
+
+    def __repr__(self):
+        return "<Emulator url='{}' assets={}>".format(self.url, len(self.corpus.assets))
+
+
+class EmulatorStats(object):
+    """
+    Counts the requests an Emulator has handled.
+
+    Attributes:
+        requests (Counter): The number of requests to each endpoint.
+        statuses (Counter): The number of responses with each status.
+        bytes_received (int): The total size of the request bodies.
+        bytes_sent (int): The total size of the response bodies.
+        in_flight (int): The number of requests being handled.
+        max_in_flight (int): The peak number of concurrent requests.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Reset the counters.
+        """
+        with self._lock:
+            self.requests = collections.Counter()
+            self.statuses = collections.Counter()
+            self.bytes_received = 0
+            self.bytes_sent = 0
+            self.in_flight = 0
+            self.max_in_flight = 0
+
+    def begin(self):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def end(self, name, status, received, sent):
+        with self._lock:
+            self.in_flight -= 1
+            self.requests[name] += 1
+            self.statuses[status] += 1
+            self.bytes_received += received
+            self.bytes_sent += sent
+
+    def __repr__(self):
+        return '<EmulatorStats requests={} max_in_flight={}>'.format(
+            sum(self.requests.values()), self.max_in_flight)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Dispatches requests to the endpoints of the emulator it's bound to."""
+
+    protocol_version = 'HTTP/1.1'
+    # Send the headers and small bodies in one write, otherwise TCP waits
+    # for a delayed ACK between them.
+    wbufsize = 64 * 1024
+    emulator = None
+
+    def log_message(self, *args):
+        pass
+
+    def handle(self):
+        try:
+            super(_Handler, self).handle()
+        except ConnectionError:
+            # The client went away, for example because its deadline passed.
+            self.close_connection = True
+
+    def finish(self):
+        try:
+            super(_Handler, self).finish()
+        except ConnectionError:
+            pass
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    def _dispatch(self, method):
+        emulator = self.emulator
+        parts = urlsplit(self.path)
+        name, match, func = emulator._route(method, parts.path)
+        emulator.stats.begin()
+        status, received, sent = 500, 0, 0
+        try:
+            start = time.monotonic()
+            body = self._read_body()
+            received = len(body)
+            query = dict((k, v[0]) for k, v in parse_qs(parts.query).items())
+            fault = emulator._fault(parts.path)
+            time.sleep(max(0.0, emulator._delay() - (time.monotonic() - start)))
+            headers = None
+            if not self.headers.get('Authorization', '').startswith('Bearer '):
+                status, payload = 401, _error(401, 'Missing bearer token')
+            elif fault:
+                status, payload = fault[0], _error(fault[0], 'Injected error')
+                if fault[1] is not None:
+                    headers = {'Retry-After': str(fault[1])}
+            elif func is None:
+                status, payload = 404, _error(404, 'No endpoint for {} {}'.format(
+                    method, parts.path))
+            else:
+                try:
+                    status, payload, headers = func(match, query, body, self.headers)
+                except Exception as e:
+                    status, payload = 500, _error(500, '{}: {}'.format(type(e).__name__, e))
+            sent = self._respond(status, payload, headers)
+        finally:
+            emulator.stats.end(name or 'unknown', status, received, sent)
+
+    def _read_body(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b';')[0], 16)
+                if not size:
+                    # Skip any trailers.
+                    while self.rfile.readline() not in (b'\r\n', b'\n', b''):
+                        pass
+                    body = b''.join(chunks)
+                    self._pace(len(body))
+                    return body
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        self._pace(len(body))
+        return body
+
+    def _pace(self, size, start=None):
+        """Sleep until size bytes would have been sent at the emulator's bandwidth."""
+        bandwidth = self.emulator.bandwidth
+        if bandwidth and size:
+            start = time.monotonic() if start is None else start
+            time.sleep(max(0.0, start + size / bandwidth - time.monotonic()))
+
+    def _respond(self, status, payload, headers):
+        if isinstance(payload, bytes):
+            data, content_type = payload, 'application/octet-stream'
+        else:
+            data, content_type = json.dumps(payload).encode('utf-8'), 'application/json'
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        bandwidth = self.emulator.bandwidth
+        if not bandwidth:
+            self.wfile.write(data)
+            return len(data)
+        # Write in slices of about 20ms each, so the rate is smooth.
+        step = max(1024, int(bandwidth / 50))
+        start = time.monotonic()
+        for pos in range(0, len(data), step):
+            self.wfile.write(data[pos:pos + step])
+            self.wfile.flush()
+            self._pace(min(pos + step, len(data)), start)
+        return len(data)
+
+
+def _error(status, message):
+    return {'status': status, 'message': message}
+
+
+def _select(document, fields):
+    """Return the top level namespaces of a document a search asked for."""
+    if not fields:
+        return document
+    fields = [fields] if isinstance(fields, str) else fields
+    selected = {}
+    for field in fields:
+        value = _get(document, field)
+        if value is None:
+            continue
+        target = selected
+        keys = field.split('.')
+        for key in keys[:-1]:
+            target = target.setdefault(key, {})
+        target[keys[-1]] = value
+    return selected
+
+
+def _get(document, field):
+    value = document
+    for key in field.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def _matches(query, asset_id, document):
+    """Evaluate the supported subset of the Elasticsearch query DSL."""
+    if not query:
+        return True
+    for kind, clause in query.items():
+        if kind in ('term', 'terms'):
+            for field, values in clause.items():
+                if not isinstance(values, list):
+                    values = [values.get('value') if isinstance(values, dict) else values]
+                value = asset_id if field == '_id' else _get(document, field)
+                if value not in values:
+                    return False
+        elif kind == 'ids':
+            if asset_id not in clause.get('values', []):
+                return False
+        elif kind == 'bool':
+            for occur in ('must', 'filter'):
+                clauses = clause.get(occur) or []
+                clauses = [clauses] if isinstance(clauses, dict) else clauses
+                if not all(_matches(sub, asset_id, document) for sub in clauses):
+                    return False
+    return True
+
+
+def _parse_multipart(content_type, body):
+    """
+    Split a multipart/form-data body.
+
+    Returns:
+        list: A list of (field name, filename, content) tuples.
+    """
+    boundary = content_type.partition('boundary=')[2].strip('"')
+    if not boundary:
+        return []
+    parts = []
+    for chunk in body.split(b'--' + boundary.encode('utf-8'))[1:]:
+        if chunk.startswith(b'--'):
+            break
+        head, _, content = chunk[2:].partition(b'\r\n\r\n')
+        headers = BytesHeaderParser().parsebytes(head + b'\r\n\r\n')
+        disposition = headers.get('Content-Disposition', '')
+        name = re.search(r'\bname="([^"]*)"', disposition)
+        filename = re.search(r'filename="([^"]*)"', disposition)
+        parts.append((name.group(1) if name else None,
+                      filename.group(1) if filename else None,
+                      content[:-2] if content.endswith(b'\r\n') else content))
+    return parts
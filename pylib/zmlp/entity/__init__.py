@@ -1,9 +1,29 @@
 # flake8: noqa
-from .asset import *
-from .dataset import *
-from .datasource import *
-from .exception import *
-from .job import *
-from .project import *
-from .model import *
-from .pmod import *
+# The entities are imported from their modules on first use, see zmlp.lazy.
+from ..lazy import lazy_attrs
+
+_ATTRS = {
+    'Asset': '.asset',
+    'FileImport': '.asset',
+    'FileUpload': '.asset',
+    'Clip': '.asset',
+    'StoredFile': '.asset',
+    'FileTypes': '.asset',
+    'DataSet': '.dataset',
+    'DataSetLabel': '.dataset',
+    'DataSetType': '.dataset',
+    'DataSource': '.datasource',
+    'ZmlpException': '.exception',
+    'Job': '.job',
+    'Task': '.job',
+    'TaskError': '.job',
+    'Project': '.project',
+    'Model': '.model',
+    'ModelType': '.model',
+    'PipelineMod': '.pmod'
+}
+
+__all__ = list(_ATTRS)
+
+__getattr__, __dir__ = lazy_attrs(__name__, _ATTRS)
+del lazy_attrs
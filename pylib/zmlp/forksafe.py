@@ -0,0 +1,40 @@
+"""Reset client state which must not be shared with a forked child process."""
+import os
+import threading
+import weakref
+
+__all__ = [
+    'register'
+]
+
+_objects = weakref.WeakSet()
+_lock = threading.Lock()
+
+
+def register(obj):
+    """
+    Call obj._after_fork() in the child process whenever the process forks,
+    for example when a multiprocessing.Pool starts its workers.  The child
+    must not use the connections or locks it inherited, sockets would be
+    shared with the parent and a lock held by another thread at the time of
+    the fork is never released.
+
+    Only a weak reference to the object is kept.
+
+    Args:
+        obj (object): An object with an _after_fork() method.
+    """
+    with _lock:
+        _objects.add(obj)
+
+
+def _after_fork_in_child():
+    global _lock
+    # The lock may have been held by another thread at the time of the fork.
+    _lock = threading.Lock()
+    for obj in list(_objects):
+        obj._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
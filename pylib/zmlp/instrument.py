@@ -0,0 +1,411 @@
+"""Request instrumentation hooks, histograms and a Prometheus exporter."""
+import bisect
+import functools
+import logging
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+from . import forksafe
+
+logger = logging.getLogger(__name__)
+
+__all__ = [
+    'Instrumentation',
+    'RequestEvent',
+    'RequestHistograms',
+    'normalize_endpoint',
+    'to_prometheus'
+]
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+"""The default upper bounds in seconds of the latency histogram buckets."""
+
+SIZE_BUCKETS = tuple(256 * 4 ** i for i in range(11))
+"""The default upper bounds in bytes of the size histogram buckets, 256B to 256MiB."""
+
+_UUID_RE = re.compile(r'^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-'
+                      r'[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$')
+_ID_RE = re.compile(r'^(?=.*\d)[\w-]{20,}$')
+_PATH_SEGMENTS = frozenset(['_stream'])
+
+
+@functools.lru_cache(maxsize=4096)
+def normalize_endpoint(url):
+    """
+    Reduce a URL to an endpoint template by removing the server and query
+    and replacing ids in the path with '{id}', so requests to the same
+    endpoint can be aggregated.
+
+    Examples:
+        normalize_endpoint('https://api.zvi.zorroa.com/api/v3/assets/dd0KZtqyec48n1q1fniqVMV5yllhRRGx')
+        '/api/v3/assets/{id}'
+
+    Args:
+        url (str): The request URL or path.
+
+    Returns:
+        str: The endpoint template.
+    """
+    path = urlsplit(url).path
+    segments = path.split('/')
+    for i, segment in enumerate(segments):
+        if segment in _PATH_SEGMENTS:
+            # The rest of the path is a file path.
+            return '/'.join(segments[:i + 1] + ['{path}'])
+        if segment.isdigit() or _UUID_RE.match(segment) or _ID_RE.match(segment):
+            segments[i] = '{id}'
+    return '/'.join(segments)
+
+
+class RequestEvent(object):
+    """
+    Describes a single logical request, including any retries.  An event is
+    passed to the start hooks before the request is sent, at which point only
+    the method, url and endpoint are set, and to the end hooks once it's done.
+    """
+
+    __slots__ = ('method', 'url', 'endpoint', 'status', 'error', 'request_bytes',
+                 'response_bytes', 'serialize_time', 'network_time', 'parse_time',
+                 'retries', 'coalesced', 'started', 'duration', '_start')
+
+    def __init__(self, method, url):
+        self.method = method.upper()
+        """The HTTP method."""
+        self.url = url
+        """The full request URL."""
+        self.endpoint = normalize_endpoint(url)
+        """The endpoint template, for example /api/v3/assets/{id}"""
+        self.status = None
+        """The status of the final response, or None if there was no response."""
+        self.error = None
+        """The exception raised by the request, if any."""
+        self.request_bytes = 0
+        """The size of the request body sent."""
+        self.response_bytes = 0
+        """The size of the response body, the Content-Length for streamed responses."""
+        self.serialize_time = 0.0
+        """The seconds spent encoding the request body."""
+        self.network_time = 0.0
+        """The seconds spent sending requests and receiving responses, over all attempts."""
+        self.parse_time = 0.0
+        """The seconds spent decoding the response body."""
+        self.retries = 0
+        """The number of times the request was retried."""
+        self.coalesced = False
+        """True if the request shared the response of an identical request in flight."""
+        self.started = time.time()
+        """The epoch time the request started."""
+        self.duration = None
+        """The total seconds the request took including retry delays."""
+        self._start = time.perf_counter()
+
+
+class Instrumentation(object):
+    """
+    Calls hooks at the start and end of every request made by a client.  When
+    no hooks are registered the client skips instrumentation entirely, so the
+    cost is a single attribute check per request.
+
+    Hooks are called on the thread making the request, so they should be
+    quick.  Exceptions raised by hooks are logged and ignored.
+
+    Examples:
+        def on_end(event):
+            print(event.method, event.endpoint, event.status, event.duration)
+
+        app.client.instrumentation.add_hooks(on_end=on_end)
+
+    """
+
+    def __init__(self):
+        self.start_hooks = []
+        self.end_hooks = []
+        self.enabled = False
+        self.histograms = None
+
+    def add_hooks(self, on_start=None, on_end=None):
+        """
+        Register hooks.
+
+        Args:
+            on_start (func): A function called with a RequestEvent before a request is sent.
+            on_end (func): A function called with the RequestEvent when the request is done.
+        """
+        if on_start:
+            self.start_hooks.append(on_start)
+        if on_end:
+            self.end_hooks.append(on_end)
+        self._update()
+
+    def remove_hooks(self, on_start=None, on_end=None):
+        """
+        Unregister hooks.
+
+        Args:
+            on_start (func): A start hook to remove.
+            on_end (func): An end hook to remove.
+        """
+        if on_start in self.start_hooks:
+            self.start_hooks.remove(on_start)
+        if on_end in self.end_hooks:
+            self.end_hooks.remove(on_end)
+        self._update()
+
+    def enable_histograms(self, **kwargs):
+        """
+        Aggregate all requests into histograms, which can be exported
+        with to_prometheus().
+
+        Args:
+            **kwargs: Arguments for RequestHistograms.
+
+        Returns:
+            RequestHistograms: The histograms.
+        """
+        if self.histograms is None:
+            self.histograms = RequestHistograms(**kwargs)
+            self.add_hooks(on_end=self.histograms.record)
+        return self.histograms
+
+    def start(self, method, url):
+        """
+        Create the RequestEvent for a new request and call the start hooks.
+
+        Args:
+            method (str): The HTTP method.
+            url (str): The request URL.
+
+        Returns:
+            RequestEvent: The event.
+        """
+        event = RequestEvent(method, url)
+        for hook in self.start_hooks:
+            self._call(hook, event)
+        return event
+
+    def end(self, event):
+        """
+        Complete the RequestEvent and call the end hooks.
+
+        Args:
+            event (RequestEvent): The event.
+        """
+        event.duration = time.perf_counter() - event._start
+        for hook in self.end_hooks:
+            self._call(hook, event)
+
+    def coalesced(self, event):
+        """
+        Call the start and end hooks for a request which shared the response
+        of an identical request already in flight rather than being sent, see
+        SingleFlight.  The event spans the time spent waiting.
+
+        Args:
+            event (RequestEvent): The event.
+        """
+        event.coalesced = True
+        for hook in self.start_hooks:
+            self._call(hook, event)
+        self.end(event)
+
+    def _call(self, hook, event):
+        try:
+            hook(event)
+        except Exception as e:
+            logger.warning("Instrumentation hook %s failed: %s", hook, e)
+
+    def _update(self):
+        self.enabled = bool(self.start_hooks or self.end_hooks)
+
+
+class Histogram(object):
+    """
+    A cumulative histogram with fixed bucket bounds.  Not thread safe
+    on its own, see RequestHistograms.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """
+        Returns:
+            list: A list of (upper bound, cumulative count) tuples ending with +Inf.
+        """
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class RequestHistograms(object):
+    """
+    Aggregates RequestEvents into histograms of latency, time per phase and
+    request and response sizes, and counters of requests and retries, labeled
+    by method and endpoint template.
+    """
+
+    def __init__(self, latency_buckets=LATENCY_BUCKETS, size_buckets=SIZE_BUCKETS):
+        """
+        Create a new RequestHistograms.
+
+        Args:
+            latency_buckets (tuple): The upper bounds of the latency buckets in seconds.
+            size_buckets (tuple): The upper bounds of the size buckets in bytes.
+        """
+        self.latency_buckets = tuple(latency_buckets)
+        self.size_buckets = tuple(size_buckets)
+        self._metrics = {}
+        self._lock = threading.Lock()
+        forksafe.register(self)
+
+    def record(self, event):
+        """
+        Record a completed request.
+
+        Args:
+            event (RequestEvent): The event.
+        """
+        labels = (event.method, event.endpoint)
+        status = str(event.status) if event.status is not None else type(event.error).__name__
+        with self._lock:
+            self._counter('requests_total', labels + (status,), 1)
+            self._counter('retries_total', labels, event.retries)
+            self._histogram('request_duration_seconds', labels,
+                            self.latency_buckets).observe(event.duration)
+            for phase in ('serialize', 'network', 'parse'):
+                self._histogram('request_phase_seconds', labels + (phase,),
+                                self.latency_buckets).observe(
+                    getattr(event, phase + '_time'))
+            self._histogram('request_bytes', labels,
+                            self.size_buckets).observe(event.request_bytes)
+            self._histogram('response_bytes', labels,
+                            self.size_buckets).observe(event.response_bytes)
+
+    def snapshot(self):
+        """
+        Return a copy of the current metrics.
+
+        Returns:
+            dict: A dictionary of metric name to a dictionary of label values to
+                either a count or a dict with the histogram sum, count and buckets.
+        """
+        with self._lock:
+            result = {}
+            for name, series in self._metrics.items():
+                result[name] = {}
+                for labels, value in series.items():
+                    if isinstance(value, Histogram):
+                        value = {'sum': value.sum, 'count': value.count,
+                                 'buckets': value.cumulative()}
+                    result[name][labels] = value
+            return result
+
+    def reset(self):
+        """
+        Clear all metrics.
+        """
+        with self._lock:
+            self._metrics = {}
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+
+    def _counter(self, name, labels, value):
+        series = self._metrics.setdefault(name, {})
+        series[labels] = series.get(labels, 0) + value
+
+    def _histogram(self, name, labels, buckets):
+        series = self._metrics.setdefault(name, {})
+        histogram = series.get(labels)
+        if histogram is None:
+            histogram = series[labels] = Histogram(buckets)
+        return histogram
+
+
+_LABEL_NAMES = {
+    'requests_total': ('method', 'endpoint', 'status'),
+    'retries_total': ('method', 'endpoint'),
+    'request_duration_seconds': ('method', 'endpoint'),
+    'request_phase_seconds': ('method', 'endpoint', 'phase'),
+    'request_bytes': ('method', 'endpoint'),
+    'response_bytes': ('method', 'endpoint')
+}
+
+_HELP = {
+    'requests_total': ('counter', 'The number of requests.'),
+    'retries_total': ('counter', 'The number of retried requests.'),
+    'request_duration_seconds': ('histogram', 'Request latency including retries.'),
+    'request_phase_seconds': ('histogram',
+                              'Time spent serializing, on the network and parsing.'),
+    'request_bytes': ('histogram', 'The size of request bodies.'),
+    'response_bytes': ('histogram', 'The size of response bodies.')
+}
+
+
+def to_prometheus(histograms, limiter=None, prefix='zmlp_client'):
+    """
+    Render metrics in the Prometheus text exposition format.
+
+    Args:
+        histograms (RequestHistograms): The request histograms.
+        limiter (AdaptiveLimiter): An optional limiter to export gauges for.
+        prefix (str): The metric name prefix.
+
+    Returns:
+        str: The metrics.
+    """
+    lines = []
+    snapshot = histograms.snapshot() if histograms else {}
+    for name in sorted(snapshot):
+        full_name = '{}_{}'.format(prefix, name)
+        kind, help_text = _HELP[name]
+        lines.append('# HELP {} {}'.format(full_name, help_text))
+        lines.append('# TYPE {} {}'.format(full_name, kind))
+        for labels, value in sorted(snapshot[name].items()):
+            label_str = _labels(_LABEL_NAMES[name], labels)
+            if kind == 'counter':
+                lines.append('{}{{{}}} {}'.format(full_name, label_str, value))
+                continue
+            for bound, count in value['buckets']:
+                lines.append('{}_bucket{{{},le="{}"}} {}'.format(
+                    full_name, label_str, _format_bound(bound), count))
+            lines.append('{}_sum{{{}}} {}'.format(full_name, label_str, repr(value['sum'])))
+            lines.append('{}_count{{{}}} {}'.format(full_name, label_str, value['count']))
+
+    if limiter is not None:
+        stats = limiter.stats()
+        for name, help_text in (('window', 'The concurrency window size.'),
+                                ('in_flight', 'The number of requests in flight.'),
+                                ('queued', 'The number of requests waiting to be sent.')):
+            full_name = '{}_limiter_{}'.format(prefix, name)
+            lines.append('# HELP {} {}'.format(full_name, help_text))
+            lines.append('# TYPE {} gauge'.format(full_name))
+            lines.append('{} {}'.format(full_name, stats[name]))
+    return '\n'.join(lines) + '\n'
+
+
+def _labels(names, values):
+    return ','.join('{}="{}"'.format(name, _escape(value)) for name, value in zip(names, values))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_bound(bound):
+    if bound == float('inf'):
+        return '+Inf'
+    return repr(float(bound))
@@ -0,0 +1,118 @@
+"""Traffic classes with separate connection pools and concurrency budgets."""
+import contextlib
+import contextvars
+
+from .limiter import AdaptiveLimiter, ConcurrencyWindow
+
+__all__ = [
+    'Lane',
+    'INTERACTIVE',
+    'BULK',
+    'current_lane',
+    'use_lane'
+]
+
+INTERACTIVE = 'interactive'
+"""The default lane, for latency sensitive requests."""
+
+BULK = 'bulk'
+"""The lane used by default for scrolls, uploads and downloads."""
+
+DEFAULT_BULK_CONCURRENCY = 8
+"""The default maximum number of bulk requests in flight."""
+
+_current_lane = contextvars.ContextVar('zmlp_lane', default=None)
+
+
+class Lane(object):
+    """
+    A Lane is a named class of traffic with its own pool of keep-alive
+    connections and its own limiter, so a large upload or scroll can't starve
+    interactive requests of connections or concurrency.
+
+    A Lane can be shared between clients, in which case they share its
+    concurrency budget, though each client keeps its own connections.
+
+    Examples:
+        client = ZmlpClient(apikey, server, lanes=[
+            Lane('bulk', concurrency=4),
+            Lane('reports', concurrency=2)
+        ])
+    """
+
+    def __init__(self, name, concurrency=None, pool_maxsize=None, rate_limits=None,
+                 limiter=None):
+        """
+        Create a new Lane.
+
+        Args:
+            name (str): The name of the lane.
+            concurrency (int): The maximum number of requests in flight, the
+                window can shrink below this if the server is overloaded.  None
+                for no limit.
+            pool_maxsize (int): The maximum number of keep-alive connections per
+                host, defaults to the concurrency or the client's pool_maxsize.
+            rate_limits (dict): A dictionary of endpoint class to a tuple of the
+                requests per second and burst size, see AdaptiveLimiter.
+            limiter (AdaptiveLimiter): Use this limiter rather than creating one
+                from the concurrency and rate_limits, or False to disable limiting.
+        """
+        self.name = name
+        self.concurrency = concurrency
+        self.pool_maxsize = pool_maxsize or concurrency
+        self.rate_limits = rate_limits
+        if limiter is None and concurrency:
+            limiter = AdaptiveLimiter(rate_limits, ConcurrencyWindow(
+                initial=concurrency, max_limit=concurrency))
+        self.limiter = limiter
+
+    def __reduce__(self):
+        return Lane, (self.name, self.concurrency, self.pool_maxsize, self.rate_limits,
+                      self.limiter)
+
+    def __repr__(self):
+        return "<Lane name='{}' concurrency={}>".format(self.name, self.concurrency)
+
+
+def current_lane():
+    """
+    Return the name of the lane selected in the current thread or asyncio task.
+
+    Returns:
+        str: The lane name or None if none has been selected.
+    """
+    return _current_lane.get()
+
+
+@contextlib.contextmanager
+def use_lane(name):
+    """
+    Send the requests made within the block through the given lane.  Prefer the
+    ZmlpClient.lane() context manager, which checks that the lane exists.
+
+    Args:
+        name (str): The lane name, None leaves the current lane unchanged.
+    """
+    if name is None:
+        yield
+        return
+    token = _current_lane.set(name)
+    try:
+        yield
+    finally:
+        _current_lane.reset(token)
+
+
+def resolve_lane(name, default=None):
+    """
+    Return the lane a request should use: the one requested for the call, else
+    the one selected with a context manager, else the default.
+
+    Args:
+        name (str): The lane requested for the call, if any.
+        default (str): The default lane of the operation.
+
+    Returns:
+        str: The lane name, or None for the client's default lane.
+    """
+    return name or _current_lane.get() or default
@@ -0,0 +1,106 @@
+"""Deferred imports, which keep 'import zmlp' fast for short lived processes."""
+import importlib.util
+import sys
+
+__all__ = [
+    'import_module',
+    'lazy_import',
+    'lazy_attrs'
+]
+
+
+class LazyModule(object):
+    """
+    Stands in for a module until one of its attributes is used, at which
+    point the module is imported.  Importing is thread safe, it's done under
+    the interpreter's import lock.
+    """
+
+    def __init__(self, name):
+        self.__name = name
+        self.__module = None
+
+    def __getattr__(self, attr):
+        module = self.__module
+        if module is None:
+            module = self.__module = import_module(self.__name)
+        return getattr(module, attr)
+
+    def __repr__(self):
+        return "<LazyModule name='{}' loaded={}>".format(self.__name, self.__module is not None)
+
+
+def lazy_import(name, optional=False):
+    """
+    Return a stand in for a module which imports it on first use.
+
+    Examples:
+        requests = lazy_import('requests')
+
+    Args:
+        name (str): The module name.
+        optional (bool): Return None if the module isn't installed, which is
+            checked without importing it.
+
+    Returns:
+        LazyModule: The lazy module, or None.
+    """
+    if optional and importlib.util.find_spec(name) is None:
+        return None
+    return LazyModule(name)
+
+
+def lazy_attrs(package, attrs):
+    """
+    Build the PEP 562 module __getattr__ and __dir__ functions for a package
+    whose public names are imported from its modules on first use.  Its
+    submodules are also imported when they're first used as attributes.
+
+    Examples:
+        __getattr__, __dir__ = lazy_attrs(__name__, {'ZmlpApp': '.app.zmlp_app'})
+
+    Args:
+        package (str): The name of the package, usually __name__.
+        attrs (dict): A dictionary of attribute name to the module it's defined in,
+            relative to the package.
+
+    Returns:
+        tuple: The __getattr__ and __dir__ functions.
+    """
+    namespace = sys.modules[package].__dict__
+
+    def __getattr__(name):
+        module = attrs.get(name)
+        if module is None:
+            # A submodule is an attribute of its package once it's imported.
+            if name.startswith('_') or importlib.util.find_spec(package + '.' + name) is None:
+                raise AttributeError("module '{}' has no attribute '{}'".format(package, name))
+            return import_module('.' + name, package)
+        value = getattr(import_module(module, package), name)
+        # Cache it so __getattr__ isn't called again.
+        namespace[name] = value
+        return value
+
+    def __dir__():
+        # Leave out the private names the package uses to set this up.
+        names = set(namespace) | set(attrs)
+        return sorted(name for name in names
+                      if not name.startswith('_') or name.startswith('__'))
+
+    return __getattr__, __dir__
+
+
+def import_module(name, package=None):
+    """
+    importlib.import_module(), except the import is seen by -X importtime.
+
+    Args:
+        name (str): The module name, relative names need the package.
+        package (str): The package a relative name is relative to.
+
+    Returns:
+        module: The module.
+    """
+    name = importlib.util.resolve_name(name, package)
+    __import__(name)
+    return sys.modules[name]
@@ -0,0 +1,470 @@
+"""Adaptive client side rate and concurrency limiting."""
+import collections
+import threading
+import time
+
+from . import forksafe
+from .lazy import lazy_import
+from .timeouts import current_deadline
+
+__all__ = [
+    'AdaptiveLimiter',
+    'ConcurrencyWindow',
+    'TokenBucket',
+    'endpoint_class'
+]
+
+# Only imported by asyncio callers.
+asyncio = lazy_import('asyncio')
+
+SUGGESTED_RATE_LIMITS = {
+    'search': (50.0, 100),
+    'upload': (10.0, 20),
+    'download': (100.0, 200),
+    'default': (100.0, 200)
+}
+"""
+Requests per second and burst sizes for each endpoint class which can be passed
+as rate_limits.  Requests are not rate limited unless rate_limits are given.
+"""
+
+CONGESTION_STATUSES = frozenset([429, 503])
+"""Response statuses which indicate the server is overloaded."""
+
+
+def endpoint_class(method, url):
+    """
+    Classify a request into an endpoint class, which determines the
+    token bucket it draws from.
+
+    Args:
+        method (str): The HTTP method.
+        url (str): The request URL or path.
+
+    Returns:
+        str: One of 'download', 'upload', 'search' or 'default'.
+    """
+    if '/_stream/' in url or '/_download' in url:
+        return 'download'
+    if '_upload' in url or '/sim-hash' in url:
+        return 'upload'
+    if '_search' in url or '_scroll' in url or '/_find' in url:
+        return 'search'
+    return 'default'
+
+
+class TokenBucket(object):
+    """
+    A thread safe token bucket which allows bursts of up to 'burst' requests
+    and an average of 'rate' requests per second.
+    """
+
+    def __init__(self, rate, burst):
+        """
+        Create a new TokenBucket.
+
+        Args:
+            rate (float): The number of tokens added per second.
+            burst (int): The maximum number of tokens.
+        """
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        forksafe.register(self)
+
+    @property
+    def tokens(self):
+        """The number of tokens currently available, negative if reserved ahead."""
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+    def reserve(self):
+        """
+        Take a token, going into debt if there are none left.
+
+        Returns:
+            float: The number of seconds to wait before the token may be used.
+        """
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def __reduce__(self):
+        return TokenBucket, (self.rate, self.burst)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+class ConcurrencyWindow(object):
+    """
+    Limits the number of requests in flight using additive increase,
+    multiplicative decrease (AIMD).  The window grows by roughly one slot for
+    every window's worth of successful requests while latency stays close to the
+    lowest latency seen, and is cut by decrease_factor when the server responds
+    with a 429 or 503 or a request times out.
+
+    Both threads and asyncio tasks can wait for a slot, optionally with a
+    timeout.  Waiters are served in FIFO order.
+    """
+
+    def __init__(self, initial=16, min_limit=1, max_limit=128, decrease_factor=0.5,
+                 latency_tolerance=2.0):
+        """
+        Create a new ConcurrencyWindow.
+
+        Args:
+            initial (int): The initial window size.
+            min_limit (int): The smallest the window can shrink to.
+            max_limit (int): The largest the window can grow to.
+            decrease_factor (float): The window is multiplied by this when
+                the server is overloaded.
+            latency_tolerance (float): The window only grows while latency is
+                within this multiple of the lowest observed latency.
+        """
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.limit = float(min(max(initial, min_limit), max_limit))
+        self.in_flight = 0
+        self.latency = None
+        self.min_latency = None
+        self.decreases = 0
+        self._last_decrease = 0
+        self._waiters = collections.deque()
+        self._lock = threading.Lock()
+        forksafe.register(self)
+
+    @property
+    def queued(self):
+        """The number of requests waiting for a slot."""
+        return len(self._waiters)
+
+    def acquire(self, timeout=None):
+        """
+        Wait for a slot in the window.
+
+        Args:
+            timeout (float): The maximum number of seconds to wait, None to
+                wait for as long as it takes.
+
+        Returns:
+            bool: True if a slot was acquired, False if the timeout expired.
+        """
+        with self._lock:
+            if self._has_slot():
+                self.in_flight += 1
+                return True
+            waiter = threading.Event()
+            self._waiters.append(waiter)
+        # The slot may be granted just as the wait times out.
+        return waiter.wait(timeout) or not self._withdraw(waiter)
+
+    async def acquire_async(self, timeout=None):
+        """
+        Wait for a slot in the window without blocking the event loop.
+
+        Args:
+            timeout (float): The maximum number of seconds to wait, None to
+                wait for as long as it takes.
+
+        Returns:
+            bool: True if a slot was acquired, False if the timeout expired.
+        """
+        with self._lock:
+            if self._has_slot():
+                self.in_flight += 1
+                return True
+            waiter = _AsyncWaiter()
+            self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter.future, timeout)
+        except asyncio.TimeoutError:
+            return not self._withdraw(waiter)
+        except asyncio.CancelledError:
+            if not self._withdraw(waiter):
+                # The slot was granted as the task was cancelled.
+                self.release()
+            raise
+        return True
+
+    def release(self):
+        """
+        Free a slot in the window.
+        """
+        with self._lock:
+            self.in_flight -= 1
+            self._wake()
+
+    def feedback(self, started, latency, congested):
+        """
+        Adjust the window based on the outcome of a request.
+
+        Args:
+            started (float): The time.monotonic() the request was started.
+            latency (float): The time in seconds the request took.
+            congested (bool): True if the server was overloaded.
+        """
+        with self._lock:
+            if congested:
+                # Only decrease once for a burst of failures, requests started
+                # before the last decrease were sent at the old rate.
+                if started >= self._last_decrease:
+                    self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                    self._last_decrease = time.monotonic()
+                    self.decreases += 1
+                return
+
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency = 0.8 * self.latency + 0.2 * latency
+            if self.min_latency is None or self.latency < self.min_latency:
+                self.min_latency = self.latency
+
+            if self.latency <= self.min_latency * self.latency_tolerance:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+                self._wake()
+
+    def __reduce__(self):
+        # Only the configuration, a new process starts with nothing in flight.
+        return ConcurrencyWindow, (int(self.limit), self.min_limit, self.max_limit,
+                                   self.decrease_factor, self.latency_tolerance)
+
+    def _after_fork(self):
+        # The requests in flight and the threads waiting belong to the parent.
+        self.in_flight = 0
+        self._waiters = collections.deque()
+        self._lock = threading.Lock()
+
+    def _withdraw(self, waiter):
+        """
+        Remove a waiter which gave up, returning False if it was already
+        granted a slot.
+        """
+        with self._lock:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                return True
+            return False
+
+    def _has_slot(self):
+        return not self._waiters and self.in_flight < int(self.limit)
+
+    def _wake(self):
+        while self._waiters and self.in_flight < int(self.limit):
+            self.in_flight += 1
+            self._waiters.popleft().set()
+
+
+class _AsyncWaiter(object):
+    """
+    Wakes an asyncio task waiting for a slot, from any thread.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.future = self.loop.create_future()
+
+    def set(self):
+        self.loop.call_soon_threadsafe(self._set)
+
+    def _set(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class Permit(object):
+    """
+    Permission to send a single request.  Report the outcome with feedback()
+    and free the slot with release() once the response has been consumed.
+    """
+
+    def __init__(self, limiter):
+        self.limiter = limiter
+        self.started = time.monotonic()
+        self._released = False
+
+    def feedback(self, status=None, error=None):
+        """
+        Report the outcome of the request.
+
+        Args:
+            status (int): The response status, if there was a response.
+            error (Exception): The exception raised making the request, if any.
+        """
+        latency = time.monotonic() - self.started
+        if error is not None:
+            congested = _is_timeout(error)
+            if not congested:
+                return
+        else:
+            congested = status in CONGESTION_STATUSES
+        self.limiter.window.feedback(self.started, latency, congested)
+
+    def release(self):
+        """
+        Free the slot held by this permit.  Only the first call has any effect.
+        """
+        if not self._released:
+            self._released = True
+            self.limiter.window.release()
+
+
+class AdaptiveLimiter(object):
+    """
+    Limits the requests made by a client with an optional token bucket per
+    endpoint class, which caps the request rate, and an AIMD ConcurrencyWindow
+    shared by all requests, which caps the number of requests in flight and adapts to how
+    loaded the server is.  An AdaptiveLimiter is thread safe and can be shared
+    between clients, including an AsyncZmlpClient.
+
+    Waiting for a permit counts against the deadline of the operation, so a
+    request which can't get a slot in time raises ZmlpDeadlineExceededException
+    rather than waiting forever.
+    """
+
+    def __init__(self, rate_limits=None, window=None, classifier=endpoint_class):
+        """
+        Create a new AdaptiveLimiter.
+
+        Args:
+            rate_limits (dict): A dictionary of endpoint class to a tuple of the
+                requests per second and burst size, for example the
+                SUGGESTED_RATE_LIMITS.  None for no rate limits.
+            window (ConcurrencyWindow): The concurrency window.
+            classifier (func): A function which takes the method and URL of a
+                request and returns its endpoint class.
+        """
+        self.rate_limits = dict(rate_limits or {})
+        self.buckets = {name: TokenBucket(*limit)
+                        for name, limit in self.rate_limits.items() if limit}
+        self.window = window or ConcurrencyWindow()
+        self.classifier = classifier
+        self._rate_waiting = 0
+        self._lock = threading.Lock()
+        forksafe.register(self)
+
+    def acquire(self, method, url, deadline=None):
+        """
+        Wait until a request can be sent.
+
+        Args:
+            method (str): The HTTP method.
+            url (str): The request URL.
+            deadline (Deadline): The deadline of the operation, defaults to the
+                current deadline.
+
+        Returns:
+            Permit: The permit for the request.
+
+        Raises:
+            ZmlpDeadlineExceededException: If the deadline passes first.
+        """
+        deadline = deadline or current_deadline()
+        delay = self._reserve(method, url)
+        if delay:
+            self._check_wait(deadline, delay, method, url)
+            self._incr_rate_waiting(1)
+            try:
+                time.sleep(delay)
+            finally:
+                self._incr_rate_waiting(-1)
+        if not self.window.acquire(_timeout(deadline)):
+            self._check_wait(deadline, None, method, url)
+        return Permit(self)
+
+    async def acquire_async(self, method, url, deadline=None):
+        """
+        Wait until a request can be sent without blocking the event loop.
+
+        Args:
+            method (str): The HTTP method.
+            url (str): The request URL.
+            deadline (Deadline): The deadline of the operation, defaults to the
+                current deadline.
+
+        Returns:
+            Permit: The permit for the request.
+
+        Raises:
+            ZmlpDeadlineExceededException: If the deadline passes first.
+        """
+        deadline = deadline or current_deadline()
+        delay = self._reserve(method, url)
+        if delay:
+            self._check_wait(deadline, delay, method, url)
+            self._incr_rate_waiting(1)
+            try:
+                await asyncio.sleep(delay)
+            finally:
+                self._incr_rate_waiting(-1)
+        if not await self.window.acquire_async(_timeout(deadline)):
+            self._check_wait(deadline, None, method, url)
+        return Permit(self)
+
+    def stats(self):
+        """
+        Return the current state of the limiter.
+
+        Returns:
+            dict: The concurrency window, requests in flight, queue depth,
+                latency and the tokens left in each bucket.
+        """
+        window = self.window
+        return {
+            'window': window.limit,
+            'in_flight': window.in_flight,
+            'queued': window.queued + self._rate_waiting,
+            'latency': window.latency,
+            'min_latency': window.min_latency,
+            'decreases': window.decreases,
+            'tokens': {name: bucket.tokens for name, bucket in self.buckets.items()}
+        }
+
+    def __reduce__(self):
+        return AdaptiveLimiter, (self.rate_limits, self.window, self.classifier)
+
+    def _after_fork(self):
+        self._rate_waiting = 0
+        self._lock = threading.Lock()
+
+    def _reserve(self, method, url):
+        bucket = self.buckets.get(self.classifier(method, url)) or self.buckets.get('default')
+        return bucket.reserve() if bucket else 0
+
+    def _check_wait(self, deadline, delay, method, url):
+        """
+        Raise if the deadline won't allow waiting delay seconds, None once the
+        wait for a slot has timed out.
+        """
+        if deadline is not None and (delay is None or delay >= deadline.remaining()):
+            from .client import ZmlpDeadlineExceededException
+            raise ZmlpDeadlineExceededException(deadline, method, url)
+
+    def _incr_rate_waiting(self, value):
+        with self._lock:
+            self._rate_waiting += value
+
+
+def _timeout(deadline):
+    return deadline.remaining() if deadline is not None else None
+
+
+def _is_timeout(error):
+    if isinstance(error, TimeoutError):
+        return True
+    # requests, urllib3, aiohttp and asyncio timeouts are matched by name.
+    return 'Timeout' in type(error).__name__
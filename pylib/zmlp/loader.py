@@ -0,0 +1,250 @@
+"""Coalesce individual asset lookups into batched searches."""
+import copy
+import threading
+import time
+from concurrent.futures import Future
+
+from . import forksafe
+from .client import ZmlpNotFoundException
+from .entity import Asset
+from .lazy import lazy_import
+
+# Only imported by the AsyncAssetLoader.
+asyncio = lazy_import('asyncio')
+
+__all__ = [
+    'AssetLoader',
+    'AsyncAssetLoader'
+]
+
+DEFAULT_WINDOW = 0.002
+"""The default number of seconds to wait for more lookups before sending a batch."""
+
+DEFAULT_MAX_BATCH_SIZE = 100
+"""The default maximum number of assets fetched by one search."""
+
+
+class _Batch(object):
+    """
+    The ids waiting to be fetched and the future of each id, which is
+    resolved with the search hit rather than an Asset so each caller of
+    a duplicate id builds its own.
+    """
+
+    def __init__(self):
+        self.futures = {}
+
+
+class _BaseLoader(object):
+    """
+    The search building and result fan out shared by the thread and asyncio loaders.
+    """
+
+    def __init__(self, app, window=DEFAULT_WINDOW, max_batch_size=DEFAULT_MAX_BATCH_SIZE):
+        """
+        Create a new loader.
+
+        Args:
+            app (ZmlpApp): The app used to search for assets.
+            window (float): The number of seconds to wait for more lookups
+                after the first lookup of a batch.
+            max_batch_size (int): The maximum number of ids fetched by one search,
+                a full batch is sent immediately.
+        """
+        if max_batch_size < 1:
+            raise ValueError("The max_batch_size must be at least 1")
+        self.app = app
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.batches_sent = 0
+        """The number of searches sent."""
+        self.lookups = 0
+        """The number of lookups, including duplicates within a batch."""
+
+    @staticmethod
+    def _search_body(ids):
+        return {
+            'size': len(ids),
+            'query': {
+                'terms': {
+                    '_id': ids
+                }
+            }
+        }
+
+    @staticmethod
+    def _asset(hit):
+        # The hit is shared by duplicate lookups, so each gets its own document.
+        return Asset({'id': hit['_id'], 'document': copy.deepcopy(hit['_source'])})
+
+    @staticmethod
+    def _fan_out(futures, rsp):
+        found = {}
+        for hit in rsp.get('hits', {}).get('hits', []):
+            found[hit['_id']] = hit
+        for asset_id, future in futures.items():
+            if future.done():
+                continue
+            hit = found.get(asset_id)
+            if hit is None:
+                future.set_exception(ZmlpNotFoundException({
+                    'message': 'Asset {} not found'.format(asset_id),
+                    'status': 404,
+                    'path': '/api/v3/assets/{}'.format(asset_id)
+                }))
+            else:
+                future.set_result(hit)
+
+    @staticmethod
+    def _fail(futures, error):
+        for future in futures.values():
+            if not future.done():
+                future.set_exception(error)
+
+
+class AssetLoader(_BaseLoader):
+    """
+    Merges get_asset() calls made by concurrent threads within a short window
+    into a single search with an _id terms query, then hands each caller
+    its asset.  Lookups of the same id in a batch share one search hit,
+    however each caller gets its own Asset.
+
+    The first lookup of a batch waits 'window' seconds for more lookups
+    to arrive, then sends the batch.  A batch which reaches max_batch_size
+    is sent straight away by the thread that filled it.
+
+    Examples:
+        app = ZmlpApp(apikey, asset_batch_window=0.002)
+        # Each thread calls app.assets.get_asset(id) as usual.
+    """
+
+    def __init__(self, app, window=DEFAULT_WINDOW, max_batch_size=DEFAULT_MAX_BATCH_SIZE):
+        super(AssetLoader, self).__init__(app, window, max_batch_size)
+        self._lock = threading.Lock()
+        self._batch = None
+        forksafe.register(self)
+
+    def _after_fork(self):
+        # The threads waiting on the parent's batch don't exist in the child.
+        self._lock = threading.Lock()
+        self._batch = None
+
+    def load(self, asset_id):
+        """
+        Fetch an asset, waiting for it to be fetched with other lookups.
+
+        Args:
+            asset_id (str): The asset id.
+
+        Returns:
+            Asset: The asset.
+
+        Raises:
+            ZmlpNotFoundException: If the asset does not exist.
+        """
+        leader = False
+        full = None
+        with self._lock:
+            self.lookups += 1
+            batch = self._batch
+            if batch is None:
+                batch = self._batch = _Batch()
+                leader = True
+            future = batch.futures.get(asset_id)
+            if future is None:
+                future = batch.futures[asset_id] = Future()
+                if len(batch.futures) >= self.max_batch_size:
+                    self._batch = None
+                    full = batch
+
+        if full is not None:
+            self._dispatch(full)
+        elif leader:
+            if self.window > 0:
+                time.sleep(self.window)
+            with self._lock:
+                if self._batch is batch:
+                    self._batch = None
+                    full = batch
+            if full is not None:
+                self._dispatch(full)
+        return self._asset(future.result())
+
+    def _dispatch(self, batch):
+        with self._lock:
+            self.batches_sent += 1
+        try:
+            rsp = self.app.client.post('api/v3/assets/_search',
+                                       self._search_body(list(batch.futures)))
+        except Exception as e:
+            self._fail(batch.futures, e)
+        else:
+            self._fan_out(batch.futures, rsp)
+
+
+class AsyncAssetLoader(_BaseLoader):
+    """
+    An AssetLoader for asyncio, which merges get_asset() calls made by
+    concurrent tasks within a short window into a single search.  A loader
+    belongs to the event loop it is first used with.
+
+    Examples:
+        app = AsyncZmlpApp(apikey, asset_batch_window=0.002)
+        assets = await asyncio.gather(*[app.assets.get_asset(i) for i in ids])
+    """
+
+    def __init__(self, app, window=DEFAULT_WINDOW, max_batch_size=DEFAULT_MAX_BATCH_SIZE):
+        super(AsyncAssetLoader, self).__init__(app, window, max_batch_size)
+        self._batch = None
+        self._timer = None
+        self._tasks = set()
+
+    async def load(self, asset_id):
+        """
+        Fetch an asset, waiting for it to be fetched with other lookups.
+
+        Args:
+            asset_id (str): The asset id.
+
+        Returns:
+            Asset: The asset.
+
+        Raises:
+            ZmlpNotFoundException: If the asset does not exist.
+        """
+        loop = asyncio.get_running_loop()
+        self.lookups += 1
+        batch = self._batch
+        if batch is None:
+            batch = self._batch = _Batch()
+            self._timer = loop.call_later(self.window, self._flush, batch)
+        future = batch.futures.get(asset_id)
+        if future is None:
+            future = batch.futures[asset_id] = loop.create_future()
+            if len(batch.futures) >= self.max_batch_size:
+                self._timer.cancel()
+                self._flush(batch)
+        # Shield the shared future so one cancelled caller doesn't cancel the others.
+        return self._asset(await asyncio.shield(future))
+
+    def _flush(self, batch):
+        if self._batch is batch:
+            self._batch = None
+            self._timer = None
+            task = asyncio.ensure_future(self._dispatch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self, batch):
+        self.batches_sent += 1
+        try:
+            rsp = await self.app.client.post('api/v3/assets/_search',
+                                             self._search_body(list(batch.futures)))
+        except asyncio.CancelledError:
+            for future in batch.futures.values():
+                future.cancel()
+            raise
+        except Exception as e:
+            self._fail(batch.futures, e)
+        else:
+            self._fan_out(batch.futures, rsp)
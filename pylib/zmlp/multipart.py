@@ -0,0 +1,241 @@
+"""A streaming multipart/form-data encoder for uploading files."""
+import io
+import os
+import stat
+import uuid
+
+__all__ = [
+    'MultipartEncoder'
+]
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+"""The size of the chunks read from each file."""
+
+
+class MultipartEncoder(object):
+    """
+    Encodes a multipart/form-data request body as a stream.  Files are opened
+    only when their part is reached, read in chunks and closed as soon as they
+    have been sent, so memory use and open file handles stay constant no
+    matter how many files are in the request.
+
+    The encoder is a readable file-like object which can be passed as the
+    data of a request.  When the size of every part is known up front it
+    has a 'len' so the Content-Length is sent, otherwise the body is sent
+    with chunked transfer encoding.
+
+    Examples:
+        encoder = MultipartEncoder(callback=print_progress)
+        encoder.add_file('files', '/images/cat.jpg')
+        encoder.add_field('body', to_json(body), content_type='application/json')
+        requests.post(url, data=encoder, headers={'Content-Type': encoder.content_type})
+
+    """
+
+    def __init__(self, boundary=None, chunk_size=DEFAULT_CHUNK_SIZE, callback=None):
+        """
+        Create a new MultipartEncoder.
+
+        Args:
+            boundary (str): The multipart boundary, a random one is used by default.
+            chunk_size (int): The size of the chunks read from each file.
+            callback (func): A function which is called with the number of bytes
+                sent so far and the total size, or None if it's unknown, each time
+                a chunk is sent.
+        """
+        self.boundary = boundary or uuid.uuid4().hex
+        self.chunk_size = chunk_size
+        self.callback = callback
+        self.parts = []
+        self.bytes_read = 0
+        self._total = None
+        self._chunks = None
+        self._buf = b''
+
+    @property
+    def content_type(self):
+        """The Content-Type header value for the request."""
+        return 'multipart/form-data; boundary={}'.format(self.boundary)
+
+    def add_field(self, name, value, content_type=None, filename=None):
+        """
+        Add a part with an in-memory value.
+
+        Args:
+            name (str): The form field name.
+            value (mixed): The value as str or bytes.
+            content_type (str): An optional content type for the part.
+            filename (str): An optional filename for the part.
+        """
+        if isinstance(value, str):
+            value = value.encode('utf-8')
+        self.parts.append(_Part(self._header(name, filename, content_type), value=value))
+
+    def add_file(self, name, file, filename=None, content_type='application/octet-stream'):
+        """
+        Add a file part.  A file path is not opened until the part is sent.  A
+        file handle is read from its current position and is not closed.
+
+        Args:
+            name (str): The form field name.
+            file (mixed): A file path or a file handle opened in binary mode.
+            filename (str): The filename, defaults to the base name of the file.
+            content_type (str): The content type of the part.
+        """
+        if hasattr(file, 'read'):
+            if filename is None:
+                path = getattr(file, 'name', None)
+                filename = os.path.basename(path) if isinstance(path, str) else 'file'
+            part = _Part(self._header(name, filename, content_type), handle=file)
+        else:
+            if filename is None:
+                filename = os.path.basename(file)
+            part = _Part(self._header(name, filename, content_type), path=file)
+        self.parts.append(part)
+
+    @property
+    def len(self):
+        """
+        The total size of the encoded body in bytes, or None if the size of
+        any part is unknown.
+        """
+        total = len(self._footer())
+        for part in self.parts:
+            size = part.size()
+            if size is None:
+                return None
+            total += len(part.header) + size + 2
+        return total
+
+    def read(self, size=-1):
+        """
+        Read up to size bytes of the encoded body.
+
+        Args:
+            size (int): The maximum number of bytes to read, -1 for everything.
+
+        Returns:
+            bytes: The data, an empty bytes object at the end of the body.
+        """
+        if self._chunks is None:
+            self._total = self.len
+            self._chunks = self._generate()
+        while size < 0 or len(self._buf) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buf += chunk
+        if size < 0:
+            data, self._buf = self._buf, b''
+        else:
+            data, self._buf = self._buf[:size], self._buf[size:]
+
+        if data:
+            self.bytes_read += len(data)
+            if self.callback:
+                self.callback(self.bytes_read, self._total)
+        return data
+
+    def __iter__(self):
+        while True:
+            data = self.read(self.chunk_size)
+            if not data:
+                return
+            yield data
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        """
+        Rewind the encoder so the body can be sent again.  Only seeking
+        to the start is supported.
+        """
+        if offset != 0 or whence != io.SEEK_SET:
+            raise io.UnsupportedOperation("MultipartEncoder can only seek to the start")
+        self.close()
+        self.bytes_read = 0
+        return 0
+
+    def close(self):
+        """
+        Close any file the encoder has opened.
+        """
+        if self._chunks is not None:
+            self._chunks.close()
+            self._chunks = None
+        self._buf = b''
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _generate(self):
+        for part in self.parts:
+            yield part.header
+            if part.value is not None:
+                yield part.value
+            else:
+                if part.path is not None:
+                    handle = open(part.path, 'rb')
+                else:
+                    handle = part.handle
+                    if part.seekable:
+                        handle.seek(part.offset)
+                try:
+                    while True:
+                        chunk = handle.read(self.chunk_size)
+                        if not chunk:
+                            break
+                        yield chunk
+                finally:
+                    if part.path is not None:
+                        handle.close()
+            yield b'\r\n'
+        yield self._footer()
+
+    def _header(self, name, filename, content_type):
+        disposition = 'form-data; name="{}"'.format(_quote(name))
+        if filename is not None:
+            disposition += '; filename="{}"'.format(_quote(filename))
+        lines = ['--' + self.boundary, 'Content-Disposition: ' + disposition]
+        if content_type:
+            lines.append('Content-Type: ' + content_type)
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('utf-8')
+
+    def _footer(self):
+        return '--{}--\r\n'.format(self.boundary).encode('utf-8')
+
+
+class _Part(object):
+    """
+    A single part of a multipart body.
+    """
+
+    def __init__(self, header, value=None, path=None, handle=None):
+        self.header = header
+        self.value = value
+        self.path = path
+        self.handle = handle
+        self.seekable = handle is not None and getattr(handle, 'seekable', lambda: False)()
+        self.offset = handle.tell() if self.seekable else 0
+
+    def size(self):
+        if self.value is not None:
+            return len(self.value)
+        if self.path is not None:
+            return os.path.getsize(self.path)
+        try:
+            info = os.fstat(self.handle.fileno())
+            if stat.S_ISREG(info.st_mode):
+                return info.st_size - self.offset
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            pass
+        if self.seekable:
+            size = self.handle.seek(0, io.SEEK_END) - self.offset
+            self.handle.seek(self.offset)
+            return size
+        return None
+
+
+def _quote(value):
+    return value.replace('"', '%22').replace('\r', '%0D').replace('\n', '%0A')
@@ -0,0 +1,335 @@
+"""Retry policies for requests made to the ZMLP API server."""
+import random
+import re
+import threading
+import time
+
+from . import forksafe
+from .lazy import lazy_import
+
+__all__ = [
+    'RetryPolicy',
+    'RetryState'
+]
+
+asyncio = lazy_import('asyncio')
+requests = lazy_import('requests')
+
+DEFAULT_RETRY_STATUSES = frozenset([429, 502, 503, 504])
+"""HTTP status codes which are retried by default."""
+
+SAFE_RETRY_STATUSES = frozenset([429, 503])
+"""Status codes that indicate the server did not process the request at all."""
+
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+"""HTTP methods that are safe to repeat."""
+
+READ_ONLY_ENDPOINTS = re.compile(r'/(_search|_search/scroll|_find_one)/?(\?|$)')
+"""Matches the URLs of read-only endpoints which take a POST, such as searches."""
+
+
+class RetryPolicy(object):
+    """
+    A RetryPolicy decides if and when a failed request should be retried.  Delays
+    use exponential backoff with decorrelated jitter, a Retry-After header sent with
+    a response takes precedence over the computed delay.  A request is not retried
+    if the server asks the client to wait longer than max_delay.
+
+    Idempotent requests, which are requests with an idempotent method or a POST
+    to a read-only endpoint such as a search, are retried on connection errors,
+    timeouts and any of the retry_statuses.  Non-idempotent requests are only
+    retried when the request was not processed by the server, which is a
+    failure to connect or a 429 or 503 response.
+
+    A RetryPolicy is thread safe and can be shared between clients.
+    """
+
+    def __init__(self, max_attempts=3, base_delay=0.5, max_delay=30.0, deadline=None,
+                 retry_statuses=DEFAULT_RETRY_STATUSES, safe_statuses=SAFE_RETRY_STATUSES,
+                 idempotent_methods=IDEMPOTENT_METHODS, read_only_endpoints=READ_ONLY_ENDPOINTS):
+        """
+        Create a new RetryPolicy.
+
+        Args:
+            max_attempts (int): The maximum number of attempts, 0 for unlimited.
+            base_delay (float): The minimum delay in seconds between attempts.
+            max_delay (float): The maximum delay in seconds between attempts,
+                including any Retry-After sent by the server.
+            deadline (float): The maximum number of seconds to spend on an
+                operation including all retries, None for no deadline.
+            retry_statuses (set): The HTTP status codes that are retryable.
+            safe_statuses (set): The HTTP status codes that are retryable even
+                for non-idempotent requests.
+            idempotent_methods (set): The HTTP methods that are idempotent.
+            read_only_endpoints (Pattern): A regular expression which matches the
+                URLs of endpoints that are idempotent whatever the method.
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.retry_statuses = frozenset(retry_statuses)
+        self.safe_statuses = frozenset(safe_statuses)
+        self.idempotent_methods = frozenset(m.upper() for m in idempotent_methods)
+        self.read_only_endpoints = read_only_endpoints
+
+        self._lock = threading.Lock()
+        self._stats = {}
+        self.reset_stats()
+        forksafe.register(self)
+
+    def begin(self, method, idempotent=None, url=None):
+        """
+        Start a new retryable operation.
+
+        Args:
+            method (str): The HTTP method.
+            idempotent (bool): Override the idempotency of the request.
+            url (str): The request URL, a request to a read-only endpoint is
+                idempotent whatever its method.
+
+        Returns:
+            RetryState: The state for the operation.
+        """
+        if idempotent is None:
+            idempotent = self.is_idempotent(method, url)
+        self._incr('operations')
+        return RetryState(self, idempotent)
+
+    def is_idempotent(self, method, url=None):
+        """
+        Return True if a request is safe to repeat.
+
+        Args:
+            method (str): The HTTP method.
+            url (str): The request URL or path.
+
+        Returns:
+            bool: True if the request is idempotent.
+        """
+        if method.upper() in self.idempotent_methods:
+            return True
+        return bool(url and self.read_only_endpoints and self.read_only_endpoints.search(url))
+
+    def is_retryable_status(self, status, idempotent):
+        """
+        Return True if a response with the given status should be retried.
+
+        Args:
+            status (int): The HTTP status code.
+            idempotent (bool): True if the request is idempotent.
+
+        Returns:
+            bool: True if the status is retryable.
+        """
+        if status not in self.retry_statuses:
+            return False
+        return idempotent or status in self.safe_statuses
+
+    def is_retryable_error(self, error, idempotent):
+        """
+        Return True if the given request exception should be retried.
+
+        Args:
+            error (Exception): The exception raised while making the request.
+            idempotent (bool): True if the request is idempotent.
+
+        Returns:
+            bool: True if the error is retryable.
+        """
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            return True
+        if isinstance(error, requests.exceptions.ConnectionError):
+            # A reset after the request was sent may have been processed.
+            return idempotent or _failed_to_connect(error)
+        if isinstance(error, ConnectionRefusedError):
+            return True
+        if isinstance(error, ConnectionError):
+            return idempotent
+        if isinstance(error, (requests.exceptions.Timeout, asyncio.TimeoutError)):
+            return idempotent
+        # aiohttp is optional, so its exceptions are matched by name.
+        name = type(error).__name__
+        if name == 'ClientConnectorError':
+            return True
+        if name.startswith('Server') or name.startswith('ClientPayload'):
+            return idempotent
+        return False
+
+    def compute_delay(self, previous_delay):
+        """
+        Compute the next delay using decorrelated jitter.
+
+        Args:
+            previous_delay (float): The previous delay, 0 for the first retry.
+
+        Returns:
+            float: The number of seconds to wait.
+        """
+        upper = max(self.base_delay, previous_delay * 3)
+        return min(self.max_delay, random.uniform(self.base_delay, upper))
+
+    def __reduce__(self):
+        return RetryPolicy, (self.max_attempts, self.base_delay, self.max_delay, self.deadline,
+                             self.retry_statuses, self.safe_statuses, self.idempotent_methods,
+                             self.read_only_endpoints)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+
+    def stats(self):
+        """
+        Return a copy of the retry counters.
+
+        Returns:
+            dict: A dictionary of counters.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['reasons'] = dict(self._stats['reasons'])
+            return stats
+
+    def reset_stats(self):
+        """
+        Reset all retry counters to zero.
+        """
+        with self._lock:
+            self._stats = {
+                'operations': 0,
+                'attempts': 0,
+                'retries': 0,
+                'giveups': 0,
+                'reasons': {}
+            }
+
+    def _incr(self, key, reason=None):
+        with self._lock:
+            self._stats[key] += 1
+            if reason is not None:
+                reasons = self._stats['reasons']
+                reasons[reason] = reasons.get(reason, 0) + 1
+
+
+def _failed_to_connect(error):
+    """
+    Return True if a requests ConnectionError was raised because a connection
+    couldn't be made, in which case the server never saw the request.
+    """
+    import urllib3
+    connect_errors = (urllib3.exceptions.NewConnectionError,
+                      urllib3.exceptions.ConnectTimeoutError)
+    # requests wraps a MaxRetryError, whose reason is the underlying error.
+    pending, seen = [error], set()
+    while pending:
+        cause = pending.pop()
+        if id(cause) in seen:
+            continue
+        seen.add(id(cause))
+        if isinstance(cause, connect_errors):
+            return True
+        nested = list(cause.args) + [getattr(cause, 'reason', None), cause.__cause__]
+        pending.extend(e for e in nested if isinstance(e, Exception))
+    return False
+
+
+class RetryState(object):
+    """
+    Tracks the attempts made for a single operation.  Call attempt() before
+    sending each request and retry_delay() after a failure to find out how long
+    to wait before the next attempt.
+    """
+
+    def __init__(self, policy, idempotent):
+        self.policy = policy
+        self.idempotent = idempotent
+        self.attempts = 0
+        self.started = time.monotonic()
+        self._delay = 0
+
+    def attempt(self):
+        """
+        Record that a request is about to be made.
+        """
+        self.attempts += 1
+        self.policy._incr('attempts')
+
+    def elapsed(self):
+        """
+        The number of seconds since the operation started.
+        """
+        return time.monotonic() - self.started
+
+    def retry_delay(self, status=None, error=None, headers=None):
+        """
+        Determine if the last attempt should be retried.
+
+        Args:
+            status (int): The HTTP status of the response, if there was one.
+            error (Exception): The exception raised making the request, if any.
+            headers (dict): The response headers, used to find Retry-After.
+
+        Returns:
+            float: The number of seconds to wait before retrying, or None if the
+                request should not be retried.
+        """
+        policy = self.policy
+        if error is not None:
+            retryable = policy.is_retryable_error(error, self.idempotent)
+            reason = type(error).__name__
+        else:
+            retryable = policy.is_retryable_status(status, self.idempotent)
+            reason = str(status)
+
+        if not retryable:
+            return None
+
+        if 0 < policy.max_attempts <= self.attempts:
+            policy._incr('giveups', reason)
+            return None
+
+        delay = policy.compute_delay(self._delay)
+        retry_after = parse_retry_after(headers)
+        if retry_after is not None:
+            if retry_after > policy.max_delay:
+                # Retrying early would only be refused again.
+                policy._incr('giveups', reason)
+                return None
+            delay = retry_after
+
+        if policy.deadline is not None and self.elapsed() + delay > policy.deadline:
+            policy._incr('giveups', reason)
+            return None
+
+        self._delay = delay
+        policy._incr('retries', reason)
+        return delay
+
+
+def parse_retry_after(headers):
+    """
+    Parse a Retry-After header value, which can be a number of seconds
+    or an HTTP date.
+
+    Args:
+        headers (dict): The response headers.
+
+    Returns:
+        float: The number of seconds to wait or None if there is no valid header.
+    """
+    if not headers:
+        return None
+    value = headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    import email.utils  # Rarely needed, and slow to import.
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date is None:
+        return None
+    return max(0.0, date.timestamp() - time.time())
@@ -1,11 +1,17 @@
+import contextlib
 import copy
 
 from .entity import Asset, ZmlpException
+from .lanes import BULK, resolve_lane
+from .timeouts import Deadline, cleanup_deadline
+from .tracing import operation_span, traced_generator, traced_async_generator
 from .util import as_collection
 
 __all__ = [
     'AssetSearchScroller',
     'AssetSearchResult',
+    'AsyncAssetSearchScroller',
+    'AsyncAssetSearchResult',
     'LabelConfidenceQuery',
     'SimilarityQuery'
 ]
@@ -21,7 +27,8 @@ class AssetSearchScroller(object):
     is not enough time, consider increasing the timeout or lowering your page size.
 
     """
-    def __init__(self, app, search, timeout="1m", raw_response=False):
+    def __init__(self, app, search, timeout="1m", raw_response=False, stream=False, lane=None,
+                 deadline=None):
         """
         Create a new AssetSearchScroller instance.
 
@@ -32,13 +39,28 @@ class AssetSearchScroller(object):
                 refreshed.
             raw_response (bool): Yield the raw ES response rather than assets. The raw
                 response will contain the entire page, not individual assets.
+            stream (bool): Decode each page incrementally, yielding assets as they are
+                received rather than once the whole page has been parsed.  The 'result'
+                property holds the response of the last page, minus the hits, once
+                the page is finished.
+            lane (str): The client lane to send the scroll requests through,
+                defaults to 'bulk'.
+            deadline (float): The number of seconds the whole scroll may take,
+                which is shared by each of its requests.  The time spent handling
+                assets between pages counts towards the deadline.
         """
+        if raw_response and stream:
+            raise ValueError("The raw_response and stream options cannot be combined")
         self.app = app
         if search and getattr(search, "to_dict", None):
             search = search.to_dict()
         self.search = copy.deepcopy(search or {})
         self.timeout = timeout
         self.raw_response = raw_response
+        self.stream = stream
+        self.lane = lane
+        self.deadline = deadline
+        self.result = None
 
     def batches_of(self, batch_size=50):
         """
@@ -74,8 +96,30 @@ class AssetSearchScroller(object):
         Yields:
             Asset: Assets that matched the search
         """
-        result = self.app.client.post(
-            "api/v3/assets/_search?scroll={}".format(self.timeout), self.search)
+        deadline = Deadline(self.deadline) if self.deadline is not None else None
+        gen = self._scroll_streaming(deadline) if self.stream else self._scroll(deadline)
+        return traced_generator(self._span(), gen)
+
+    def _span(self):
+        return operation_span(self.app.client, type(self).__name__ + '.scroll',
+                              **{'zmlp.scroll_timeout': self.timeout})
+
+    @contextlib.contextmanager
+    def _scope(self, deadline, cleanup=False):
+        # The lane and deadline are applied around each request rather than the
+        # whole scroll, a context manager can't be held open across a yield.
+        # Clearing the scroll gets its own deadline, so the server side scroll
+        # context is released even when the scroll's deadline has passed.
+        client = self.app.client
+        with client.lane(resolve_lane(self.lane, BULK)), \
+                (cleanup_deadline() if cleanup else client.deadline(deadline)):
+            yield
+
+    def _scroll(self, deadline):
+        with self._scope(deadline):
+            result = self.app.client.post(
+                "api/v3/assets/_search?scroll={}".format(self.timeout), self.search)
+        self.result = result
         scroll_id = result.get("_scroll_id")
         if not scroll_id:
             raise ZmlpException("No scroll ID returned with scroll search, has it timed out?")
@@ -96,18 +140,142 @@ class AssetSearchScroller(object):
                 if not scroll_id:
                     raise ZmlpException(
                         "No scroll ID returned with scroll search, has it timed out?")
-                result = self.app.client.post("api/v3/assets/_search/scroll", {
-                    "scroll": self.timeout,
+                with self._scope(deadline):
+                    result = self.app.client.post("api/v3/assets/_search/scroll", {
+                        "scroll": self.timeout,
+                        "scroll_id": scroll_id
+                    })
+                self.result = result
+                if not result["hits"]["hits"]:
+                    return
+        finally:
+            with self._scope(deadline, cleanup=True):
+                self.app.client.delete("api/v3/assets/_search/scroll", {
                     "scroll_id": scroll_id
                 })
+
+    def _scroll_streaming(self, deadline):
+        with self._scope(deadline):
+            rsp = self.app.client.post_streaming(
+                "api/v3/assets/_search?scroll={}".format(self.timeout), self.search)
+        scroll_id = None
+        try:
+            while True:
+                for hit in rsp.hits():
+                    yield Asset({'id': hit['_id'],
+                                 'document': hit['_source'],
+                                 'score': hit['_score']})
+
+                self.result = rsp.result
+                scroll_id = self.result.get("_scroll_id")
+                if not scroll_id:
+                    raise ZmlpException(
+                        "No scroll ID returned with scroll search, has it timed out?")
+                if not rsp.hit_count:
+                    return
+                with self._scope(deadline):
+                    rsp = self.app.client.post_streaming("api/v3/assets/_search/scroll", {
+                        "scroll": self.timeout,
+                        "scroll_id": scroll_id
+                    })
+        finally:
+            # ES sends the scroll id before the hits, so it's known even if
+            # the scroll is abandoned part way through a page.
+            scroll_id = rsp.scroll_id or scroll_id
+            if scroll_id:
+                with self._scope(deadline, cleanup=True):
+                    self.app.client.delete("api/v3/assets/_search/scroll", {
+                        "scroll_id": scroll_id
+                    })
+
+    def __iter__(self):
+        return self.scroll()
+
+
+class AsyncAssetSearchScroller(AssetSearchScroller):
+    """
+    An AssetSearchScroller for use with an AsyncZmlpApp.  Iterate the
+    scroller with 'async for'.
+
+    Examples:
+        async for asset in app.assets.scroll_search(search):
+            do_something(asset)
+
+    """
+    async def batches_of(self, batch_size=50):
+        """
+        An async generator function capable of efficiently scrolling through
+        large numbers of assets, returning them in batches of
+        the given batch size.
+
+        Args:
+            batch_size (int): The size of the batch.
+
+        Returns:
+            AsyncGenerator: An async generator that yields batches of Assets.
+
+        """
+        batch = []
+        async for asset in self.scroll():
+            batch.append(asset)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def scroll(self):
+        """
+        An async generator function capable of efficiently scrolling through large
+        results.
+
+        Yields:
+            Asset: Assets that matched the search
+        """
+        deadline = Deadline(self.deadline) if self.deadline is not None else None
+        return traced_async_generator(self._span(), self._scroll(deadline))
+
+    async def _scroll(self, deadline):
+        with self._scope(deadline):
+            result = await self.app.client.post(
+                "api/v3/assets/_search?scroll={}".format(self.timeout), self.search)
+        scroll_id = result.get("_scroll_id")
+        if not scroll_id:
+            raise ZmlpException("No scroll ID returned with scroll search, has it timed out?")
+        try:
+            while True:
+                hits = result.get("hits")
+                if not hits:
+                    return
+                if self.raw_response:
+                    yield result
+                else:
+                    for hit in hits['hits']:
+                        yield Asset({'id': hit['_id'],
+                                     'document': hit['_source'],
+                                     'score': hit['_score']})
+
+                scroll_id = result.get("_scroll_id")
+                if not scroll_id:
+                    raise ZmlpException(
+                        "No scroll ID returned with scroll search, has it timed out?")
+                with self._scope(deadline):
+                    result = await self.app.client.post("api/v3/assets/_search/scroll", {
+                        "scroll": self.timeout,
+                        "scroll_id": scroll_id
+                    })
                 if not result["hits"]["hits"]:
                     return
         finally:
-            self.app.client.delete("api/v3/assets/_search/scroll", {
-                "scroll_id": scroll_id
-            })
+            with self._scope(deadline, cleanup=True):
+                await self.app.client.delete("api/v3/assets/_search/scroll", {
+                    "scroll_id": scroll_id
+                })
 
     def __iter__(self):
+        raise TypeError("AsyncAssetSearchScroller must be iterated with 'async for'")
+
+    def __aiter__(self):
         return self.scroll()
 
 
@@ -117,21 +285,48 @@ class AssetSearchResult(object):
     for accessing the data.
 
     """
-    def __init__(self, app, search):
+    def __init__(self, app, search, result=None, stream=False):
         """
         Create a new AssetSearchResult.
 
         Args:
             app (ZmlpApp): A ZmlpApp instance.
             search (dict): An ElasticSearch query.
+            result (dict): An optional ES response for the search, if not provided
+                the search is executed.
+            stream (bool): Decode the response incrementally, iterating the
+                AssetSearchResult yields assets as they are received.  Any other
+                access to the result waits for the whole page.
         """
         self.app = app
         if search and getattr(search, "to_dict", None):
             search = search.to_dict()
         self.search = search
-        self.result = None
+        self.stream = stream
+        self._result = result
+        self._pending = None
+        self._hits = None
+
+        if result is None:
+            self._execute_search()
+
+    @property
+    def result(self):
+        """
+        The ES response for the current page.
+
+        Returns:
+            dict: The ES response.
+        """
+        if self._pending is not None:
+            for hit in self._pending:
+                self._hits.append(hit)
+            self._finish_stream()
+        return self._result
 
-        self._execute_search()
+    @result.setter
+    def result(self, value):
+        self._result = value
 
     @property
     def assets(self):
@@ -273,18 +468,127 @@ class AssetSearchResult(object):
         """
         search = copy.deepcopy(self.search or {})
         search['from'] = search.get('from', 0) + len(self.result.get("hits"))
-        return AssetSearchResult(self.app, search)
+        return AssetSearchResult(self.app, search, stream=self.stream)
 
     def _execute_search(self):
-        self.result = self.app.client.post("api/v3/assets/_search", self.search)
+        if self.stream:
+            self._response = self.app.client.post_streaming("api/v3/assets/_search", self.search)
+            self._pending = self._response.hits()
+            self._hits = []
+            self._result = None
+        else:
+            self.result = self.app.client.post("api/v3/assets/_search", self.search)
+
+    def _finish_stream(self):
+        result = self._response.result
+        if 'hits' in result:
+            result['hits']['hits'] = self._hits
+        self._result = result
+        self._pending = None
+
+    def _iter_stream(self):
+        hits = self._hits
+        idx = 0
+        while True:
+            if idx < len(hits):
+                yield Asset.from_hit(hits[idx])
+                idx += 1
+            elif self._pending is None or hits is not self._hits:
+                return
+            else:
+                try:
+                    hits.append(next(self._pending))
+                except StopIteration:
+                    self._finish_stream()
 
     def __iter__(self):
+        if self._pending is not None:
+            return self._iter_stream()
         return iter(self.assets)
 
     def __getitem__(self, item):
         return self.assets[item]
 
 
+class AsyncAssetSearchResult(AssetSearchResult):
+    """
+    An AssetSearchResult for use with an AsyncZmlpApp.  Use the execute()
+    coroutine to run a search.
+    """
+
+    @classmethod
+    async def execute(cls, app, search):
+        """
+        Execute the given search and return an AsyncAssetSearchResult.
+
+        Args:
+            app (AsyncZmlpApp): An AsyncZmlpApp instance.
+            search (dict): An ElasticSearch query.
+
+        Returns:
+            AsyncAssetSearchResult: The search result.
+        """
+        if search and getattr(search, "to_dict", None):
+            search = search.to_dict()
+        result = await app.client.post("api/v3/assets/_search", search)
+        return cls(app, search, result)
+
+    async def batches_of(self, batch_size, max_assets=None):
+        """
+        An async generator function which returns batches of assets in the
+        given batch size.  This method will optionally page through
+        N pages, yielding arrays of assets as it goes.
+
+        Args:
+            batch_size (int): The size of the batch.
+            max_assets (int): The max number of assets to return, max is 10k
+
+        Returns:
+            AsyncGenerator: An async generator that yields batches of Assets.
+
+        """
+        asset_countdown = max_assets or 10000
+
+        batch = []
+        while True:
+            assets = self.assets
+            if not assets:
+                break
+
+            for asset in assets:
+                batch.append(asset)
+                asset_countdown -= 1
+                if asset_countdown <= 0:
+                    break
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+
+            if asset_countdown <= 0:
+                break
+
+            self.search['from'] = self.search.get('from', 0) + len(assets)
+            await self._execute_search()
+
+        if batch:
+            yield batch
+
+    async def next_page(self):
+        """
+        Return an AsyncAssetSearchResult containing the next page.
+
+        Returns:
+            AsyncAssetSearchResult: The next page
+
+        """
+        search = copy.deepcopy(self.search or {})
+        search['from'] = search.get('from', 0) + len(self.result.get("hits"))
+        return await AsyncAssetSearchResult.execute(self.app, search)
+
+    async def _execute_search(self):
+        self.result = await self.app.client.post("api/v3/assets/_search", self.search)
+
+
 class LabelConfidenceQuery(object):
     """
     A helper class for building a label confidence score query.  This query must point
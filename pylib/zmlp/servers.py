@@ -0,0 +1,252 @@
+"""Latency aware selection of and failover between equivalent API servers."""
+import threading
+import time
+
+from . import forksafe
+
+__all__ = [
+    'ServerPool'
+]
+
+CLOSED = 'closed'
+"""The circuit breaker state of a healthy server."""
+
+OPEN = 'open'
+"""The circuit breaker state of a server which is not sent requests."""
+
+HALF_OPEN = 'half_open'
+"""The circuit breaker state of a server which is being probed."""
+
+FAILURE_STATUSES = frozenset([502, 503, 504])
+"""Response statuses which count as a failure of the server."""
+
+
+class ServerState(object):
+    """
+    The health of a single server: an EWMA of its latency and error rate,
+    and its circuit breaker state.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.latency = None
+        self.error_rate = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.state = CLOSED
+        self.cooldown = 0.0
+        self.retry_at = 0.0
+        self.probing = False
+
+    def score(self):
+        """
+        The expected cost of sending a request to the server, lower is better.
+        Servers which haven't been used yet score 0 so they are tried.
+        """
+        if self.latency is None:
+            return 0.0
+        return self.latency / max(0.05, 1.0 - self.error_rate)
+
+    def to_dict(self):
+        return {
+            'server': self.url,
+            'state': self.state,
+            'latency': self.latency,
+            'error_rate': self.error_rate,
+            'requests': self.requests,
+            'failures': self.failures
+        }
+
+
+class ServerPool(object):
+    """
+    A ServerPool routes each request to the best healthy server from a list of
+    equivalent ZMLP API servers, for example the regional endpoints of a
+    deployment.  The pool tracks an EWMA of the latency and error rate of each
+    server and sends requests to the server with the lowest latency, weighted
+    by its error rate.
+
+    A server which fails failure_threshold requests in a row, or whose error
+    rate passes error_threshold, is ejected by opening its circuit breaker.
+    Once its cooldown has passed the next request is sent to it as a probe.
+    If the probe succeeds the server is used again, otherwise it's ejected
+    for twice as long, up to max_cooldown.  A failure is a connection error,
+    a timeout or a 502, 503 or 504 response.
+
+    A ServerPool is thread safe and can be shared between clients.
+
+    Examples:
+        app = ZmlpApp(apikey, ['https://us.api.zvi.zorroa.com',
+                               'https://eu.api.zvi.zorroa.com'])
+        ...
+        print(app.client.server_pool.stats())
+    """
+
+    def __init__(self, servers, failure_threshold=3, error_threshold=0.5, min_requests=10,
+                 cooldown=5.0, max_cooldown=300.0, decay=0.2):
+        """
+        Create a new ServerPool.
+
+        Args:
+            servers (list): The URLs of the servers, in order of preference.
+            failure_threshold (int): The number of failures in a row which eject a server.
+            error_threshold (float): The error rate, 0 to 1, which ejects a server.
+            min_requests (int): The number of requests a server must have handled
+                before it can be ejected by its error rate.
+            cooldown (float): The seconds an ejected server waits before it's probed.
+            max_cooldown (float): The longest a server can be ejected for.
+            decay (float): The weight, 0 to 1, of the latest request in the
+                latency and error rate averages.
+        """
+        if not servers:
+            raise ValueError("A ServerPool requires at least one server")
+        self.servers = [ServerState(url) for url in servers]
+        self.failure_threshold = failure_threshold
+        self.error_threshold = error_threshold
+        self.min_requests = min_requests
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.decay = decay
+        self._by_url = {server.url: server for server in self.servers}
+        self._lock = threading.Lock()
+        forksafe.register(self)
+
+    def __reduce__(self):
+        # Only the configuration, a new process measures the servers itself.
+        return ServerPool, ([server.url for server in self.servers], self.failure_threshold,
+                            self.error_threshold, self.min_requests, self.base_cooldown,
+                            self.max_cooldown, self.decay)
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        # A probe in flight in the parent never finishes in the child.
+        for server in self.servers:
+            server.probing = False
+
+    @property
+    def primary(self):
+        """The URL of the first server."""
+        return self.servers[0].url
+
+    def select(self):
+        """
+        Choose the server to send a request to.  An ejected server whose
+        cooldown has passed is chosen to probe it, otherwise the healthy server
+        with the lowest score.  If every server is ejected, the one due to be
+        probed soonest is chosen.
+
+        Returns:
+            str: The server URL.
+        """
+        now = time.monotonic()
+        with self._lock:
+            for server in self.servers:
+                if server.state == OPEN and now >= server.retry_at:
+                    server.state = HALF_OPEN
+                if server.state == HALF_OPEN and not server.probing:
+                    server.probing = True
+                    return server.url
+            healthy = [server for server in self.servers if server.state == CLOSED]
+            if healthy:
+                # Avoid a server which just failed while there is another.
+                return min(healthy, key=lambda server: (
+                    server.consecutive_failures > 0, server.score())).url
+            return min(self.servers, key=lambda server: server.retry_at).url
+
+    def route(self, url, base):
+        """
+        Choose the server for a request and rewrite its URL to point at it.
+
+        Args:
+            url (str): The request URL, built with the base server.
+            base (str): The server the URL was built with.
+
+        Returns:
+            tuple: The chosen server URL and the rewritten request URL.
+        """
+        server = self.select()
+        if server != base and url.startswith(base):
+            url = server.rstrip('/') + '/' + url[len(base):].lstrip('/')
+        return server, url
+
+    def has_alternative(self, url):
+        """
+        Return True if a healthy server other than the given one is available.
+
+        Args:
+            url (str): The server URL.
+
+        Returns:
+            bool: True if there is another healthy server.
+        """
+        with self._lock:
+            return any(server.url != url and server.state == CLOSED for server in self.servers)
+
+    def record(self, url, latency=None, failed=False):
+        """
+        Record the outcome of a request.
+
+        Args:
+            url (str): The server URL.
+            latency (float): The seconds the request took, if it succeeded.
+            failed (bool): True if the request failed.
+        """
+        server = self._by_url.get(url)
+        if server is None:
+            return
+        with self._lock:
+            server.requests += 1
+            server.error_rate += self.decay * ((1.0 if failed else 0.0) - server.error_rate)
+            if server.state == HALF_OPEN:
+                server.probing = False
+            if failed:
+                server.failures += 1
+                server.consecutive_failures += 1
+                if server.state == HALF_OPEN:
+                    self._eject(server, server.cooldown * 2)
+                elif server.state == CLOSED and (
+                        server.consecutive_failures >= self.failure_threshold or
+                        (server.requests >= self.min_requests and
+                         server.error_rate >= self.error_threshold)):
+                    self._eject(server, self.base_cooldown)
+                return
+
+            server.consecutive_failures = 0
+            if latency is not None:
+                if server.latency is None:
+                    server.latency = latency
+                else:
+                    server.latency += self.decay * (latency - server.latency)
+            if server.state == HALF_OPEN:
+                server.state = CLOSED
+                server.error_rate = 0.0
+
+    def abandon(self, url):
+        """
+        Record that a request was abandoned before its outcome was known, for
+        example because the thread was interrupted, so a probe can be retried.
+
+        Args:
+            url (str): The server URL.
+        """
+        server = self._by_url.get(url)
+        if server is not None:
+            with self._lock:
+                server.probing = False
+
+    def stats(self):
+        """
+        Return the health of each server.
+
+        Returns:
+            list: A dictionary for each server, with its state, the average
+                latency and error rate, and the number of requests and failures.
+        """
+        with self._lock:
+            return [server.to_dict() for server in self.servers]
+
+    def _eject(self, server, cooldown):
+        server.state = OPEN
+        server.cooldown = min(self.max_cooldown, max(cooldown, self.base_cooldown))
+        server.retry_at = time.monotonic() + server.cooldown
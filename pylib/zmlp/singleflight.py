@@ -0,0 +1,89 @@
+"""Collapse concurrent identical calls into a single call."""
+import threading
+from concurrent.futures import Future
+
+from . import forksafe
+
+__all__ = [
+    'SingleFlight'
+]
+
+
+class SingleFlight(object):
+    """
+    Collapses concurrent calls with the same key into one call.  The first
+    caller for a key makes the call, callers which arrive while it's in flight
+    wait for it and share its result or exception.  Once the call is done the
+    key is forgotten, so results are never cached.  A caller can give up
+    waiting after a timeout, the call carries on for the others.
+
+    SingleFlight is thread safe.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        """The number of calls made."""
+        self.shared = 0
+        """The number of callers which shared the result of another caller's call."""
+        forksafe.register(self)
+
+    def __reduce__(self):
+        return SingleFlight, ()
+
+    def _after_fork(self):
+        # Calls in flight in the parent never finish in the child.
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args, timeout=None, **kwargs):
+        """
+        Call func(*args, **kwargs) unless a call with the same key is already
+        in flight, in which case wait for that call instead.
+
+        Args:
+            key (hashable): The key which identifies identical calls.
+            func (func): The function to call.
+            *args: The function arguments.
+            timeout (float): The maximum number of seconds to wait for a call
+                made by another caller, None to wait for as long as it takes.
+            **kwargs: The function keyword arguments.
+
+        Returns:
+            tuple: The result of the call and True if it was shared with
+                another caller, False if this caller made the call.
+
+        Raises:
+            concurrent.futures.TimeoutError: If the timeout expired waiting for
+                another caller's call.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            if future is None:
+                future = self._calls[key] = Future()
+                self.calls += 1
+                leader = True
+            else:
+                self.shared += 1
+                leader = False
+
+        if not leader:
+            return future.result(timeout=timeout), True
+
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    @property
+    def in_flight(self):
+        """The number of calls in flight."""
+        return len(self._calls)
@@ -0,0 +1,252 @@
+"""Incremental parsing of large ElasticSearch search responses."""
+import re
+
+from .codec import get_json_codec
+
+__all__ = [
+    'StreamingSearchResponse'
+]
+
+_WHITESPACE = b' \t\r\n'
+_STRUCT_RE = re.compile(rb'["{}\[\]]')
+_STRING_RE = re.compile(rb'["\\]')
+_PRIMITIVE_END_RE = re.compile(rb'[,}\]\s]')
+
+_COMPACT_SIZE = 64 * 1024
+
+
+class StreamingSearchResponse(object):
+    """
+    Parses an ElasticSearch search response incrementally from a stream
+    of bytes.  Each hit in 'hits.hits' is decoded and yielded as soon as it has
+    been received, without waiting for, or holding, the entire response.
+
+    Everything else in the response, for example the scroll id, totals and
+    aggregations, is available from the 'result' property once all the hits
+    have been consumed.  The 'hits.hits' list in the result is always empty.
+
+    Examples:
+        rsp = StreamingSearchResponse(response.iter_content(65536))
+        for hit in rsp.hits():
+            do_something(hit)
+        scroll_id = rsp.result['_scroll_id']
+
+    """
+
+    def __init__(self, chunks):
+        """
+        Create a new StreamingSearchResponse.
+
+        Args:
+            chunks (iterable): An iterable of bytes making up the response body.
+        """
+        self.chunks = iter(chunks)
+        self.codec = get_json_codec()
+        self.finished = False
+        self.hit_count = 0
+        self._result = {}
+        self._buf = bytearray()
+        self._pos = 0
+        self._eof = False
+        self._parser = None
+
+    @property
+    def scroll_id(self):
+        """
+        The scroll id of the response, which is available as soon as it has been
+        received rather than when the response is finished.
+
+        Returns:
+            str: The scroll id or None.
+        """
+        return self._result.get('_scroll_id')
+
+    @property
+    def result(self):
+        """
+        The search response without the hits.  Any hits that have not been
+        consumed are read and discarded.
+
+        Returns:
+            dict: The search response.
+        """
+        if not self.finished:
+            for _ in self.hits():
+                pass
+        return self._result
+
+    def hits(self):
+        """
+        Return an iterator which yields each search hit as it's decoded.  Hits
+        can only be consumed once, calling hits() again continues where the
+        previous iterator left off.
+
+        Returns:
+            iterator: An iterator of ElasticSearch hit dicts.
+        """
+        if self._parser is None:
+            self._parser = self._parse()
+        return self._parser
+
+    def _parse(self):
+        self._expect(b'{')
+        for key in self._iter_keys():
+            if key == 'hits' and self._peek() == b'{'[0]:
+                hits = self._result['hits'] = {}
+                self._expect(b'{')
+                for hits_key in self._iter_keys():
+                    if hits_key == 'hits' and self._peek() == b'['[0]:
+                        hits['hits'] = []
+                        for hit in self._iter_array():
+                            self.hit_count += 1
+                            yield hit
+                    else:
+                        hits[hits_key] = self._read_value()
+            else:
+                self._result[key] = self._read_value()
+        self.finished = True
+        # Release the underlying response.
+        close = getattr(self.chunks, 'close', None)
+        if close:
+            close()
+
+    def _iter_keys(self):
+        """
+        Iterate the keys of the object being parsed, the caller must consume
+        the value of each key.
+        """
+        first = True
+        while True:
+            char = self._peek()
+            if char == b'}'[0]:
+                self._pos += 1
+                return
+            if not first:
+                self._expect(b',')
+            first = False
+            key = self._read_value()
+            self._expect(b':')
+            yield key
+
+    def _iter_array(self):
+        """
+        Iterate the decoded elements of the array being parsed.
+        """
+        self._expect(b'[')
+        first = True
+        while True:
+            char = self._peek()
+            if char == b']'[0]:
+                self._pos += 1
+                return
+            if not first:
+                self._expect(b',')
+            first = False
+            yield self._read_value()
+
+    def _read_value(self):
+        """
+        Read and decode the next complete JSON value.
+        """
+        self._peek()
+        start = self._pos
+        end = self._scan_value(start)
+        value = self.codec.loads(bytes(self._buf[start:end]))
+        self._pos = end
+        self._compact()
+        return value
+
+    def _scan_value(self, start):
+        """
+        Find the end of the JSON value starting at the given position, reading
+        more data as required.  The scan is resumed where it left off when more
+        data arrives so each byte is only examined once.
+        """
+        buf = self._buf
+        first = buf[start]
+        if first not in b'{["':
+            while True:
+                match = _PRIMITIVE_END_RE.search(buf, start)
+                if match:
+                    return match.start()
+                if not self._fill():
+                    return len(buf)
+
+        depth = 0
+        in_string = False
+        pos = start
+        while True:
+            if in_string:
+                match = _STRING_RE.search(buf, pos)
+                if match and match.group() == b'\\':
+                    if match.end() < len(buf):
+                        pos = match.end() + 1
+                        continue
+                    match = None
+                if match is None:
+                    if not self._fill():
+                        raise ValueError("Unexpected end of JSON response")
+                    continue
+                in_string = False
+                pos = match.end()
+                if depth == 0:
+                    return pos
+            else:
+                match = _STRUCT_RE.search(buf, pos)
+                if match is None:
+                    if not self._fill():
+                        raise ValueError("Unexpected end of JSON response")
+                    continue
+                char = match.group()
+                pos = match.end()
+                if char == b'"':
+                    in_string = True
+                elif char in (b'{', b'['):
+                    depth += 1
+                else:
+                    depth -= 1
+                    if depth == 0:
+                        return pos
+
+    def _peek(self):
+        """
+        Skip whitespace and return the next byte without consuming it.
+        """
+        while True:
+            buf = self._buf
+            while self._pos < len(buf) and buf[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(buf):
+                return buf[self._pos]
+            if not self._fill():
+                raise ValueError("Unexpected end of JSON response")
+
+    def _expect(self, char):
+        if self._peek() != char[0]:
+            raise ValueError("Invalid JSON response, expected '{}' at '{}'".format(
+                char.decode(), bytes(self._buf[self._pos:self._pos + 32])))
+        self._pos += 1
+
+    def _fill(self):
+        """
+        Append the next chunk of data to the buffer.
+
+        Returns:
+            bool: False if there is no more data.
+        """
+        if self._eof:
+            return False
+        for chunk in self.chunks:
+            if chunk:
+                self._buf.extend(chunk)
+                return True
+        self._eof = True
+        return False
+
+    def _compact(self):
+        """
+        Discard consumed data from the buffer.
+        """
+        if self._pos >= _COMPACT_SIZE:
+            del self._buf[:self._pos]
+            self._pos = 0
@@ -0,0 +1,237 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+from http.server import BaseHTTPRequestHandler
+
+from zmlp import AsyncZmlpClient
+from zmlp.client import ZmlpConnectionException, ZmlpNotFoundException
+from zmlp.aio import aiohttp
+from zmlp.emulator import Corpus, Emulator
+from zmlp.limiter import AdaptiveLimiter, ConcurrencyWindow
+from zmlp.retry import RetryPolicy
+from .util import LocalServer
+
+key_dict = {
+    'accessKey': 'A5BAFAAA-42FD-45BE-9FA2-92670AB4DA80',
+    'secretKey': 'test123test135'
+}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Echos requests back as JSON."""
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, body, content_type='application/json'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self):
+        size = int(self.headers.get('Content-Length') or 0)
+        data = self.rfile.read(size) if size else b''
+        if self.path.startswith('/missing'):
+            self._reply(404, json.dumps({'message': 'not found', 'status': 404}).encode())
+        elif self.path.startswith('/jobs/_search'):
+            req = json.loads(data)
+            start = req['page']['from']
+            items = [{'id': str(i)} for i in range(start, min(start + req['page']['size'], 250))]
+            self._reply(200, json.dumps({'list': items}).encode())
+        elif self.path.startswith('/text'):
+            self._reply(200, b'line1\nline2\n', 'text/plain')
+        elif self.path.startswith('/upload'):
+            self._reply(200, json.dumps({'size': len(data),
+                                         'type': self.headers['Content-Type']}).encode())
+        else:
+            self._reply(200, json.dumps({
+                'method': self.command,
+                'path': self.path,
+                'auth': self.headers.get('Authorization'),
+                'body': json.loads(data) if data else None}).encode())
+
+    do_GET = do_POST = do_PUT = do_DELETE = _handle
+
+
+class Item:
+    def __init__(self, data):
+        self.id = data['id']
+
+
+@unittest.skipIf(aiohttp is None, 'aiohttp is not installed')
+class AsyncZmlpClientTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = LocalServer(StubHandler).start()
+        cls.url = cls.server.url
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def run_async(self, func):
+        async def wrapper():
+            async with AsyncZmlpClient(key_dict, self.url) as client:
+                return await func(client)
+        return asyncio.run(wrapper())
+
+    def test_verbs(self):
+        async def test(client):
+            return [await getattr(client, verb)('/api/v1/foo', {'a': 1})
+                    for verb in ('get', 'post', 'put', 'delete')]
+
+        for verb, rsp in zip(('GET', 'POST', 'PUT', 'DELETE'), self.run_async(test)):
+            assert verb == rsp['method']
+            assert {'a': 1} == rsp['body']
+            assert rsp['auth'].startswith('Bearer ')
+
+    def test_concurrent_requests(self):
+        async def test(client):
+            return await asyncio.gather(
+                *[client.get('/api/v1/foo/{}'.format(i)) for i in range(50)])
+
+        rsps = self.run_async(test)
+        assert 50 == len(rsps)
+        assert '/api/v1/foo/49' == rsps[49]['path']
+
+    def test_concurrent_requests_limited(self):
+        limiter = AdaptiveLimiter(window=ConcurrencyWindow(initial=3, max_limit=3))
+
+        async def test():
+            async with AsyncZmlpClient(key_dict, self.url, limiter=limiter) as client:
+                return await asyncio.gather(
+                    *[client.get('/api/v1/foo/{}'.format(i)) for i in range(20)])
+
+        assert 20 == len(asyncio.run(test()))
+        stats = limiter.stats()
+        assert 0 == stats['in_flight']
+        assert 0 == stats['queued']
+        assert 3 == stats['window']
+
+    def test_default_window_sized_from_pool(self):
+        async def test(client, lane):
+            return await asyncio.gather(
+                *[client.post('/api/v1/jobs/_search', {}, lane=lane) for _ in range(40)])
+
+        with Emulator(Corpus(size=0, jobs=1, tasks_per_job=0), latency=0.2) as emulator:
+            # More than the synchronous defaults of 16 and 8 in flight at once.
+            for lane, low, high in ((None, 16, 40), ('bulk', 8, 20)):
+                emulator.stats.reset()
+
+                async def wrapper():
+                    async with AsyncZmlpClient(key_dict, emulator.url, pool_maxsize=40) as client:
+                        assert 40 == client.client.limiter.window.limit
+                        return await test(client, lane)
+
+                assert 40 == len(asyncio.run(wrapper()))
+                assert low < emulator.stats.max_in_flight <= high
+
+    def test_exception_translation(self):
+        async def test(client):
+            await client.get('/missing')
+
+        with self.assertRaises(ZmlpNotFoundException):
+            self.run_async(test)
+
+    def test_stream_exception_translation(self):
+        async def test(client):
+            with tempfile.TemporaryDirectory() as tmp:
+                await client.stream('/missing', os.path.join(tmp, 'missing.bin'))
+
+        with self.assertRaises(ZmlpNotFoundException):
+            self.run_async(test)
+
+    def test_stream_text_exception_translation(self):
+        async def test(client):
+            return [line async for line in client.stream_text('/missing')]
+
+        with self.assertRaises(ZmlpNotFoundException):
+            self.run_async(test)
+
+    def test_iter_paged_results(self):
+        async def test(client):
+            return [item async for item in
+                    client.iter_paged_results('/jobs/_search', {}, None, Item)]
+
+        items = self.run_async(test)
+        assert 250 == len(items)
+        assert '249' == items[-1].id
+
+    def test_stream_text(self):
+        async def test(client):
+            return [line async for line in client.stream_text('/text')]
+
+        assert [b'line1', b'line2'] == self.run_async(test)
+
+    def test_request_while_streaming(self):
+        limiter = AdaptiveLimiter(window=ConcurrencyWindow(initial=1, max_limit=1))
+
+        async def test():
+            async with AsyncZmlpClient(key_dict, self.url, limiter=limiter) as client:
+                with client.deadline(1):
+                    return [(await client.get('/api/v1/foo'))['method']
+                            async for _ in client.stream_text('/text')]
+
+        assert ['GET', 'GET'] == asyncio.run(test())
+        assert 0 == limiter.stats()['in_flight']
+
+    def test_stream(self):
+        dst = os.path.join(tempfile.mkdtemp(), 'out.txt')
+
+        async def test(client):
+            return await client.stream('/text', dst)
+
+        assert dst == self.run_async(test)
+        with open(dst, 'rb') as fp:
+            assert b'line1\nline2\n' == fp.read()
+
+    def test_upload_files(self):
+        with tempfile.NamedTemporaryFile(suffix='.txt') as fp:
+            fp.write(b'x' * 1000)
+            fp.flush()
+
+            async def test(client):
+                return await client.upload_files('/upload', [fp.name], {'foo': 'bar'})
+
+            rsp = self.run_async(test)
+        assert rsp['size'] > 1000
+        assert rsp['type'].startswith('multipart/form-data')
+
+    def test_upload_files_closes_files(self):
+        opened = []
+
+        def tracking_open(*args, **kwargs):
+            fp = open(*args, **kwargs)
+            opened.append(fp)
+            return fp
+
+        async def upload(url, files=None):
+            policy = RetryPolicy(max_attempts=3, base_delay=0, max_delay=0)
+            async with AsyncZmlpClient(key_dict, url, retry_policy=policy) as client:
+                return await client.upload_files('/upload', files or [fp.name], {'foo': 'bar'})
+
+        with tempfile.NamedTemporaryFile(suffix='.txt') as fp:
+            fp.write(b'x' * 1000)
+            fp.flush()
+            with mock.patch('zmlp.aio.open', tracking_open, create=True):
+                with self.assertRaises(ZmlpConnectionException):
+                    asyncio.run(upload('http://127.0.0.1:1'))
+                assert 3 == len(opened)
+                assert all(f.closed for f in opened)
+
+                del opened[:]
+                assert asyncio.run(upload(self.url))['size'] > 1000
+                assert 1 == len(opened)
+                assert opened[0].closed
+
+                del opened[:]
+                with self.assertRaises(FileNotFoundError):
+                    asyncio.run(upload(self.url, [fp.name, fp.name + '.missing']))
+                assert 1 == len(opened)
+                assert opened[0].closed
@@ -0,0 +1,171 @@
+import json
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler
+
+from zmlp import ZmlpApp
+from zmlp.cache import ResponseCache
+from .util import LocalServer
+
+key_dict = {
+    'projectId': 'A5BAFAAA-42FD-45BE-9FA2-92670AB4DA80',
+    'accessKey': 'test123test135',
+    'secretKey': 'test123test135'
+}
+
+DS_ID = 'b3a09695-b9fb-40bd-8ea8-bbe0c2cba33f'
+
+
+class CacheHandler(BaseHTTPRequestHandler):
+    """
+    Serves a DataSet and project settings with ETags, and
+    counts the requests and 304 replies.
+    """
+
+    requests = []
+    version = 1
+    etags = True
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body=None, headers=None):
+        data = json.dumps(body).encode() if body is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        CacheHandler.requests.append(('GET', self.path, self.headers.get('If-None-Match')))
+        etag = '"v{}"'.format(CacheHandler.version)
+        if CacheHandler.etags and self.headers.get('If-None-Match') == etag:
+            return self.reply(304)
+        headers = {'ETag': etag} if CacheHandler.etags else {}
+        if self.path == '/api/v1/project/_settings':
+            return self.reply(200, {'version': CacheHandler.version}, headers)
+        self.reply(200, {'id': DS_ID, 'name': 'ds', 'type': 'LABEL_DETECTION',
+                         'version': CacheHandler.version}, headers)
+
+    def do_PUT(self):
+        CacheHandler.requests.append(('PUT', self.path, None))
+        self.rfile.read(int(self.headers['Content-Length']))
+        CacheHandler.version += 1
+        self.reply(200, {'version': CacheHandler.version})
+
+    def do_POST(self):
+        CacheHandler.requests.append(('POST', self.path, None))
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.reply(200, {'id': 'pmod', 'name': json.loads(body)['names'][0]})
+
+
+class ResponseCacheTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = LocalServer(CacheHandler).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        CacheHandler.requests = []
+        CacheHandler.version = 1
+        CacheHandler.etags = True
+        self.cache = ResponseCache()
+        self.app = ZmlpApp(key_dict, self.server.url, response_cache=self.cache)
+
+    def test_disabled_by_default(self):
+        app = ZmlpApp(key_dict, self.server.url)
+        assert app.client.response_cache is None
+        app.datasets.get_dataset(DS_ID)
+        app.datasets.get_dataset(DS_ID)
+        assert 2 == len(CacheHandler.requests)
+
+    def test_enabled_with_defaults(self):
+        app = ZmlpApp(key_dict, self.server.url, response_cache=True)
+        assert isinstance(app.client.response_cache, ResponseCache)
+
+    def test_fresh_hit(self):
+        ds1 = self.app.datasets.get_dataset(DS_ID)
+        ds2 = self.app.datasets.get_dataset(DS_ID)
+        assert ds1.id == ds2.id
+        assert ds1 is not ds2
+        assert 1 == len(CacheHandler.requests)
+        stats = self.cache.stats()
+        assert 1 == stats['hits']
+        assert 1 == stats['misses']
+        assert 1 == stats['entries']
+        assert stats['bytes'] > 0
+        assert 0.5 == stats['hit_rate']
+
+    def test_revalidate(self):
+        self.cache.ttls[('GET', '/api/v1/data-sets/{id}')] = 0
+        self.app.datasets.get_dataset(DS_ID)
+        self.app.datasets.get_dataset(DS_ID)
+        assert [None, '"v1"'] == [r[2] for r in CacheHandler.requests]
+        assert 1 == self.cache.stats()['revalidations']
+
+        CacheHandler.version = 2
+        self.app.datasets.get_dataset(DS_ID)
+        assert [None, '"v1"', '"v1"'] == [r[2] for r in CacheHandler.requests]
+        assert 2 == self.app.client.get('/api/v1/data-sets/{}'.format(DS_ID))['version']
+        assert 2 == self.cache.stats()['revalidations']
+
+    def test_expired_without_validators(self):
+        CacheHandler.etags = False
+        self.cache.ttls[('GET', '/api/v1/data-sets/{id}')] = 0.01
+        self.app.datasets.get_dataset(DS_ID)
+        time.sleep(0.02)
+        self.app.datasets.get_dataset(DS_ID)
+        assert [None, None] == [r[2] for r in CacheHandler.requests]
+        assert 1 == self.cache.stats()['stale']
+
+    def test_invalidated_by_mutation(self):
+        assert 1 == self.app.projects.get_project_settings()['version']
+        self.app.projects.update_project_settings({'foo': 'bar'})
+        assert 2 == self.app.projects.get_project_settings()['version']
+        assert 1 == self.cache.stats()['invalidations']
+
+    def test_unrelated_mutation_keeps_entries(self):
+        self.app.datasets.get_dataset(DS_ID)
+        self.app.client.put('/api/v1/data-sets/b3a09695-0000-40bd-8ea8-bbe0c2cba33f', {})
+        self.app.client.post('/api/v1/data-sets/_search', {'names': ['x']})
+        self.app.datasets.get_dataset(DS_ID)
+        assert 1 == self.cache.stats()['hits']
+
+    def test_post_keyed_by_body(self):
+        assert 'a' == self.app.pmods.find_one_pipeline_mod(name='a').name
+        assert 'b' == self.app.pmods.find_one_pipeline_mod(name='b').name
+        assert 'a' == self.app.pmods.find_one_pipeline_mod(name='a').name
+        assert 2 == len(CacheHandler.requests)
+
+    def test_lru_eviction_by_count(self):
+        cache = ResponseCache(max_entries=2)
+        for i in range(3):
+            cache.put(('GET', str(i), None), '/api/v1/data-sets/{}'.format(i), b'{}', {}, 60)
+        assert cache.get(('GET', '0', None)) is None
+        assert cache.get(('GET', '2', None)) is not None
+        assert 1 == cache.stats()['evictions']
+
+    def test_lru_eviction_by_bytes(self):
+        cache = ResponseCache(max_bytes=1000)
+        for i in range(4):
+            cache.put(('GET', str(i), None), '/api/v1/a/{}'.format(i), b'x' * 250, {}, 60)
+        cache.get(('GET', '0', None))
+        cache.put(('GET', '4', None), '/api/v1/a/4', b'x' * 250, {}, 60)
+        assert 1000 == cache.stats()['bytes']
+        assert cache.get(('GET', '1', None)) is None
+        assert cache.get(('GET', '0', None)) is not None
+        # Larger than a quarter of max_bytes.
+        cache.put(('GET', '5', None), '/api/v1/a/5', b'x' * 251, {}, 60)
+        assert cache.get(('GET', '5', None)) is None
+
+    def test_no_store(self):
+        self.cache.put(('GET', '0', None), '/api/v1/a/0', b'{}',
+                       {'Cache-Control': 'private, no-store'}, 60)
+        assert 0 == self.cache.stats()['entries']
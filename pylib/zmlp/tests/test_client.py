@@ -1,15 +1,38 @@
+import gzip
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
 import unittest
+from http.server import BaseHTTPRequestHandler
+from unittest.mock import patch, MagicMock
 
-from zmlp import Asset, DataSource
-from zmlp.client import SearchResult, to_json
+import jwt
+import requests
+
+from zmlp import Asset, DataSource, ZmlpClient
+from zmlp.client import SearchResult, TokenCache, ZmlpNotFoundException, to_json
+from zmlp.codec import set_json_codec
+from .util import LocalServer
+
+key_dict = {
+    'accessKey': 'A5BAFAAA-42FD-45BE-9FA2-92670AB4DA80',
+    'secretKey': 'test123test135'
+}
 
 
 class TestClientFunctions(unittest.TestCase):
 
     def test_to_json(self):
-        asset = Asset({"id": "abc123", "document": {"foo": "bar"}})
-        value = to_json(asset)
-        assert "{\"id\": \"abc123\", \"uri\": null, \"document\": {\"foo\": \"bar\"}}" == value
+        previous = set_json_codec('stdlib')
+        try:
+            asset = Asset({"id": "abc123", "document": {"foo": "bar"}})
+            value = to_json(asset)
+            assert "{\"id\": \"abc123\", \"uri\": null, \"document\": {\"foo\": \"bar\"}}" == value
+        finally:
+            set_json_codec(previous)
 
 
 class SearchResultTests(unittest.TestCase):
@@ -31,3 +54,244 @@ class SearchResultTests(unittest.TestCase):
         assert sr.offset == 10
         assert sr[0].id == "abc123"
         assert len(list(sr)) == 1
+
+
+class ZmlpClientTests(unittest.TestCase):
+
+    def setUp(self):
+        self.client = ZmlpClient(key_dict, 'https://localhost:9999')
+
+    def test_session_pool_config(self):
+        client = ZmlpClient(key_dict, 'https://localhost:9999',
+                            pool_connections=2, pool_maxsize=32, pool_block=True)
+        adapter = client.session.get_adapter('https://localhost:9999')
+        assert 32 == adapter._pool_maxsize
+        assert 2 == adapter._pool_connections
+        assert adapter._pool_block
+
+    def test_session_is_shared(self):
+        assert self.client.session is self.client.session
+
+    def test_close(self):
+        session = self.client.session
+        self.client.close()
+        assert self.client.session is not session
+
+    def test_context_manager(self):
+        with ZmlpClient(key_dict, 'https://localhost:9999') as client:
+            session = client.session
+        assert client._session is None
+        assert session is not None
+
+    @patch.object(ZmlpClient, 'headers')
+    @patch.object(requests.Session, 'request')
+    def test_verbs_use_session(self, req_patch, headers_patch):
+        headers_patch.return_value = {}
+        rsp = MagicMock()
+        rsp.status_code = 200
+        rsp.content = b'{"success": true}'
+        rsp.json.return_value = {'success': True}
+        req_patch.return_value = rsp
+
+        for verb in ('get', 'post', 'put', 'delete'):
+            assert getattr(self.client, verb)('/api/v1/foo', {})['success']
+        assert 4 == req_patch.call_count
+
+
+class TokenCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.client = ZmlpClient(key_dict, 'https://localhost:9999')
+
+    def get_token(self):
+        return self.client.headers()['Authorization'].split(' ')[1]
+
+    def test_token_is_reused(self):
+        token1 = self.get_token()
+        token2 = self.get_token()
+        assert token1 == token2
+        stats = self.client.token_cache.stats()
+        assert 1 == stats['hits']
+        assert 1 == stats['misses']
+
+    def test_token_claims(self):
+        self.client.project_id = 'abc123'
+        claims = jwt.decode(self.get_token(), key_dict['secretKey'],
+                            algorithms=['HS512'], audience='https://localhost:9999')
+        assert key_dict['accessKey'] == claims['accessKey']
+        assert 'abc123' == claims['projectId']
+
+    def test_token_keyed_on_task(self):
+        token1 = self.get_token()
+        os.environ['ZMLP_TASK_ID'] = 'task-1'
+        os.environ['ZMLP_JOB_ID'] = 'job-1'
+        try:
+            token2 = self.get_token()
+        finally:
+            del os.environ['ZMLP_TASK_ID']
+            del os.environ['ZMLP_JOB_ID']
+        assert token1 != token2
+        claims = jwt.decode(token2, options={'verify_signature': False})
+        assert 'task-1' == claims['taskId']
+        assert 'job-1' == claims['jobId']
+
+    def test_stale_token_is_resigned(self):
+        cache = TokenCache(refresh_margin=10)
+        cache.put('key', 'token', 5)
+        assert cache.get('key') is None
+        assert 1 == cache.misses
+
+    def test_thread_safety(self):
+        tokens = set()
+
+        def sign():
+            for _ in range(50):
+                tokens.add(self.get_token())
+
+        threads = [threading.Thread(target=sign) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        stats = self.client.token_cache.stats()
+        assert 200 == stats['hits'] + stats['misses']
+        assert 1 == stats['size']
+
+
+class GzipHandler(BaseHTTPRequestHandler):
+    """Decodes gzip requests and gzip encodes responses when asked to."""
+
+    def log_message(self, *args):
+        pass
+
+    def _handle(self):
+        data = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        encoding = self.headers.get('Content-Encoding')
+        if encoding == 'gzip':
+            data = gzip.decompress(data)
+        body = json.dumps({
+            'encoding': encoding,
+            'body': json.loads(data) if data else None,
+            'padding': 'x' * 50000
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = do_PUT = _handle
+
+
+class CompressionTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = LocalServer(GzipHandler).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def test_compressed_request(self):
+        client = ZmlpClient(key_dict, self.server.url,
+                            compress_requests=True, compress_threshold=1024)
+        body = {'assets': ['gs://foo/bar/{}.jpg'.format(i) for i in range(1000)]}
+        rsp = client.post('/api/v3/assets/_batch_create', body)
+        assert 'gzip' == rsp['encoding']
+        assert body == rsp['body']
+
+        stats = client.transfer_stats.stats()
+        assert 1 == stats['compressed_requests']
+        assert stats['request_bytes_wire'] < stats['request_bytes_logical']
+        assert 1 == stats['compressed_responses']
+        assert stats['response_bytes_wire'] < stats['response_bytes_logical']
+
+    def test_small_request_not_compressed(self):
+        client = ZmlpClient(key_dict, self.server.url,
+                            compress_requests=True, compress_threshold=1024)
+        rsp = client.post('/api/v3/foo', {'a': 1})
+        assert rsp['encoding'] is None
+        assert 0 == client.transfer_stats.stats()['compressed_requests']
+
+    def test_compression_disabled_by_default(self):
+        client = ZmlpClient(key_dict, self.server.url)
+        body = {'padding': 'x' * 100000}
+        assert client.put('/api/v3/foo', body)['encoding'] is None
+
+    def test_stream_compressed_response(self):
+        client = ZmlpClient(key_dict, self.server.url)
+        dst = os.path.join(tempfile.mkdtemp(), 'rsp.json')
+        client.stream('/api/v3/foo', dst)
+        with open(dst) as fp:
+            assert 50000 == len(json.load(fp)['padding'])
+        stats = client.transfer_stats.stats()
+        assert stats['response_bytes_wire'] < stats['response_bytes_logical']
+
+    def test_post_streaming(self):
+        client = ZmlpClient(key_dict, self.server.url)
+        rsp = client.post_streaming('/api/v3/assets/_search', {'size': 10})
+        assert [] == list(rsp.hits())
+        assert {'size': 10} == rsp.result['body']
+        assert client.transfer_stats.stats()['response_bytes_logical'] > 50000
+
+
+class FileHandler(BaseHTTPRequestHandler):
+    """Serves a block of random bytes."""
+
+    data = os.urandom(3 * 1024 * 1024 + 17)
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.endswith('missing.jpg'):
+            body = b'{"message": "not found", "status": 404}'
+            self.send_response(404)
+        else:
+            body = self.data
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class DownloadTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = LocalServer(FileHandler).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.client = ZmlpClient(key_dict, self.server.url, block_size=64 * 1024)
+
+    def test_download_to_path(self):
+        dst = os.path.join(tempfile.mkdtemp(), 'file.bin')
+        checksum = hashlib.sha256()
+        size = self.client.download('/api/v3/files/_stream/foo.bin', dst, checksum=checksum)
+        assert len(FileHandler.data) == size
+        assert hashlib.sha256(FileHandler.data).hexdigest() == checksum.hexdigest()
+        with open(dst, 'rb') as fp:
+            assert FileHandler.data == fp.read()
+
+    def test_download_to_file_object(self):
+        buf = io.BytesIO()
+        size = self.client.download('/api/v3/files/_stream/foo.bin', buf, block_size=1000)
+        assert len(FileHandler.data) == size
+        assert FileHandler.data == buf.getvalue()
+
+    def test_stream(self):
+        dst = os.path.join(tempfile.mkdtemp(), 'file.bin')
+        assert dst == self.client.stream('/api/v3/files/_stream/foo.bin', dst)
+        assert len(FileHandler.data) == os.path.getsize(dst)
+
+    def test_download_not_found(self):
+        with self.assertRaises(ZmlpNotFoundException):
+            self.client.download('/api/v3/files/_stream/missing.jpg', io.BytesIO())
@@ -0,0 +1,91 @@
+import datetime
+import decimal
+import json
+import math
+import unittest
+
+from zmlp import Asset
+from zmlp.client import to_json
+from zmlp.codec import StdlibJsonCodec, OrjsonCodec, get_json_codec, \
+    set_json_codec, orjson
+
+
+class CodecTestMixin(object):
+
+    codec = None
+
+    def test_for_json(self):
+        asset = Asset({'id': 'abc123', 'document': {'foo': 'bar'}})
+        assert {'id': 'abc123', 'uri': None, 'document': {'foo': 'bar'}} == \
+            json.loads(self.codec.dumps(asset))
+
+    def test_defaults(self):
+        value = {
+            'set': {1},
+            'datetime': datetime.datetime(2020, 1, 2, 3, 4, 5, 6),
+            'date': datetime.date(2020, 1, 2),
+            'time': datetime.time(3, 4, 5),
+            'decimal': decimal.Decimal('1.5')
+        }
+        assert {
+            'set': [1],
+            'datetime': '2020-01-02T03:04:05.000006',
+            'date': '2020-01-02',
+            'time': '03:04:05',
+            'decimal': 1.5
+        } == json.loads(self.codec.dumps(value))
+
+    def test_dumpb(self):
+        assert b'{"a":[1,2]}' == self.codec.dumpb({'a': [1, 2]}).replace(b' ', b'')
+
+    def test_loads(self):
+        assert {'a': [1, 2]} == self.codec.loads(b'{"a": [1, 2]}')
+        assert {'a': [1, 2]} == self.codec.loads('{"a": [1, 2]}')
+
+    def test_indent(self):
+        assert '{\n  "a": 1\n}' == self.codec.dumps({'a': 1}, indent=2)
+
+    def test_unserializable(self):
+        with self.assertRaises(TypeError):
+            self.codec.dumps({'a': object()})
+
+
+class StdlibJsonCodecTests(CodecTestMixin, unittest.TestCase):
+
+    codec = StdlibJsonCodec()
+
+
+@unittest.skipIf(orjson is None, 'orjson is not installed')
+class OrjsonCodecTests(CodecTestMixin, unittest.TestCase):
+
+    def setUp(self):
+        self.codec = OrjsonCodec()
+
+    def test_big_int_fallback(self):
+        assert {'a': 2 ** 70} == json.loads(self.codec.dumps({'a': 2 ** 70}))
+
+    def test_non_str_keys(self):
+        assert {'1': 'a'} == json.loads(self.codec.dumps({1: 'a'}))
+
+    def test_nan_fallback(self):
+        assert math.isnan(self.codec.loads('{"a": NaN}')['a'])
+
+
+class CodecSelectionTests(unittest.TestCase):
+
+    def test_set_json_codec(self):
+        previous = set_json_codec('stdlib')
+        try:
+            assert 'stdlib' == get_json_codec().name
+            assert '{"a": 1}' == to_json({'a': 1})
+        finally:
+            set_json_codec(previous)
+        assert previous is get_json_codec()
+
+    def test_default_codec(self):
+        expected = 'orjson' if orjson is not None else 'stdlib'
+        previous = set_json_codec(None)
+        try:
+            assert expected == get_json_codec().name
+        finally:
+            set_json_codec(previous)
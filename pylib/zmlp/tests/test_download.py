@@ -0,0 +1,286 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler
+from unittest.mock import patch
+
+from zmlp.client import ZmlpClient, ZmlpNotFoundException
+from zmlp.download import RangedDownload, ZmlpDownloadException
+from zmlp.retry import RetryPolicy
+from .util import LocalServer
+
+key_dict = {
+    'projectId': 'A5BAFAAA-42FD-45BE-9FA2-92670AB4DA80',
+    'accessKey': 'test123test135',
+    'secretKey': 'test123test135'
+}
+
+DATA = os.urandom(1024 * 1024 + 123)
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """
+    Serves DATA with support for Range requests.  The class attributes
+    control the behavior of the server.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    ranges = True
+    """Set to False to ignore Range headers."""
+
+    drops = 0
+    """The number of responses to cut short."""
+
+    requests = []
+    """The Range headers of each request received."""
+
+    etag = '"v1"'
+    """The ETag of DATA."""
+
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.endswith('missing.bin'):
+            self.send_response(404)
+            self.send_header('Content-Length', '2')
+            self.end_headers()
+            self.wfile.write(b'{}')
+            return
+
+        header = self.headers.get('Range')
+        with self.lock:
+            self.requests.append(header)
+            drop = RangeHandler.drops > 0
+            RangeHandler.drops -= 1
+
+        match = re.match(r'bytes=(\d+)-(\d*)', header or '')
+        if_range = self.headers.get('If-Range')
+        if not self.ranges or not match or (if_range and if_range != self.etag):
+            start, end = 0, len(DATA) - 1
+            self.send_response(200)
+        else:
+            start = int(match.group(1))
+            end = int(match.group(2)) if match.group(2) else len(DATA) - 1
+            if start >= len(DATA):
+                self.send_response(416)
+                self.send_header('Content-Range', 'bytes */{}'.format(len(DATA)))
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(start, end, len(DATA)))
+
+        body = DATA[start:end + 1]
+        self.send_header('ETag', self.etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if drop:
+            # Send some of the body and then close the connection.
+            self.wfile.write(body[:len(body) // 3])
+            self.close_connection = True
+        else:
+            self.wfile.write(body)
+
+
+class RangedDownloadTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = LocalServer(RangeHandler).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        RangeHandler.ranges = True
+        RangeHandler.drops = 0
+        RangeHandler.requests = []
+        self.dst = os.path.join(tempfile.mkdtemp(), 'file.bin')
+        self.client = ZmlpClient(key_dict, self.server.url,
+                                 retry_policy=RetryPolicy(base_delay=0, max_delay=0),
+                                 download_part_size=256 * 1024,
+                                 download_concurrency=3,
+                                 parallel_download_threshold=512 * 1024,
+                                 block_size=16 * 1024)
+
+    def assert_downloaded(self):
+        with open(self.dst, 'rb') as fp:
+            assert DATA == fp.read()
+        assert not os.path.exists(self.dst + '.part')
+        assert not os.path.exists(self.dst + '.part.json')
+
+    def write_journal(self, **kwargs):
+        journal = {'url': self.client.get_url('/api/v3/files/_stream/file.bin'),
+                   'size': len(DATA), 'validator': RangeHandler.etag}
+        journal.update(kwargs)
+        with open(self.dst + '.part.json', 'w') as fp:
+            json.dump(journal, fp)
+
+    def download(self, **kwargs):
+        return RangedDownload(self.client, '/api/v3/files/_stream/file.bin',
+                              self.dst, **kwargs).run()
+
+    def test_download_sequential(self):
+        assert len(DATA) == self.download(concurrency=1)
+        self.assert_downloaded()
+        assert ['bytes=0-'] == RangeHandler.requests
+
+    def test_download_parallel(self):
+        assert len(DATA) == self.download()
+        self.assert_downloaded()
+        assert 'bytes=0-' == RangeHandler.requests[0]
+        assert {'bytes=262144-524287', 'bytes=524288-786431', 'bytes=786432-1048575',
+                'bytes=1048576-1048698'} == set(RangeHandler.requests[1:])
+
+    def test_download_below_parallel_threshold(self):
+        self.download(parallel_threshold=len(DATA) + 1)
+        self.assert_downloaded()
+        assert 1 == len(RangeHandler.requests)
+
+    def test_resume_part_file(self):
+        with open(self.dst + '.part', 'wb') as fp:
+            fp.write(DATA[:1000])
+        self.write_journal()
+        self.download()
+        self.assert_downloaded()
+        assert ['bytes=1000-'] == RangeHandler.requests
+
+    def test_part_file_without_journal(self):
+        with open(self.dst + '.part', 'wb') as fp:
+            fp.write(b'x' * 1000)
+        self.download(concurrency=1)
+        self.assert_downloaded()
+        assert ['bytes=0-'] == RangeHandler.requests
+
+    def test_resume_changed_file(self):
+        with open(self.dst + '.part', 'wb') as fp:
+            fp.write(b'x' * 1000)
+        self.write_journal(validator='"v0"')
+        self.download(concurrency=1)
+        self.assert_downloaded()
+        # The server sent the whole file as the If-Range validator didn't match.
+        assert ['bytes=1000-'] == RangeHandler.requests
+
+    def test_resume_journal_size_mismatch(self):
+        with open(self.dst + '.part', 'wb') as fp:
+            fp.write(b'x' * 1000)
+        self.write_journal(size=500)
+        self.download(concurrency=1)
+        self.assert_downloaded()
+        assert ['bytes=0-'] == RangeHandler.requests
+
+    def test_resume_without_validator(self):
+        with open(self.dst + '.part', 'wb') as fp:
+            fp.write(b'x' * 1000)
+        self.write_journal(validator=None)
+        self.download(concurrency=1)
+        self.assert_downloaded()
+        assert ['bytes=0-'] == RangeHandler.requests
+
+    def test_resume_completed_part_file(self):
+        with open(self.dst + '.part', 'wb') as fp:
+            fp.write(DATA)
+        self.write_journal()
+        assert len(DATA) == self.download()
+        self.assert_downloaded()
+
+    def test_resume_parallel_journal(self):
+        part_size = 256 * 1024
+        with open(self.dst + '.part', 'wb') as fp:
+            fp.write(DATA[:part_size])
+            fp.write(b'\0' * part_size)
+            fp.write(DATA[part_size * 2:part_size * 3])
+        self.write_journal(part_size=part_size, done=[0, 2])
+        self.download()
+        self.assert_downloaded()
+        assert {'bytes=262144-524287', 'bytes=786432-1048575',
+                'bytes=1048576-1048698'} == set(RangeHandler.requests)
+
+    def test_resume_parallel_changed_file(self):
+        part_size = 256 * 1024
+        with open(self.dst + '.part', 'wb') as fp:
+            fp.write(b'x' * len(DATA))
+        self.write_journal(validator='"v0"', part_size=part_size, done=[0, 2])
+        self.download()
+        self.assert_downloaded()
+        assert 'bytes=0-' in RangeHandler.requests
+
+    def test_resume_dropped_connection(self):
+        RangeHandler.drops = 1
+        self.download(concurrency=1)
+        self.assert_downloaded()
+        assert 2 == len(RangeHandler.requests)
+        assert RangeHandler.requests[1] != 'bytes=0-'
+
+    def test_resume_dropped_connection_parallel(self):
+        RangeHandler.drops = 3
+        self.download()
+        self.assert_downloaded()
+
+    def test_too_many_dropped_connections(self):
+        RangeHandler.drops = 100
+        with self.assertRaises(ZmlpDownloadException):
+            self.download(concurrency=1)
+        # The partial download is kept for next time.
+        assert os.path.getsize(self.dst + '.part') > 0
+
+    def test_ranges_not_supported(self):
+        RangeHandler.ranges = False
+        self.download()
+        self.assert_downloaded()
+        assert 1 == len(RangeHandler.requests)
+
+    def assert_checksum(self, **kwargs):
+        checksum = hashlib.sha256()
+        assert len(DATA) == self.download(checksum=checksum, **kwargs)
+        self.assert_downloaded()
+        assert hashlib.sha256(DATA).hexdigest() == checksum.hexdigest()
+
+    def test_checksum_sequential(self):
+        RangeHandler.drops = 1
+        with patch.object(RangedDownload, '_hash_part_file', autospec=True) as hash_patch:
+            self.assert_checksum(concurrency=1)
+        # Every block was hashed as it was written, none were read back.
+        for call in hash_patch.call_args_list:
+            assert call[0][0]._hashed >= call[0][1]
+
+    def test_checksum_resumed(self):
+        with open(self.dst + '.part', 'wb') as fp:
+            fp.write(DATA[:1000])
+        self.write_journal()
+        self.assert_checksum(concurrency=1)
+
+    def test_checksum_parallel(self):
+        self.assert_checksum()
+
+    def test_checksum_changed_file(self):
+        RangeHandler.drops = 1
+        checksum = hashlib.sha256()
+        download = RangedDownload(self.client, '/api/v3/files/_stream/file.bin', self.dst,
+                                  concurrency=1, checksum=checksum)
+        # The file changes after the connection drops, it can't be hashed again.
+        orig_request = download._request
+
+        def request(start, end=None, validator=None):
+            return orig_request(start, end, validator and '"v0"')
+
+        download._request = request
+        self.assertRaises(ZmlpDownloadException, download.run)
+
+    def test_not_found(self):
+        with self.assertRaises(ZmlpNotFoundException):
+            RangedDownload(self.client, '/api/v3/files/_stream/missing.bin', self.dst).run()
+
+    def test_client_download(self):
+        assert len(DATA) == self.client.download('/api/v3/files/_stream/file.bin', self.dst)
+        self.assert_downloaded()
+        assert 5 == len(RangeHandler.requests)
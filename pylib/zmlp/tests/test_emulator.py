@@ -0,0 +1,179 @@
+import hashlib
+import os
+import tempfile
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from zmlp import ZmlpApp
+from zmlp.client import ZmlpClient, ZmlpNotFoundException, ZmlpRequestException
+from zmlp.emulator import Corpus, Emulator
+from zmlp.entity import DataSet, DataSetLabel, FileImport, FileUpload
+from zmlp.retry import RetryPolicy
+
+key_dict = {
+    'projectId': 'A5BAFAAA-42FD-45BE-9FA2-92670AB4DA80',
+    'accessKey': 'test123test135',
+    'secretKey': 'test123test135'
+}
+
+
+class EmulatorTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.emulator = Emulator(Corpus(size=250, file_size=200 * 1024)).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.emulator.stop()
+
+    def setUp(self):
+        self.emulator.stats.reset()
+        self.app = ZmlpApp(key_dict, self.emulator.url,
+                           retry_policy=RetryPolicy(base_delay=0, max_delay=0))
+
+    def tearDown(self):
+        emulator = self.emulator
+        emulator.latency = emulator.error_rate = emulator.throttle_rate = 0
+        emulator.bandwidth = None
+        emulator.ranges = True
+
+    def test_scroll_search(self):
+        # Other tests add assets to the shared corpus.
+        total = len(self.emulator.corpus.assets)
+        assets = list(self.app.assets.scroll_search({'size': 100}))
+        assert total == len(assets)
+        assert total == len(set(asset.id for asset in assets))
+        assert 'jpg' == assets[0].get_attr('source.extension')
+        assert {'search': 1, 'scroll': -(-total // 100), 'clear_scroll': 1} == \
+            self.emulator.stats.requests
+        assert not self.emulator.scrolls
+
+    def test_scroll_search_streaming(self):
+        total = len(self.emulator.corpus.assets)
+        assets = list(self.app.assets.scroll_search({'size': 40}, stream=True))
+        assert total == len(assets)
+        assert not self.emulator.scrolls
+
+    def test_search(self):
+        ids = list(self.emulator.corpus.assets)[:3]
+        result = self.app.assets.search({'query': {'terms': {'_id': ids}},
+                                         '_source': ['source.path']})
+        assert ids == [asset.id for asset in result]
+        assert ['source'] == list(result[0].document)
+
+    def test_get_assets(self):
+        ids = list(self.emulator.corpus.assets)[10:30]
+        assets = list(self.app.assets.get_assets(ids, chunk_size=5))
+        assert ids == [asset.id for asset in assets]
+
+    def test_get_asset(self):
+        asset_id = next(iter(self.emulator.corpus.assets))
+        assert asset_id == self.app.assets.get_asset(asset_id).id
+        self.assertRaises(ZmlpNotFoundException, self.app.assets.get_asset, 'missing')
+
+    def test_batch_import_files(self):
+        rsp = self.app.assets.batch_import_files([FileImport('gs://bucket/a.mov'),
+                                                  FileImport('gs://bucket/b.jpg')])
+        assert 2 == len(rsp['created'])
+        assert 'mov' == self.app.assets.get_asset(rsp['created'][0]).get_attr(
+            'source.extension')
+        assert self.app.jobs.get_job(rsp['jobId']).name.startswith('Analyze 2')
+
+    def test_batch_upload_and_download(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'upload.jpg')
+            content = os.urandom(300 * 1024)
+            with open(path, 'wb') as fp:
+                fp.write(content)
+            rsp = self.app.assets.batch_upload_files([FileUpload(path)])
+            asset = self.app.assets.get_asset(rsp['created'][0])
+            stored = asset.get_files(category='source')[0]
+            assert content == self.app.assets.download_file(stored).getvalue()
+
+            dst = os.path.join(tmpdir, 'download.jpg')
+            self.app.client.parallel_download_threshold = 0
+            self.app.client.download_part_size = 64 * 1024
+            assert len(content) == self.app.assets.download_file(stored, dst)
+            with open(dst, 'rb') as fp:
+                assert content == fp.read()
+            assert 5 == self.emulator.stats.statuses[206]
+
+    def test_download_without_ranges(self):
+        self.emulator.ranges = False
+        file_id = next(iter(self.emulator.corpus.files))
+        with tempfile.TemporaryDirectory() as tmpdir:
+            dst = os.path.join(tmpdir, 'download.jpg')
+            checksum = hashlib.md5()
+            assert 200 * 1024 == self.app.assets.download_file(file_id, dst, checksum=checksum)
+        expected = hashlib.md5(self.emulator.corpus.file_content(file_id)).hexdigest()
+        assert expected == checksum.hexdigest()
+
+    def test_find_jobs_and_tasks(self):
+        jobs = list(self.app.jobs.find_jobs())
+        assert 10 <= len(jobs)
+        failed = list(self.app.jobs.find_jobs(state='Failure'))
+        assert 3 == len(failed)
+        tasks = list(self.app.jobs.find_tasks(job=failed[0]))
+        assert 5 == len(tasks)
+        assert tasks[0] == self.app.jobs.find_one_task(id=tasks[0].id)
+        errors = list(self.app.jobs.find_task_errors(job=failed[0]))
+        assert 1 == len(errors)
+        assert failed[0].id == errors[0].job_id
+        assert jobs[0] == self.app.jobs.find_one_job(id=jobs[0].id)
+        self.assertRaises(ZmlpRequestException, self.app.jobs.find_one_job, state='Failure')
+
+    def test_find_jobs_paged(self):
+        corpus = Corpus(size=0, jobs=150, tasks_per_job=0)
+        with Emulator(corpus) as emulator:
+            app = ZmlpApp(key_dict, emulator.url)
+            assert 150 == len(list(app.jobs.find_jobs()))
+            assert 120 == len(list(app.jobs.find_jobs(limit=120)))
+
+    def test_update_labels(self):
+        asset_id = next(iter(self.emulator.corpus.assets))
+        ds = DataSet({'id': 'ds1'})
+        rsp = self.app.assets.update_labels(asset_id, add_labels=DataSetLabel(ds, 'cat'))
+        assert rsp['success']
+        labels = self.app.assets.get_asset(asset_id).get_attr('labels')
+        assert [{'dataSetId': 'ds1', 'label': 'cat', 'bbox': None, 'simhash': None}] == labels
+        self.app.assets.update_labels(asset_id, remove_labels=DataSetLabel(ds, 'cat'))
+        assert [] == self.app.assets.get_asset(asset_id).get_attr('labels')
+
+    def test_throttle_is_retried(self):
+        self.emulator.fail_next(429, count=2, path='_search', retry_after=0)
+        result = self.app.assets.search({'size': 5})
+        assert 5 == len(result.assets)
+        assert 2 == self.emulator.stats.statuses[429]
+        assert 1 == self.emulator.stats.statuses[200]
+
+    def test_injected_errors(self):
+        self.emulator.error_rate = 1.0
+        client = ZmlpClient(key_dict, self.emulator.url,
+                            retry_policy=RetryPolicy(max_attempts=1))
+        self.assertRaises(ZmlpRequestException, client.post, '/api/v1/jobs/_search', {})
+        assert 1 == self.emulator.stats.statuses[503]
+
+    def test_unauthorized(self):
+        rsp = requests.post(self.emulator.url + '/api/v1/jobs/_search', json={})
+        assert 401 == rsp.status_code
+
+    def test_latency_and_concurrency(self):
+        self.emulator.latency = 0.1
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            list(pool.map(lambda _: self.app.client.post('/api/v1/jobs/_search', {}),
+                          range(4)))
+        elapsed = time.monotonic() - start
+        assert 0.1 <= elapsed < 0.35
+        assert 4 == self.emulator.stats.max_in_flight
+
+    def test_bandwidth(self):
+        self.emulator.bandwidth = 1024 * 1024
+        file_id = next(iter(self.emulator.corpus.files))
+        start = time.monotonic()
+        assert 200 * 1024 == len(self.app.assets.download_file(file_id).getvalue())
+        assert time.monotonic() - start >= 0.18
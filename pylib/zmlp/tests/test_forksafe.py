@@ -0,0 +1,180 @@
+import copy as copy_module
+import json
+import multiprocessing
+import os
+import pickle
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler
+from unittest.mock import patch
+
+from zmlp import ZmlpApp
+from zmlp import client as client_module
+from zmlp.client import ZmlpClient
+from zmlp.lanes import Lane
+from zmlp.limiter import AdaptiveLimiter, ConcurrencyWindow
+from zmlp.retry import RetryPolicy
+from .util import LocalServer
+
+key_dict = {
+    'projectId': 'A5BAFAAA-42FD-45BE-9FA2-92670AB4DA80',
+    'accessKey': 'test123test135',
+    'secretKey': 'test123test135'
+}
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+    """Replies with the port of the client, over keep-alive connections."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        body = json.dumps({'port': self.client_address[1]}).encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def in_other_process():
+    """Unpickle as if in another process, such as a forked worker."""
+    return patch('os.getpid', return_value=-1)
+
+
+def _fetch(app):
+    fresh = app.client._session is None
+    return os.getpid(), fresh, id(app.client), app.client.get('/api/v3/things')['port']
+
+
+class PickleTests(unittest.TestCase):
+
+    def test_pickle_method_is_small(self):
+        app = ZmlpApp(key_dict, 'https://localhost:9999', asset_batch_window=0.01,
+                      response_cache=True)
+        app.client.session
+        data = pickle.dumps(app.assets.download_file)
+        assert len(data) < 2048
+
+        with in_other_process():
+            method = pickle.loads(data)
+            assert method.__self__.app.client is app.client
+            assert method.__self__ is pickle.loads(data).__self__
+
+    def test_same_process_makes_new_client(self):
+        app = ZmlpApp(key_dict, 'https://localhost:9999', read_timeout=5)
+        copy = pickle.loads(pickle.dumps(app))
+        assert copy is not app
+        assert copy.client is not app.client
+        assert copy.client._instance_id != app.client._instance_id
+        assert 5 == copy.client.read_timeout
+        assert pickle.loads(pickle.dumps(app)).client is not copy.client
+
+    def test_deepcopy(self):
+        limiter = AdaptiveLimiter(window=ConcurrencyWindow(initial=4, max_limit=8))
+        client = ZmlpClient(key_dict, 'https://localhost:9999', read_timeout=5,
+                            limiter=limiter, lanes=[Lane('reports', concurrency=2)])
+        copy = copy_module.deepcopy(client)
+        assert copy is not client
+        assert copy._instance_id != client._instance_id
+        assert 5 == copy.read_timeout
+        assert client.apikey == copy.apikey
+        assert copy.limiter is not client.limiter
+        assert 8 == copy.limiter.window.max_limit
+        assert 2 == copy.lanes['reports'].concurrency
+        assert copy.session is not client.session
+
+    def test_restore_config(self):
+        limiter = AdaptiveLimiter({'search': (5, 10)}, ConcurrencyWindow(initial=4, max_limit=8))
+        client = ZmlpClient(key_dict, ['https://a.localhost', 'https://b.localhost'],
+                            project_id='abc', read_timeout=5, limiter=limiter,
+                            retry_policy=RetryPolicy(max_attempts=7),
+                            lanes=[Lane('reports', concurrency=2)])
+        data = pickle.dumps(client)
+        # As if unpickled in a new process.
+        del client_module._clients[client._instance_id]
+        with in_other_process():
+            copy = pickle.loads(data)
+            assert copy is pickle.loads(data)
+
+        assert copy is not client
+        assert 'abc' == copy.project_id
+        assert 5 == copy.read_timeout
+        assert 7 == copy.retry_policy.max_attempts
+        assert ['https://a.localhost', 'https://b.localhost'] == \
+            [s['server'] for s in copy.server_pool.stats()]
+        assert 4 == copy.limiter.window.limit
+        assert 8 == copy.limiter.window.max_limit
+        assert 5 == copy.limiter.buckets['search'].rate
+        assert copy.limiter is copy.lanes['interactive'].limiter
+        assert 2 == copy.lanes['reports'].concurrency
+        assert copy.session is not client.session
+
+    def test_window_state_not_pickled(self):
+        window = ConcurrencyWindow(initial=2)
+        window.acquire()
+        window.acquire()
+        copy = pickle.loads(pickle.dumps(window))
+        assert 0 == copy.in_flight
+        assert 2 == copy.limit
+
+
+class ThreadSafetyTests(unittest.TestCase):
+
+    def test_one_session_created(self):
+        client = ZmlpClient(key_dict, 'https://localhost:9999')
+        create = client._create_session
+
+        def slow_create(*args):
+            time.sleep(0.05)
+            return create(*args)
+
+        sessions = []
+        with patch.object(client, '_create_session', side_effect=slow_create) as create_patch:
+            threads = [threading.Thread(target=lambda: sessions.append(client.session))
+                       for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        assert 1 == create_patch.call_count
+        assert 1 == len(set(map(id, sessions)))
+
+
+@unittest.skipUnless(hasattr(os, 'fork'), 'requires fork')
+class ForkTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = LocalServer(EchoHandler).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def test_fork_rebuilds_connections(self):
+        app = ZmlpApp(key_dict, self.server.url)
+        parent_port = app.client.get('/api/v3/things')['port']
+        assert app.client._session is not None
+
+        ctx = multiprocessing.get_context('fork')
+        with ctx.Pool(2) as pool:
+            results = [pool.apply_async(_fetch, (app,)) for _ in range(4)]
+            results = [result.get(10) for result in results]
+
+        for pid, fresh, _, port in results:
+            assert os.getpid() != pid
+            assert port != parent_port
+        # Each worker opened its own pool on first use, then reused it.
+        by_pid = {}
+        for pid, fresh, client_id, port in results:
+            by_pid.setdefault(pid, []).append((fresh, client_id))
+        for calls in by_pid.values():
+            assert calls[0][0]
+            assert 1 == len(set(client_id for _, client_id in calls))
+
+        # The parent's connection is still usable.
+        assert parent_port == app.client.get('/api/v3/things')['port']
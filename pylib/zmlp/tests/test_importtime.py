@@ -0,0 +1,130 @@
+import os
+import subprocess
+import sys
+import unittest
+
+import zmlp
+from zmlp.lazy import lazy_import
+
+PYLIB = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+HEAVY_MODULES = ('requests', 'jwt', 'urllib3', 'cryptography', 'aiohttp', 'asyncio', 'orjson')
+"""Modules which must not be imported until a request is made."""
+
+EAGER_MODULES = {'zmlp', 'zmlp.lazy', 'zmlp.entity'}
+"""The only zmlp modules 'import zmlp' may import."""
+
+
+def import_times(code):
+    """
+    Run the code in a new interpreter with -X importtime.
+
+    Returns:
+        dict: The cumulative import time in seconds of each module imported.
+    """
+    env = dict(os.environ, PYTHONPATH=PYLIB)
+    env.pop('ZMLP_SIDECAR', None)
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                          env=env, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+
+class ImportTimeTests(unittest.TestCase):
+
+    def assert_not_imported(self, times):
+        imported = [name for name in times if name.split('.')[0] in HEAVY_MODULES]
+        assert not imported, "Imported eagerly: {}".format(', '.join(imported))
+
+    def test_import_zmlp(self):
+        # What is imported is checked rather than how long it takes, which
+        # depends on the machine.
+        times = import_times('import zmlp')
+        self.assert_not_imported(times)
+        assert EAGER_MODULES == {name for name in times if name.split('.')[0] == 'zmlp'}
+
+    def test_create_app(self):
+        times = import_times(
+            "import zmlp\n"
+            "app = zmlp.ZmlpApp({'accessKey': 'a', 'secretKey': 'b'}, 'https://localhost')\n"
+            "app.assets\n")
+        self.assert_not_imported(times)
+        assert 'zmlp.app.asset_app' in times
+        assert 'zmlp.app.job_app' not in times
+
+    def test_request_imports_dependencies(self):
+        times = import_times(
+            "import zmlp\n"
+            "app = zmlp.ZmlpApp({'accessKey': 'a', 'secretKey': 'b'}, 'https://localhost')\n"
+            "app.client.headers()\n"
+            "app.client.session\n")
+        assert 'jwt' in times
+        assert 'requests' in times
+
+
+class LazyAttrTests(unittest.TestCase):
+
+    def test_attrs(self):
+        from zmlp.app.zmlp_app import ZmlpApp
+        from zmlp.entity.asset import Asset
+        assert zmlp.ZmlpApp is ZmlpApp
+        assert zmlp.Asset is Asset
+        assert zmlp.entity.Asset is Asset
+        assert zmlp.app.AssetApp is zmlp.app.asset_app.AssetApp
+        assert 'ZmlpClient' in dir(zmlp)
+        assert set(zmlp.__all__) <= set(dir(zmlp))
+
+    def test_dir_hides_helpers(self):
+        for package in (zmlp, zmlp.app, zmlp.entity):
+            names = dir(package)
+            assert 'lazy_attrs' not in names
+            assert '_ATTRS' not in names
+            assert '__all__' in names
+        assert '_ENTITY_ATTRS' not in dir(zmlp)
+        self.assertRaises(AttributeError, getattr, zmlp, 'lazy_attrs')
+
+    def test_missing_attr(self):
+        self.assertRaises(AttributeError, getattr, zmlp, 'NotAThing')
+        self.assertRaises(AttributeError, getattr, zmlp.entity, 'NotAThing')
+        assert not hasattr(zmlp, '__wrapped__')
+
+    def test_star_import(self):
+        namespace = {}
+        exec('from zmlp import *', namespace)
+        assert namespace['ZmlpApp'] is zmlp.ZmlpApp
+        assert namespace['Asset'] is zmlp.Asset
+
+    def test_lazy_module(self):
+        json = lazy_import('json')
+        assert '{}' == json.dumps({})
+        assert lazy_import('zmlp_not_installed', optional=True) is None
+
+
+class LazySubAppTests(unittest.TestCase):
+
+    key = {'accessKey': 'a', 'secretKey': 'b'}
+
+    def test_sub_apps(self):
+        app = zmlp.ZmlpApp(self.key, 'https://localhost')
+        assert 'assets' not in vars(app)
+        assets = app.assets
+        assert assets is app.assets
+        assert app is assets.app
+        assert assets.loader is None
+        assert isinstance(app.jobs, zmlp.app.JobApp)
+
+    def test_replace_sub_app(self):
+        app = zmlp.ZmlpApp(self.key, 'https://localhost')
+        app.assets = 'assets'
+        assert 'assets' == app.assets
+
+    def test_loader(self):
+        app = zmlp.ZmlpApp(self.key, 'https://localhost', asset_batch_window=0.01,
+                           asset_batch_size=10)
+        assert 0.01 == app.assets.loader.window
+        assert 10 == app.assets.loader.max_batch_size
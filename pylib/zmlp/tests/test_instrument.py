@@ -0,0 +1,207 @@
+import json
+import unittest
+from http.server import BaseHTTPRequestHandler
+from unittest.mock import patch
+
+from zmlp.client import ZmlpClient, ZmlpNotFoundException
+from zmlp.instrument import Instrumentation, RequestEvent, RequestHistograms, \
+    normalize_endpoint, to_prometheus
+from zmlp.limiter import AdaptiveLimiter
+from zmlp.retry import RetryPolicy
+from .util import LocalServer
+
+key_dict = {
+    'projectId': 'A5BAFAAA-42FD-45BE-9FA2-92670AB4DA80',
+    'accessKey': 'test123test135',
+    'secretKey': 'test123test135'
+}
+
+
+class NormalizeEndpointTests(unittest.TestCase):
+
+    def test_normalize_endpoint(self):
+        assert '/api/v3/assets/{id}' == normalize_endpoint(
+            'https://api.zvi.zorroa.com/api/v3/assets/dd0KZtqyec48n1q1fniqVMV5yllhRRGx')
+        assert '/api/v1/jobs/{id}/_retryAllFailures' == normalize_endpoint(
+            '/api/v1/jobs/ba310246-1f87-1ece-b67c-be3f79a80d11/_retryAllFailures')
+        assert '/api/v1/tasks/{id}' == normalize_endpoint('/api/v1/tasks/12345')
+        assert '/api/v3/files/_stream/{path}' == normalize_endpoint(
+            '/api/v3/files/_stream/assets/123/proxy/image_450x360.jpg')
+        assert '/api/v3/assets/_search' == normalize_endpoint(
+            'http://localhost/api/v3/assets/_search?q=1')
+        assert '/api/v3/assets/_batch_update_labels' == normalize_endpoint(
+            '/api/v3/assets/_batch_update_labels')
+
+
+class InstrumentationTests(unittest.TestCase):
+
+    def test_disabled_by_default(self):
+        instrumentation = Instrumentation()
+        assert not instrumentation.enabled
+
+    def test_hooks(self):
+        instrumentation = Instrumentation()
+        started, ended = [], []
+        instrumentation.add_hooks(on_start=started.append, on_end=ended.append)
+        assert instrumentation.enabled
+
+        event = instrumentation.start('get', '/api/v3/assets/12345')
+        assert [event] == started
+        assert 'GET' == event.method
+        assert '/api/v3/assets/{id}' == event.endpoint
+        instrumentation.end(event)
+        assert [event] == ended
+        assert event.duration >= 0
+
+        instrumentation.remove_hooks(on_start=started.append, on_end=ended.append)
+        assert not instrumentation.enabled
+
+    def test_hook_errors_ignored(self):
+        instrumentation = Instrumentation()
+
+        def bad_hook(event):
+            raise ValueError("bad")
+
+        instrumentation.add_hooks(on_start=bad_hook, on_end=bad_hook)
+        instrumentation.end(instrumentation.start('GET', '/foo'))
+
+
+class HistogramTests(unittest.TestCase):
+
+    def event(self, status=200, duration=0.02, retries=0):
+        event = RequestEvent('GET', '/api/v3/assets/12345')
+        event.status = status
+        event.duration = duration
+        event.network_time = duration
+        event.response_bytes = 1000
+        event.retries = retries
+        return event
+
+    def test_record(self):
+        histograms = RequestHistograms()
+        histograms.record(self.event())
+        histograms.record(self.event(duration=2, retries=2))
+        histograms.record(self.event(status=404))
+
+        snapshot = histograms.snapshot()
+        assert 2 == snapshot['requests_total'][('GET', '/api/v3/assets/{id}', '200')]
+        assert 1 == snapshot['requests_total'][('GET', '/api/v3/assets/{id}', '404')]
+        assert 2 == snapshot['retries_total'][('GET', '/api/v3/assets/{id}')]
+        latency = snapshot['request_duration_seconds'][('GET', '/api/v3/assets/{id}')]
+        assert 3 == latency['count']
+        assert (0.025, 2) == latency['buckets'][2]
+        assert (float('inf'), 3) == latency['buckets'][-1]
+
+    def test_to_prometheus(self):
+        histograms = RequestHistograms(latency_buckets=(0.1, 1.0))
+        histograms.record(self.event())
+        histograms.record(self.event(duration=0.5))
+        text = to_prometheus(histograms, limiter=AdaptiveLimiter())
+
+        assert '# TYPE zmlp_client_request_duration_seconds histogram' in text
+        assert 'zmlp_client_requests_total{method="GET",endpoint="/api/v3/assets/{id}",' \
+               'status="200"} 2' in text
+        assert 'zmlp_client_request_duration_seconds_bucket{method="GET",' \
+               'endpoint="/api/v3/assets/{id}",le="0.1"} 1' in text
+        assert 'zmlp_client_request_duration_seconds_bucket{method="GET",' \
+               'endpoint="/api/v3/assets/{id}",le="+Inf"} 2' in text
+        assert 'zmlp_client_request_duration_seconds_count{method="GET",' \
+               'endpoint="/api/v3/assets/{id}"} 2' in text
+        assert 'zmlp_client_request_phase_seconds_sum{method="GET",' \
+               'endpoint="/api/v3/assets/{id}",phase="network"} 0.52' in text
+        assert '# TYPE zmlp_client_limiter_window gauge' in text
+        assert 'zmlp_client_limiter_queued 0' in text
+
+
+class InstrumentHandler(BaseHTTPRequestHandler):
+    """Echos the request, replies 503 to the first request to /flaky."""
+
+    flaky = True
+
+    def log_message(self, *args):
+        pass
+
+    def _handle(self):
+        data = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.path.startswith('/api/v3/missing'):
+            status = 404
+        elif self.path.startswith('/api/v3/flaky') and InstrumentHandler.flaky:
+            InstrumentHandler.flaky = False
+            status = 503
+        else:
+            status = 200
+        body = json.dumps({'size': len(data), 'padding': 'x' * 100}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = _handle
+
+
+class ClientInstrumentationTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = LocalServer(InstrumentHandler).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        InstrumentHandler.flaky = True
+        self.events = []
+        self.client = ZmlpClient(key_dict, self.server.url,
+                                 retry_policy=RetryPolicy(base_delay=0, max_delay=0))
+        self.client.instrumentation.add_hooks(on_end=self.events.append)
+
+    def test_post(self):
+        rsp = self.client.post('/api/v3/assets/dd0KZtqyec48n1q1fniqVMV5yllhRRGx/_foo',
+                               {'a': 'b' * 100})
+        event = self.events[0]
+        assert 1 == len(self.events)
+        assert 'POST' == event.method
+        assert '/api/v3/assets/{id}/_foo' == event.endpoint
+        assert 200 == event.status
+        assert rsp['size'] == event.request_bytes
+        assert event.response_bytes > 100
+        assert event.serialize_time > 0
+        assert event.network_time > 0
+        assert event.parse_time > 0
+        assert event.duration >= event.network_time
+        assert 0 == event.retries
+        assert event.error is None
+
+    def test_retries(self):
+        self.client.get('/api/v3/flaky')
+        assert 1 == self.events[0].retries
+        assert 200 == self.events[0].status
+
+    def test_error(self):
+        with self.assertRaises(ZmlpNotFoundException):
+            self.client.get('/api/v3/missing')
+        assert 404 == self.events[0].status
+        assert isinstance(self.events[0].error, ZmlpNotFoundException)
+
+    def test_streamed_request(self):
+        list(self.client.stream_text('/api/v3/foo'))
+        assert 1 == len(self.events)
+        assert '/api/v3/foo' == self.events[0].endpoint
+        assert self.events[0].response_bytes > 100
+
+    def test_histograms(self):
+        histograms = self.client.instrumentation.enable_histograms()
+        self.client.get('/api/v3/foo')
+        self.client.get('/api/v3/foo')
+        text = to_prometheus(histograms, self.client.limiter)
+        assert 'zmlp_client_requests_total{method="GET",endpoint="/api/v3/foo",' \
+               'status="200"} 2' in text
+
+    def test_disabled_skips_instrumentation(self):
+        client = ZmlpClient(key_dict, self.server.url)
+        with patch.object(Instrumentation, 'start') as start_patch:
+            client.get('/api/v3/foo')
+            client.stream_text('/api/v3/foo')
+        assert not start_patch.called
@@ -0,0 +1,165 @@
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler
+from unittest.mock import patch
+
+from zmlp import ZmlpApp
+from zmlp.client import ZmlpClient
+from zmlp.lanes import Lane, BULK, INTERACTIVE, current_lane
+from zmlp.search import AssetSearchScroller
+from .util import LocalServer
+
+key_dict = {
+    'projectId': 'A5BAFAAA-42FD-45BE-9FA2-92670AB4DA80',
+    'accessKey': 'test123test135',
+    'secretKey': 'test123test135'
+}
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+    """Serves files slowly and JSON quickly, and tracks the files in flight."""
+
+    lock = threading.Lock()
+    in_flight = 0
+    max_in_flight = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.startswith('/api/v3/files/_stream/'):
+            cls = SlowHandler
+            with cls.lock:
+                cls.in_flight += 1
+                cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+            time.sleep(0.2)
+            with cls.lock:
+                cls.in_flight -= 1
+            body = b'x' * 100
+        else:
+            body = b'{"id": "abc"}'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class LaneTests(unittest.TestCase):
+
+    def test_default_lanes(self):
+        client = ZmlpClient(key_dict, 'http://localhost:9999')
+        assert {INTERACTIVE, BULK} == set(client.lanes)
+        assert client.limiter is client.lanes[INTERACTIVE].limiter
+        assert client.lanes[BULK].limiter is not client.limiter
+        assert client.lanes[INTERACTIVE] is client.get_lane()
+
+    def test_custom_lanes(self):
+        reports = Lane('reports', concurrency=2)
+        client = ZmlpClient(key_dict, 'http://localhost:9999',
+                            lanes=[reports, Lane(BULK, concurrency=1)])
+        assert reports is client.get_lane('reports')
+        assert 1 == client.get_lane(BULK).limiter.window.max_limit
+        assert 2 == reports.pool_maxsize
+
+    def test_limiter_disabled(self):
+        client = ZmlpClient(key_dict, 'http://localhost:9999', limiter=False)
+        assert not client.lanes[INTERACTIVE].limiter
+        assert not client.lanes[BULK].limiter
+
+    def test_unknown_lane(self):
+        client = ZmlpClient(key_dict, 'http://localhost:9999')
+        self.assertRaises(ValueError, client.lane, 'nope')
+        self.assertRaises(ValueError, client.get_lane, 'nope')
+
+    def test_context_manager(self):
+        client = ZmlpClient(key_dict, 'http://localhost:9999')
+        assert current_lane() is None
+        with client.lane(BULK):
+            assert client.lanes[BULK] is client.get_lane()
+            with client.lane(None):
+                assert BULK == current_lane()
+        assert current_lane() is None
+
+
+class ClientLaneTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = LocalServer(SlowHandler).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        SlowHandler.max_in_flight = 0
+        self.client = ZmlpClient(key_dict, self.server.url, single_flight=False,
+                                 lanes=[Lane(BULK, concurrency=2)])
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_separate_pools(self):
+        self.client.get('/api/v3/things/abc')
+        assert {} == self.client._lane_sessions
+        self.client.download_bytes('/api/v3/files/_stream/a.jpg')
+        assert [BULK] == list(self.client._lane_sessions)
+        assert self.client.session is not self.client._lane_sessions[BULK]
+        self.client.close()
+        assert {} == self.client._lane_sessions
+
+    def test_override_per_call(self):
+        self.client.download_bytes('/api/v3/files/_stream/a.jpg', lane=INTERACTIVE)
+        assert {} == self.client._lane_sessions
+        self.client.get('/api/v3/things/abc', lane=BULK)
+        assert [BULK] == list(self.client._lane_sessions)
+
+    def test_override_with_context_manager(self):
+        with self.client.lane(INTERACTIVE):
+            self.client.download_bytes('/api/v3/files/_stream/a.jpg')
+        assert {} == self.client._lane_sessions
+
+    def test_bulk_budget_does_not_block_interactive(self):
+        threads = [threading.Thread(target=self.client.download_bytes,
+                                    args=('/api/v3/files/_stream/{}.jpg'.format(i),))
+                   for i in range(6)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.05)
+        start = time.monotonic()
+        assert {'id': 'abc'} == self.client.get('/api/v3/things/abc')
+        assert time.monotonic() - start < 0.15
+        for thread in threads:
+            thread.join()
+        assert 2 == SlowHandler.max_in_flight
+
+
+class ScrollLaneTests(unittest.TestCase):
+
+    def setUp(self):
+        self.app = ZmlpApp(key_dict, 'http://localhost:9999')
+        self.lanes = []
+
+        def post(*args, **kwargs):
+            self.lanes.append(current_lane())
+            return {'_scroll_id': 'abc', 'hits': {'hits': []}}
+        self.post = post
+
+    @patch.object(ZmlpClient, 'delete')
+    @patch.object(ZmlpClient, 'post')
+    def test_scroll_defaults_to_bulk(self, post_patch, del_patch):
+        post_patch.side_effect = self.post
+        del_patch.side_effect = self.post
+        list(AssetSearchScroller(self.app, {}))
+        assert [BULK, BULK, BULK] == self.lanes
+
+    @patch.object(ZmlpClient, 'delete')
+    @patch.object(ZmlpClient, 'post')
+    def test_scroll_override(self, post_patch, del_patch):
+        post_patch.side_effect = self.post
+        del_patch.side_effect = self.post
+        list(self.app.assets.scroll_search({}, lane=INTERACTIVE))
+        with self.app.client.lane(INTERACTIVE):
+            list(AssetSearchScroller(self.app, {}))
+        assert [INTERACTIVE] * 6 == self.lanes
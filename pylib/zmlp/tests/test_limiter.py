@@ -0,0 +1,316 @@
+import asyncio
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler
+
+import requests
+
+from zmlp.client import ZmlpClient, ZmlpDeadlineExceededException
+from zmlp.limiter import AdaptiveLimiter, ConcurrencyWindow, SUGGESTED_RATE_LIMITS, TokenBucket, \
+    endpoint_class
+from zmlp.retry import RetryPolicy
+from zmlp.timeouts import Deadline, deadline
+from .util import LocalServer
+
+key_dict = {
+    'projectId': 'A5BAFAAA-42FD-45BE-9FA2-92670AB4DA80',
+    'accessKey': 'test123test135',
+    'secretKey': 'test123test135'
+}
+
+
+class EndpointClassTests(unittest.TestCase):
+
+    def test_endpoint_class(self):
+        assert 'download' == endpoint_class('GET', '/api/v3/files/_stream/assets/1/x.jpg')
+        assert 'upload' == endpoint_class('POST', '/api/v3/assets/_batch_upload')
+        assert 'upload' == endpoint_class('PUT', '/api/v3/assets/_chunked_upload/1/0')
+        assert 'upload' == endpoint_class('POST', '/ml/v1/sim-hash')
+        assert 'search' == endpoint_class('POST', '/api/v3/assets/_search')
+        assert 'search' == endpoint_class('POST', '/api/v3/assets/_search/scroll')
+        assert 'default' == endpoint_class('GET', '/api/v3/assets/123')
+
+
+class TokenBucketTests(unittest.TestCase):
+
+    def test_burst_then_rate(self):
+        bucket = TokenBucket(10, 3)
+        assert [0, 0, 0] == [bucket.reserve() for _ in range(3)]
+        assert 0.09 < bucket.reserve() <= 0.1
+        assert 0.19 < bucket.reserve() <= 0.2
+
+    def test_refill(self):
+        bucket = TokenBucket(1000, 2)
+        bucket.reserve()
+        bucket.reserve()
+        time.sleep(0.01)
+        assert 0 == bucket.reserve()
+        assert bucket.tokens <= 2
+
+
+class ConcurrencyWindowTests(unittest.TestCase):
+
+    def test_grows_while_latency_stable(self):
+        window = ConcurrencyWindow(initial=4, max_limit=6)
+        for _ in range(100):
+            window.feedback(time.monotonic(), 0.01, False)
+        assert 6 == window.limit
+
+    def test_no_growth_when_latency_rises(self):
+        window = ConcurrencyWindow(initial=4)
+        window.feedback(time.monotonic(), 0.01, False)
+        for _ in range(20):
+            window.feedback(time.monotonic(), 1.0, False)
+        limit = window.limit
+        window.feedback(time.monotonic(), 1.0, False)
+        assert limit == window.limit
+
+    def test_decrease_on_congestion(self):
+        window = ConcurrencyWindow(initial=16)
+        started = time.monotonic()
+        window.feedback(started, 0.01, True)
+        assert 8 == window.limit
+        # Requests sent before the decrease don't decrease it again.
+        window.feedback(started, 0.01, True)
+        assert 8 == window.limit
+        window.feedback(time.monotonic(), 0.01, True)
+        assert 4 == window.limit
+        assert 2 == window.decreases
+
+    def test_min_limit(self):
+        window = ConcurrencyWindow(initial=2, min_limit=1)
+        for _ in range(5):
+            window.feedback(time.monotonic(), 0.01, True)
+        assert 1 == window.limit
+
+    def test_acquire_blocks_when_full(self):
+        window = ConcurrencyWindow(initial=1)
+        window.acquire()
+        acquired = threading.Event()
+
+        def worker():
+            window.acquire()
+            acquired.set()
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        time.sleep(0.05)
+        assert not acquired.is_set()
+        assert 1 == window.queued
+
+        window.release()
+        assert acquired.wait(1)
+        thread.join()
+        assert 1 == window.in_flight
+        assert 0 == window.queued
+
+    def test_acquire_async(self):
+        window = ConcurrencyWindow(initial=2)
+        peak = []
+
+        async def task():
+            await window.acquire_async()
+            peak.append(window.in_flight)
+            await asyncio.sleep(0.01)
+            window.release()
+
+        async def run():
+            await asyncio.gather(*[task() for _ in range(10)])
+
+        asyncio.run(run())
+        assert 2 == max(peak)
+        assert 0 == window.in_flight
+
+    def test_acquire_async_cancelled(self):
+        window = ConcurrencyWindow(initial=1)
+
+        async def run():
+            await window.acquire_async()
+            waiter = asyncio.ensure_future(window.acquire_async())
+            await asyncio.sleep(0.01)
+            waiter.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await waiter
+            assert 0 == window.queued
+            window.release()
+
+        asyncio.run(run())
+        assert 0 == window.in_flight
+
+    def test_acquire_timeout(self):
+        window = ConcurrencyWindow(initial=1)
+        assert window.acquire(0.01)
+        start = time.monotonic()
+        assert not window.acquire(0.05)
+        assert time.monotonic() - start >= 0.05
+        assert 0 == window.queued
+        assert 1 == window.in_flight
+
+    def test_acquire_async_timeout(self):
+        window = ConcurrencyWindow(initial=1)
+
+        async def run():
+            assert await window.acquire_async(0.01)
+            assert not await window.acquire_async(0.05)
+            assert 0 == window.queued
+            window.release()
+            assert await window.acquire_async(0.01)
+
+        asyncio.run(run())
+        assert 1 == window.in_flight
+
+
+class AdaptiveLimiterTests(unittest.TestCase):
+
+    def test_acquire_deadline(self):
+        limiter = AdaptiveLimiter(window=ConcurrencyWindow(initial=1))
+        limiter.acquire('get', '/api/v3/foo')
+        with self.assertRaises(ZmlpDeadlineExceededException):
+            limiter.acquire('get', '/api/v3/foo', Deadline(0.05))
+        with deadline(0.05):
+            self.assertRaises(ZmlpDeadlineExceededException, limiter.acquire,
+                              'get', '/api/v3/foo')
+        assert 0 == limiter.stats()['queued']
+
+    def test_acquire_async_deadline(self):
+        limiter = AdaptiveLimiter(window=ConcurrencyWindow(initial=1))
+
+        async def run():
+            await limiter.acquire_async('get', '/api/v3/foo')
+            with deadline(0.05):
+                with self.assertRaises(ZmlpDeadlineExceededException):
+                    await limiter.acquire_async('get', '/api/v3/foo')
+
+        asyncio.run(run())
+        assert 1 == limiter.stats()['in_flight']
+
+    def test_rate_limit_deadline(self):
+        limiter = AdaptiveLimiter(rate_limits={'default': (1, 1)})
+        limiter.acquire('get', '/api/v3/foo').release()
+        start = time.monotonic()
+        with self.assertRaises(ZmlpDeadlineExceededException):
+            limiter.acquire('get', '/api/v3/foo', Deadline(0.1))
+        # There is no point waiting for a token which arrives too late.
+        assert time.monotonic() - start < 0.1
+
+
+class LimiterHandler(BaseHTTPRequestHandler):
+    """Replies with the statuses in the 'statuses' list, then 200."""
+
+    statuses = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        status = self.statuses.pop(0) if self.statuses else 200
+        body = b'{"ok": true}'
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class ClientLimiterTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = LocalServer(LimiterHandler).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        LimiterHandler.statuses = []
+        self.limiter = AdaptiveLimiter(window=ConcurrencyWindow(initial=8))
+        self.client = ZmlpClient(key_dict, self.server.url, limiter=self.limiter,
+                                 retry_policy=RetryPolicy(base_delay=0, max_delay=0))
+
+    def test_window_shrinks_on_429(self):
+        LimiterHandler.statuses = [429, 503]
+        assert {'ok': True} == self.client.get('/api/v3/foo')
+        stats = self.limiter.stats()
+        assert stats['window'] < 4
+        assert 2 == stats['decreases']
+        assert 0 == stats['in_flight']
+
+    def test_window_grows(self):
+        for _ in range(20):
+            self.client.get('/api/v3/foo')
+        stats = self.limiter.stats()
+        assert stats['window'] > 8
+        assert stats['latency'] is not None
+
+    def test_streamed_response_releases_slot(self):
+        rsp = self.client._send('get', self.client.get_url('/api/v3/files/_stream/foo'),
+                                stream=True)
+        assert 0 == self.limiter.stats()['in_flight']
+        rsp.close()
+        assert 0 == self.limiter.stats()['in_flight']
+
+    def test_request_while_streaming(self):
+        limiter = AdaptiveLimiter(window=ConcurrencyWindow(initial=1, max_limit=1))
+        client = ZmlpClient(key_dict, self.server.url, limiter=limiter)
+        with client.deadline(1):
+            rsp = client._send('get', client.get_url('/api/v3/files/_stream/foo'), stream=True)
+            assert {'ok': True} == client.get('/api/v3/foo')
+            rsp.close()
+
+    def test_deadline_waiting_for_slot(self):
+        limiter = AdaptiveLimiter(window=ConcurrencyWindow(initial=1, max_limit=1))
+        client = ZmlpClient(key_dict, self.server.url, limiter=limiter,
+                            operation_deadline=0.1)
+        permit = limiter.acquire('get', '/api/v3/foo')
+        self.assertRaises(ZmlpDeadlineExceededException, client.get, '/api/v3/foo')
+        permit.release()
+        assert {'ok': True} == client.get('/api/v3/foo')
+        assert 0 == limiter.stats()['in_flight']
+
+    def test_connection_error_releases_slot(self):
+        client = ZmlpClient(key_dict, 'http://127.0.0.1:1', limiter=self.limiter,
+                            retry_policy=RetryPolicy(max_attempts=1))
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            client._send('get', 'http://127.0.0.1:1/api/v3/foo')
+        assert 0 == self.limiter.stats()['in_flight']
+
+    def test_not_rate_limited_by_default(self):
+        client = ZmlpClient(key_dict, self.server.url)
+        assert {} == client.limiter.buckets
+        assert {} == client.get_lane('bulk').limiter.buckets
+        limiter = AdaptiveLimiter(SUGGESTED_RATE_LIMITS)
+        assert 10 == limiter.buckets['upload'].rate
+
+    def test_rate_limited(self):
+        limiter = AdaptiveLimiter(rate_limits={'default': (50, 1)})
+        client = ZmlpClient(key_dict, self.server.url, limiter=limiter)
+        start = time.monotonic()
+        for _ in range(4):
+            client.get('/api/v3/foo')
+        assert time.monotonic() - start >= 0.05
+
+    def test_shared_by_thread_pool(self):
+        limiter = AdaptiveLimiter(window=ConcurrencyWindow(initial=2, max_limit=2))
+        client = ZmlpClient(key_dict, self.server.url, limiter=limiter, single_flight=False)
+        peak = []
+        release = limiter.window.release
+
+        def tracking_release():
+            peak.append(limiter.window.in_flight)
+            release()
+
+        limiter.window.release = tracking_release
+        threads = [threading.Thread(target=client.get, args=('/api/v3/foo',))
+                   for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert 10 == len(peak)
+        assert max(peak) <= 2
+
+    def test_disabled(self):
+        client = ZmlpClient(key_dict, self.server.url, limiter=False)
+        assert {'ok': True} == client.get('/api/v3/foo')
@@ -0,0 +1,132 @@
+import asyncio
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler
+
+from zmlp import ZmlpApp, AsyncZmlpApp
+from zmlp.client import ZmlpNotFoundException, ZmlpInvalidRequestException
+from zmlp.loader import AssetLoader
+from .util import LocalServer
+
+key_dict = {
+    'projectId': 'A5BAFAAA-42FD-45BE-9FA2-92670AB4DA80',
+    'accessKey': 'test123test135',
+    'secretKey': 'test123test135'
+}
+
+
+class SearchHandler(BaseHTTPRequestHandler):
+    """Returns a hit for every requested id which doesn't start with 'missing'."""
+
+    searches = []
+    status = 200
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        ids = body['query']['terms']['_id']
+        self.searches.append(ids)
+        if self.status != 200:
+            rsp = {'message': 'bad request'}
+        else:
+            rsp = {'hits': {'hits': [{'_id': i, '_source': {'source': {'filename': i}}}
+                                     for i in ids if not i.startswith('missing')]}}
+        data = json.dumps(rsp).encode()
+        self.send_response(self.status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class AssetLoaderTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = LocalServer(SearchHandler).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        SearchHandler.searches = []
+        SearchHandler.status = 200
+        self.app = ZmlpApp(key_dict, self.server.url, asset_batch_window=0.05)
+
+    def load_concurrently(self, ids):
+        results = {}
+
+        def load(i, asset_id):
+            try:
+                results[i] = self.app.assets.get_asset(asset_id)
+            except Exception as e:
+                results[i] = e
+
+        threads = [threading.Thread(target=load, args=(i, asset_id))
+                   for i, asset_id in enumerate(ids)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return [results[i] for i in range(len(ids))]
+
+    def test_disabled_by_default(self):
+        assert ZmlpApp(key_dict, self.server.url).assets.loader is None
+
+    def test_coalesced(self):
+        ids = ['a', 'b', 'c', 'a', 'b', 'd']
+        assets = self.load_concurrently(ids)
+        assert ids == [asset.id for asset in assets]
+        assert 'c' == assets[2].get_attr('source.filename')
+        assert 1 == len(SearchHandler.searches)
+        assert ['a', 'b', 'c', 'd'] == sorted(SearchHandler.searches[0])
+        assert 6 == self.app.assets.loader.lookups
+        assert 1 == self.app.assets.loader.batches_sent
+
+    def test_duplicates_get_own_asset(self):
+        assets = self.load_concurrently(['a', 'a'])
+        assert 1 == len(SearchHandler.searches)
+        assert assets[0] is not assets[1]
+        assets[0].set_attr('source.filename', 'changed')
+        assert 'changed' != assets[1].get_attr('source.filename')
+
+    def test_max_batch_size(self):
+        self.app.assets.loader = AssetLoader(self.app, window=0.05, max_batch_size=2)
+        assets = self.load_concurrently(['a', 'b', 'c', 'd', 'e'])
+        assert ['a', 'b', 'c', 'd', 'e'] == [asset.id for asset in assets]
+        assert [2, 2, 1] == sorted((len(ids) for ids in SearchHandler.searches), reverse=True)
+
+    def test_missing(self):
+        results = self.load_concurrently(['a', 'missing'])
+        assert 'a' == results[0].id
+        assert isinstance(results[1], ZmlpNotFoundException)
+        assert 404 == results[1].status
+
+    def test_error_raised_for_every_caller(self):
+        SearchHandler.status = 400
+        results = self.load_concurrently(['a', 'b'])
+        assert all(isinstance(result, ZmlpInvalidRequestException) for result in results)
+
+    def test_sequential(self):
+        assert 'a' == self.app.assets.get_asset('a').id
+        assert 'b' == self.app.assets.get_asset('b').id
+        assert [['a'], ['b']] == SearchHandler.searches
+
+    def test_async(self):
+        async def run():
+            async with AsyncZmlpApp(key_dict, self.server.url, asset_batch_window=0.01,
+                                    asset_batch_size=3) as app:
+                return await asyncio.gather(
+                    *[app.assets.get_asset(i) for i in ['a', 'b', 'a', 'c', 'd', 'missing']],
+                    return_exceptions=True)
+
+        results = asyncio.run(run())
+        assert ['a', 'b', 'a', 'c', 'd'] == [asset.id for asset in results[:5]]
+        assert results[0] is not results[2]
+        assert results[0].document is not results[2].document
+        assert isinstance(results[5], ZmlpNotFoundException)
+        assert [['a', 'b', 'c'], ['d', 'missing']] == SearchHandler.searches
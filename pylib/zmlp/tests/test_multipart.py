@@ -0,0 +1,216 @@
+import email.parser
+import email.policy
+import io
+import json
+import os
+import tempfile
+import unittest
+from http.server import BaseHTTPRequestHandler
+from unittest.mock import patch
+
+from zmlp.client import ZmlpClient, to_json
+from zmlp.multipart import MultipartEncoder
+from .util import LocalServer
+
+key_dict = {
+    'projectId': 'A5BAFAAA-42FD-45BE-9FA2-92670AB4DA80',
+    'accessKey': 'test123test135',
+    'secretKey': 'test123test135'
+}
+
+
+def parse(content_type, body):
+    """Parse a multipart body into a list of (name, filename, content type, data)."""
+    msg = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+        b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + body)
+    return [(part.get_param('name', header='content-disposition'),
+             part.get_filename(),
+             part.get('Content-Type'),
+             part.get_payload(decode=True)) for part in msg.iter_parts()]
+
+
+def write_temp_file(data, suffix='.jpg'):
+    fd, path = tempfile.mkstemp(suffix)
+    with os.fdopen(fd, 'wb') as fp:
+        fp.write(data)
+    return path
+
+
+class MultipartEncoderTests(unittest.TestCase):
+
+    def setUp(self):
+        self.data1 = os.urandom(200000)
+        self.data2 = os.urandom(1000)
+        self.path1 = write_temp_file(self.data1)
+        self.path2 = write_temp_file(self.data2)
+
+    def tearDown(self):
+        os.unlink(self.path1)
+        os.unlink(self.path2)
+
+    def test_encode(self):
+        encoder = MultipartEncoder()
+        encoder.add_file('files', self.path1)
+        encoder.add_file('files', self.path2, content_type='image/jpeg')
+        encoder.add_field('body', '{"a": 1}', content_type='application/json')
+
+        body = encoder.read()
+        assert encoder.len == len(body)
+        parts = parse(encoder.content_type, body)
+        assert ('files', os.path.basename(self.path1),
+                'application/octet-stream', self.data1) == parts[0]
+        assert ('files', os.path.basename(self.path2), 'image/jpeg', self.data2) == parts[1]
+        assert ('body', None, 'application/json', b'{"a": 1}') == parts[2]
+
+    def test_read_in_chunks(self):
+        progress = []
+        encoder = MultipartEncoder(chunk_size=4096, callback=lambda *args: progress.append(args))
+        encoder.add_file('files', self.path1)
+
+        chunks = list(encoder)
+        assert all(len(chunk) <= 4096 for chunk in chunks)
+        assert encoder.len == sum(len(chunk) for chunk in chunks)
+        assert (encoder.len, encoder.len) == progress[-1]
+        assert len(chunks) == len(progress)
+
+    def test_files_opened_one_at_a_time(self):
+        encoder = MultipartEncoder(chunk_size=1024)
+        encoder.add_file('files', self.path1)
+        encoder.add_file('files', self.path2)
+        opened = []
+
+        def tracking_open(*args, **kwargs):
+            handle = open(*args, **kwargs)
+            opened.append(handle)
+            return handle
+
+        with patch('zmlp.multipart.open', side_effect=tracking_open, create=True):
+            assert [] == opened
+            encoder.read(1024)
+            assert 1 == len(opened)
+            while encoder.read(1024):
+                assert sum(not h.closed for h in opened) <= 1
+        assert 2 == len(opened)
+        assert all(h.closed for h in opened)
+
+    def test_close_closes_open_file(self):
+        encoder = MultipartEncoder(chunk_size=1024)
+        encoder.add_file('files', self.path1)
+        encoder.read(5000)
+        handle = encoder._chunks.gi_frame.f_locals['handle']
+        assert not handle.closed
+        encoder.close()
+        assert handle.closed
+
+    def test_seek_to_start(self):
+        encoder = MultipartEncoder()
+        encoder.add_file('files', self.path1)
+        first = encoder.read(1000)
+        encoder.seek(0)
+        assert 0 == encoder.bytes_read
+        body = encoder.read()
+        assert body.startswith(first)
+        assert encoder.len == len(body)
+        with self.assertRaises(io.UnsupportedOperation):
+            encoder.seek(10)
+
+    def test_file_handle(self):
+        with open(self.path1, 'rb') as handle:
+            handle.read(100)
+            encoder = MultipartEncoder()
+            encoder.add_file('files', handle)
+            assert encoder.len is not None
+            parts = parse(encoder.content_type, encoder.read())
+            assert self.data1[100:] == parts[0][3]
+            assert not handle.closed
+
+    def test_unknown_length(self):
+        read_fd, write_fd = os.pipe()
+        os.write(write_fd, b'piped data')
+        os.close(write_fd)
+        with os.fdopen(read_fd, 'rb') as handle:
+            encoder = MultipartEncoder()
+            encoder.add_file('files', handle, filename='pipe.bin')
+            assert encoder.len is None
+            parts = parse(encoder.content_type, encoder.read())
+            assert ('files', 'pipe.bin', 'application/octet-stream', b'piped data') == parts[0]
+
+    def test_quoted_filename(self):
+        encoder = MultipartEncoder()
+        encoder.add_field('body', b'x', filename='a"b.txt')
+        assert b'filename="a%22b.txt"' in encoder.read()
+
+
+class UploadHandler(BaseHTTPRequestHandler):
+    """Echos the multipart request back as JSON."""
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        if self.headers.get('Transfer-Encoding') == 'chunked':
+            body = b''
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                chunk = self.rfile.read(size + 2)
+                if not size:
+                    break
+                body += chunk[:-2]
+            length = None
+        else:
+            length = int(self.headers['Content-Length'])
+            body = self.rfile.read(length)
+
+        parts = parse(self.headers['Content-Type'], body)
+        rsp = json.dumps({
+            'length': length,
+            'parts': [[name, filename, len(data)] for name, filename, _, data in parts]
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(rsp)))
+        self.end_headers()
+        self.wfile.write(rsp)
+
+
+class UploadTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = LocalServer(UploadHandler).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.client = ZmlpClient(key_dict, self.server.url)
+        self.path = write_temp_file(os.urandom(300000))
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def test_upload_files(self):
+        progress = []
+        with open(self.path, 'rb') as handle:
+            rsp = self.client.upload_files('/api/v3/assets/_batch_upload',
+                                           [self.path, handle], {'assets': []},
+                                           progress=lambda *args: progress.append(args))
+        name = os.path.basename(self.path)
+        assert [['files', name, 300000], ['files', name, 300000],
+                ['body', '', 13]] == rsp['parts']
+        assert rsp['length'] == progress[-1][0] == progress[-1][1]
+        assert rsp['length'] == self.client.transfer_stats.stats()['request_bytes_wire']
+
+    def test_upload_file(self):
+        rsp = self.client.upload_file('/api/v3/files/_upload', self.path, {'a': 1})
+        assert [['file', os.path.basename(self.path), 300000],
+                ['body', None, len(to_json({'a': 1}))]] == rsp['parts']
+
+    def test_upload_chunked(self):
+        read_fd, write_fd = os.pipe()
+        os.write(write_fd, b'x' * 5000)
+        os.close(write_fd)
+        with os.fdopen(read_fd, 'rb') as handle:
+            rsp = self.client.upload_files('/ml/v1/sim-hash', [handle], None)
+        assert rsp['length'] is None
+        assert [['files', 'file', 5000]] == rsp['parts']
@@ -0,0 +1,240 @@
+import socket
+import struct
+import unittest
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler
+from time import time
+from unittest.mock import patch, MagicMock
+
+import requests
+import urllib3
+
+from zmlp import ZmlpApp, ZmlpClient
+from zmlp.client import ZmlpRequestException
+from zmlp.emulator import Corpus, Emulator
+from zmlp.retry import RetryPolicy, parse_retry_after
+from .util import LocalServer
+
+key_dict = {
+    'accessKey': 'A5BAFAAA-42FD-45BE-9FA2-92670AB4DA80',
+    'secretKey': 'test123test135'
+}
+
+
+def connect_error():
+    """A ConnectionError like the one requests raises when a connection is refused."""
+    reason = urllib3.exceptions.NewConnectionError(None, 'Connection refused')
+    return requests.exceptions.ConnectionError(
+        urllib3.exceptions.MaxRetryError(None, '/', reason))
+
+
+class ResetHandler(BaseHTTPRequestHandler):
+    """Reads each request, then resets the connection without responding."""
+
+    protocol_version = 'HTTP/1.1'
+    requests = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        type(self).requests += 1
+        self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+        self.close_connection = True
+
+    do_PUT = do_POST
+
+
+def mock_response(status, headers=None, body=b'{"success": true}'):
+    rsp = MagicMock()
+    rsp.status_code = status
+    rsp.headers = headers or {}
+    rsp.content = body
+    rsp.json.return_value = {'success': True, 'message': 'error'}
+    return rsp
+
+
+class RetryPolicyTests(unittest.TestCase):
+
+    def test_retryable_status(self):
+        policy = RetryPolicy()
+        assert policy.is_retryable_status(502, True)
+        assert not policy.is_retryable_status(502, False)
+        assert policy.is_retryable_status(503, False)
+        assert policy.is_retryable_status(429, False)
+        assert not policy.is_retryable_status(404, True)
+
+    def test_retryable_error(self):
+        policy = RetryPolicy()
+        assert policy.is_retryable_error(connect_error(), False)
+        assert not policy.is_retryable_error(requests.exceptions.ConnectionError(), False)
+        assert policy.is_retryable_error(requests.exceptions.ConnectionError(), True)
+        assert policy.is_retryable_error(ConnectionRefusedError(), False)
+        assert not policy.is_retryable_error(ConnectionResetError(), False)
+        assert policy.is_retryable_error(requests.exceptions.ReadTimeout(), True)
+        assert not policy.is_retryable_error(requests.exceptions.ReadTimeout(), False)
+        assert not policy.is_retryable_error(ValueError(), True)
+
+    def test_decorrelated_jitter_bounds(self):
+        policy = RetryPolicy(base_delay=1, max_delay=10)
+        delay = 0
+        for _ in range(100):
+            delay = policy.compute_delay(delay)
+            assert 1 <= delay <= 10
+
+    def test_max_attempts(self):
+        policy = RetryPolicy(max_attempts=2)
+        state = policy.begin('get')
+        state.attempt()
+        assert state.retry_delay(status=503) is not None
+        state.attempt()
+        assert state.retry_delay(status=503) is None
+        stats = policy.stats()
+        assert 2 == stats['attempts']
+        assert 1 == stats['retries']
+        assert 1 == stats['giveups']
+        assert 2 == stats['reasons']['503']
+
+    def test_deadline(self):
+        policy = RetryPolicy(max_attempts=0, base_delay=5, deadline=1)
+        state = policy.begin('get')
+        state.attempt()
+        assert state.retry_delay(status=503) is None
+
+    def test_idempotent_override(self):
+        policy = RetryPolicy()
+        state = policy.begin('post', idempotent=True)
+        state.attempt()
+        assert state.retry_delay(status=502) is not None
+
+    def test_read_only_endpoints(self):
+        policy = RetryPolicy()
+        assert policy.is_idempotent('post', '/api/v3/assets/_search')
+        assert policy.is_idempotent('post', 'https://localhost/api/v3/assets/_search/scroll')
+        assert policy.is_idempotent('post', '/api/v1/jobs/_find_one')
+        assert not policy.is_idempotent('post', '/api/v3/assets/_search/reprocess')
+        assert not policy.is_idempotent('post', '/api/v3/assets/_batch_create')
+        state = policy.begin('post', url='/api/v1/jobs/_search')
+        state.attempt()
+        assert state.retry_delay(status=502) is not None
+
+    def test_retry_after(self):
+        policy = RetryPolicy(max_delay=10)
+        state = policy.begin('get')
+        state.attempt()
+        assert 7 == state.retry_delay(status=429, headers={'Retry-After': '7'})
+
+    def test_retry_after_longer_than_max_delay(self):
+        policy = RetryPolicy()
+        state = policy.begin('get')
+        state.attempt()
+        assert state.retry_delay(status=429, headers={'Retry-After': '3600'}) is None
+        assert {'429': 1} == policy.stats()['reasons']
+
+    def test_parse_retry_after_date(self):
+        value = parse_retry_after({'Retry-After': formatdate(time() + 30, usegmt=True)})
+        assert 25 < value <= 30
+        assert parse_retry_after({'Retry-After': 'garbage'}) is None
+        assert parse_retry_after({}) is None
+
+
+class ClientRetryTests(unittest.TestCase):
+
+    def setUp(self):
+        self.policy = RetryPolicy(max_attempts=3)
+        self.client = ZmlpClient(key_dict, 'https://localhost:9999',
+                                 retry_policy=self.policy)
+
+    @patch('zmlp.client.time.sleep')
+    @patch.object(requests.Session, 'request')
+    def test_retry_on_status(self, req_patch, sleep_patch):
+        req_patch.side_effect = [mock_response(503, {'Retry-After': '2'}), mock_response(200)]
+        assert self.client.get('/api/v1/foo')['success']
+        sleep_patch.assert_called_once_with(2.0)
+        assert 1 == self.policy.stats()['retries']
+
+    @patch('zmlp.client.time.sleep')
+    @patch.object(requests.Session, 'request')
+    def test_retry_on_connection_error(self, req_patch, sleep_patch):
+        req_patch.side_effect = [connect_error(), mock_response(200)]
+        assert self.client.post('/api/v1/foo', {})['success']
+        assert 2 == req_patch.call_count
+
+    @patch('zmlp.client.time.sleep')
+    @patch.object(requests.Session, 'request')
+    def test_post_not_retried_on_reset(self, req_patch, sleep_patch):
+        req_patch.side_effect = requests.exceptions.ConnectionError(
+            urllib3.exceptions.ProtocolError('Connection aborted.', ConnectionResetError()))
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            self.client.post('/api/v1/foo', {})
+        assert 1 == req_patch.call_count
+
+    @patch('zmlp.client.time.sleep')
+    @patch.object(requests.Session, 'request')
+    def test_post_not_retried_on_502(self, req_patch, sleep_patch):
+        req_patch.return_value = mock_response(502)
+        with self.assertRaises(ZmlpRequestException):
+            self.client.post('/api/v1/foo', {})
+        assert 1 == req_patch.call_count
+        sleep_patch.assert_not_called()
+
+    @patch('zmlp.client.time.sleep')
+    @patch.object(requests.Session, 'request')
+    def test_gives_up(self, req_patch, sleep_patch):
+        req_patch.side_effect = requests.exceptions.ConnectionError()
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            self.client.get('/api/v1/foo')
+        assert 3 == req_patch.call_count
+
+    @patch('zmlp.client.time.sleep')
+    @patch.object(requests.Session, 'request')
+    def test_upload_files_rewinds(self, req_patch, sleep_patch):
+        positions = []
+
+        def request(method, url, **kwargs):
+            encoder = kwargs['data']
+            positions.append(encoder.bytes_read)
+            bodies.append(encoder.read())
+            return mock_response(503 if len(positions) == 1 else 200)
+
+        bodies = []
+        req_patch.side_effect = request
+        self.client.upload_files('/api/v1/upload', [__file__], None)
+        assert [0, 0] == positions
+        assert bodies[0] == bodies[1]
+
+
+class ConnectionResetTests(unittest.TestCase):
+
+    def setUp(self):
+        ResetHandler.requests = 0
+        self.server = LocalServer(ResetHandler).start()
+        self.client = ZmlpClient(key_dict, self.server.url,
+                                 retry_policy=RetryPolicy(base_delay=0, max_delay=0))
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_post_sent_once(self):
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            self.client.post('/api/v3/assets/_batch_create', {'assets': []})
+        assert 1 == ResetHandler.requests
+
+    def test_idempotent_retried(self):
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            self.client.put('/api/v3/assets/_batch_update_labels', {'add': {}})
+        assert 3 == ResetHandler.requests
+
+
+class ReadOnlyRetryTests(unittest.TestCase):
+
+    def test_scroll_retried_after_502(self):
+        with Emulator(Corpus(size=50)) as emulator:
+            app = ZmlpApp(key_dict, emulator.url,
+                          retry_policy=RetryPolicy(base_delay=0, max_delay=0))
+            emulator.fail_next(502, path='_search/scroll')
+            emulator.fail_next(504, path='_search')
+            assert 50 == len(list(app.assets.scroll_search({'size': 20})))
+            assert 1 == emulator.stats.statuses[502]
+            assert 1 == emulator.stats.statuses[504]
@@ -1,12 +1,15 @@
+import copy
+import json
 import logging
 import unittest
 from unittest.mock import patch
 
 import pytest
 
-from zmlp import ZmlpClient, app_from_env, Asset
+from zmlp import ZmlpClient, app_from_env, Asset, ZmlpException
 from zmlp.search import AssetSearchScroller, AssetSearchResult, \
     SimilarityQuery, LabelConfidenceQuery
+from zmlp.streaming import StreamingSearchResponse
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
@@ -66,6 +69,84 @@ class AssetSearchScrollerTests(unittest.TestCase):
         assert results[0] == self.mock_search_result
 
 
+def streaming_response(result):
+    data = json.dumps(result).encode()
+    return StreamingSearchResponse([data[i:i + 100] for i in range(0, len(data), 100)])
+
+
+class StreamingAssetSearchScrollerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app_from_env()
+
+    @patch.object(ZmlpClient, 'delete')
+    @patch.object(ZmlpClient, 'post_streaming')
+    def test_iterate(self, post_patch, del_patch):
+        post_patch.side_effect = [streaming_response(mock_search_result),
+                                  streaming_response({"_scroll_id": "bob", "hits": {"hits": []}})]
+        del_patch.return_value = {}
+
+        scroller = AssetSearchScroller(self.app, {}, stream=True)
+        results = list(scroller)
+        assert 2 == len(results)
+        assert 'https://i.imgur.com/foo.jpg' == results[1].get_attr('source.path')
+        assert 'bob' == scroller.result['_scroll_id']
+        del_patch.assert_called_once_with('api/v3/assets/_search/scroll', {'scroll_id': 'bob'})
+
+    @patch.object(ZmlpClient, 'delete')
+    @patch.object(ZmlpClient, 'post_streaming')
+    def test_first_page_result(self, post_patch, del_patch):
+        post_patch.side_effect = [streaming_response(mock_search_result)]
+        del_patch.return_value = {}
+
+        scroller = AssetSearchScroller(self.app, {}, stream=True)
+        gen = scroller.scroll()
+        next(gen)
+        assert scroller.result is None
+        next(gen)
+        gen.close()
+        del_patch.assert_called_once_with('api/v3/assets/_search/scroll', {'scroll_id': 'bob'})
+
+    @patch.object(ZmlpClient, 'delete')
+    @patch.object(ZmlpClient, 'post_streaming')
+    def test_raises_on_no_scroll_id(self, post_patch, del_patch):
+        result = copy.deepcopy(mock_search_result)
+        del result['_scroll_id']
+        post_patch.side_effect = [streaming_response(result)]
+        with pytest.raises(ZmlpException):
+            list(AssetSearchScroller(self.app, {}, stream=True))
+        del_patch.assert_not_called()
+
+    def test_raw_response_not_supported(self):
+        with pytest.raises(ValueError):
+            AssetSearchScroller(self.app, {}, raw_response=True, stream=True)
+
+
+class StreamingAssetSearchResultTests(unittest.TestCase):
+
+    def setUp(self):
+        self.app = app_from_env()
+
+    @patch.object(ZmlpClient, 'post_streaming')
+    def test_iterate(self, post_patch):
+        post_patch.return_value = streaming_response(mock_search_result)
+        results = AssetSearchResult(self.app, {}, stream=True)
+        assets = list(results)
+        assert 2 == len(assets)
+        assert 2 == results.size
+        assert 100 == results.total_size
+        assert results.raw_response == mock_search_result
+        assert 2 == len(list(results))
+
+    @patch.object(ZmlpClient, 'post_streaming')
+    def test_properties_before_iterate(self, post_patch):
+        post_patch.return_value = streaming_response(mock_search_result)
+        results = AssetSearchResult(self.app, {}, stream=True)
+        assert 1 == results.aggregation("file_types")["buckets"][0]["doc_count"]
+        assert 2 == len(results.assets)
+        assert 2 == len(list(results))
+
+
 class AssetSearchResultTests(unittest.TestCase):
 
     def setUp(self):
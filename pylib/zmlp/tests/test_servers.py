@@ -0,0 +1,210 @@
+import json
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler
+from unittest.mock import patch
+
+import jwt
+
+from zmlp import ZmlpApp
+from zmlp.client import ZmlpClient
+from zmlp.servers import ServerPool, CLOSED, OPEN, HALF_OPEN
+from .util import LocalServer
+
+key_dict = {
+    'projectId': 'A5BAFAAA-42FD-45BE-9FA2-92670AB4DA80',
+    'accessKey': 'test123test135',
+    'secretKey': 'test123test135'
+}
+
+A = 'https://a.zvi.zorroa.com'
+B = 'https://b.zvi.zorroa.com'
+
+
+class ServerPoolTests(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = ServerPool([A, B], cooldown=0.05)
+
+    def states(self):
+        return [s['state'] for s in self.pool.stats()]
+
+    def test_requires_servers(self):
+        self.assertRaises(ValueError, ServerPool, [])
+
+    def test_prefers_untried_then_fastest(self):
+        assert A == self.pool.select()
+        self.pool.record(A, 0.2)
+        assert B == self.pool.select()
+        self.pool.record(B, 0.1)
+        assert B == self.pool.select()
+        for _ in range(10):
+            self.pool.record(B, 0.5)
+        assert A == self.pool.select()
+
+    def test_eject_after_consecutive_failures(self):
+        self.pool.record(A, failed=True)
+        self.pool.record(A, failed=True)
+        assert CLOSED == self.states()[0]
+        self.pool.record(A, failed=True)
+        assert [OPEN, CLOSED] == self.states()
+        assert B == self.pool.select()
+        assert not self.pool.has_alternative(B)
+        assert self.pool.has_alternative(A)
+
+    def test_eject_by_error_rate(self):
+        pool = ServerPool([A, B], failure_threshold=100, min_requests=4)
+        for _ in range(4):
+            pool.record(A, 0.1, failed=True)
+            pool.record(A, 0.1)
+        assert CLOSED == pool.stats()[0]['state']
+        for _ in range(3):
+            pool.record(A, failed=True)
+        assert OPEN == pool.stats()[0]['state']
+
+    def test_probe_recovers(self):
+        for _ in range(3):
+            self.pool.record(A, failed=True)
+        time.sleep(0.06)
+        assert A == self.pool.select()
+        assert HALF_OPEN == self.states()[0]
+        # Only one probe at a time.
+        assert B == self.pool.select()
+        self.pool.record(A, 0.01)
+        assert [CLOSED, CLOSED] == self.states()
+
+    def test_probe_failure_backs_off(self):
+        for _ in range(3):
+            self.pool.record(A, failed=True)
+        time.sleep(0.06)
+        assert A == self.pool.select()
+        self.pool.record(A, failed=True)
+        assert OPEN == self.states()[0]
+        assert 0.1 == self.pool.servers[0].cooldown
+        time.sleep(0.06)
+        assert B == self.pool.select()
+
+    def test_abandoned_probe(self):
+        for _ in range(3):
+            self.pool.record(A, failed=True)
+        time.sleep(0.06)
+        assert A == self.pool.select()
+        self.pool.abandon(A)
+        assert A == self.pool.select()
+
+    def test_all_ejected(self):
+        pool = ServerPool([A, B], cooldown=10)
+        for server in (B, A):
+            for _ in range(3):
+                pool.record(server, failed=True)
+        assert B == pool.select()
+
+    def test_route(self):
+        for _ in range(3):
+            self.pool.record(A, failed=True)
+        assert (B, B + '/api/v3/assets') == self.pool.route(A + '/api/v3/assets', A)
+
+
+class ClientServerPoolTests(unittest.TestCase):
+
+    def test_server_options(self):
+        client = ZmlpClient(key_dict, [A, B])
+        assert A == client.server
+        assert [A, B] == [s['server'] for s in client.server_pool.stats()]
+
+        client = ZmlpClient(key_dict, '{}, {}'.format(A, B))
+        assert [A, B] == [s['server'] for s in client.server_pool.stats()]
+
+        client = ZmlpClient(key_dict, [A])
+        assert client.server_pool is None
+        assert A == client.server
+
+        pool = ServerPool([B, A])
+        client = ZmlpClient(key_dict, pool)
+        assert pool is client.server_pool
+        assert B == client.server
+
+    def test_token_audience(self):
+        client = ZmlpClient(key_dict, [A, B])
+        for server in (A, B):
+            token = client.headers(server=server)['Authorization'].split()[1]
+            claims = jwt.decode(token, key_dict['secretKey'], algorithms=['HS512'],
+                                audience=server)
+            assert server == claims['aud']
+        assert 2 == client.token_cache.stats()['size']
+
+
+class FailoverHandler(BaseHTTPRequestHandler):
+    """Fails with a 503 if 'down', otherwise echoes the token audience."""
+
+    down = set()
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = 'http://127.0.0.1:{}'.format(self.server.server_address[1])
+        FailoverHandler.requests.append(url)
+        if url in FailoverHandler.down:
+            body = b'{"message": "unavailable"}'
+            self.send_response(503)
+        else:
+            token = self.headers['Authorization'].split()[1]
+            claims = jwt.decode(token, key_dict['secretKey'], algorithms=['HS512'],
+                                audience=url)
+            body = json.dumps({'server': url, 'path': self.path, 'aud': claims['aud']}).encode()
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FailoverTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.servers = [LocalServer(FailoverHandler).start() for _ in range(2)]
+
+    @classmethod
+    def tearDownClass(cls):
+        for server in cls.servers:
+            server.stop()
+
+    def setUp(self):
+        FailoverHandler.down = set()
+        FailoverHandler.requests = []
+        self.urls = [server.url for server in self.servers]
+        self.app = ZmlpApp(key_dict, self.urls)
+
+    def test_fails_over_without_waiting(self):
+        FailoverHandler.down = {self.urls[0]}
+        start = time.monotonic()
+        rsp = self.app.client.get('/api/v3/things/abc')
+        assert time.monotonic() - start < 0.5
+        assert self.urls[1] == rsp['server']
+        assert self.urls[1] == rsp['aud']
+        assert '/api/v3/things/abc' == rsp['path']
+        assert self.urls == FailoverHandler.requests
+
+    def test_avoids_failing_server(self):
+        FailoverHandler.down = {self.urls[0]}
+        for _ in range(5):
+            self.app.client.get('/api/v3/things/abc')
+        stats = self.app.client.server_pool.stats()
+        assert 1 == stats[0]['failures']
+        assert 5 == stats[1]['requests']
+        assert 5 == FailoverHandler.requests.count(self.urls[1])
+
+    def test_ejects_failing_server(self):
+        FailoverHandler.down = {self.urls[0]}
+        client = ZmlpClient(key_dict, ServerPool(self.urls, failure_threshold=1))
+        client.get('/api/v3/things/abc')
+        assert OPEN == client.server_pool.stats()[0]['state']
+
+    @patch('time.sleep')
+    def test_all_servers_down(self, sleep_patch):
+        FailoverHandler.down = set(self.urls)
+        client = ZmlpClient(key_dict, self.urls, max_retries=4)
+        self.assertRaises(Exception, client.get, '/api/v3/things/abc')
+        assert 4 == len(FailoverHandler.requests)
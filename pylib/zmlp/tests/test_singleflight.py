@@ -0,0 +1,212 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler
+
+from zmlp.client import ZmlpClient, ZmlpDeadlineExceededException, ZmlpNotFoundException
+from zmlp.singleflight import SingleFlight
+from .util import LocalServer
+
+key_dict = {
+    'projectId': 'A5BAFAAA-42FD-45BE-9FA2-92670AB4DA80',
+    'accessKey': 'test123test135',
+    'secretKey': 'test123test135'
+}
+
+CONTENT = os.urandom(100000)
+
+
+def run_threads(target, count):
+    results = [None] * count
+    barrier = threading.Barrier(count)
+
+    def run(i):
+        barrier.wait()
+        try:
+            results[i] = target(i)
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class SingleFlightTests(unittest.TestCase):
+
+    def test_shared_result(self):
+        flights = SingleFlight()
+        calls = []
+
+        def slow(value):
+            calls.append(value)
+            time.sleep(0.1)
+            return value * 2
+
+        results = run_threads(lambda i: flights.do('key', slow, 21), 5)
+        assert [(42, False)] == [r for r in results if not r[1]]
+        assert 4 == len([r for r in results if r[1]])
+        assert [21] == calls
+        assert 1 == flights.calls
+        assert 4 == flights.shared
+        assert 0 == flights.in_flight
+
+    def test_shared_exception(self):
+        flights = SingleFlight()
+
+        def fail():
+            time.sleep(0.1)
+            raise ValueError('bad')
+
+        results = run_threads(lambda i: flights.do('key', fail), 3)
+        assert all(isinstance(r, ValueError) for r in results)
+        assert 1 == flights.calls
+
+    def test_sequential_calls_not_shared(self):
+        flights = SingleFlight()
+        assert (1, False) == flights.do('key', lambda: 1)
+        assert (2, False) == flights.do('key', lambda: 2)
+
+    def test_different_keys(self):
+        flights = SingleFlight()
+        run_threads(lambda i: flights.do(i % 2, time.sleep, 0.05), 4)
+        assert 2 == flights.calls
+
+    def test_timeout(self):
+        flights = SingleFlight()
+        results = run_threads(
+            lambda i: flights.do('key', time.sleep, 0.2 if i else 0.3, timeout=0.05), 3)
+        assert 1 == results.count((None, False))
+        assert 2 == len([r for r in results if isinstance(r, FutureTimeoutError)])
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+    """Serves a JSON document and a file, slowly, and counts the requests."""
+
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        SlowHandler.requests.append(self.path)
+        time.sleep(0.1)
+        if self.path.startswith('/api/v3/files/_stream/'):
+            body = CONTENT
+            status = 200
+        elif self.path == '/api/v3/missing':
+            body = b'{"message": "not found"}'
+            status = 404
+        else:
+            body = b'{"id": "abc", "labels": []}'
+            status = 200
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class ClientSingleFlightTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = LocalServer(SlowHandler).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        SlowHandler.requests = []
+        self.client = ZmlpClient(key_dict, self.server.url, single_flight=True)
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_get(self):
+        results = run_threads(lambda i: self.client.get('/api/v3/things/abc'), 5)
+        assert 1 == len(SlowHandler.requests)
+        assert all(r == {'id': 'abc', 'labels': []} for r in results)
+        # Each caller gets its own object.
+        assert 5 == len(set(id(r) for r in results))
+
+    def test_get_error(self):
+        results = run_threads(lambda i: self.client.get('/api/v3/missing'), 3)
+        assert 1 == len(SlowHandler.requests)
+        assert all(isinstance(r, ZmlpNotFoundException) for r in results)
+
+    def test_only_get_shared(self):
+        run_threads(lambda i: self.client.delete('/api/v3/things/abc'), 2)
+        assert 0 == self.client.single_flight.calls
+
+    def test_disabled_by_default(self):
+        client = ZmlpClient(key_dict, self.server.url)
+        assert client.single_flight is None
+        run_threads(lambda i: client.get('/api/v3/things/abc'), 3)
+        assert 3 == len(SlowHandler.requests)
+
+    def test_download_to_paths(self):
+        paths = [os.path.join(self.tmp, 'file{}.jpg'.format(i % 3)) for i in range(5)]
+        sizes = run_threads(
+            lambda i: self.client.download('/api/v3/files/_stream/a/b.jpg', paths[i]), 5)
+        assert 1 == len(SlowHandler.requests)
+        assert [len(CONTENT)] * 5 == sizes
+        for path in set(paths):
+            with open(path, 'rb') as fp:
+                assert CONTENT == fp.read()
+
+    def test_download_bytes(self):
+        results = run_threads(
+            lambda i: self.client.download_bytes('/api/v3/files/_stream/a/b.jpg'), 4)
+        assert 1 == len(SlowHandler.requests)
+        assert all(r == CONTENT for r in results)
+
+    def test_download_bytes_checksum(self):
+        checksums = [hashlib.sha256() for _ in range(4)]
+        run_threads(lambda i: self.client.download_bytes('/api/v3/files/_stream/a/b.jpg',
+                                                         checksum=checksums[i]), 4)
+        assert 1 == len(SlowHandler.requests)
+        expected = hashlib.sha256(CONTENT).hexdigest()
+        assert all(expected == c.hexdigest() for c in checksums)
+
+    def test_follower_deadline(self):
+        def get(i):
+            if i:
+                time.sleep(0.02)
+            with self.client.deadline(0.05 if i else 1):
+                return self.client.get('/api/v3/things/abc')
+
+        results = run_threads(get, 3)
+        assert {'id': 'abc', 'labels': []} == results[0]
+        assert all(isinstance(r, ZmlpDeadlineExceededException) for r in results[1:])
+        assert 1 == len(SlowHandler.requests)
+
+    def test_coalesced_events(self):
+        events = []
+        self.client.instrumentation.add_hooks(on_end=events.append)
+        run_threads(lambda i: self.client.get('/api/v3/things/abc'), 3)
+        run_threads(lambda i: self.client.download_bytes('/api/v3/files/_stream/a/b.jpg'), 3)
+        assert 6 == len(events)
+        assert [False, True, True] * 2 == [e.coalesced for e in events]
+        assert all(200 == e.status for e in events)
+        assert all(0 == e.network_time for e in events if e.coalesced)
+
+    def test_coalesced_events_without_caller_event(self):
+        # Downloads to a path make their requests without an event of their own.
+        events = []
+        self.client.instrumentation.add_hooks(on_end=events.append)
+        paths = [os.path.join(self.tmp, 'file{}.jpg'.format(i)) for i in range(3)]
+        run_threads(
+            lambda i: self.client.download('/api/v3/files/_stream/a/b.jpg', paths[i]), 3)
+        assert 1 == len(SlowHandler.requests)
+        assert 2 == len([e for e in events if e.coalesced])
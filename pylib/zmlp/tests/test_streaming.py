@@ -0,0 +1,74 @@
+import json
+import unittest
+
+from zmlp.streaming import StreamingSearchResponse
+from .test_search import mock_search_result
+
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class StreamingSearchResponseTests(unittest.TestCase):
+
+    def setUp(self):
+        self.data = json.dumps(mock_search_result, indent=2).encode()
+
+    def test_hits(self):
+        for size in (1, 7, 64, len(self.data)):
+            rsp = StreamingSearchResponse(chunked(self.data, size))
+            hits = list(rsp.hits())
+            assert mock_search_result['hits']['hits'] == hits
+            assert 2 == rsp.hit_count
+
+    def test_result(self):
+        rsp = StreamingSearchResponse(chunked(self.data, 5))
+        for _ in rsp.hits():
+            pass
+        assert rsp.finished
+        assert 'bob' == rsp.result['_scroll_id']
+        assert 100 == rsp.result['hits']['total']['value']
+        assert [] == rsp.result['hits']['hits']
+        assert mock_search_result['aggregations'] == rsp.result['aggregations']
+
+    def test_result_consumes_remaining_hits(self):
+        rsp = StreamingSearchResponse(chunked(self.data, 5))
+        assert mock_search_result['hits']['hits'][0] == next(rsp.hits())
+        assert 'bob' == rsp.result['_scroll_id']
+        assert 2 == rsp.hit_count
+
+    def test_scroll_id_available_before_hits_finish(self):
+        rsp = StreamingSearchResponse(chunked(self.data, 5))
+        next(rsp.hits())
+        assert 'bob' == rsp.scroll_id
+        assert not rsp.finished
+
+    def test_strings_with_structure_and_escapes(self):
+        doc = {
+            '_scroll_id': 'a"}]\\',
+            'hits': {'hits': [
+                {'_id': '{[', '_source': {'path': 'c:\\\\foo\\"bar}', 'name': '\u00e9\u4e2d'}},
+                {'_id': 'x', '_source': {'list': [1, 2.5, -3e10, True, False, None]}}
+            ]}
+        }
+        data = json.dumps(doc, ensure_ascii=False).encode('utf-8')
+        for size in (1, 2, 3, 11):
+            rsp = StreamingSearchResponse(chunked(data, size))
+            assert doc['hits']['hits'] == list(rsp.hits())
+            assert doc['_scroll_id'] == rsp.result['_scroll_id']
+
+    def test_empty_hits(self):
+        rsp = StreamingSearchResponse([b'{"hits": {"total": {"value": 0}, "hits": []}}'])
+        assert [] == list(rsp.hits())
+        assert 0 == rsp.hit_count
+        assert 0 == rsp.result['hits']['total']['value']
+
+    def test_no_hits_key(self):
+        rsp = StreamingSearchResponse([b'{"took": 1, "timed_out": false}'])
+        assert [] == list(rsp.hits())
+        assert {'took': 1, 'timed_out': False} == rsp.result
+
+    def test_truncated(self):
+        rsp = StreamingSearchResponse(chunked(self.data[:-40], 16))
+        with self.assertRaises(ValueError):
+            list(rsp.hits())
@@ -0,0 +1,207 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler
+from unittest.mock import patch
+
+import requests
+
+from zmlp import ZmlpApp
+from zmlp.client import ZmlpClient, ZmlpDeadlineExceededException, ZmlpRequestException
+from zmlp.emulator import Corpus, Emulator
+from zmlp.retry import RetryPolicy
+from zmlp.timeouts import Deadline, cleanup_deadline, current_deadline, current_timeouts, \
+    deadline, timeouts
+from .util import LocalServer
+
+key_dict = {
+    'projectId': 'A5BAFAAA-42FD-45BE-9FA2-92670AB4DA80',
+    'accessKey': 'test123test135',
+    'secretKey': 'test123test135'
+}
+
+
+class DeadlineTests(unittest.TestCase):
+
+    def test_deadline(self):
+        d = Deadline(0.05)
+        assert not d.expired
+        assert 0 < d.remaining() <= 0.05
+        time.sleep(0.06)
+        assert d.expired
+        assert 0 == d.remaining()
+
+    def test_nested_deadline_only_shortens(self):
+        assert current_deadline() is None
+        with deadline(10) as outer:
+            with deadline(20) as inner:
+                assert outer is inner
+            with deadline(1) as inner:
+                assert 1 == inner.seconds
+                with deadline(None) as same:
+                    assert inner is same
+            assert outer is current_deadline()
+        assert current_deadline() is None
+
+    def test_cleanup_deadline(self):
+        with deadline(0):
+            with cleanup_deadline(5):
+                assert not current_deadline().expired
+            assert current_deadline().expired
+
+    def test_timeouts(self):
+        with timeouts(connect=1):
+            with timeouts(read=2):
+                assert (1, 2) == current_timeouts()
+        assert (None, None) == current_timeouts()
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+    """Replies slowly to /slow, with a 503 to /busy, and serves a scroll."""
+
+    deletes = []
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/slow':
+            time.sleep(0.5)
+            self.reply(200, {})
+        elif self.path == '/busy':
+            self.reply(503, {'message': 'busy'}, {'Retry-After': '5'})
+        else:
+            self.reply(200, {'ok': True})
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        hit = {'_id': 'abc', '_source': {}, '_score': 1}
+        self.reply(200, {'_scroll_id': 'scroll1', 'hits': {'hits': [hit]}})
+
+    def do_DELETE(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        SlowHandler.deletes.append(self.path)
+        self.reply(200, {})
+
+
+class ClientTimeoutTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = LocalServer(SlowHandler).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        SlowHandler.deletes = []
+        self.client = ZmlpClient(key_dict, self.server.url,
+                                 retry_policy=RetryPolicy(max_attempts=1))
+
+    @patch.object(requests.Session, 'request')
+    def test_default_timeouts(self, req_patch):
+        req_patch.return_value.status_code = 200
+        req_patch.return_value.content = b'{}'
+        self.client.get('/fast')
+        assert (10.0, 120.0) == req_patch.call_args[1]['timeout']
+        with self.client.timeouts(read=5):
+            self.client.get('/fast')
+        assert (10.0, 5) == req_patch.call_args[1]['timeout']
+        with self.client.deadline(2):
+            self.client.get('/fast')
+        connect, read = req_patch.call_args[1]['timeout']
+        assert connect <= 2 and read <= 2
+
+    def test_read_timeout(self):
+        client = ZmlpClient(key_dict, self.server.url, read_timeout=0.1,
+                            retry_policy=RetryPolicy(max_attempts=1))
+        self.assertRaises(requests.exceptions.ReadTimeout, client.get, '/slow')
+
+    def test_deadline_exceeded(self):
+        start = time.monotonic()
+        with self.client.deadline(0.1):
+            self.assertRaises(ZmlpDeadlineExceededException, self.client.get, '/slow')
+        assert time.monotonic() - start < 0.4
+
+    def test_expired_deadline_not_sent(self):
+        with patch.object(requests.Session, 'request') as req_patch:
+            with self.client.deadline(0):
+                self.assertRaises(ZmlpDeadlineExceededException, self.client.get, '/fast')
+            assert not req_patch.called
+
+    def test_operation_deadline(self):
+        client = ZmlpClient(key_dict, self.server.url, operation_deadline=0.1)
+        self.assertRaises(ZmlpDeadlineExceededException, client.get, '/slow')
+
+    def test_no_retry_past_deadline(self):
+        client = ZmlpClient(key_dict, self.server.url)
+        start = time.monotonic()
+        with client.deadline(1):
+            self.assertRaises(ZmlpRequestException, client.get, '/busy')
+        assert time.monotonic() - start < 0.5
+
+    def test_scroll_deadline(self):
+        app = ZmlpApp(key_dict, self.server.url)
+        scroll = app.assets.scroll_search({}, deadline=0.1)
+        with self.assertRaises(ZmlpDeadlineExceededException):
+            for _ in scroll:
+                time.sleep(0.15)
+        # The scroll is still cleared.
+        assert ['/api/v3/assets/_search/scroll'] == SlowHandler.deletes
+
+
+class DownloadDeadlineTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # 200KB files over 16KB/s take about 12 seconds.
+        cls.emulator = Emulator(Corpus(size=1, file_size=200 * 1024),
+                                bandwidth=16 * 1024).start()
+        cls.file_id = next(iter(cls.emulator.corpus.files))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.emulator.stop()
+
+    def setUp(self):
+        self.app = ZmlpApp(key_dict, self.emulator.url)
+
+    def assert_deadline_exceeded(self, **kwargs):
+        start = time.monotonic()
+        with self.assertRaises(ZmlpDeadlineExceededException):
+            self.app.assets.download_file(self.file_id, deadline=1.0, **kwargs)
+        assert time.monotonic() - start < 1.5
+
+    def test_download_bytes(self):
+        self.assert_deadline_exceeded()
+
+    def test_download_path(self):
+        dst = os.path.join(tempfile.mkdtemp(), 'file.jpg')
+        self.assert_deadline_exceeded(dst_file=dst)
+        # The part file is kept so the download can be resumed.
+        assert os.path.getsize(dst + '.part') > 0
+
+    def test_download_parallel(self):
+        self.app.client.parallel_download_threshold = 0
+        self.app.client.download_part_size = 64 * 1024
+        dst = os.path.join(tempfile.mkdtemp(), 'file.jpg')
+        self.assert_deadline_exceeded(dst_file=dst)
+
+    def test_operation_deadline(self):
+        client = ZmlpClient(key_dict, self.emulator.url, operation_deadline=1.0)
+        start = time.monotonic()
+        with self.assertRaises(ZmlpDeadlineExceededException):
+            client.download_bytes('/api/v3/files/_stream/' + self.file_id)
+        assert time.monotonic() - start < 1.5
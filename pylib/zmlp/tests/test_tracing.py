@@ -0,0 +1,203 @@
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from http.server import BaseHTTPRequestHandler
+from unittest.mock import patch
+
+from zmlp import ZmlpApp, AsyncZmlpApp
+from zmlp.client import ZmlpClient, ZmlpNotFoundException
+from zmlp.search import AssetSearchScroller
+from zmlp.tracing import NOOP_SPAN, SpanContext, Tracer, current_span, operation_span
+from .util import LocalServer
+
+key_dict = {
+    'projectId': 'A5BAFAAA-42FD-45BE-9FA2-92670AB4DA80',
+    'accessKey': 'test123test135',
+    'secretKey': 'test123test135'
+}
+
+
+class TracerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.spans = []
+        self.tracer = Tracer(exporter=self.spans.append)
+
+    def test_traceparent(self):
+        context = SpanContext.from_traceparent(
+            '00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01')
+        assert '4bf92f3577b34da6a3ce929d0e0e4736' == context.trace_id
+        assert '00f067aa0ba902b7' == context.span_id
+        assert '01' == context.flags
+        assert '00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01' == context.traceparent
+
+    def test_invalid_traceparent(self):
+        assert SpanContext.from_traceparent(None) is None
+        assert SpanContext.from_traceparent('00-abc-def-01') is None
+        assert SpanContext.from_traceparent(
+            '00-00000000000000000000000000000000-00f067aa0ba902b7-01') is None
+        assert SpanContext.from_traceparent(
+            'ff-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01') is None
+
+    def test_nested_spans(self):
+        with self.tracer.start_span('parent') as parent:
+            assert parent is current_span()
+            with self.tracer.start_span('child') as child:
+                pass
+        assert current_span() is None
+        assert [child, parent] == self.spans
+        assert parent.parent_id is None
+        assert parent.span_id == child.parent_id
+        assert parent.trace_id == child.trace_id
+        assert 32 == len(parent.trace_id)
+        assert 16 == len(parent.span_id)
+        assert parent.duration >= child.duration
+
+    def test_continue_trace(self):
+        span = self.tracer.start_span(
+            'op', parent='00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-00')
+        assert '4bf92f3577b34da6a3ce929d0e0e4736' == span.trace_id
+        assert '00f067aa0ba902b7' == span.parent_id
+        assert span.traceparent.endswith('-00')
+
+    def test_exception_recorded(self):
+        with self.assertRaises(ValueError):
+            with self.tracer.start_span('op'):
+                raise ValueError('bad')
+        assert 'error' == self.spans[0].status
+        assert 'ValueError' == self.spans[0].attributes['exception.type']
+
+    def test_exporter_errors_ignored(self):
+        def bad_exporter(span):
+            raise ValueError('bad')
+
+        self.tracer.add_exporter(bad_exporter)
+        self.tracer.start_span('op').end()
+        assert 1 == len(self.spans)
+
+    def test_no_tracer(self):
+        client = ZmlpClient(key_dict, 'http://localhost:9999')
+        with operation_span(client, 'op') as span:
+            assert NOOP_SPAN is span
+            assert current_span() is None
+
+
+class TraceHandler(BaseHTTPRequestHandler):
+    """Records the traceparent headers and mimics the scroll and upload endpoints."""
+
+    traceparents = []
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _handle(self):
+        self.traceparents.append(self.headers.get('traceparent'))
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.path.startswith('/api/v3/missing'):
+            self.reply(404, {'message': 'not found'})
+        elif self.path.startswith('/api/v3/assets/_search?scroll'):
+            self.reply(200, {'_scroll_id': 'abc', 'hits': {'hits': [
+                {'_id': 'a', '_source': {}, '_score': 1}]}})
+        elif self.path == '/api/v3/assets/_search/scroll':
+            self.reply(200, {'_scroll_id': 'abc', 'hits': {'hits': []}})
+        elif self.path == '/api/v3/assets/_batch_upload':
+            self.reply(200, {'created': ['a'], 'failed': []})
+        else:
+            self.reply(200, {})
+
+    do_GET = do_POST = do_DELETE = _handle
+
+
+class ClientTracingTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = LocalServer(TraceHandler).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        TraceHandler.traceparents = []
+        self.spans = []
+        self.tracer = Tracer(exporter=self.spans.append)
+        self.app = ZmlpApp(key_dict, self.server.url, tracer=self.tracer)
+
+    def test_request_span(self):
+        self.app.client.post('/api/v3/assets/12345/_foo', {'a': 'b'})
+        span = self.spans[0]
+        assert 'POST /api/v3/assets/{id}/_foo' == span.name
+        assert 'client' == span.kind
+        assert span.parent_id is None
+        assert 200 == span.attributes['http.response.status_code']
+        assert span.attributes['http.request.body.size'] > 0
+        assert [span.traceparent] == TraceHandler.traceparents
+
+    def test_request_span_error(self):
+        with self.assertRaises(ZmlpNotFoundException):
+            self.app.client.get('/api/v3/missing')
+        assert 'error' == self.spans[0].status
+        assert 404 == self.spans[0].attributes['http.response.status_code']
+
+    def test_scroll(self):
+        assets = list(AssetSearchScroller(self.app, {}).scroll())
+        assert 1 == len(assets)
+        scroll_span = self.spans[-1]
+        assert 'AssetSearchScroller.scroll' == scroll_span.name
+        requests = self.spans[:-1]
+        assert ['POST /api/v3/assets/_search', 'POST /api/v3/assets/_search/scroll',
+                'DELETE /api/v3/assets/_search/scroll'] == [span.name for span in requests]
+        assert all(span.parent_id == scroll_span.span_id for span in requests)
+        assert [span.traceparent for span in requests] == TraceHandler.traceparents
+
+    def test_scroll_not_active_in_caller(self):
+        for _ in AssetSearchScroller(self.app, {}).scroll():
+            assert current_span() is None
+
+    def test_batch_upload_directory(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            for name in ('a.jpg', 'b.jpg', 'c.png'):
+                with open(os.path.join(tmp, name), 'wb') as fp:
+                    fp.write(b'x' * 10)
+            totals = self.app.assets.batch_upload_directory(tmp, batch_size=2)
+        finally:
+            shutil.rmtree(tmp)
+
+        parent = self.spans[-1]
+        assert 'AssetApp.batch_upload_directory' == parent.name
+        assert 2 == totals['batch_count'] == parent.attributes['zmlp.batch_count']
+        uploads = self.spans[:-1]
+        assert 2 == len(uploads)
+        assert all(span.parent_id == parent.span_id for span in uploads)
+        assert all(span.trace_id == parent.trace_id for span in uploads)
+
+    def test_async_scroll(self):
+        async def run():
+            async with AsyncZmlpApp(key_dict, self.server.url, tracer=self.tracer) as app:
+                return [asset async for asset in app.assets.scroll_search({})]
+
+        assert 1 == len(asyncio.run(run()))
+        scroll_span = self.spans[-1]
+        assert 'AsyncAssetSearchScroller.scroll' == scroll_span.name
+        assert 3 == len(self.spans[:-1])
+        assert all(span.parent_id == scroll_span.span_id for span in self.spans[:-1])
+
+    def test_no_tracer_sends_no_traceparent(self):
+        with patch.object(Tracer, 'start_span') as start_patch:
+            app = ZmlpApp(key_dict, self.server.url)
+            list(AssetSearchScroller(app, {}).scroll())
+        assert not start_patch.called
+        assert [None, None, None] == TraceHandler.traceparents
@@ -0,0 +1,191 @@
+import asyncio
+import json
+import os
+import pickle
+import tempfile
+import unittest
+from http.server import BaseHTTPRequestHandler
+from unittest.mock import patch
+
+import jwt
+
+from zmlp import AsyncZmlpClient
+from zmlp.aio import aiohttp
+from zmlp.client import ZmlpClient, ZmlpConnectionException, ZmlpNotFoundException
+from zmlp.retry import RetryPolicy
+from zmlp.transport import SidecarTransport, Transport, default_transport, join_url, \
+    socket_path_of, unix_url
+from .util import LocalServer, LocalUnixServer
+
+key_dict = {
+    'projectId': 'A5BAFAAA-42FD-45BE-9FA2-92670AB4DA80',
+    'accessKey': 'test123test135',
+    'secretKey': 'test123test135'
+}
+
+API = 'https://api.zvi.zorroa.com'
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+    """Echoes the request path, Host header and token audience."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.startswith('/missing'):
+            body = json.dumps({'message': 'not found', 'status': 404}).encode()
+            self.send_response(404)
+        else:
+            token = self.headers['Authorization'].split()[1]
+            claims = jwt.decode(token, key_dict['secretKey'], algorithms=['HS512'],
+                                options={'verify_aud': False})
+            body = json.dumps({'path': self.path, 'host': self.headers['Host'],
+                               'aud': claims['aud']}).encode()
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class UrlTests(unittest.TestCase):
+
+    def test_unix_url(self):
+        url = unix_url('/run/zmlp/api.sock')
+        assert 'http+unix://%2Frun%2Fzmlp%2Fapi.sock/' == url
+        assert '/run/zmlp/api.sock' == socket_path_of(url)
+        assert socket_path_of(API) is None
+
+    def test_join_url(self):
+        base = unix_url('/tmp/api.sock')
+        assert base + 'api/v3/assets' == join_url(base, '/api/v3/assets')
+        assert base + 'api/v3/assets?a=1' == join_url(base, 'api/v3/assets?a=1')
+        assert API + '/api/v3/assets' == join_url(API, '/api/v3/assets')
+
+    def test_default_transport(self):
+        with patch.dict(os.environ, {'ZMLP_SIDECAR': 'http://127.0.0.1:8181'}):
+            transport = default_transport()
+            assert isinstance(transport, SidecarTransport)
+            assert 'http://127.0.0.1:8181' == transport.address
+        with patch.dict(os.environ, {'ZMLP_SIDECAR': ''}):
+            assert type(default_transport()) is Transport
+
+    def test_default_transport_must_be_local(self):
+        for address in ('/run/s.sock', 'http://localhost:8181', 'http://[::1]:8181',
+                        'http://127.0.0.2:8181'):
+            with patch.dict(os.environ, {'ZMLP_SIDECAR': address}):
+                assert default_transport().is_local
+        for address in ('http://10.0.0.5:8181', 'http://sidecar.example.com'):
+            with patch.dict(os.environ, {'ZMLP_SIDECAR': address}):
+                self.assertRaises(ValueError, default_transport)
+                self.assertRaises(ValueError, ZmlpClient, key_dict, API)
+        # A remote sidecar can still be chosen explicitly.
+        client = ZmlpClient(key_dict, API, transport=SidecarTransport('http://10.0.0.5:8181'))
+        assert not client.transport.is_local
+
+    def test_sidecar_address(self):
+        assert '/run/s.sock' == SidecarTransport('/run/s.sock').socket_path
+        assert '/run/s.sock' == SidecarTransport(unix_url('/run/s.sock')).socket_path
+        self.assertRaises(ValueError, SidecarTransport, 'https://127.0.0.1:8181')
+
+    def test_sidecar_route(self):
+        transport = SidecarTransport('http://127.0.0.1:8181/')
+        assert ('http://127.0.0.1:8181/api/v3/assets?a=1',
+                {'Host': 'api.zvi.zorroa.com'}) == transport.route(API + '/api/v3/assets?a=1')
+
+
+class UnixSocketTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = LocalUnixServer(EchoHandler).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def test_request(self):
+        client = ZmlpClient(key_dict, self.server.url)
+        rsp = client.get('/api/v3/things/abc')
+        assert '/api/v3/things/abc' == rsp['path']
+        assert self.server.url == rsp['aud']
+        # The connection is kept alive.
+        client.get('/api/v3/things/abc')
+        pool = list(client.session.adapters['http+unix://']._pools.values())[0]
+        assert 1 == pool.num_connections
+
+    def test_exceptions(self):
+        client = ZmlpClient(key_dict, self.server.url)
+        self.assertRaises(ZmlpNotFoundException, client.get, '/missing')
+
+    def test_sidecar_socket(self):
+        client = ZmlpClient(key_dict, API, transport=SidecarTransport(self.server.socket_path))
+        rsp = client.get('/api/v3/things/abc')
+        assert '/api/v3/things/abc' == rsp['path']
+        assert 'api.zvi.zorroa.com' == rsp['host']
+        assert API == rsp['aud']
+
+    def test_missing_socket(self):
+        path = os.path.join(tempfile.gettempdir(), 'zmlp-missing.sock')
+        client = ZmlpClient(key_dict, unix_url(path), retry_policy=RetryPolicy(max_attempts=1))
+        self.assertRaises(ZmlpConnectionException, client.download_bytes, '/files/abc')
+
+    def test_pickle(self):
+        client = ZmlpClient(key_dict, API, transport=SidecarTransport(self.server.socket_path))
+        data = pickle.dumps(client)
+        del client
+        client = pickle.loads(data)
+        assert self.server.socket_path == client.transport.socket_path
+
+    @unittest.skipIf(aiohttp is None, 'requires aiohttp')
+    def test_async_request(self):
+        async def run():
+            async with AsyncZmlpClient(key_dict, self.server.url) as client:
+                return await client.get('/api/v3/things/abc')
+
+        rsp = asyncio.run(run())
+        assert '/api/v3/things/abc' == rsp['path']
+        assert self.server.url == rsp['aud']
+
+    @unittest.skipIf(aiohttp is None, 'requires aiohttp')
+    def test_async_sidecar_socket(self):
+        async def run():
+            transport = SidecarTransport(self.server.socket_path)
+            async with AsyncZmlpClient(key_dict, API, transport=transport) as client:
+                return await client.get('/api/v3/things/abc')
+
+        rsp = asyncio.run(run())
+        assert 'api.zvi.zorroa.com' == rsp['host']
+        assert API == rsp['aud']
+
+
+class SidecarTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = LocalServer(EchoHandler).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def test_request(self):
+        client = ZmlpClient(key_dict, API, transport=SidecarTransport(self.server.url))
+        rsp = client.get('/api/v3/things/abc?x=1')
+        assert '/api/v3/things/abc?x=1' == rsp['path']
+        assert 'api.zvi.zorroa.com' == rsp['host']
+        assert API == rsp['aud']
+        self.assertRaises(ZmlpNotFoundException, client.get, '/missing')
+
+    @unittest.skipIf(aiohttp is None, 'requires aiohttp')
+    def test_async_request(self):
+        async def run():
+            transport = SidecarTransport(self.server.url)
+            async with AsyncZmlpClient(key_dict, API, transport=transport) as client:
+                return await client.get('/api/v3/things/abc')
+
+        rsp = asyncio.run(run())
+        assert 'api.zvi.zorroa.com' == rsp['host']
+        assert API == rsp['aud']
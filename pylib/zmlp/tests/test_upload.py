@@ -0,0 +1,244 @@
+import base64
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler
+
+from zmlp.client import ZmlpClient, ZmlpClientException, ZmlpRequestException
+from zmlp.entity import FileUpload
+from zmlp.retry import RetryPolicy
+from zmlp.upload import MAX_PART_ATTEMPTS, ChunkedUpload
+from .util import LocalServer
+
+key_dict = {
+    'projectId': 'A5BAFAAA-42FD-45BE-9FA2-92670AB4DA80',
+    'accessKey': 'test123test135',
+    'secretKey': 'test123test135'
+}
+
+
+class UploadHandler(BaseHTTPRequestHandler):
+    """
+    A stand-in for the chunked upload endpoints which keeps uploads in memory.
+    """
+
+    uploads = {}
+    """Upload id to a dict of the upload request and the received parts."""
+
+    committed = {}
+    """Upload id to the assembled file content."""
+
+    failures = {}
+    """Part number to a list of status codes to return before accepting the part."""
+
+    corrupt = {}
+    """Part number to the number of times to acknowledge the part with a bad md5."""
+
+    empty = set()
+    """Part numbers which are acknowledged with an empty body."""
+
+    expired = []
+    """The ids of expired uploads."""
+
+    requests = []
+    """The method and path of every request."""
+
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+    def do_POST(self):
+        self.requests.append(('POST', self.path))
+        body = json.loads(self.read_body())
+        if self.path == '/api/v3/assets/_chunked_upload':
+            upload_id = 'upload-{}'.format(len(self.uploads) + len(self.expired))
+            self.uploads[upload_id] = {'request': body, 'parts': {}}
+            return self.reply(200, {'id': upload_id})
+
+        match = re.match(r'/api/v3/assets/_chunked_upload/([^/]+)/_commit$', self.path)
+        upload = self.uploads[match.group(1)]
+        parts = upload['parts']
+        for part in body['parts']:
+            if hashlib.md5(parts[part['part']]).hexdigest() != part['md5']:
+                return self.reply(400, {'message': 'bad checksum'})
+        self.committed[match.group(1)] = b''.join(parts[i] for i in sorted(parts))
+        self.reply(200, {'created': ['asset-1'], 'failed': [], 'jobId': 'job-1'})
+
+    def do_PUT(self):
+        self.requests.append(('PUT', self.path))
+        match = re.match(r'/api/v3/assets/_chunked_upload/([^/]+)/(\d+)$', self.path)
+        data = self.read_body()
+        index = int(match.group(2))
+        with self.lock:
+            failures = self.failures.get(index)
+            if failures:
+                return self.reply(failures.pop(0), {'message': 'failed'})
+        md5 = hashlib.md5(data)
+        if base64.b64encode(md5.digest()).decode() != self.headers['Content-MD5']:
+            return self.reply(400, {'message': 'bad checksum'})
+        self.uploads[match.group(1)]['parts'][index] = data
+        if index in self.empty:
+            self.send_response(200)
+            self.send_header('Content-Length', '0')
+            return self.end_headers()
+        with self.lock:
+            if self.corrupt.get(index):
+                self.corrupt[index] -= 1
+                md5 = hashlib.md5(data[1:])
+        self.reply(200, {'part': index, 'size': len(data), 'md5': md5.hexdigest()})
+
+    def do_GET(self):
+        self.requests.append(('GET', self.path))
+        upload_id = self.path.rsplit('/', 1)[-1]
+        if upload_id not in self.uploads:
+            return self.reply(404, {'message': 'not found'})
+        self.reply(200, {'id': upload_id, 'parts': sorted(self.uploads[upload_id]['parts'])})
+
+
+class ChunkedUploadTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = LocalServer(UploadHandler).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        UploadHandler.uploads.clear()
+        UploadHandler.committed.clear()
+        UploadHandler.failures.clear()
+        UploadHandler.corrupt.clear()
+        UploadHandler.empty.clear()
+        UploadHandler.expired = []
+        UploadHandler.requests = []
+        self.tmp = tempfile.mkdtemp()
+        self.journal_dir = os.path.join(self.tmp, 'journal')
+        self.data = os.urandom(250000)
+        self.path = os.path.join(self.tmp, 'movie.mxf')
+        with open(self.path, 'wb') as fp:
+            fp.write(self.data)
+        self.client = ZmlpClient(key_dict, self.server.url,
+                                 retry_policy=RetryPolicy(base_delay=0, max_delay=0))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def upload(self, **kwargs):
+        return ChunkedUpload(self.client, FileUpload(self.path), part_size=100000,
+                             journal_dir=self.journal_dir, **kwargs)
+
+    def test_upload(self):
+        progress = []
+        rsp = self.upload(modules=['foo'], progress=lambda *args: progress.append(args)).run()
+        assert ['asset-1'] == rsp['created']
+        assert self.data == UploadHandler.committed['upload-0']
+        request = UploadHandler.uploads['upload-0']['request']
+        assert self.path == request['asset']['uri']
+        assert 250000 == request['size']
+        assert 100000 == request['partSize']
+        assert ['foo'] == request['modules']
+        assert [(100000, 250000), (200000, 250000), (250000, 250000)] == progress
+        assert [] == os.listdir(self.journal_dir)
+
+    def test_upload_empty_file(self):
+        with open(self.path, 'wb'):
+            pass
+        self.upload().run()
+        assert b'' == UploadHandler.committed['upload-0']
+
+    def test_part_retried(self):
+        UploadHandler.failures[1] = [503, 503]
+        self.upload().run()
+        assert self.data == UploadHandler.committed['upload-0']
+        puts = [path for method, path in UploadHandler.requests if method == 'PUT']
+        assert 5 == len(puts)
+
+    def test_part_resent_on_md5_mismatch(self):
+        UploadHandler.corrupt[1] = 2
+        self.upload().run()
+        assert self.data == UploadHandler.committed['upload-0']
+        puts = [path for method, path in UploadHandler.requests if method == 'PUT']
+        assert 5 == len(puts)
+
+    def test_md5_mismatch(self):
+        UploadHandler.corrupt[1] = MAX_PART_ATTEMPTS
+        with self.assertRaises(ZmlpClientException):
+            self.upload().run()
+        assert {} == UploadHandler.committed
+        with open(os.path.join(self.journal_dir, os.listdir(self.journal_dir)[0])) as fp:
+            assert ['0'] == list(json.load(fp)['parts'])
+
+    def test_part_acknowledged_with_empty_body(self):
+        UploadHandler.empty.add(1)
+        self.upload().run()
+        assert self.data == UploadHandler.committed['upload-0']
+
+    def test_resume_after_failure(self):
+        UploadHandler.failures[2] = [400]
+        with self.assertRaises(ZmlpRequestException):
+            self.upload().run()
+        journal = os.listdir(self.journal_dir)
+        assert 1 == len(journal)
+
+        UploadHandler.requests = []
+        self.upload().run()
+        assert self.data == UploadHandler.committed['upload-0']
+        assert [('GET', '/api/v3/assets/_chunked_upload/upload-0'),
+                ('PUT', '/api/v3/assets/_chunked_upload/upload-0/2'),
+                ('POST', '/api/v3/assets/_chunked_upload/upload-0/_commit')] == \
+            UploadHandler.requests
+        assert [] == os.listdir(self.journal_dir)
+
+    def test_resume_only_acknowledged_parts(self):
+        UploadHandler.failures[2] = [400]
+        with self.assertRaises(ZmlpRequestException):
+            self.upload().run()
+        # The server lost part 1.
+        del UploadHandler.uploads['upload-0']['parts'][1]
+
+        UploadHandler.requests = []
+        self.upload().run()
+        puts = [path for method, path in UploadHandler.requests if method == 'PUT']
+        assert ['/api/v3/assets/_chunked_upload/upload-0/1',
+                '/api/v3/assets/_chunked_upload/upload-0/2'] == puts
+        assert self.data == UploadHandler.committed['upload-0']
+
+    def test_restart_expired_upload(self):
+        UploadHandler.failures[2] = [400]
+        with self.assertRaises(ZmlpRequestException):
+            self.upload().run()
+        del UploadHandler.uploads['upload-0']
+        UploadHandler.expired.append('upload-0')
+
+        self.upload().run()
+        assert self.data == UploadHandler.committed['upload-1']
+
+    def test_restart_changed_file(self):
+        UploadHandler.failures[2] = [400]
+        with self.assertRaises(ZmlpRequestException):
+            self.upload().run()
+        self.data = os.urandom(150000)
+        with open(self.path, 'wb') as fp:
+            fp.write(self.data)
+
+        self.upload().run()
+        assert self.data == UploadHandler.committed['upload-1']
@@ -0,0 +1,80 @@
+import os
+import socketserver
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer
+
+from zmlp.transport import unix_url
+
+
+class LocalServer(object):
+    """
+    Runs an HTTP server on a random local port in a background thread.
+
+    Examples:
+        with LocalServer(MyHandler) as server:
+            client = ZmlpClient(apikey, server.url)
+
+    """
+
+    def __init__(self, handler):
+        """
+        Create a new LocalServer.
+
+        Args:
+            handler (BaseHTTPRequestHandler): The request handler class.
+        """
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        """The base URL of the server."""
+        return 'http://127.0.0.1:{}'.format(self.httpd.server_address[1])
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+class _UnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super(_UnixHTTPServer, self).get_request()
+        # BaseHTTPRequestHandler expects a (host, port) client address.
+        return request, ('local', 0)
+
+
+class LocalUnixServer(LocalServer):
+    """
+    Runs an HTTP server on a Unix domain socket in a background thread.
+    """
+
+    def __init__(self, handler):
+        self.tmpdir = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.tmpdir, 'zmlp.sock')
+        self.httpd = _UnixHTTPServer(self.socket_path, handler)
+        self.thread = None
+
+    @property
+    def url(self):
+        """The http+unix URL of the server."""
+        return unix_url(self.socket_path)
+
+    def stop(self):
+        super(LocalUnixServer, self).stop()
+        os.unlink(self.socket_path)
+        os.rmdir(self.tmpdir)
@@ -0,0 +1,139 @@
+"""Connect and read timeouts and per operation deadlines."""
+import contextlib
+import contextvars
+import time
+
+__all__ = [
+    'Deadline',
+    'current_deadline',
+    'deadline',
+    'timeouts'
+]
+
+DEFAULT_CONNECT_TIMEOUT = 10.0
+"""The default seconds to wait for a connection to the server."""
+
+DEFAULT_READ_TIMEOUT = 120.0
+"""The default seconds to wait for the server to send data."""
+
+CLEANUP_DEADLINE = 10.0
+"""The seconds allowed for cleanup requests made after a deadline has passed."""
+
+_current_deadline = contextvars.ContextVar('zmlp_deadline', default=None)
+_current_timeouts = contextvars.ContextVar('zmlp_timeouts', default=(None, None))
+
+
+class Deadline(object):
+    """
+    The point in time by which an operation, and every request it makes,
+    must be finished.
+    """
+
+    __slots__ = ('seconds', 'expires')
+
+    def __init__(self, seconds):
+        """
+        Create a new Deadline.
+
+        Args:
+            seconds (float): The number of seconds from now.
+        """
+        self.seconds = seconds
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self):
+        """
+        Returns:
+            float: The number of seconds left, 0 if the deadline has passed.
+        """
+        return max(0.0, self.expires - time.monotonic())
+
+    @property
+    def expired(self):
+        """True if the deadline has passed."""
+        return time.monotonic() >= self.expires
+
+    def __repr__(self):
+        return "<Deadline seconds={} remaining={:.3f}>".format(self.seconds, self.remaining())
+
+
+def current_deadline():
+    """
+    Return the deadline of the current thread or asyncio task.
+
+    Returns:
+        Deadline: The deadline or None.
+    """
+    return _current_deadline.get()
+
+
+def current_timeouts():
+    """
+    Return the connect and read timeouts selected with timeouts().
+
+    Returns:
+        tuple: The connect and read timeouts, either may be None.
+    """
+    return _current_timeouts.get()
+
+
+@contextlib.contextmanager
+def deadline(seconds):
+    """
+    Give the requests made within the block, including their retries, a
+    deadline.  A nested deadline can only shorten the deadline it's in.
+
+    Args:
+        seconds (mixed): The number of seconds or a Deadline, None to leave
+            the current deadline unchanged.
+
+    Yields:
+        Deadline: The deadline in effect.
+    """
+    current = _current_deadline.get()
+    if seconds is None:
+        yield current
+        return
+    new = seconds if isinstance(seconds, Deadline) else Deadline(seconds)
+    if current is not None and current.expires < new.expires:
+        new = current
+    token = _current_deadline.set(new)
+    try:
+        yield new
+    finally:
+        _current_deadline.reset(token)
+
+
+@contextlib.contextmanager
+def cleanup_deadline(seconds=CLEANUP_DEADLINE):
+    """
+    Replace the current deadline with a new short one, so a request which
+    releases server side resources, such as a scroll, is still made once
+    the operation's deadline has passed.
+
+    Args:
+        seconds (float): The seconds allowed for the cleanup.
+    """
+    token = _current_deadline.set(Deadline(seconds))
+    try:
+        yield
+    finally:
+        _current_deadline.reset(token)
+
+
+@contextlib.contextmanager
+def timeouts(connect=None, read=None):
+    """
+    Override the client's connect and read timeouts for the requests made
+    within the block.
+
+    Args:
+        connect (float): The seconds to wait for a connection.
+        read (float): The seconds to wait for the server to send data.
+    """
+    outer = _current_timeouts.get()
+    token = _current_timeouts.set((connect or outer[0], read or outer[1]))
+    try:
+        yield
+    finally:
+        _current_timeouts.reset(token)
@@ -0,0 +1,423 @@
+"""Lightweight tracing with W3C Trace Context propagation."""
+import contextlib
+import contextvars
+import logging
+import random
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+__all__ = [
+    'Span',
+    'SpanContext',
+    'Tracer',
+    'current_span'
+]
+
+_current_span = contextvars.ContextVar('zmlp_current_span', default=None)
+
+_TRACEPARENT_RE = re.compile(r'^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+_INVALID_TRACE_ID = '0' * 32
+_INVALID_SPAN_ID = '0' * 16
+
+
+def current_span():
+    """
+    Return the active span in the current thread or asyncio task.
+
+    Returns:
+        Span: The active span or None.
+    """
+    return _current_span.get()
+
+
+class SpanContext(object):
+    """
+    The part of a span which is propagated to other services: the trace id,
+    the span id and the trace flags.
+    """
+
+    __slots__ = ('trace_id', 'span_id', 'flags')
+
+    def __init__(self, trace_id, span_id, flags='01'):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.flags = flags
+
+    @property
+    def traceparent(self):
+        """The W3C traceparent header value."""
+        return '00-{}-{}-{}'.format(self.trace_id, self.span_id, self.flags)
+
+    @classmethod
+    def from_traceparent(cls, value):
+        """
+        Parse a W3C traceparent header value, for example one received by a
+        service which is calling ZMLP, so its requests join the caller's trace.
+
+        Args:
+            value (str): The traceparent header value.
+
+        Returns:
+            SpanContext: The span context, or None if the value is invalid.
+        """
+        match = _TRACEPARENT_RE.match((value or '').strip().lower())
+        if not match:
+            return None
+        version, trace_id, span_id, flags = match.groups()
+        if version == 'ff' or trace_id == _INVALID_TRACE_ID or span_id == _INVALID_SPAN_ID:
+            return None
+        return cls(trace_id, span_id, flags)
+
+
+class Span(object):
+    """
+    A timed operation within a trace.  Spans are created by a Tracer, using a
+    Span as a context manager makes it the active span, so any spans started
+    inside the block, including the spans for HTTP requests, are its children.
+    The span is ended when the block exits.
+    """
+
+    __slots__ = ('name', 'kind', 'context', 'parent_id', 'attributes', 'status', 'error',
+                 'start_time', 'end_time', '_tracer', '_start', '_token')
+
+    def __init__(self, tracer, name, context, parent_id=None, kind='internal', attributes=None):
+        self.name = name
+        """The span name."""
+        self.kind = kind
+        """The span kind, 'internal' or 'client'."""
+        self.context = context
+        """The SpanContext."""
+        self.parent_id = parent_id
+        """The span id of the parent span, or None for a root span."""
+        self.attributes = attributes or {}
+        """A dictionary of attributes describing the operation."""
+        self.status = 'unset'
+        """The span status, 'unset', 'ok' or 'error'."""
+        self.error = None
+        """The exception recorded on the span, if any."""
+        self.start_time = time.time()
+        """The epoch time the span started."""
+        self.end_time = None
+        """The epoch time the span ended."""
+        self._tracer = tracer
+        self._start = time.perf_counter()
+        self._token = None
+
+    @property
+    def trace_id(self):
+        """The 32 character hex trace id."""
+        return self.context.trace_id
+
+    @property
+    def span_id(self):
+        """The 16 character hex span id."""
+        return self.context.span_id
+
+    @property
+    def traceparent(self):
+        """The W3C traceparent header value for this span."""
+        return self.context.traceparent
+
+    @property
+    def duration(self):
+        """The number of seconds the span took, or None if it hasn't ended."""
+        if self.end_time is None:
+            return None
+        return self.end_time - self.start_time
+
+    def set_attribute(self, key, value):
+        """
+        Set an attribute on the span.
+
+        Args:
+            key (str): The attribute name.
+            value (mixed): The attribute value.
+        """
+        self.attributes[key] = value
+
+    def record_exception(self, error):
+        """
+        Mark the span as failed.
+
+        Args:
+            error (Exception): The exception.
+        """
+        self.status = 'error'
+        self.error = error
+        self.attributes['exception.type'] = type(error).__name__
+        self.attributes['exception.message'] = str(error)
+
+    def end(self):
+        """
+        End the span and export it.  Only the first call has any effect.
+        """
+        if self.end_time is not None:
+            return
+        self.end_time = self.start_time + time.perf_counter() - self._start
+        self._tracer._export(self)
+
+    @contextlib.contextmanager
+    def activate(self):
+        """
+        A context manager which makes this the active span without ending
+        it on exit.  This is for spans which are open across yields,
+        for example the span of a generator.
+        """
+        token = _current_span.set(self)
+        try:
+            yield self
+        finally:
+            _current_span.reset(token)
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_span.reset(self._token)
+        if exc is not None and isinstance(exc, Exception):
+            self.record_exception(exc)
+        self.end()
+        return False
+
+    def __repr__(self):
+        return '<Span name={} trace_id={} span_id={}>'.format(
+            self.name, self.trace_id, self.span_id)
+
+
+class _NoopSpan(object):
+    """
+    Stands in for a Span when no tracer is installed.
+    """
+
+    def set_attribute(self, key, value):
+        pass
+
+    def record_exception(self, error):
+        pass
+
+    def end(self):
+        pass
+
+    def activate(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+"""The span returned by operation_span() when a client has no tracer."""
+
+
+class Tracer(object):
+    """
+    Creates spans and passes them to exporters when they end.  Install a
+    Tracer on a client with the 'tracer' option, then each high level App
+    operation, for example AssetApp.batch_upload_directory(), opens a span,
+    each HTTP request it makes is a child span, and the W3C traceparent
+    header is sent with every request so the server side spans join the trace.
+
+    Span names and attributes follow the OpenTelemetry conventions, so an
+    exporter can forward them to an OpenTelemetry collector or any other
+    tracing backend.
+
+    Examples:
+        tracer = Tracer(exporter=lambda span: print(span.name, span.duration))
+        app = zmlp.app_from_env(tracer=tracer)
+    """
+
+    def __init__(self, exporter=None):
+        """
+        Create a new Tracer.
+
+        Args:
+            exporter (func): An optional function called with each Span when it ends.
+        """
+        self.exporters = [exporter] if exporter else []
+
+    def add_exporter(self, exporter):
+        """
+        Add a function which is called with each Span when it ends.
+
+        Args:
+            exporter (func): The exporter.
+        """
+        self.exporters.append(exporter)
+
+    def start_span(self, name, parent=None, kind='internal', attributes=None):
+        """
+        Start a new span.  The span must be ended, either by using it as a
+        context manager or by calling end().
+
+        Args:
+            name (str): The span name.
+            parent (mixed): The parent Span, SpanContext or traceparent header value.
+                Defaults to the active span.  A new trace is started if there is
+                no parent.
+            kind (str): The span kind, 'internal' or 'client'.
+            attributes (dict): The span attributes.
+
+        Returns:
+            Span: The span.
+        """
+        if parent is None:
+            parent = _current_span.get()
+        elif isinstance(parent, str):
+            parent = SpanContext.from_traceparent(parent)
+
+        if isinstance(parent, Span):
+            parent = parent.context
+        if parent is None:
+            context = SpanContext(_new_id(128), _new_id(64))
+            parent_id = None
+        else:
+            context = SpanContext(parent.trace_id, _new_id(64), parent.flags)
+            parent_id = parent.span_id
+        return Span(self, name, context, parent_id, kind, attributes)
+
+    def start_request_span(self, event):
+        """
+        Start the client span for an HTTP request.
+
+        Args:
+            event (RequestEvent): The request's instrumentation event.
+
+        Returns:
+            Span: The span.
+        """
+        return self.start_span('{} {}'.format(event.method, event.endpoint), kind='client',
+                               attributes={'http.request.method': event.method,
+                                           'url.full': event.url,
+                                           'url.template': event.endpoint})
+
+    def end_request_span(self, span, event):
+        """
+        Record the outcome of an HTTP request on its span and end it.
+
+        Args:
+            span (Span): The span.
+            event (RequestEvent): The request's instrumentation event.
+        """
+        attributes = span.attributes
+        if event.status is not None:
+            attributes['http.response.status_code'] = event.status
+            if event.status >= 400:
+                span.status = 'error'
+        if event.retries:
+            attributes['http.request.resend_count'] = event.retries
+        if event.request_bytes:
+            attributes['http.request.body.size'] = event.request_bytes
+        if event.response_bytes:
+            attributes['http.response.body.size'] = event.response_bytes
+        if event.error is not None:
+            span.record_exception(event.error)
+        span.end()
+
+    def _export(self, span):
+        for exporter in self.exporters:
+            try:
+                exporter(span)
+            except Exception as e:
+                logger.warning("Span exporter %s failed: %s", exporter, e)
+
+
+def operation_span(client, name, **attributes):
+    """
+    Start the span for a high level App operation, or return a no-op span
+    if the client has no tracer.
+
+    Args:
+        client (ZmlpClient): The client the operation uses.
+        name (str): The span name, for example 'AssetApp.batch_upload_directory'.
+        **attributes: The span attributes.
+
+    Returns:
+        Span: The span, use it as a context manager.
+    """
+    tracer = client.tracer
+    if tracer is None:
+        return NOOP_SPAN
+    return tracer.start_span(name, attributes=attributes)
+
+
+def traced_generator(span, gen):
+    """
+    Wrap a generator so the span is active while the generator runs, but not
+    while the caller processes each item, and end the span when the generator
+    is exhausted or closed.
+
+    Args:
+        span (Span): The span, from operation_span().
+        gen (generator): The generator.
+
+    Returns:
+        generator: The wrapped generator, or gen if span is a no-op span.
+    """
+    if span is NOOP_SPAN:
+        return gen
+    return _iter_in_span(span, gen)
+
+
+def traced_async_generator(span, agen):
+    """
+    The asyncio version of traced_generator().
+
+    Args:
+        span (Span): The span, from operation_span().
+        agen (AsyncGenerator): The async generator.
+
+    Returns:
+        AsyncGenerator: The wrapped generator, or agen if span is a no-op span.
+    """
+    if span is NOOP_SPAN:
+        return agen
+    return _aiter_in_span(span, agen)
+
+
+def _iter_in_span(span, gen):
+    try:
+        while True:
+            with span.activate():
+                try:
+                    item = next(gen)
+                except StopIteration:
+                    return
+            yield item
+    except Exception as e:
+        span.record_exception(e)
+        raise
+    finally:
+        with span.activate():
+            gen.close()
+        span.end()
+
+
+async def _aiter_in_span(span, agen):
+    try:
+        while True:
+            with span.activate():
+                try:
+                    item = await agen.__anext__()
+                except StopAsyncIteration:
+                    return
+            yield item
+    except Exception as e:
+        span.record_exception(e)
+        raise
+    finally:
+        with span.activate():
+            await agen.aclose()
+        span.end()
+
+
+def _new_id(bits):
+    value = 0
+    while not value:
+        value = random.getrandbits(bits)
+    return '{:0{}x}'.format(value, bits // 4)
@@ -3,6 +3,9 @@ import os
 import logging
 import json
 
+from .timeouts import current_deadline
+from .tracing import operation_span
+
 logger = logging.getLogger(__name__)
 
 __all__ = [
@@ -74,7 +77,7 @@ class DataSetDownloader:
 
         os.makedirs(self.dst_dir, exist_ok=True)
 
-    def build(self, pool=None):
+    def build(self, pool=None, deadline=None):
         """
         Downloads the files in the DataSet to local disk.
 
@@ -82,16 +85,22 @@ class DataSetDownloader:
             labels_std, objects_keras, objects_coco
             pool (multiprocessing.Pool): An optional Pool instance which can be used
                 to download files in parallel.
+            deadline (float): The number of seconds the whole build may take, which
+                is shared by the scroll and every download.  Downloads made by a
+                pool are given the time left when they are queued.
 
         """
-        if self.style == "labels_std":
-            self._build_labels_std_format(pool)
-        elif self.style == "objects_coco":
-            self._build_objects_coco_format(pool)
-        elif self.style == "objects_keras":
-            self._build_objects_keras_format(pool)
-        else:
-            raise ValueError("{} not supported by the DataSetDownloader".format(format))
+        with operation_span(self.app.client, 'DataSetDownloader.build',
+                            **{'zmlp.dataset_id': self.dataset.id, 'zmlp.style': self.style}), \
+                self.app.client.deadline(deadline):
+            if self.style == "labels_std":
+                self._build_labels_std_format(pool)
+            elif self.style == "objects_coco":
+                self._build_objects_coco_format(pool)
+            elif self.style == "objects_keras":
+                self._build_objects_keras_format(pool)
+            else:
+                raise ValueError("{} not supported by the DataSetDownloader".format(format))
 
     def _build_labels_std_format(self, pool):
 
@@ -118,10 +127,7 @@ class DataSetDownloader:
             os.makedirs(os.path.dirname(dst_path), exist_ok=True)
 
             logger.info('Downloading to {}'.format(dst_path))
-            if pool:
-                pool.apply_async(self.app.assets.download_file, args=(prx, dst_path))
-            else:
-                self.app.assets.download_file(prx, dst_path)
+            self._download_file(prx, dst_path, pool)
 
     def _build_objects_coco_format(self, pool=None):
         """
@@ -270,7 +276,10 @@ class DataSetDownloader:
 
     def _download_file(self, prx, dst_path, pool=None):
         if pool:
-            pool.apply_async(self.app.assets.download_file, args=(prx, dst_path))
+            # The deadline can't follow the call into the pool's process.
+            deadline = current_deadline()
+            kwds = {'deadline': deadline.remaining()} if deadline is not None else {}
+            pool.apply_async(self.app.assets.download_file, args=(prx, dst_path), kwds=kwds)
         else:
             self.app.assets.download_file(prx, dst_path)
 
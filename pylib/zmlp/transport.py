@@ -0,0 +1,239 @@
+"""Pluggable transports, which carry requests over TCP, Unix sockets or a local sidecar."""
+import ipaddress
+import os
+from urllib.parse import quote, unquote, urljoin, urlsplit
+
+__all__ = [
+    'Transport',
+    'SidecarTransport',
+    'default_transport',
+    'unix_url'
+]
+
+UNIX_SCHEME = 'http+unix'
+"""The URL scheme of a server listening on a Unix domain socket."""
+
+SIDECAR_ENV = 'ZMLP_SIDECAR'
+"""The environment variable which names a local sidecar to send requests through."""
+
+
+def unix_url(socket_path, path=''):
+    """
+    Build an http+unix:// URL for a server listening on a Unix domain socket.
+
+    Examples:
+        app = ZmlpApp(apikey, unix_url('/run/zmlp/api.sock'))
+
+    Args:
+        socket_path (str): The path of the socket.
+        path (str): An optional URL path.
+
+    Returns:
+        str: The URL, with the socket path percent encoded as the host.
+    """
+    return '{}://{}/{}'.format(UNIX_SCHEME, quote(socket_path, safe=''), path.lstrip('/'))
+
+
+def socket_path_of(url):
+    """
+    Return the socket path of an http+unix:// URL.
+
+    Args:
+        url (str): The URL.
+
+    Returns:
+        str: The socket path, or None if the URL isn't an http+unix URL.
+    """
+    parts = urlsplit(url)
+    if parts.scheme != UNIX_SCHEME:
+        return None
+    return unquote(parts.netloc)
+
+
+def join_url(base, path):
+    """
+    urljoin() which also handles http+unix:// URLs.
+
+    Args:
+        base (str): The base URL.
+        path (str): The path to join.
+
+    Returns:
+        str: The joined URL.
+    """
+    if not base.startswith(UNIX_SCHEME + '://'):
+        return urljoin(base, path)
+    # urljoin() only resolves paths against the schemes it knows.
+    return UNIX_SCHEME + urljoin('http' + base[len(UNIX_SCHEME):], path)[len('http'):]
+
+
+class Transport(object):
+    """
+    A Transport creates the connection pools a client sends requests through.
+    The default Transport uses TCP, with TLS for https URLs, and connects to a
+    Unix domain socket for http+unix:// URLs, see unix_url().
+
+    Subclasses override mount() to install requests transport adapters, and
+    connector() and route() for the AsyncZmlpClient.
+    """
+
+    def mount(self, session, pool_connections, pool_maxsize, pool_block):
+        """
+        Install the transport adapters on a requests.Session.
+
+        Args:
+            session (requests.Session): The session.
+            pool_connections (int): The number of per-host connection pools to cache.
+            pool_maxsize (int): The maximum number of keep-alive connections per host.
+            pool_block (bool): Block when the pool for a host is exhausted.
+        """
+        # Imported here so requests is only loaded once a session is needed.
+        from requests.adapters import HTTPAdapter
+        from .adapters import UnixSocketAdapter
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                              pool_block=pool_block)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.mount(UNIX_SCHEME + '://', UnixSocketAdapter(
+            pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+            pool_block=pool_block))
+
+    def connector(self, server, limit):
+        """
+        Create the aiohttp connector for an AsyncZmlpClient.
+
+        Args:
+            server (str): The URL of the server.
+            limit (int): The maximum number of concurrent connections.
+
+        Returns:
+            aiohttp.BaseConnector: The connector.
+        """
+        import aiohttp
+        path = socket_path_of(server)
+        if path:
+            return aiohttp.UnixConnector(path=path, limit=limit)
+        return aiohttp.TCPConnector(limit=limit, ssl=False)
+
+    def route(self, url):
+        """
+        Return the URL an AsyncZmlpClient actually requests for a URL, and any
+        headers to add.
+
+        Args:
+            url (str): The request URL.
+
+        Returns:
+            tuple: The URL and a dictionary of headers, or None.
+        """
+        if socket_path_of(url):
+            # The UnixConnector ignores the host.
+            return 'http://localhost' + _path_url(url), None
+        return url, None
+
+    def __repr__(self):
+        return '<{}>'.format(type(self).__name__)
+
+
+class SidecarTransport(Transport):
+    """
+    Sends every request, whatever the server, to a local sidecar over plain
+    HTTP, which saves a TLS handshake and the trip to the API server's load
+    balancer.  The sidecar is reached over TCP or a Unix domain socket.  The
+    original host is sent in the Host header, and requests are signed for the
+    configured server, so authentication and errors are unchanged.
+
+    A client running in a processing task uses the sidecar named by the
+    ZMLP_SIDECAR environment variable, if it's set.  As requests carry the
+    signed API key in the clear, that sidecar must be a Unix socket or
+    listen on a loopback address.  A sidecar anywhere else can only be
+    used by passing the transport explicitly.
+
+    Examples:
+        app = ZmlpApp(apikey, transport=SidecarTransport('http://127.0.0.1:8181'))
+        app = ZmlpApp(apikey, transport=SidecarTransport('/run/zmlp/sidecar.sock'))
+    """
+
+    def __init__(self, address):
+        """
+        Create a new SidecarTransport.
+
+        Args:
+            address (str): The http:// URL of the sidecar, or the path or
+                http+unix:// URL of its socket.
+        """
+        self.address = address
+        if address.startswith('/'):
+            self.socket_path = address
+        else:
+            self.socket_path = socket_path_of(address)
+        if not self.socket_path and not address.startswith('http://'):
+            raise ValueError("A sidecar must be a http:// URL or socket path, "
+                             "not '{}'".format(address))
+
+    def mount(self, session, pool_connections, pool_maxsize, pool_block):
+        from .adapters import SidecarAdapter, UnixSocketAdapter
+        if self.socket_path:
+            adapter = UnixSocketAdapter(self.socket_path, pool_connections=pool_connections,
+                                        pool_maxsize=pool_maxsize, pool_block=pool_block)
+        else:
+            adapter = SidecarAdapter(self.address, pool_connections=pool_connections,
+                                     pool_maxsize=pool_maxsize, pool_block=pool_block)
+        for prefix in ('https://', 'http://', UNIX_SCHEME + '://'):
+            session.mount(prefix, adapter)
+
+    def connector(self, server, limit):
+        import aiohttp
+        if self.socket_path:
+            return aiohttp.UnixConnector(path=self.socket_path, limit=limit)
+        return aiohttp.TCPConnector(limit=limit)
+
+    @property
+    def is_local(self):
+        """True if the sidecar is a Unix socket or listens on a loopback address."""
+        if self.socket_path:
+            return True
+        host = urlsplit(self.address).hostname
+        if host == 'localhost':
+            return True
+        try:
+            return ipaddress.ip_address(host).is_loopback
+        except ValueError:
+            return False
+
+    def route(self, url):
+        headers = {'Host': urlsplit(url).netloc}
+        if self.socket_path:
+            return 'http://localhost' + _path_url(url), headers
+        return self.address.rstrip('/') + _path_url(url), headers
+
+    def __repr__(self):
+        return "<SidecarTransport address='{}'>".format(self.address)
+
+
+def default_transport():
+    """
+    Return the transport for a client created without one, a SidecarTransport
+    if the ZMLP_SIDECAR environment variable is set, otherwise a Transport.
+
+    Returns:
+        Transport: The transport.
+
+    Raises:
+        ValueError: If ZMLP_SIDECAR isn't a Unix socket or a loopback address.
+    """
+    address = os.environ.get(SIDECAR_ENV)
+    if address:
+        transport = SidecarTransport(address)
+        if not transport.is_local:
+            raise ValueError("{} must be a socket path or a loopback address, not '{}', "
+                             "pass a SidecarTransport to use a remote sidecar".format(
+                                 SIDECAR_ENV, address))
+        return transport
+    return Transport()
+
+
+def _path_url(url):
+    parts = urlsplit(url)
+    path = parts.path or '/'
+    return path + ('?' + parts.query if parts.query else '')
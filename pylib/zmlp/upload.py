@@ -0,0 +1,196 @@
+"""Chunked, resumable uploads of large files."""
+import base64
+import hashlib
+import json
+import logging
+import os
+
+from .client import ZmlpClientException, ZmlpNotFoundException
+
+logger = logging.getLogger(__name__)
+
+__all__ = [
+    'ChunkedUpload'
+]
+
+DEFAULT_UPLOAD_PART_SIZE = 16 * 1024 * 1024
+"""The default size in bytes of each part of a chunked upload."""
+
+DEFAULT_JOURNAL_DIR = os.path.join(os.path.expanduser('~'), '.zmlp', 'uploads')
+"""The default directory chunked upload journals are written to."""
+
+UPLOAD_ENDPOINT = '/api/v3/assets/_chunked_upload'
+"""The base endpoint for chunked uploads."""
+
+MAX_PART_ATTEMPTS = 3
+"""The number of times a part is sent before an md5 mismatch fails the upload."""
+
+
+class ChunkedUpload(object):
+    """
+    Uploads a single file as a series of fixed size parts followed by a commit.
+    Each part is acknowledged by the server and recorded in a local journal, so
+    if the process is restarted the upload continues from the last acknowledged
+    part instead of sending the whole file again.  Parts are sent with a PUT,
+    which is idempotent, so a failed part is retried according to the client's
+    RetryPolicy without restarting the upload.  A part the server acknowledges
+    with a different md5 than the local one is sent again, up to
+    MAX_PART_ATTEMPTS times.
+
+    The protocol is:
+        POST /api/v3/assets/_chunked_upload
+            {"asset": <FileUpload>, "size": 123, "partSize": 16777216, "modules": []}
+            -> {"id": "<upload id>"}
+        PUT /api/v3/assets/_chunked_upload/<upload id>/<part number>
+            The part bytes, with a Content-MD5 header.
+            -> {"part": 0, "size": 16777216, "md5": "<hex digest>"}
+        GET /api/v3/assets/_chunked_upload/<upload id>
+            -> {"id": "<upload id>", "parts": [0, 1]}
+        POST /api/v3/assets/_chunked_upload/<upload id>/_commit
+            {"parts": [{"part": 0, "md5": "<hex digest>"}]}
+            -> The same response as a batch upload.
+
+    """
+
+    def __init__(self, client, file_upload, modules=None, part_size=None,
+                 journal_dir=None, progress=None):
+        """
+        Create a new ChunkedUpload.
+
+        Args:
+            client (ZmlpClient): The client used to make requests.
+            file_upload (FileUpload): The file to upload.
+            modules (list): A list of Pipeline Modules to apply to the file.
+            part_size (int): The size in bytes of each part.
+            journal_dir (str): The directory to write the upload journal to.
+            progress (func): An optional function called with the number of bytes
+                acknowledged and the total size after each part is sent.
+        """
+        self.client = client
+        self.file_upload = file_upload
+        self.path = file_upload.uri
+        self.modules = modules
+        self.part_size = part_size or DEFAULT_UPLOAD_PART_SIZE
+        self.journal_dir = journal_dir or DEFAULT_JOURNAL_DIR
+        self.progress = progress
+
+        info = os.stat(self.path)
+        self.size = info.st_size
+        self.mtime = info.st_mtime_ns
+        self.journal_path = os.path.join(self.journal_dir, self._journal_name())
+
+    @property
+    def part_count(self):
+        """The number of parts the file is split into."""
+        return max(1, (self.size + self.part_size - 1) // self.part_size)
+
+    def run(self):
+        """
+        Run the upload, resuming a previous attempt if there is one.
+
+        Returns:
+            dict: The response of the commit, which is the same as a batch upload.
+        """
+        journal = self._resume() or self._begin()
+        parts = journal['parts']
+
+        with open(self.path, 'rb') as handle:
+            for index in range(self.part_count):
+                if str(index) in parts:
+                    continue
+                handle.seek(index * self.part_size)
+                data = handle.read(self.part_size)
+                parts[str(index)] = self._send_part(journal['id'], index, data)
+                self._save_journal(journal)
+                if self.progress:
+                    self.progress(self._acknowledged(parts), self.size)
+
+        body = {
+            'parts': [{'part': i, 'md5': parts[str(i)]} for i in range(self.part_count)]
+        }
+        rsp = self.client.post('{}/{}/_commit'.format(UPLOAD_ENDPOINT, journal['id']), body)
+        os.remove(self.journal_path)
+        return rsp
+
+    def _begin(self):
+        body = {
+            'asset': self.file_upload,
+            'size': self.size,
+            'partSize': self.part_size,
+            'modules': self.modules
+        }
+        rsp = self.client.post(UPLOAD_ENDPOINT, body)
+        journal = {
+            'id': rsp['id'],
+            'path': self.path,
+            'size': self.size,
+            'mtime': self.mtime,
+            'partSize': self.part_size,
+            'parts': {}
+        }
+        self._save_journal(journal)
+        return journal
+
+    def _resume(self):
+        """
+        Load the journal of a previous attempt and reconcile it with
+        the parts the server has acknowledged.
+
+        Returns:
+            dict: The journal or None if the upload can't be resumed.
+        """
+        try:
+            with open(self.journal_path) as fp:
+                journal = json.load(fp)
+        except (OSError, ValueError):
+            return None
+
+        if journal.get('size') != self.size or journal.get('mtime') != self.mtime:
+            logger.warning("'%s' has changed, restarting the upload", self.path)
+            return None
+
+        try:
+            status = self.client.get('{}/{}'.format(UPLOAD_ENDPOINT, journal['id']))
+        except ZmlpNotFoundException:
+            logger.warning("Upload '%s' of '%s' has expired, restarting the upload",
+                           journal['id'], self.path)
+            return None
+
+        acknowledged = set(str(part) for part in status.get('parts', []))
+        journal['parts'] = {k: v for k, v in journal['parts'].items() if k in acknowledged}
+        logger.info("Resuming upload of '%s' at part %d of %d", self.path,
+                    len(journal['parts']), self.part_count)
+        return journal
+
+    def _send_part(self, upload_id, index, data):
+        digest = hashlib.md5(data)
+        headers = {'Content-MD5': base64.b64encode(digest.digest()).decode()}
+        md5 = digest.hexdigest()
+        url = '{}/{}/{}'.format(UPLOAD_ENDPOINT, upload_id, index)
+        for attempt in range(1, MAX_PART_ATTEMPTS + 1):
+            rsp = self.client.put_bytes(url, data, headers=headers)
+            # A part acknowledged with an empty body has no md5 to compare.
+            remote = rsp.get('md5') if isinstance(rsp, dict) else None
+            if not remote or remote.lower() == md5:
+                return md5
+            logger.warning("Part %d of '%s' was received with md5 %s instead of %s, "
+                           "attempt %d of %d", index, self.path, remote, md5,
+                           attempt, MAX_PART_ATTEMPTS)
+        raise ZmlpClientException(
+            "Part {} of '{}' was not received intact after {} attempts".format(
+                index, self.path, MAX_PART_ATTEMPTS))
+
+    def _acknowledged(self, parts):
+        return sum(min(self.part_size, self.size - int(i) * self.part_size) for i in parts)
+
+    def _journal_name(self):
+        key = '|'.join([str(self.client.server), str(self.client.project_id),
+                        self.path, str(self.part_size)])
+        return hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json'
+
+    def _save_journal(self, journal):
+        os.makedirs(self.journal_dir, exist_ok=True)
+        tmp_path = self.journal_path + '.tmp'
+        with open(tmp_path, 'w') as fp:
+            json.dump(journal, fp)
+        os.replace(tmp_path, self.journal_path)
@@ -39,5 +39,9 @@ setup(
     ],
 
     include_package_data=True,
-    install_requires=requirements
+    install_requires=requirements,
+    extras_require={
+        'async': ['aiohttp'],
+        'fast': ['orjson']
+    }
 )